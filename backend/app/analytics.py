@@ -0,0 +1,356 @@
+"""
+Latency analytics over model responses.
+
+Each completed, non-cached response adds its metrics to an hourly
+LatencyRollup row holding a histogram over log-spaced bins (each bin 10%
+wider than the previous, so percentiles read from it are within ~5%). The
+rollups are updated by a response-writer listener as rows are inserted, so a
+report over whole hours costs the same however much history there is.
+
+Reports merge the rollups for the whole hours in the requested range and
+bin the raw rows of the partial hours at its edges. With `exact=True` the
+raw rows of the whole range are loaded instead and percentiles are computed
+with numpy.
+"""
+import math
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .models import LatencyRollup, ModelResponse
+from .tokens import throughput
+
+METRICS = ("ttft", "total_time", "chars_per_second", "output_tokens_per_second")
+PERCENTILES = (50, 95, 99)
+
+HISTOGRAM_MIN = 1e-3
+HISTOGRAM_GROWTH = 1.1
+HISTOGRAM_BINS = 220  # covers 1e-3 .. ~1.3e6
+_LOG_GROWTH = math.log(HISTOGRAM_GROWTH)
+# Geometric midpoint of each bin, reported for percentiles that fall in it
+_BIN_VALUES = HISTOGRAM_MIN * HISTOGRAM_GROWTH ** (np.arange(HISTOGRAM_BINS) + 0.5)
+
+BACKFILL_CHUNK = 20_000
+# Rows older than response_chars are never compressed, so their length is the text's
+RESPONSE_CHARS = func.coalesce(ModelResponse.response_chars, func.length(ModelResponse.stored_text))
+
+
+def metric_values(
+    time_to_first_token: float,
+    total_time: float,
+    response_chars: int,
+    completion_tokens: Optional[int] = None,
+) -> Dict[str, float]:
+    values = {"ttft": time_to_first_token, "total_time": total_time}
+    if total_time and total_time > 0:
+        values["chars_per_second"] = response_chars / total_time
+    rate = throughput(completion_tokens, time_to_first_token, total_time)
+    if rate["output_tokens_per_second"] is not None:
+        values["output_tokens_per_second"] = rate["output_tokens_per_second"]
+    return values
+
+
+def bin_counts(values: np.ndarray) -> np.ndarray:
+    """Histogram of `values` over the shared log-spaced bins"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        bins = np.floor(np.log(values / HISTOGRAM_MIN) / _LOG_GROWTH)
+    bins = np.clip(np.nan_to_num(bins, nan=0, neginf=0), 0, HISTOGRAM_BINS - 1)
+    return np.bincount(bins.astype(np.int64), minlength=HISTOGRAM_BINS).astype(np.uint32)
+
+
+def _hour(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+class _Accumulator:
+    """Count, sum, extremes and histogram of one model's metric"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min_value = math.inf
+        self.max_value = -math.inf
+        self.histogram = np.zeros(HISTOGRAM_BINS, dtype=np.uint64)
+
+    def add_values(self, values: np.ndarray):
+        if not len(values):
+            return
+        self.count += len(values)
+        self.total += float(values.sum())
+        self.min_value = min(self.min_value, float(values.min()))
+        self.max_value = max(self.max_value, float(values.max()))
+        self.histogram += bin_counts(values)
+
+    def add_rollup(self, rollup: LatencyRollup):
+        self.count += rollup.count
+        self.total += rollup.total
+        self.min_value = min(self.min_value, rollup.min_value)
+        self.max_value = max(self.max_value, rollup.max_value)
+        self.histogram += np.frombuffer(rollup.histogram, dtype="<u4")
+
+    def stats(self) -> Dict[str, float]:
+        cumulative = np.cumsum(self.histogram)
+        stats = {
+            "count": self.count,
+            "mean": self.total / self.count,
+            "min": self.min_value,
+            "max": self.max_value,
+        }
+        for pct in PERCENTILES:
+            rank = max(1, math.ceil(pct / 100 * self.count))
+            value = float(_BIN_VALUES[np.searchsorted(cumulative, rank)])
+            stats[f"p{pct}"] = min(max(value, self.min_value), self.max_value)
+        return stats
+
+
+def _exact_stats(values: np.ndarray) -> Dict[str, float]:
+    stats = {
+        "count": int(len(values)),
+        "mean": float(values.mean()),
+        "min": float(values.min()),
+        "max": float(values.max()),
+    }
+    for pct, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+        stats[f"p{pct}"] = float(value)
+    return stats
+
+
+def update_rollups(db_session: Session, rows: Iterable):
+    """Add responses to their hourly rollups (response-writer listener)
+
+    Rows need model_name, status, cached, created_at, time_to_first_token,
+    total_time, completion_tokens and either response_text or response_chars.
+    """
+    groups: Dict[Tuple[str, str, datetime], List[float]] = defaultdict(list)
+    for row in rows:
+        if row.status != "completed" or row.cached or row.created_at is None:
+            continue
+        response_chars = getattr(row, "response_chars", None)
+        if response_chars is None:
+            response_chars = len(row.response_text)
+        hour = _hour(row.created_at)
+        values = metric_values(
+            row.time_to_first_token, row.total_time, response_chars, row.completion_tokens
+        )
+        for metric, value in values.items():
+            groups[(row.model_name, metric, hour)].append(value)
+
+    for (model_name, metric, hour), values in groups.items():
+        values = np.asarray(values, dtype=np.float64)
+        histogram = bin_counts(values)
+        rollup = db_session.get(LatencyRollup, (model_name, metric, hour))
+        if rollup is None:
+            db_session.add(
+                LatencyRollup(
+                    model_name=model_name,
+                    metric=metric,
+                    bucket_start=hour,
+                    count=len(values),
+                    total=float(values.sum()),
+                    min_value=float(values.min()),
+                    max_value=float(values.max()),
+                    histogram=histogram.astype("<u4").tobytes(),
+                )
+            )
+        else:
+            merged = np.frombuffer(rollup.histogram, dtype="<u4") + histogram
+            rollup.count += len(values)
+            rollup.total += float(values.sum())
+            rollup.min_value = min(rollup.min_value, float(values.min()))
+            rollup.max_value = max(rollup.max_value, float(values.max()))
+            rollup.histogram = merged.astype("<u4").tobytes()
+    db_session.flush()
+
+
+def _raw_query(db_session: Session, columns, model_name: str, start: datetime, end: datetime):
+    # SQLite keeps whole seconds (models.Timestamp) and the bounds are stored
+    # the same way: round a fractional end up so its own second is included
+    if end.microsecond and db_session.get_bind().dialect.name == "sqlite":
+        end = end.replace(microsecond=0) + timedelta(seconds=1)
+    return db_session.query(*columns).filter(
+        ModelResponse.model_name == model_name,
+        ModelResponse.status == "completed",
+        ModelResponse.cached.is_(False),
+        ModelResponse.created_at >= start,
+        ModelResponse.created_at < end,
+    )
+
+
+def _raw_values(
+    db_session: Session, model_name: str, start: datetime, end: datetime
+) -> Dict[str, np.ndarray]:
+    rows = _raw_query(
+        db_session,
+        (
+            ModelResponse.time_to_first_token,
+            ModelResponse.total_time,
+            RESPONSE_CHARS,
+            ModelResponse.completion_tokens,
+        ),
+        model_name,
+        start,
+        end,
+    ).all()
+    if not rows:
+        return {}
+    ttft, total_time, chars, tokens = (
+        np.asarray(column, dtype=np.float64) for column in zip(*rows)
+    )  # tokens is NaN where uncounted
+    positive = total_time > 0
+    decoding = (tokens > 1) & (total_time > ttft)
+    return {
+        "ttft": ttft,
+        "total_time": total_time,
+        "chars_per_second": chars[positive] / total_time[positive],
+        "output_tokens_per_second": (tokens[decoding] - 1) / (total_time - ttft)[decoding],
+    }
+
+
+def latency_report(
+    db_session: Session,
+    start: datetime,
+    end: datetime,
+    models: Optional[List[str]] = None,
+    exact: bool = False,
+) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """Per-model stats of every metric over [start, end), in naive UTC"""
+    first_hour = _hour(start) if _hour(start) == start else _hour(start) + timedelta(hours=1)
+    last_hour = _hour(end)
+    # Rollups hold everything inserted so far, so a range ending in the current
+    # hour reads that hour from its rollup instead of scanning its rows
+    if last_hour >= _hour(datetime.now(timezone.utc)):
+        last_hour += timedelta(hours=1)
+
+    if models is None:
+        # Every model with activity in the range has a rollup for its hours
+        models = [
+            name
+            for (name,) in db_session.query(LatencyRollup.model_name)
+            .filter(
+                LatencyRollup.bucket_start >= _hour(start),
+                LatencyRollup.bucket_start < end,
+            )
+            .distinct()
+        ]
+
+    report = {}
+    for model_name in models:
+        if exact:
+            stats = {
+                metric: _exact_stats(values)
+                for metric, values in _raw_values(db_session, model_name, start, end).items()
+                if len(values)
+            }
+        else:
+            stats = _rollup_stats(db_session, model_name, start, end, first_hour, last_hour)
+        if stats:
+            report[model_name] = stats
+    return report
+
+
+def _rollup_stats(
+    db_session: Session,
+    model_name: str,
+    start: datetime,
+    end: datetime,
+    first_hour: datetime,
+    last_hour: datetime,
+) -> Dict[str, Dict[str, float]]:
+    accumulators = {metric: _Accumulator() for metric in METRICS}
+    if first_hour >= last_hour:
+        raw_ranges = [(start, end)]
+    else:
+        raw_ranges = [(start, first_hour), (last_hour, end)]
+        for rollup in db_session.query(LatencyRollup).filter(
+            LatencyRollup.model_name == model_name,
+            LatencyRollup.bucket_start >= first_hour,
+            LatencyRollup.bucket_start < last_hour,
+        ):
+            accumulators[rollup.metric].add_rollup(rollup)
+
+    for range_start, range_end in raw_ranges:
+        if range_start >= range_end:
+            continue
+        for metric, values in _raw_values(db_session, model_name, range_start, range_end).items():
+            accumulators[metric].add_values(values)
+    return {
+        metric: accumulator.stats()
+        for metric, accumulator in accumulators.items()
+        if accumulator.count
+    }
+
+
+def _backfill_chunk(after_id: int, max_id: int):
+    def task(db_session: Session):
+        rows = (
+            db_session.query(
+                ModelResponse.id,
+                ModelResponse.model_name,
+                ModelResponse.status,
+                ModelResponse.cached,
+                ModelResponse.created_at,
+                ModelResponse.time_to_first_token,
+                ModelResponse.total_time,
+                ModelResponse.completion_tokens,
+                RESPONSE_CHARS.label("response_chars"),
+            )
+            .filter(ModelResponse.id > after_id, ModelResponse.id <= max_id)
+            .order_by(ModelResponse.id)
+            .limit(BACKFILL_CHUNK)
+            .all()
+        )
+        update_rollups(db_session, rows)
+        return rows[-1].id if rows else None
+
+    return task
+
+
+def backfill_rollups(writer) -> bool:
+    """Rebuild rollups from existing responses if there are none (blocking)
+
+    Runs on the response writer so it is serialized with the insert listener:
+    rows up to the id seen when the rebuild starts are backfilled, later rows
+    are added by the listener. Workers starting together race to insert an
+    empty marker rollup; only the one that succeeds backfills. Returns
+    whether a backfill ran.
+    """
+
+    def start(db_session: Session) -> Optional[int]:
+        if db_session.query(LatencyRollup.model_name).first() is not None:
+            return None
+        max_id = db_session.query(func.max(ModelResponse.id)).scalar()
+        if not max_id:
+            return None
+        db_session.add(
+            LatencyRollup(
+                model_name="",
+                metric=METRICS[0],
+                bucket_start=datetime(1970, 1, 1),
+                count=0,
+                total=0.0,
+                min_value=math.inf,
+                max_value=-math.inf,
+                histogram=np.zeros(HISTOGRAM_BINS, dtype="<u4").tobytes(),
+            )
+        )
+        try:
+            db_session.flush()
+        except IntegrityError:
+            db_session.rollback()
+            return None
+        return max_id
+
+    max_id = writer.run_task(start).result()
+    if not max_id:
+        return False
+    after_id = 0
+    while after_id is not None:
+        after_id = writer.run_task(_backfill_chunk(after_id, max_id)).result()
+    return True
@@ -0,0 +1,115 @@
+"""
+Synthetic canary probes that keep each model's latency series populated.
+
+Every CANARY_INTERVAL seconds, each canary model (CANARY_MODELS, default all
+configured) that has not completed a response on this worker for that long
+is sent CANARY_PROMPT through the fan-out engine as user `canary`. Probes
+are ordinary generations: they are scheduled and rate limited like any
+other, stored under one prompt row per process, counted in the latency
+rollups and watched by the regression detector, so regressions show up
+even while users are idle. Probing is off unless CANARY_INTERVAL is set.
+With several workers, one probes at a time: each round is run by the worker
+holding the 'canary' lease (see coordination.py), which another takes over
+should that worker stop.
+"""
+import asyncio
+import os
+from typing import List, Optional
+
+from .coordination import LEASE_TTL, acquire_lease, worker_id
+from .database import SessionLocal
+from .fanout import FanoutEngine
+from .models import Prompt
+from .regressions import RegressionDetector
+
+# Seconds between probe rounds (and of idleness before a model is probed); 0 disables
+CANARY_INTERVAL = float(os.getenv("CANARY_INTERVAL", "0"))
+# Fixed prompt, so probes measure the model rather than the input
+CANARY_PROMPT = os.getenv("CANARY_PROMPT", "Reply with the word OK.")
+# Comma-separated model keys to probe; empty probes every configured model
+CANARY_MODELS = os.getenv("CANARY_MODELS", "")
+
+
+def _create_prompt(text: str) -> int:
+    db_session = SessionLocal()
+    try:
+        prompt = Prompt(text=text)
+        db_session.add(prompt)
+        db_session.commit()
+        return prompt.id
+    finally:
+        db_session.close()
+
+
+class CanaryProber:
+    """Periodically probes idle models with a fixed prompt"""
+
+    def __init__(
+        self,
+        engine: FanoutEngine,
+        detector: RegressionDetector,
+        interval: float = CANARY_INTERVAL,
+        prompt: str = CANARY_PROMPT,
+    ):
+        self.engine = engine
+        self.detector = detector
+        self.interval = interval
+        self.prompt = prompt
+        self._prompt_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def models(self) -> List[str]:
+        available = self.engine.llm_service.get_available_models()
+        wanted = [key.strip() for key in CANARY_MODELS.split(",") if key.strip()]
+        return [model for model in wanted if model in available] if wanted else available
+
+    def start(self):
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        # Outlives a round, so the holder keeps it from one round to the next
+        ttl = max(LEASE_TTL, 2 * self.interval)
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                if await loop.run_in_executor(
+                    self.engine.db_executor, acquire_lease, "canary", worker_id(), ttl
+                ):
+                    await self.probe_idle()
+            except Exception as e:
+                print(f"Warning: canary probes failed: {e}")
+
+    async def probe_idle(self) -> List[str]:
+        """Probe the models idle for an interval, concurrently; returns them"""
+        idle = [
+            model for model in self.models() if self.detector.idle_for(model) >= self.interval
+        ]
+        if not idle:
+            return idle
+        if self._prompt_id is None:
+            self._prompt_id = await asyncio.get_running_loop().run_in_executor(
+                self.engine.db_executor, _create_prompt, self.prompt
+            )
+        await asyncio.gather(*(self._probe(model) for model in idle))
+        return idle
+
+    async def _probe(self, model_name: str):
+        update_queue: asyncio.Queue = asyncio.Queue()
+        await self.engine.run_model(
+            model_name,
+            self.prompt,
+            self._prompt_id,
+            update_queue,
+            stream_tokens=False,
+            user="canary",
+        )
+        update = update_queue.get_nowait()
+        if update.status != "completed":
+            print(f"Warning: canary probe of {model_name} ended {update.status}: {update.error}")
@@ -0,0 +1,285 @@
+"""
+Optional compression of stored response texts (SQLite only).
+
+With RESPONSE_COMPRESSION set, responses of at least
+RESPONSE_COMPRESSION_MIN_CHARS characters are stored compressed in
+model_responses.response_body and their response_text is left empty. Each
+row names its format in response_codec, so rows written under different
+settings, or before compression was enabled, read back alike:
+
+    NULL         plain text in response_text
+    zlib         zlib stream
+    zstd         zstandard frame
+    zstd:<id>    zstandard frame using shared dictionary <id>
+
+A dictionary trained on past responses (`python -m app.compression train`)
+shrinks typical answers well beyond what zstd achieves on them one by one;
+new rows use the newest dictionary present when the process first writes.
+zstandard is optional: without it 'zstd' falls back to zlib.
+
+ModelResponse.response_text decodes transparently. SQL that needs the text
+(the full-text index) calls decode_response(), registered on every SQLite
+connection. PostgreSQL compresses large values itself (TOAST), so
+RESPONSE_COMPRESSION is ignored there.
+
+Usage (from the backend directory):
+    uv run python -m app.compression train --samples 5000
+    uv run python -m app.compression compress --vacuum
+    uv run python -m app.compression stats
+"""
+import argparse
+import os
+import sys
+import threading
+import zlib
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+# 'zstd' or 'zlib'; empty stores responses as plain text
+RESPONSE_COMPRESSION = os.getenv("RESPONSE_COMPRESSION", "").lower()
+# Shorter responses are stored as plain text
+RESPONSE_COMPRESSION_MIN_CHARS = int(os.getenv("RESPONSE_COMPRESSION_MIN_CHARS", "256"))
+# Compression level; 0 uses the codec's default
+RESPONSE_COMPRESSION_LEVEL = int(os.getenv("RESPONSE_COMPRESSION_LEVEL", "0"))
+
+DEFAULT_LEVELS = {"zstd": 3, "zlib": 6}
+DICTIONARY_SIZE = 112 * 1024  # zstd's own default
+DICTIONARY_SAMPLES = 5000
+
+# Compressor objects are not thread-safe; each thread keeps its own
+_local = threading.local()
+# Dictionaries never change once stored, so they are cached for good
+_dictionaries: Dict[int, bytes] = {}
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def _level(name: str) -> int:
+    return RESPONSE_COMPRESSION_LEVEL or DEFAULT_LEVELS[name]
+
+
+def _dictionary(dictionary_id: int) -> bytes:
+    data = _dictionaries.get(dictionary_id)
+    if data is None:
+        from .database import SessionLocal
+        from .models import CompressionDictionary
+
+        db_session = SessionLocal()
+        try:
+            row = db_session.get(CompressionDictionary, dictionary_id)
+            if row is None:
+                raise ValueError(f"Unknown compression dictionary {dictionary_id}")
+            data = _dictionaries[dictionary_id] = row.data
+        finally:
+            db_session.close()
+    return data
+
+
+def _zstd_coder(codec: str, compress: bool):
+    coders = getattr(_local, "coders", None)
+    if coders is None:
+        coders = _local.coders = {}
+    coder = coders.get((codec, compress))
+    if coder is None:
+        zstandard = _zstandard()
+        if zstandard is None:
+            raise RuntimeError(f"Reading {codec} responses needs the zstandard package")
+        _, _, dictionary_id = codec.partition(":")
+        dict_data = None
+        if dictionary_id:
+            dict_data = zstandard.ZstdCompressionDict(_dictionary(int(dictionary_id)))
+        if compress:
+            coder = zstandard.ZstdCompressor(level=_level("zstd"), dict_data=dict_data)
+        else:
+            coder = zstandard.ZstdDecompressor(dict_data=dict_data)
+        coders[(codec, compress)] = coder
+    return coder
+
+
+def compress(codec: str, text: str) -> bytes:
+    data = text.encode("utf-8")
+    if codec == "zlib":
+        return zlib.compress(data, _level("zlib"))
+    return _zstd_coder(codec, compress=True).compress(data)
+
+
+def decompress(codec: str, body: bytes) -> str:
+    if codec == "zlib":
+        data = zlib.decompress(body)
+    elif codec == "zstd" or codec.startswith("zstd:"):
+        data = _zstd_coder(codec, compress=False).decompress(body)
+    else:
+        raise ValueError(f"Unsupported response codec {codec!r}")
+    return data.decode("utf-8")
+
+
+def latest_dictionary_id() -> Optional[int]:
+    from .database import SessionLocal
+    from .models import CompressionDictionary
+
+    db_session = SessionLocal()
+    try:
+        row = (
+            db_session.query(CompressionDictionary.id)
+            .order_by(CompressionDictionary.id.desc())
+            .first()
+        )
+        return row.id if row else None
+    finally:
+        db_session.close()
+
+
+@lru_cache(maxsize=None)
+def write_codec() -> Optional[str]:
+    """Codec new responses are stored with (None for plain text)"""
+    if not RESPONSE_COMPRESSION:
+        return None
+    from .database import engine
+
+    if engine.dialect.name != "sqlite":
+        print(
+            f"Warning: RESPONSE_COMPRESSION is ignored on {engine.dialect.name}, "
+            "which compresses large values itself"
+        )
+        return None
+    if RESPONSE_COMPRESSION == "zlib":
+        return "zlib"
+    if RESPONSE_COMPRESSION != "zstd":
+        print(f"Warning: unknown RESPONSE_COMPRESSION {RESPONSE_COMPRESSION!r}; storing plain text")
+        return None
+    if _zstandard() is None:
+        print("Warning: zstandard is not installed; compressing responses with zlib")
+        return "zlib"
+    dictionary_id = latest_dictionary_id()
+    return f"zstd:{dictionary_id}" if dictionary_id else "zstd"
+
+
+def encode_response(text: str) -> Tuple[Optional[str], Optional[bytes], str]:
+    """(response_codec, response_body, response_text) to store `text` as"""
+    codec = write_codec()
+    if codec is None or len(text) < RESPONSE_COMPRESSION_MIN_CHARS:
+        return None, None, text
+    return codec, compress(codec, text), ""
+
+
+def decode_response(codec: Optional[str], body: Optional[bytes], text: str) -> str:
+    """Text of a stored response (also the decode_response() SQL function)"""
+    if codec is None:
+        return text
+    return decompress(codec, body)
+
+
+def train_dictionary(db_session, samples: int = DICTIONARY_SAMPLES, size: int = DICTIONARY_SIZE):
+    """Train and store a zstd dictionary on the latest completed responses"""
+    from .models import CompressionDictionary, ModelResponse
+
+    zstandard = _zstandard()
+    if zstandard is None:
+        raise RuntimeError("Training a dictionary needs the zstandard package")
+    rows = (
+        db_session.query(ModelResponse)
+        .filter(ModelResponse.status == "completed")
+        .order_by(ModelResponse.id.desc())
+        .limit(samples)
+        .all()
+    )
+    texts = [row.response_text.encode("utf-8") for row in rows if row.response_text]
+    dictionary = zstandard.train_dictionary(size, texts)
+    row = CompressionDictionary(data=dictionary.as_bytes(), samples=len(texts))
+    db_session.add(row)
+    db_session.commit()
+    return row
+
+
+def compress_stored(db_session, batch_size: int = 500) -> Tuple[int, int, int]:
+    """Compress plain-text responses already stored; returns (rows, bytes before, bytes after)"""
+    from sqlalchemy import func
+
+    from .models import ModelResponse
+
+    if write_codec() is None:
+        raise RuntimeError("Set RESPONSE_COMPRESSION (SQLite only) to compress stored responses")
+    rows_done = before = after = 0
+    after_id = 0
+    while True:
+        rows = (
+            db_session.query(ModelResponse)
+            .filter(
+                ModelResponse.id > after_id,
+                ModelResponse.response_codec.is_(None),
+                func.length(ModelResponse.stored_text) >= RESPONSE_COMPRESSION_MIN_CHARS,
+            )
+            .order_by(ModelResponse.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            return rows_done, before, after
+        for row in rows:
+            before += len(row.stored_text.encode("utf-8"))
+            row.response_text = row.stored_text
+            after += len(row.response_body)
+        # Short transactions: the server keeps writing in between
+        db_session.commit()
+        rows_done += len(rows)
+        after_id = rows[-1].id
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    train = commands.add_parser("train", help="Train a zstd dictionary on recent responses")
+    train.add_argument("--samples", type=int, default=DICTIONARY_SAMPLES)
+    train.add_argument("--size", type=int, default=DICTIONARY_SIZE, help="Dictionary size in bytes")
+    stored = commands.add_parser("compress", help="Compress responses stored as plain text")
+    stored.add_argument("--batch-size", type=int, default=500)
+    stored.add_argument("--vacuum", action="store_true", help="VACUUM afterwards to shrink the file")
+    commands.add_parser("stats", help="Stored responses and bytes by codec")
+    args = parser.parse_args()
+
+    from sqlalchemy import text
+
+    from .database import SessionLocal, engine, init_db
+    from .search import ensure_search_index
+
+    init_db()
+    # Compressing under an index's triggers from before compression existed
+    # would empty the indexed texts
+    ensure_search_index()
+    db_session = SessionLocal()
+    try:
+        if args.command == "train":
+            row = train_dictionary(db_session, args.samples, args.size)
+            print(f"Stored dictionary {row.id} ({len(row.data)} bytes, {row.samples} samples)")
+            print("New responses use it once the server restarts")
+        elif args.command == "compress":
+            rows, before, after = compress_stored(db_session, args.batch_size)
+            ratio = f" ({before / after:.1f}x)" if after else ""
+            print(f"Compressed {rows} responses with {write_codec()}: {before} -> {after} bytes{ratio}")
+            if args.vacuum:
+                db_session.close()
+                with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                    conn.execute(text("VACUUM"))
+        else:
+            rows = db_session.execute(
+                text(
+                    "SELECT response_codec, COUNT(*), SUM(LENGTH(CAST(response_text AS BLOB))), "
+                    "SUM(LENGTH(response_body)) FROM model_responses GROUP BY response_codec"
+                )
+            )
+            for codec, count, text_bytes, body_bytes in rows:
+                print(f"{codec or 'plain':12} {count:>9} rows {(text_bytes or 0) + (body_bytes or 0):>14} bytes")
+    except RuntimeError as e:
+        sys.exit(str(e))
+    finally:
+        db_session.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,505 @@
+"""
+Run coordination between workers.
+
+With RUN_BACKEND=local (the default) runs live in the process that started
+them (runs.RunManager), which is all a single worker needs. RUN_BACKEND=sql
+shares them through the database so several uvicorn workers, or nodes on a
+shared Postgres, can serve the same run:
+
+- A worker claims a prompt's run by inserting its generation_runs row; a
+  partial unique index allows one running run per prompt and run key, so
+  concurrent claims on other workers fail and they follow the winner
+  instead.
+- The owner generates as usual, and appends the run's updates to run_events
+  every RUN_FLUSH_INTERVAL seconds through the response writer, refreshing
+  its heartbeat. Its own clients read the in-memory ring buffer.
+- Other workers stream a run by polling run_events after the last sequence
+  they sent (RemoteRun), so Last-Event-ID resumes work across workers too,
+  and mark it watched so the owner does not cancel it as orphaned.
+- A run whose owner stopped heartbeating for RUN_OWNER_TIMEOUT seconds is
+  abandoned: followers end the stream and the next request starts over.
+- Runs are deleted, with their logs, RUN_RETENTION seconds after they end.
+
+Background work that must run on one worker only (batch jobs, prompt sweeps,
+canary probes) is claimed through a lease whatever the RUN_BACKEND: a
+worker_leases row naming the work, held by the worker that inserted it and
+renewed while it works. Once it has gone LEASE_TTL seconds without renewal
+(its holder died), another worker takes it over.
+"""
+import asyncio
+import json
+import os
+import socket
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Union
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .database import SessionLocal
+from .fanout import FanoutEngine, TokenEvent
+from .models import GenerationRun, RunEvent, WorkerLease
+from .persistence import ResponseWriter, response_writer
+from .runs import RESET, Event, Run, RunManager
+from .schemas import StreamUpdate
+
+RUN_BACKEND = os.getenv("RUN_BACKEND", "local")  # 'local' or 'sql'
+# Seconds between appends of a run's updates to run_events
+RUN_FLUSH_INTERVAL = float(os.getenv("RUN_FLUSH_INTERVAL", "0.05"))
+# Seconds between polls of run_events by workers following another's run
+RUN_POLL_INTERVAL = float(os.getenv("RUN_POLL_INTERVAL", "0.05"))
+# Seconds without a heartbeat after which a run's owner is presumed dead
+RUN_OWNER_TIMEOUT = float(os.getenv("RUN_OWNER_TIMEOUT", "15"))
+# Seconds a lease on background work lasts unless its holder renews it
+LEASE_TTL = float(os.getenv("LEASE_TTL", "30"))
+
+HEARTBEAT_INTERVAL = 1.0
+POLL_BATCH = 1000
+
+
+def encode_update(update: Event) -> str:
+    if isinstance(update, TokenEvent):
+        return json.dumps(["t", *update])
+    return json.dumps(["u", update.dict(exclude_none=True)])
+
+
+def decode_update(payload: str) -> Event:
+    kind, *fields = json.loads(payload)
+    if kind == "t":
+        return TokenEvent(*fields)
+    return StreamUpdate(**fields[0])
+
+
+def _utcnow() -> datetime:
+    return datetime.utcnow()
+
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def acquire_lease(name: str, owner: str, ttl: float = LEASE_TTL) -> bool:
+    """Take or renew lease `name` unless another worker holds it (blocking)"""
+    now = _utcnow()
+    expires_at = now + timedelta(seconds=ttl)
+    db_session = SessionLocal()
+    try:
+        taken = (
+            db_session.query(WorkerLease)
+            .filter(
+                WorkerLease.name == name,
+                or_(WorkerLease.owner == owner, WorkerLease.expires_at < now),
+            )
+            .update({"owner": owner, "expires_at": expires_at}, synchronize_session=False)
+        )
+        if not taken:
+            db_session.add(WorkerLease(name=name, owner=owner, expires_at=expires_at))
+        try:
+            db_session.commit()
+        except IntegrityError:
+            # Held by another worker, or just inserted by one
+            db_session.rollback()
+            return False
+        return True
+    finally:
+        db_session.close()
+
+
+def release_lease(name: str, owner: str):
+    db_session = SessionLocal()
+    try:
+        db_session.query(WorkerLease).filter(
+            WorkerLease.name == name, WorkerLease.owner == owner
+        ).delete(synchronize_session=False)
+        db_session.commit()
+    finally:
+        db_session.close()
+
+
+def held_leases(prefix: str) -> List[str]:
+    """Names of the unexpired leases starting with `prefix` (blocking)"""
+    db_session = SessionLocal()
+    try:
+        return [
+            name
+            for (name,) in db_session.query(WorkerLease.name).filter(
+                WorkerLease.name.startswith(prefix), WorkerLease.expires_at >= _utcnow()
+            )
+        ]
+    finally:
+        db_session.close()
+
+
+@asynccontextmanager
+async def leased(name: str, executor=None, ttl: float = LEASE_TTL) -> AsyncIterator[bool]:
+    """Hold lease `name` for the body of the block; yields whether it was taken
+
+    The lease is renewed every third of `ttl`. Should a renewal find it
+    taken over (this worker stalled past the ttl), the block's task is
+    cancelled rather than left working alongside the new holder.
+    """
+    loop = asyncio.get_running_loop()
+    owner = worker_id()
+    if not await loop.run_in_executor(executor, acquire_lease, name, owner, ttl):
+        yield False
+        return
+    holder = asyncio.current_task()
+
+    async def renew():
+        while True:
+            await asyncio.sleep(ttl / 3)
+            try:
+                held = await loop.run_in_executor(executor, acquire_lease, name, owner, ttl)
+            except Exception as e:
+                print(f"Warning: renewing lease {name} failed: {e}")
+                continue
+            if not held:
+                print(f"Warning: lease {name} was taken over by another worker; stopping")
+                holder.cancel()
+                return
+
+    renewer = asyncio.create_task(renew())
+    try:
+        yield True
+    finally:
+        renewer.cancel()
+        try:
+            await loop.run_in_executor(executor, release_lease, name, owner)
+        except Exception as e:
+            # It expires on its own
+            print(f"Warning: releasing lease {name} failed: {e}")
+
+
+class MirroredRun(Run):
+    """A run whose updates are also queued for appending to run_events"""
+
+    def __init__(self, models: List[str], key: str):
+        super().__init__(models, key)
+        self.pending: List[Tuple[int, Event]] = []
+
+    def publish(self, event: Event) -> int:
+        seq = super().publish(event)
+        self.pending.append((seq, event))
+        return seq
+
+
+class RemoteRun:
+    """A run owned by another worker, streamed from run_events"""
+
+    def __init__(self, manager: "SqlRunManager", record: dict):
+        self.manager = manager
+        self.id = record["id"]
+        self.models = json.loads(record["models"])
+        self.key = record["run_key"]
+        self.finished = record["status"] != "running"
+        self.subscribers = 0
+        # Watched from this worker and generated on another
+        self.shared = True
+
+    async def subscribe(
+        self, after: int = 0, reset: bool = False, heartbeat: Optional[float] = None
+    ) -> AsyncIterator[Optional[Tuple[Optional[int], object]]]:
+        """Same contract as Run.subscribe; the log is complete, so no snapshots"""
+        self.subscribers += 1
+        loop = asyncio.get_running_loop()
+        watched_at = 0.0
+        try:
+            if reset:
+                yield None, RESET
+                after = 0
+            while True:
+                status, rows = await run_in_threadpool(self.manager.read_events, self.id, after)
+                for seq, payload in rows:
+                    after = seq
+                    yield seq, decode_update(payload)
+                if len(rows) == POLL_BATCH:
+                    continue
+                if status != "running":
+                    return
+                if loop.time() - watched_at >= self.manager.orphan_timeout / 3:
+                    watched_at = loop.time()
+                    self.manager.writer.run_task(self.manager.touch_watched(self.id))
+                await asyncio.sleep(self.manager.poll_interval)
+                if heartbeat is not None:
+                    yield None
+        finally:
+            self.subscribers -= 1
+
+
+class SqlRunManager(RunManager):
+    """RunManager sharing runs between workers through the database"""
+
+    def __init__(
+        self,
+        engine: FanoutEngine,
+        writer: Optional[ResponseWriter] = None,
+        poll_interval: float = RUN_POLL_INTERVAL,
+        flush_interval: float = RUN_FLUSH_INTERVAL,
+        owner_timeout: float = RUN_OWNER_TIMEOUT,
+        **kwargs,
+    ):
+        super().__init__(engine, **kwargs)
+        self.writer = writer or response_writer
+        self.poll_interval = poll_interval
+        self.flush_interval = flush_interval
+        self.owner_timeout = owner_timeout
+        self.worker_id = worker_id()
+        # Claims in flight per prompt and run key, shared by concurrent starts on this worker
+        self._claims: Dict[Tuple[int, str], asyncio.Future] = {}
+
+    async def find(
+        self, prompt_id: int, key: Optional[str] = None
+    ) -> Optional[Union[Run, RemoteRun]]:
+        run = await super().find(prompt_id, key)
+        if run is not None and not (key is None and run.finished):
+            return run
+        record = await run_in_threadpool(self._latest_record, prompt_id, key)
+        if record is None:
+            return run
+        return RemoteRun(self, record)
+
+    def _latest_record(self, prompt_id: int, key: Optional[str] = None) -> Optional[dict]:
+        """The prompt's live run, or one finished within the retention period
+
+        Only runs of `key` if given.
+        """
+        now = _utcnow()
+        db_session = SessionLocal()
+        try:
+            runs = db_session.query(GenerationRun).filter(GenerationRun.prompt_id == prompt_id)
+            if key is not None:
+                runs = runs.filter(GenerationRun.run_key == key)
+            record = runs.filter(
+                GenerationRun.status == "running",
+                GenerationRun.heartbeat_at >= now - timedelta(seconds=self.owner_timeout),
+            ).first()
+            if record is not None:
+                return _record_dict(record)
+            record = (
+                runs.filter(
+                    GenerationRun.status == "finished",
+                    GenerationRun.finished_at >= now - timedelta(seconds=self.retention),
+                )
+                .order_by(GenerationRun.finished_at.desc())
+                .first()
+            )
+            return _record_dict(record) if record is not None else None
+        finally:
+            db_session.close()
+
+    def _new_run(self, models: List[str], key: str) -> Run:
+        return MirroredRun(models, key)
+
+    async def _register(self, prompt_id: int, run: Run) -> Union[Run, RemoteRun]:
+        claim = (prompt_id, run.key)
+        existing = self.runs.get(claim)
+        if existing is not None and not existing.finished:
+            return existing
+        pending = self._claims.get(claim)
+        while pending is not None:
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise
+                # The claiming request went away; claim in its place
+                pending = self._claims.get(claim)
+        pending = self._claims[claim] = asyncio.get_running_loop().create_future()
+        try:
+            winner = await self._claim_or_follow(prompt_id, run)
+            pending.set_result(winner)
+            return winner
+        except asyncio.CancelledError:
+            pending.cancel()
+            raise
+        except Exception as e:
+            pending.set_exception(e)
+            raise
+        finally:
+            del self._claims[claim]
+
+    async def _claim_or_follow(self, prompt_id: int, run: Run) -> Union[Run, RemoteRun]:
+        while True:
+            claimed, winner = await asyncio.wrap_future(
+                self.writer.run_task(self._claim(prompt_id, run))
+            )
+            if claimed:
+                self.runs[(prompt_id, run.key)] = run
+                return run
+            if winner is not None:
+                return RemoteRun(self, winner)
+            # The winner finished before it could be read; claim again
+
+    def _claim(self, prompt_id: int, run: Run):
+        def task(db_session: Session) -> Tuple[bool, Optional[dict]]:
+            """(claimed, the running run that won otherwise)"""
+            now = _utcnow()
+            # Take over from an owner that stopped heartbeating
+            db_session.query(GenerationRun).filter(
+                GenerationRun.prompt_id == prompt_id,
+                GenerationRun.run_key == run.key,
+                GenerationRun.status == "running",
+                GenerationRun.heartbeat_at < now - timedelta(seconds=self.owner_timeout),
+            ).update({"status": "abandoned", "finished_at": now}, synchronize_session=False)
+            try:
+                # A savepoint: a lost claim must not undo the takeover above
+                with db_session.begin_nested():
+                    db_session.add(
+                        GenerationRun(
+                            id=run.id,
+                            prompt_id=prompt_id,
+                            models=json.dumps(run.models),
+                            run_key=run.key,
+                            status="running",
+                            owner=self.worker_id,
+                            heartbeat_at=now,
+                        )
+                    )
+            except IntegrityError:
+                record = (
+                    db_session.query(GenerationRun)
+                    .filter(
+                        GenerationRun.prompt_id == prompt_id,
+                        GenerationRun.run_key == run.key,
+                        GenerationRun.status == "running",
+                    )
+                    .first()
+                )
+                return False, _record_dict(record) if record is not None else None
+            return True, None
+
+        return task
+
+    async def _pump(self, prompt_id: int, run: Run, *args):
+        mirror = asyncio.create_task(self._mirror(run))
+        try:
+            await super()._pump(prompt_id, run, *args)
+        finally:
+            # Not cancelled: that would also cancel an append it has queued
+            await mirror
+            await asyncio.wrap_future(self.writer.run_task(self._append(run, finished=True)))
+
+    async def _mirror(self, run: MirroredRun):
+        """Append pending updates periodically until the run finishes"""
+        loop = asyncio.get_running_loop()
+        heartbeat_at = loop.time()
+        while not run.finished:
+            await asyncio.sleep(self.flush_interval)
+            if run.pending or loop.time() - heartbeat_at >= HEARTBEAT_INTERVAL:
+                heartbeat_at = loop.time()
+                await asyncio.wrap_future(self.writer.run_task(self._append(run)))
+
+    def _append(self, run: MirroredRun, finished: bool = False):
+        """Writer task appending the run's pending updates and refreshing its row"""
+        pending, run.pending = run.pending, []
+
+        def task(db_session: Session):
+            now = _utcnow()
+            db_session.bulk_insert_mappings(
+                RunEvent,
+                [
+                    {"run_id": run.id, "seq": seq, "payload": encode_update(update)}
+                    for seq, update in pending
+                ],
+            )
+            values = {"heartbeat_at": now}
+            if finished:
+                values.update(status="finished", finished_at=now)
+            db_session.query(GenerationRun).filter(GenerationRun.id == run.id).update(
+                values, synchronize_session=False
+            )
+            if finished:
+                self._purge(db_session, now)
+
+        return task
+
+    def _purge(self, db_session: Session, now: datetime):
+        """Delete runs past their retention, and their logs
+
+        That is runs that ended longer ago, and runs whose owner died that
+        long before anyone took over from it.
+        """
+        cutoff = now - timedelta(seconds=self.retention)
+        expired = db_session.query(GenerationRun.id).filter(
+            or_(
+                (GenerationRun.status != "running") & (GenerationRun.finished_at < cutoff),
+                (GenerationRun.status == "running")
+                & (GenerationRun.heartbeat_at < cutoff - timedelta(seconds=self.owner_timeout)),
+            )
+        )
+        expired_ids = [run_id for (run_id,) in expired]
+        if not expired_ids:
+            return
+        db_session.query(RunEvent).filter(RunEvent.run_id.in_(expired_ids)).delete(
+            synchronize_session=False
+        )
+        db_session.query(GenerationRun).filter(GenerationRun.id.in_(expired_ids)).delete(
+            synchronize_session=False
+        )
+
+    def read_events(self, run_id: str, after: int) -> Tuple[str, List[Tuple[int, str]]]:
+        """Run status and updates after `after` (blocking)
+
+        The status is read first: a run seen finished has all its updates
+        written, so an empty read after it means the log is complete.
+        """
+        db_session = SessionLocal()
+        try:
+            record = db_session.get(GenerationRun, run_id)
+            status = record.status
+            if status == "running" and record.heartbeat_at < _utcnow() - timedelta(
+                seconds=self.owner_timeout
+            ):
+                status = "abandoned"
+            rows = (
+                db_session.query(RunEvent.seq, RunEvent.payload)
+                .filter(RunEvent.run_id == run_id, RunEvent.seq > after)
+                .order_by(RunEvent.seq)
+                .limit(POLL_BATCH)
+                .all()
+            )
+            return status, [(seq, payload) for seq, payload in rows]
+        finally:
+            db_session.close()
+
+    def touch_watched(self, run_id: str):
+        def task(db_session: Session):
+            db_session.query(GenerationRun).filter(GenerationRun.id == run_id).update(
+                {"watched_at": _utcnow()}, synchronize_session=False
+            )
+
+        return task
+
+    async def _watched_elsewhere(self, run: Run) -> bool:
+        def watched_at() -> Optional[datetime]:
+            db_session = SessionLocal()
+            try:
+                return db_session.query(GenerationRun.watched_at).filter(
+                    GenerationRun.id == run.id
+                ).scalar()
+            finally:
+                db_session.close()
+
+        last = await run_in_threadpool(watched_at)
+        return last is not None and last >= _utcnow() - timedelta(seconds=self.orphan_timeout)
+
+
+def _record_dict(record: GenerationRun) -> dict:
+    return {
+        "id": record.id,
+        "models": record.models,
+        "run_key": record.run_key,
+        "status": record.status,
+    }
+
+
+def create_run_manager(engine: FanoutEngine) -> RunManager:
+    """Run manager for the configured RUN_BACKEND"""
+    if RUN_BACKEND == "sql":
+        return SqlRunManager(engine)
+    if RUN_BACKEND != "local":
+        raise ValueError(f"Unknown RUN_BACKEND {RUN_BACKEND!r}; expected 'local' or 'sql'")
+    return RunManager(engine)
@@ -1,7 +1,11 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
+import time
+
+from .compression import decode_response
 
 # SQLite database URL
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./llm_comparison.db")
@@ -9,8 +13,28 @@ SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./llm_comparison.
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
 )
+
+if engine.dialect.name == "sqlite":
+
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        """Let readers run alongside the single writer and wait out brief locks"""
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        # Durable across application crashes in WAL mode; only power loss can
+        # drop the last commits, in exchange for no fsync per transaction
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))}")
+        cursor.close()
+        # Lets SQL (the full-text index) read compressed responses
+        dbapi_connection.create_function("decode_response", 3, decode_response, deterministic=True)
+
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Indexes replaced since, by table; dropped from existing databases
+REPLACED_INDEXES = {"generation_runs": ["ux_generation_runs_running_prompt"]}
+
 Base = declarative_base()
 
 
@@ -23,7 +47,53 @@ def get_db():
         db.close()
 
 
-def init_db():
-    """Initialize database tables"""
-    Base.metadata.create_all(bind=engine)
+def init_db(attempts: int = 5):
+    """Initialize database tables
+
+    Workers starting together race to create the same tables; the losers
+    fail on what the winner just created and try again, finding it there.
+    """
+    for attempt in range(attempts):
+        try:
+            Base.metadata.create_all(bind=engine)
+            _add_missing_columns()
+            _add_missing_indexes()
+            return
+        except OperationalError:
+            if attempt == attempts - 1:
+                raise
+            time.sleep(0.2 * (attempt + 1))
+
+
+def _add_missing_columns():
+    """Add columns introduced after an existing database was created"""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = (
+                    f"ALTER TABLE {table.name} ADD COLUMN {column.name} "
+                    f"{column.type.compile(dialect=engine.dialect)}"
+                )
+                if column.server_default is not None and isinstance(
+                    column.server_default.arg, str
+                ):
+                    ddl += f" DEFAULT '{column.server_default.arg}'"
+                conn.execute(text(ddl))
+
 
+def _add_missing_indexes():
+    """Create indexes introduced after an existing database was created"""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {index["name"] for index in inspector.get_indexes(table.name)}
+            for name in REPLACED_INDEXES.get(table.name, ()):
+                if name in existing:
+                    conn.execute(text(f"DROP INDEX {name}"))
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(bind=conn)
@@ -0,0 +1,106 @@
+import asyncio
+import json
+import os
+from dataclasses import dataclass, replace
+from functools import lru_cache
+from typing import Optional
+
+
+@dataclass(frozen=True)
+class Deadlines:
+    """Per-generation time limits, all in seconds"""
+
+    ttft: float  # from request start to the first chunk
+    idle: float  # maximum gap between two consecutive chunks
+    total: float  # from request start to the last chunk
+
+
+class GenerationTimeout(Exception):
+    """Raised when a model misses one of its deadlines"""
+
+    def __init__(self, model_name: str, phase: str, limit: float):
+        self.model_name = model_name
+        self.phase = phase
+        self.limit = limit
+        super().__init__(
+            f"{model_name} timed out: no {PHASE_DESCRIPTIONS[phase]} within {limit:g}s"
+        )
+
+
+PHASE_DESCRIPTIONS = {
+    "ttft": "first token",
+    "idle": "new token",
+    "total": "complete response",
+}
+
+
+@lru_cache(maxsize=1)
+def _load_overrides() -> dict:
+    # e.g. MODEL_TIMEOUT_OVERRIDES='{"xai.": {"ttft": 30}, "google.gemini-2.5-pro": {"total": 600}}'
+    raw = os.getenv("MODEL_TIMEOUT_OVERRIDES")
+    return json.loads(raw) if raw else {}
+
+
+@lru_cache(maxsize=None)
+def get_deadlines(model_key: str) -> Deadlines:
+    """Resolve deadlines for a model: defaults, then provider prefix, then exact key"""
+    deadlines = Deadlines(
+        ttft=float(os.getenv("MODEL_TTFT_TIMEOUT", "60")),
+        idle=float(os.getenv("MODEL_IDLE_TIMEOUT", "30")),
+        total=float(os.getenv("MODEL_TOTAL_TIMEOUT", "300")),
+    )
+    overrides = _load_overrides()
+    # Shorter prefixes first so the most specific match wins
+    for pattern in sorted(overrides, key=len):
+        if model_key == pattern or (pattern.endswith(".") and model_key.startswith(pattern)):
+            deadlines = replace(
+                deadlines, **{k: float(v) for k, v in overrides[pattern].items()}
+            )
+    return deadlines
+
+
+class Watchdog:
+    """Cancels the current task when a generation misses one of its deadlines
+
+    A single timer is kept per generation; receiving a chunk only records a
+    timestamp and the timer re-arms itself lazily when it fires early.
+    """
+
+    def __init__(self, deadlines: Deadlines):
+        self.deadlines = deadlines
+        self.loop = asyncio.get_running_loop()
+        self.task = asyncio.current_task()
+        self.started_at = self.loop.time()
+        self.last_chunk_at: Optional[float] = None
+        self.expired: Optional[str] = None
+        self._handle = self.loop.call_at(self._next_deadline()[0], self._check)
+
+    def _next_deadline(self):
+        total = (self.started_at + self.deadlines.total, "total")
+        if self.last_chunk_at is None:
+            gap = (self.started_at + self.deadlines.ttft, "ttft")
+        else:
+            gap = (self.last_chunk_at + self.deadlines.idle, "idle")
+        return min(total, gap)
+
+    def _check(self):
+        when, phase = self._next_deadline()
+        if self.loop.time() >= when:
+            self.expired = phase
+            self.task.cancel()
+        else:
+            self._handle = self.loop.call_at(when, self._check)
+
+    def chunk_received(self):
+        self.last_chunk_at = self.loop.time()
+
+    def stop(self):
+        self._handle.cancel()
+
+    def timeout_error(self, model_name: str) -> GenerationTimeout:
+        """Turn the watchdog's cancellation back into a timeout error"""
+        if hasattr(self.task, "uncancel"):
+            self.task.uncancel()
+        return GenerationTimeout(
+            model_name, self.expired, getattr(self.deadlines, self.expired)
+        )
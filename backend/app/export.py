@@ -0,0 +1,189 @@
+"""
+Streaming export of the comparison history.
+
+One record per model response with its prompt's text, in response id order.
+Rows are read through a server-side cursor (stream_results) in batches of
+EXPORT_BATCH_ROWS and written out batch by batch, so memory stays flat
+however large the history is. Compressed responses are decoded.
+
+Formats:
+
+- ndjson: one JSON object per line (also served by GET /api/export)
+- parquet: one row group per batch; needs pyarrow, which is optional
+
+Usage (from the backend directory):
+    uv run python -m app.export --output history.ndjson
+    uv run python -m app.export --format parquet --output history.parquet --start 2025-06-01
+"""
+import argparse
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional
+
+from sqlalchemy import String, literal, select, type_coerce
+from sqlalchemy.orm import Session
+
+from .compression import decode_response
+from .models import ModelResponse, Prompt
+
+# Rows fetched from the cursor and written at a time
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "1000"))
+
+# Exported fields and their Parquet types
+FIELDS = {
+    "response_id": "int64",
+    "prompt_id": "int64",
+    "job_id": "int64",
+    "prompt_text": "string",
+    "model_name": "string",
+    "model_id": "string",
+    "status": "string",
+    "error": "string",
+    "response_text": "string",
+    "time_to_first_token": "float64",
+    "total_time": "float64",
+    "queue_wait_time": "float64",
+    "prompt_tokens": "int64",
+    "completion_tokens": "int64",
+    "token_count_source": "string",
+    "cached": "bool",
+    "created_at": "string",  # as stored: UTC, 'YYYY-MM-DD HH:MM:SS'
+}
+
+
+def export_batches(
+    db_session: Session,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    models: Optional[List[str]] = None,
+    batch_size: int = EXPORT_BATCH_ROWS,
+) -> Iterator[List[Dict]]:
+    """Exported records in batches of up to `batch_size`
+
+    `start` / `end` (naive UTC) bound created_at; `models` restricts the
+    responses to those models.
+    """
+    statement = (
+        select(
+            ModelResponse.id,
+            ModelResponse.prompt_id,
+            Prompt.job_id,
+            Prompt.text,
+            ModelResponse.model_name,
+            ModelResponse.model_id,
+            ModelResponse.status,
+            ModelResponse.error,
+            ModelResponse.response_codec,
+            ModelResponse.response_body,
+            ModelResponse.stored_text,
+            ModelResponse.time_to_first_token,
+            ModelResponse.total_time,
+            ModelResponse.queue_wait_time,
+            ModelResponse.prompt_tokens,
+            ModelResponse.completion_tokens,
+            ModelResponse.token_count_source,
+            ModelResponse.cached,
+            type_coerce(ModelResponse.created_at, String),
+        )
+        .join(Prompt, Prompt.id == ModelResponse.prompt_id)
+        .order_by(ModelResponse.id)
+    )
+    # created_at holds CURRENT_TIMESTAMP text (whole seconds), as in analytics.py
+    created_at = type_coerce(ModelResponse.created_at, String)
+    if start is not None:
+        statement = statement.where(created_at >= literal(start.strftime("%Y-%m-%d %H:%M:%S"), String))
+    if end is not None:
+        if end.microsecond:
+            end = end.replace(microsecond=0) + timedelta(seconds=1)
+        statement = statement.where(created_at < literal(end.strftime("%Y-%m-%d %H:%M:%S"), String))
+    if models:
+        statement = statement.where(ModelResponse.model_name.in_(models))
+
+    result = db_session.execute(statement.execution_options(yield_per=batch_size))
+    for rows in result.partitions():
+        yield [
+            {
+                "response_id": row[0],
+                "prompt_id": row[1],
+                "job_id": row[2],
+                "prompt_text": row[3],
+                "model_name": row[4],
+                "model_id": row[5],
+                "status": row[6],
+                "error": row[7],
+                "response_text": decode_response(row[8], row[9], row[10]),
+                "time_to_first_token": row[11],
+                "total_time": row[12],
+                "queue_wait_time": row[13],
+                "prompt_tokens": row[14],
+                "completion_tokens": row[15],
+                "token_count_source": row[16],
+                "cached": bool(row[17]),
+                "created_at": row[18],
+            }
+            for row in rows
+        ]
+
+
+def ndjson_chunks(batches: Iterator[List[Dict]]) -> Iterator[bytes]:
+    """One chunk of newline-terminated JSON records per batch"""
+    for batch in batches:
+        yield "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in batch).encode("utf-8")
+
+
+def write_parquet(batches: Iterator[List[Dict]], path: str) -> int:
+    """Write the batches as row groups of a Parquet file; returns the row count"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+    schema = pa.schema([(name, getattr(pa, type_name)()) for name, type_name in FIELDS.items()])
+    rows = 0
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        for batch in batches:
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+            rows += len(batch)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--format", choices=("ndjson", "parquet"), default="ndjson")
+    parser.add_argument("--output", help="Output file (default: stdout, ndjson only)")
+    parser.add_argument("--start", type=datetime.fromisoformat, help="Created at or after (UTC)")
+    parser.add_argument("--end", type=datetime.fromisoformat, help="Created before (UTC)")
+    parser.add_argument("--models", nargs="+", help="Only responses of these models")
+    parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_ROWS)
+    args = parser.parse_args()
+    if args.format == "parquet" and not args.output:
+        parser.error("--output is required for parquet")
+
+    from .database import SessionLocal, init_db
+
+    init_db()
+    db_session = SessionLocal()
+    try:
+        batches = export_batches(db_session, args.start, args.end, args.models, args.batch_size)
+        if args.format == "parquet":
+            try:
+                rows = write_parquet(batches, args.output)
+            except RuntimeError as e:
+                sys.exit(str(e))
+            print(f"Exported {rows} responses to {args.output}", file=sys.stderr)
+            return
+        output = open(args.output, "wb") if args.output else sys.stdout.buffer
+        try:
+            for chunk in ndjson_chunks(batches):
+                output.write(chunk)
+        finally:
+            if args.output:
+                output.close()
+    finally:
+        db_session.close()
+
+
+if __name__ == "__main__":
+    main()
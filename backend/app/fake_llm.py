@@ -0,0 +1,224 @@
+"""
+Local stand-in chat models for benchmarking the service without OCI.
+
+Models named in FAKE_LLM_MODELS (comma-separated, e.g. fake.fast,fake.slow)
+share the FAKE_LLM_* settings below. FAKE_LLM_CONFIG, a JSON object (inline
+or the path of a JSON file), adds models or overrides settings per model,
+using FakeChatModel's field names:
+
+    {"fake.fast": {"time_to_first_token": 0.05},
+     "fake.flaky": {"delay_distribution": "lognormal", "delay_jitter": 0.5,
+                    "error_rate": 0.05, "throttle_rate": 0.02}}
+
+Fake model keys must start with "fake.". Set FAKE_LLM_SEED for the same
+sequence of delays, lengths and failures on every run.
+"""
+import asyncio
+import json
+import math
+import os
+import random
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+FAKE_WORDS = (
+    "Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod "
+    "tempor incididunt ut labore et dolore magna aliqua."
+).split()
+
+
+DELAY_DISTRIBUTIONS = ("fixed", "uniform", "exponential", "lognormal")
+
+
+class FakeProviderError(Exception):
+    """Injected provider failure; status_code 429 counts as throttling"""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(f"{status_code} {message}")
+        self.status_code = status_code
+
+
+class FakeChatModel(BaseChatModel):
+    """Local stand-in chat model that streams canned tokens
+
+    Delays (TTFT and between tokens) are drawn around their configured mean
+    from `delay_distribution`; `delay_jitter` is the spread as a fraction of
+    the mean (uniform: +/- that much, lognormal: sigma). Output length varies
+    uniformly by +/- `length_jitter`. With `error_rate` / `throttle_rate` a
+    generation fails with a 500 / 429 at a random point of the stream,
+    before the first token included.
+    """
+
+    time_to_first_token: float = 0.2  # in seconds
+    token_delay: float = 0.02  # in seconds, between consecutive tokens
+    output_tokens: int = 50
+    report_usage: bool = True  # usage_metadata on the last chunk, like OpenAI
+    delay_distribution: str = "fixed"
+    delay_jitter: float = 0.0
+    length_jitter: float = 0.0
+    error_rate: float = 0.0
+    throttle_rate: float = 0.0
+    seed: Optional[int] = None
+    # Reported as the serving model on the last chunk, like OpenAI's model_name
+    model_version: Optional[str] = None
+
+    _rng: random.Random = PrivateAttr(default_factory=random.Random)
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        if self.delay_distribution not in DELAY_DISTRIBUTIONS:
+            raise ValueError(
+                f"Unknown delay_distribution {self.delay_distribution!r}; "
+                f"expected one of {', '.join(DELAY_DISTRIBUTIONS)}"
+            )
+        self._rng = random.Random(self.seed)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    def _delay(self, mean: float) -> float:
+        if mean <= 0 or self.delay_distribution == "fixed":
+            return mean
+        if self.delay_distribution == "uniform":
+            return self._rng.uniform(mean * (1 - self.delay_jitter), mean * (1 + self.delay_jitter))
+        if self.delay_distribution == "exponential":
+            return self._rng.expovariate(1 / mean)
+        # Lognormal with the configured mean: heavy right tail, like real ITL
+        sigma = self.delay_jitter
+        return self._rng.lognormvariate(math.log(mean) - sigma**2 / 2, sigma)
+
+    def _plan(self) -> Tuple[List[str], List[float], Optional[FakeProviderError], int]:
+        """Tokens, the delay before each, and the failure to raise before token `fail_at`"""
+        length = self.output_tokens
+        if self.length_jitter:
+            spread = int(self.output_tokens * self.length_jitter)
+            length = max(1, self._rng.randint(length - spread, length + spread))
+        tokens = [FAKE_WORDS[i % len(FAKE_WORDS)] + " " for i in range(length)]
+        delays = [
+            max(0.0, self._delay(self.time_to_first_token if i == 0 else self.token_delay))
+            for i in range(length)
+        ]
+        error, fail_at = None, length
+        draw = self._rng.random()
+        if draw < self.throttle_rate:
+            error = FakeProviderError(429, "Too Many Requests (injected)")
+        elif draw < self.throttle_rate + self.error_rate:
+            error = FakeProviderError(500, "Internal Server Error (injected)")
+        if error is not None:
+            fail_at = self._rng.randrange(length)
+        return tokens, delays, error, fail_at
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        text = "".join(chunk.message.content for chunk in self._stream(messages))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _chunk(
+        self, messages: List[BaseMessage], i: int, token: str, length: int
+    ) -> ChatGenerationChunk:
+        usage = None
+        metadata = {}
+        if self.model_version and i == length - 1:
+            metadata["model_name"] = self.model_version
+        if self.report_usage and i == length - 1:
+            prompt_tokens = sum(len(str(message.content).split()) for message in messages)
+            usage = {
+                "input_tokens": prompt_tokens,
+                "output_tokens": length,
+                "total_tokens": prompt_tokens + length,
+            }
+        return ChatGenerationChunk(
+            message=AIMessageChunk(content=token, usage_metadata=usage, response_metadata=metadata)
+        )
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        tokens, delays, error, fail_at = self._plan()
+        for i, token in enumerate(tokens):
+            time.sleep(delays[i])
+            if i == fail_at:
+                raise error
+            yield self._chunk(messages, i, token, len(tokens))
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        tokens, delays, error, fail_at = self._plan()
+        for i, token in enumerate(tokens):
+            await asyncio.sleep(delays[i])
+            if i == fail_at:
+                raise error
+            yield self._chunk(messages, i, token, len(tokens))
+
+
+def _default_settings() -> Dict[str, Any]:
+    settings = {
+        "time_to_first_token": float(os.getenv("FAKE_LLM_TTFT", "0.2")),
+        "token_delay": float(os.getenv("FAKE_LLM_TOKEN_DELAY", "0.02")),
+        "output_tokens": int(os.getenv("FAKE_LLM_OUTPUT_TOKENS", "50")),
+        "report_usage": os.getenv("FAKE_LLM_REPORT_USAGE", "true").lower() == "true",
+        "delay_distribution": os.getenv("FAKE_LLM_DELAY_DISTRIBUTION", "fixed"),
+        "delay_jitter": float(os.getenv("FAKE_LLM_DELAY_JITTER", "0")),
+        "error_rate": float(os.getenv("FAKE_LLM_ERROR_RATE", "0")),
+    }
+    if os.getenv("FAKE_LLM_SEED"):
+        settings["seed"] = int(os.getenv("FAKE_LLM_SEED"))
+    return settings
+
+
+def _load_config() -> Dict[str, Dict[str, Any]]:
+    raw = os.getenv("FAKE_LLM_CONFIG", "").strip()
+    if not raw:
+        return {}
+    try:
+        if not raw.startswith("{"):
+            with open(raw) as f:
+                raw = f.read()
+        config = json.loads(raw)
+    except (OSError, ValueError) as e:
+        print(f"Warning: ignoring FAKE_LLM_CONFIG: {e}")
+        return {}
+    models = {}
+    for model_key, overrides in config.items():
+        if not model_key.startswith("fake."):
+            print(f"Warning: fake model {model_key} in FAKE_LLM_CONFIG must start with 'fake.'")
+            continue
+        models[model_key] = overrides or {}
+    return models
+
+
+def fake_model_settings() -> Dict[str, Dict[str, Any]]:
+    """FakeChatModel arguments per configured fake model key"""
+    defaults = _default_settings()
+    config = _load_config()
+    model_keys = [key.strip() for key in os.getenv("FAKE_LLM_MODELS", "").split(",")]
+    model_keys = list(dict.fromkeys([key for key in model_keys if key] + list(config)))
+    settings = {}
+    for i, model_key in enumerate(model_keys):
+        model_settings = dict(defaults)
+        if "seed" in defaults:
+            # One seed, a different sequence per model
+            model_settings["seed"] = defaults["seed"] + i
+        model_settings.update(config.get(model_key, {}))
+        settings[model_key] = model_settings
+    return settings
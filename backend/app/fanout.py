@@ -0,0 +1,494 @@
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import Executor
+from collections import Counter
+from typing import AsyncIterator, Dict, List, NamedTuple, Optional, Set, Union
+
+from .deadlines import GenerationTimeout
+from .llm_service import LLMService
+from .metrics import (
+    COMPLETION_TOKENS,
+    GENERATION_TIME,
+    GENERATIONS,
+    PROVIDER_ERRORS,
+    QUEUE_WAIT,
+    TOKENS,
+    TTFT,
+    span,
+)
+from .persistence import ResponseWriter, response_writer
+from .response_cache import CacheEntry, ResponseCache, make_cache_key
+from .scheduler import Scheduler, is_rate_limited
+from .schemas import StreamUpdate
+from .tokens import count_usage, throughput
+from .traces import TokenTrace
+
+# Upper bound on generations running at once across all requests of a worker
+MAX_CONCURRENT_GENERATIONS = int(os.getenv("MAX_CONCURRENT_GENERATIONS", "256"))
+
+
+class TokenEvent(NamedTuple):
+    """A streamed token; kept as a plain tuple since one is built per token"""
+
+    model_name: str
+    token: str
+    time_to_first_token: Optional[float]
+    total_time: Optional[float]
+    cached: bool = False
+
+
+class FanoutEngine:
+    """Runs one prompt against many models concurrently on the event loop"""
+
+    def __init__(
+        self,
+        llm_service: LLMService,
+        executor: Executor,
+        db_executor: Executor,
+        max_concurrency: int = MAX_CONCURRENT_GENERATIONS,
+        response_cache: Optional[ResponseCache] = None,
+        writer: Optional[ResponseWriter] = None,
+    ):
+        self.llm_service = llm_service
+        self.executor = executor
+        self.db_executor = db_executor
+        self.response_cache = response_cache
+        self.writer = writer or response_writer
+        self.max_concurrency = max_concurrency
+        self.scheduler = Scheduler(max_concurrency)
+
+    async def run_model(
+        self,
+        model_name: str,
+        prompt_text: str,
+        prompt_id: int,
+        update_queue: asyncio.Queue,
+        use_cache: bool = False,
+        replay: str = "instant",
+        stream_tokens: bool = True,
+        user: str = "anonymous",
+        delay: float = 0,
+        system_prompt: Optional[str] = None,
+        params: Optional[Dict] = None,
+    ):
+        """Generate one model's response, pushing updates to the queue
+
+        With `stream_tokens` off only the terminal StreamUpdate is queued.
+        Generations are admitted by the scheduler, queued fairly per `user`,
+        after waiting `delay` seconds (a hedge's backup). `system_prompt` and
+        `params` (generation param overrides) are stored with the response,
+        as is the model ID it was served by: the one the provider reports,
+        else the configured one.
+        """
+        if delay:
+            await asyncio.sleep(delay)
+        model_id = self.llm_service.model_registry.get(model_name, model_name)
+        variant = {
+            "system_prompt": system_prompt,
+            "generation_params": json.dumps(params, sort_keys=True) if params else None,
+            "model_id": model_id,
+        }
+        cache_key = None
+        if use_cache and self.response_cache is not None:
+            key_params = self.llm_service.get_generation_params(model_name, params)
+            if system_prompt:
+                key_params["system_prompt"] = system_prompt
+            cache_key = make_cache_key(prompt_text, model_name, model_id, key_params)
+            entry = await self._cache_lookup(cache_key)
+            if entry is not None:
+                await self._replay_cached(
+                    entry, model_name, prompt_id, update_queue, replay, stream_tokens, variant
+                )
+                return
+
+        # Partial progress, saved if the generation is cancelled midway
+        response_parts = []
+        token_timings = []
+        trace = TokenTrace()
+        progress = {"started_at": None, "time_to_first_token": None, "queue_wait": None}
+        token_counter = TOKENS.labels(model_name)
+
+        def stream_callback(token: str, metrics: dict):
+            """Callback for streaming tokens"""
+            response_parts.append(token)
+            if token:  # usage-only chunks carry no text
+                trace.add(metrics.get("elapsed_time") or 0.0, len(token))
+                token_counter.inc()
+            if cache_key:
+                token_timings.append((metrics.get("elapsed_time"), token))
+            progress["time_to_first_token"] = metrics.get("time_to_first_token")
+            if not stream_tokens:
+                return
+            update_queue.put_nowait(
+                TokenEvent(
+                    model_name,
+                    token,
+                    metrics.get("time_to_first_token"),
+                    metrics.get("elapsed_time"),
+                )
+            )
+
+        async def save_partial(status: str):
+            elapsed = time.perf_counter() - progress["started_at"]
+            ttft = progress["time_to_first_token"]
+            response_text = "".join(response_parts)
+            usage = await asyncio.get_running_loop().run_in_executor(
+                self.executor, count_usage, model_name, prompt_text, response_text
+            )
+            await self.save_response(
+                prompt_id=prompt_id,
+                model_name=model_name,
+                response_text=response_text,
+                time_to_first_token=ttft if ttft is not None else elapsed,
+                total_time=elapsed,
+                status=status,
+                queue_wait_time=progress["queue_wait"],
+                token_trace=trace.encode() if len(trace) else None,
+                prompt_tokens=usage.prompt_tokens,
+                completion_tokens=usage.completion_tokens,
+                token_count_source=usage.source,
+                **variant,
+            )
+            return usage
+
+        try:
+            # The slot is released as soon as the generation ends or is cancelled.
+            # TTFT and total time are measured from admission, not from enqueue.
+            async with self.scheduler.slot(model_name, user) as ticket:
+                progress["queue_wait"] = ticket.queue_wait
+                progress["started_at"] = time.perf_counter()
+                QUEUE_WAIT.labels(model_name).observe(ticket.queue_wait)
+                try:
+                    with span("llm.generate", model=model_name, prompt_id=prompt_id):
+                        (
+                            response_text,
+                            time_to_first_token,
+                            total_time,
+                            usage,
+                        ) = await self.llm_service.agenerate_with_metrics(
+                            model_name,
+                            prompt_text,
+                            stream_callback=stream_callback,
+                            executor=self.executor,
+                            system_prompt=system_prompt,
+                            params=params,
+                        )
+                except Exception as e:
+                    ticket.failed(e)
+                    raise
+                ticket.succeeded(time_to_first_token)
+        except asyncio.CancelledError:
+            GENERATIONS.labels(model_name, "cancelled").inc()
+            cancelled_update = StreamUpdate(
+                model_name=model_name,
+                time_to_first_token=progress["time_to_first_token"],
+                is_complete=True,
+                status="cancelled",
+                queue_wait=progress["queue_wait"],
+            )
+            try:
+                if progress["started_at"] is not None:
+                    cancelled_update.total_time = time.perf_counter() - progress["started_at"]
+                    usage = await save_partial("cancelled")
+                    cancelled_update.prompt_tokens = usage.prompt_tokens
+                    cancelled_update.completion_tokens = usage.completion_tokens
+            finally:
+                # Read by race mode, which reports the losers' progress
+                update_queue.put_nowait(cancelled_update)
+            raise
+        except GenerationTimeout as e:
+            PROVIDER_ERRORS.labels(model_name, "timeout").inc()
+            GENERATIONS.labels(model_name, "timeout").inc()
+            timeout_update = StreamUpdate(
+                model_name=model_name,
+                time_to_first_token=progress["time_to_first_token"],
+                total_time=time.perf_counter() - progress["started_at"],
+                is_complete=True,
+                status="timeout",
+                error=str(e),
+                queue_wait=progress["queue_wait"],
+            )
+            update_queue.put_nowait(timeout_update)
+            await save_partial("timeout")
+            return
+        except Exception as e:
+            kind = "throttled" if is_rate_limited(e) else "error"
+            PROVIDER_ERRORS.labels(model_name, kind).inc()
+            GENERATIONS.labels(model_name, "error").inc()
+            error_update = StreamUpdate(
+                model_name=model_name,
+                is_complete=True,
+                status="error",
+                error=str(e),
+                queue_wait=progress["queue_wait"],
+            )
+            update_queue.put_nowait(error_update)
+            return
+
+        try:
+            await self.save_response(
+                prompt_id=prompt_id,
+                model_name=model_name,
+                response_text=response_text,
+                time_to_first_token=time_to_first_token,
+                total_time=total_time,
+                queue_wait_time=progress["queue_wait"],
+                token_trace=trace.encode() if len(trace) else None,
+                prompt_tokens=usage.prompt_tokens,
+                completion_tokens=usage.completion_tokens,
+                token_count_source=usage.source,
+                **dict(variant, model_id=usage.model_id or model_id),
+            )
+        except Exception as e:
+            GENERATIONS.labels(model_name, "error").inc()
+            error_update = StreamUpdate(
+                model_name=model_name, is_complete=True, status="error", error=str(e)
+            )
+            update_queue.put_nowait(error_update)
+            return
+
+        GENERATIONS.labels(model_name, "completed").inc()
+        TTFT.labels(model_name).observe(time_to_first_token)
+        GENERATION_TIME.labels(model_name).observe(total_time)
+        if usage.completion_tokens:
+            COMPLETION_TOKENS.labels(model_name).inc(usage.completion_tokens)
+
+        if cache_key:
+            await self._cache_store(
+                cache_key,
+                CacheEntry(
+                    model_name=model_name,
+                    response_text=response_text,
+                    time_to_first_token=time_to_first_token,
+                    total_time=total_time,
+                    token_timings=token_timings,
+                    stored_at=time.time(),
+                ),
+            )
+
+        completion_update = StreamUpdate(
+            model_name=model_name,
+            time_to_first_token=time_to_first_token,
+            total_time=total_time,
+            is_complete=True,
+            status="completed",
+            queue_wait=progress["queue_wait"],
+            prompt_tokens=usage.prompt_tokens,
+            completion_tokens=usage.completion_tokens,
+            **throughput(usage.completion_tokens, time_to_first_token, total_time),
+        )
+        update_queue.put_nowait(completion_update)
+
+    async def save_response(self, **fields) -> int:
+        """Persist a ModelResponse through the write-behind writer; returns its id"""
+        return await asyncio.wrap_future(self.writer.submit(**fields))
+
+    async def _cache_lookup(self, cache_key: str) -> Optional[CacheEntry]:
+        entry = self.response_cache.get_memory(cache_key)
+        if entry is not None:
+            return entry
+        loop = asyncio.get_running_loop()
+        try:
+            entry = await loop.run_in_executor(
+                self.db_executor, self.response_cache.load, cache_key
+            )
+        except Exception as e:
+            print(f"Warning: response cache lookup failed: {e}")
+            return None
+        if entry is not None:
+            self.response_cache.put_memory(cache_key, entry)
+        return entry
+
+    async def _cache_store(self, cache_key: str, entry: CacheEntry):
+        self.response_cache.put_memory(cache_key, entry)
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(
+                self.db_executor,
+                self.response_cache.store,
+                cache_key,
+                entry,
+                self.llm_service.model_registry.get(entry.model_name, entry.model_name),
+            )
+        except Exception as e:
+            print(f"Warning: response cache store failed: {e}")
+
+    async def _replay_cached(
+        self,
+        entry: CacheEntry,
+        model_name: str,
+        prompt_id: int,
+        update_queue: asyncio.Queue,
+        replay: str,
+        stream_tokens: bool = True,
+        variant: Optional[Dict] = None,
+    ):
+        """Stream a cached answer, instantly or with its original token timing"""
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        for elapsed, token in entry.token_timings:
+            if not stream_tokens:
+                break
+            if replay == "timed":
+                delay = started_at + elapsed - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            update_queue.put_nowait(
+                TokenEvent(model_name, token, entry.time_to_first_token, elapsed, True)
+            )
+
+        try:
+            await self.save_response(
+                prompt_id=prompt_id,
+                model_name=model_name,
+                response_text=entry.response_text,
+                time_to_first_token=entry.time_to_first_token,
+                total_time=entry.total_time,
+                cached=True,
+                **(variant or {}),
+            )
+        except Exception as e:
+            error_update = StreamUpdate(
+                model_name=model_name, is_complete=True, status="error", error=str(e)
+            )
+            update_queue.put_nowait(error_update)
+            return
+
+        GENERATIONS.labels(model_name, "cached").inc()
+        completion_update = StreamUpdate(
+            model_name=model_name,
+            time_to_first_token=entry.time_to_first_token,
+            total_time=entry.total_time,
+            is_complete=True,
+            status="completed",
+            cached=True,
+        )
+        update_queue.put_nowait(completion_update)
+
+    async def _cancel_losers(
+        self,
+        losers: Dict[str, asyncio.Task],
+        completed_models: Set[str],
+        update_queue: asyncio.Queue,
+    ):
+        """Cancel a race's losers; each ends with a terminal update in the queue"""
+        for task in losers.values():
+            task.cancel()
+        # Each records its partial output, then queues a "cancelled" update
+        await asyncio.gather(*losers.values(), return_exceptions=True)
+        queued = []
+        while not update_queue.empty():
+            queued.append(update_queue.get_nowait())
+        ended = completed_models | {
+            update.model_name
+            for update in queued
+            if isinstance(update, StreamUpdate) and update.is_complete
+        }
+        # Cancelled outside a generation (e.g. while saving it): no progress to report
+        for model_name in losers:
+            if model_name not in ended:
+                queued.append(
+                    StreamUpdate(model_name=model_name, is_complete=True, status="cancelled")
+                )
+        for update in queued:
+            update_queue.put_nowait(update)
+
+    async def stream(
+        self,
+        prompt_id: int,
+        prompt_text: str,
+        model_names: List[str],
+        heartbeat: Optional[float] = None,
+        use_cache: bool = False,
+        replay: str = "instant",
+        user: str = "anonymous",
+        first_k: Optional[int] = None,
+        min_tokens: Optional[int] = None,
+        start_delays: Optional[Dict[str, float]] = None,
+    ) -> AsyncIterator[Optional[Union[TokenEvent, StreamUpdate]]]:
+        """
+        Yield stream updates from all models as they arrive.
+
+        Tokens are yielded as TokenEvent and terminal updates as StreamUpdate.
+        With `heartbeat` set, None is yielded whenever no update arrived for
+        that many seconds, so consumers can flush buffered output. With
+        `use_cache`, models with a cached answer replay it ('instant' or
+        'timed') instead of generating. `user` identifies the caller for fair
+        queueing.
+
+        With `first_k` set the models race: once that many finished (completed,
+        or streamed `min_tokens` tokens if set), the other generations are
+        cancelled and end with a "cancelled" update carrying their progress.
+        Winners keep generating to completion; their terminal update has
+        their finishing position as `rank`. `start_delays` holds seconds to
+        wait before starting a model: a hedge is a race for the first token
+        (first_k=1, min_tokens=1) whose backup starts late.
+        """
+        model_names = list(dict.fromkeys(model_names))
+        update_queue: asyncio.Queue = asyncio.Queue()
+        tasks = [
+            asyncio.create_task(
+                self.run_model(
+                    model_name,
+                    prompt_text,
+                    prompt_id,
+                    update_queue,
+                    use_cache=use_cache,
+                    replay=replay,
+                    user=user,
+                    delay=(start_delays or {}).get(model_name, 0),
+                )
+            )
+            for model_name in model_names
+        ]
+
+        tasks_by_model = dict(zip(model_names, tasks))
+        winners: List[str] = []
+        token_counts: Counter = Counter()
+        completed_models = set()
+        try:
+            while len(completed_models) < len(model_names):
+                if heartbeat is None or not update_queue.empty():
+                    update = await update_queue.get()
+                else:
+                    try:
+                        update = await asyncio.wait_for(update_queue.get(), heartbeat)
+                    except asyncio.TimeoutError:
+                        yield None
+                        continue
+                if first_k is None:
+                    yield update
+                    if isinstance(update, StreamUpdate) and update.is_complete:
+                        completed_models.add(update.model_name)
+                    continue
+
+                model_name = update.model_name
+                if model_name not in winners and len(winners) < first_k:
+                    if isinstance(update, TokenEvent):
+                        if update.token and min_tokens:
+                            token_counts[model_name] += 1
+                            if token_counts[model_name] >= min_tokens:
+                                winners.append(model_name)
+                    elif update.status == "completed":
+                        winners.append(model_name)
+                if isinstance(update, StreamUpdate) and update.is_complete:
+                    completed_models.add(model_name)
+                    if model_name in winners:
+                        update = update.copy(update={"rank": winners.index(model_name) + 1})
+                yield update
+
+                if len(winners) == first_k and len(completed_models) < len(model_names):
+                    losers = {
+                        model: task
+                        for model, task in tasks_by_model.items()
+                        if model not in winners and model not in completed_models
+                    }
+                    await self._cancel_losers(losers, completed_models, update_queue)
+        finally:
+            # Reached early when the client disconnects: stop the remaining
+            # generations, which record their partial output as cancelled
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
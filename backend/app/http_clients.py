@@ -0,0 +1,126 @@
+"""
+Process-wide HTTP connection pools shared by all models of an endpoint host.
+
+Model clients used to build their own httpx.Client per model, so every model
+paid its own TLS handshake and none of them reused connections. Pools here
+are created once per (host, compartment) under a lock and kept alive.
+"""
+import asyncio
+import importlib.util
+import os
+import threading
+from typing import Callable, Dict, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+# HTTP/2 multiplexes concurrent streams over one connection, but httpx only
+# supports it when the optional 'h2' package is installed. It is opt-in: h2 is
+# not a dependency, so install httpx[http2] to enable it; otherwise pools
+# keep many HTTP/1.1 connections alive instead
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "256"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "64"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "120"))
+
+_lock = threading.Lock()
+_sync_clients: Dict[Tuple[str, str], httpx.Client] = {}
+_async_clients: Dict[Tuple[str, str], httpx.AsyncClient] = {}
+_oci_clients: Dict[str, object] = {}
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+def host_of(url: str) -> str:
+    return urlsplit(url).netloc
+
+
+def get_http_clients(
+    base_url: str, compartment_id: str, auth_factory: Callable[[], httpx.Auth]
+) -> Tuple[httpx.Client, httpx.AsyncClient]:
+    """Get the shared sync and async clients for an OpenAI-compatible endpoint"""
+    key = (host_of(base_url), compartment_id)
+    with _lock:
+        if key not in _sync_clients:
+            if not HTTP2_AVAILABLE:
+                print(f"{key[0]}: HTTP/1.1 connection pool (install httpx[http2] for HTTP/2)")
+            auth = auth_factory()
+            options = dict(
+                auth=auth,
+                headers={"CompartmentId": compartment_id},
+                limits=_limits(),
+                http2=HTTP2_AVAILABLE,
+            )
+            _sync_clients[key] = httpx.Client(**options)
+            _async_clients[key] = httpx.AsyncClient(**options)
+        return _sync_clients[key], _async_clients[key]
+
+
+def get_oci_client(service_endpoint: str, factory: Callable[[], object]):
+    """Get the shared OCI SDK inference client for an endpoint host"""
+    key = host_of(service_endpoint)
+    with _lock:
+        if key not in _oci_clients:
+            client = factory()
+            _resize_oci_pool(client)
+            _oci_clients[key] = client
+        return _oci_clients[key]
+
+
+def _resize_oci_pool(client):
+    """Widen the SDK's requests pool (10 connections by default) to our limit"""
+    session = getattr(getattr(client, "base_client", None), "session", None)
+    if session is None:
+        return
+    try:
+        from oci.base_client import OCIHTTPAdapter
+    except ImportError:
+        return
+    session.mount(
+        "https://",
+        OCIHTTPAdapter(
+            pool_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            pool_maxsize=HTTP_MAX_CONNECTIONS,
+        ),
+    )
+
+
+async def open_connections(timeout: float = 10.0):
+    """Open (and keep alive) a connection to every pooled endpoint host"""
+    with _lock:
+        async_targets = [
+            (f"https://{host}/", client) for (host, _), client in _async_clients.items()
+        ]
+        sync_targets = [
+            (f"https://{host}/", client) for (host, _), client in _sync_clients.items()
+        ]
+        sync_targets += [
+            (f"https://{host}/", client.base_client.session)
+            for host, client in _oci_clients.items()
+            if hasattr(client, "base_client")
+        ]
+
+    def head(url, client):
+        try:
+            # Any response (even 404) leaves a warm TLS connection in the pool
+            client.head(url, timeout=timeout)
+        except Exception as e:
+            print(f"Warning: could not pre-connect to {url}: {e}")
+
+    async def ahead(url, client):
+        try:
+            await client.head(url, timeout=timeout)
+        except Exception as e:
+            print(f"Warning: could not pre-connect to {url}: {e}")
+
+    await asyncio.gather(
+        *(ahead(url, client) for url, client in async_targets),
+        *(asyncio.to_thread(head, url, client) for url, client in sync_targets),
+    )
@@ -0,0 +1,352 @@
+"""
+Batch evaluation jobs: run a dataset of prompts against a set of models.
+
+A job's prompts are stored as ordinary Prompt rows tagged with the job id,
+and its results are ordinary ModelResponse rows. Work still to do is always
+derived from the database (job prompts x job models without a final
+response), which is what makes jobs resumable after a restart.
+"""
+import asyncio
+import csv
+import io
+import json
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import func, insert
+
+from .coordination import held_leases, leased
+from .database import SessionLocal
+from .fanout import FanoutEngine
+from .models import EvaluationJob, ModelResponse, Prompt
+
+# Responses that settle a (prompt, model) pair; cancelled ones are retried
+FINAL_STATUSES = ("completed", "timeout", "error")
+
+
+def parse_dataset(content: str, fmt: str) -> List[str]:
+    """Extract prompt texts from a JSONL or CSV dataset
+
+    JSONL lines may be plain JSON strings or objects with a "prompt" or
+    "text" field; CSV files need a "prompt" or "text" header column.
+    """
+    prompts = []
+    if fmt == "jsonl":
+        for line_number, line in enumerate(content.splitlines(), start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if isinstance(record, dict):
+                record = record.get("prompt", record.get("text"))
+            if not isinstance(record, str):
+                raise ValueError(f"Line {line_number} has no prompt text")
+            prompts.append(record)
+    elif fmt == "csv":
+        reader = csv.DictReader(io.StringIO(content))
+        column = next(
+            (name for name in ("prompt", "text") if name in (reader.fieldnames or [])),
+            None,
+        )
+        if column is None:
+            raise ValueError("CSV dataset needs a 'prompt' or 'text' column")
+        prompts = [row[column] for row in reader if row[column]]
+    else:
+        raise ValueError(f"Unsupported dataset format: {fmt}")
+    return prompts
+
+
+def create_job(
+    prompts: List[str],
+    models: List[str],
+    max_concurrency: int,
+    per_model_concurrency: int,
+) -> int:
+    """Create a job and bulk-insert its prompts (blocking)"""
+    db_session = SessionLocal()
+    try:
+        job = EvaluationJob(
+            models=json.dumps(models),
+            total_prompts=len(prompts),
+            max_concurrency=max_concurrency,
+            per_model_concurrency=per_model_concurrency,
+        )
+        db_session.add(job)
+        db_session.flush()
+        db_session.execute(
+            insert(Prompt), [{"text": text, "job_id": job.id} for text in prompts]
+        )
+        db_session.commit()
+        return job.id
+    finally:
+        db_session.close()
+
+
+def get_job_counts(job_id: int) -> Dict[str, int]:
+    """Count a job's final responses by status (blocking)"""
+    db_session = SessionLocal()
+    try:
+        rows = (
+            db_session.query(ModelResponse.status, func.count(ModelResponse.id))
+            .join(Prompt, Prompt.id == ModelResponse.prompt_id)
+            .filter(Prompt.job_id == job_id)
+            .filter(ModelResponse.status.in_(FINAL_STATUSES))
+            .group_by(ModelResponse.status)
+            .all()
+        )
+        return {status: count for status, count in rows}
+    finally:
+        db_session.close()
+
+
+def _load_pending_work(job_id: int) -> Tuple[EvaluationJob, List[Tuple[int, str, str]]]:
+    """Return the job and its (prompt_id, text, model) pairs still to run (blocking)"""
+    db_session = SessionLocal()
+    try:
+        job = db_session.get(EvaluationJob, job_id)
+        db_session.expunge(job)
+        models = json.loads(job.models)
+        done: Set[Tuple[int, str]] = set(
+            db_session.query(ModelResponse.prompt_id, ModelResponse.model_name)
+            .join(Prompt, Prompt.id == ModelResponse.prompt_id)
+            .filter(Prompt.job_id == job_id)
+            .filter(ModelResponse.status.in_(FINAL_STATUSES))
+            .all()
+        )
+        prompts = (
+            db_session.query(Prompt.id, Prompt.text)
+            .filter(Prompt.job_id == job_id)
+            .order_by(Prompt.id)
+            .all()
+        )
+        work = [
+            (prompt_id, text, model)
+            for prompt_id, text in prompts
+            for model in models
+            if (prompt_id, model) not in done
+        ]
+        return job, work
+    finally:
+        db_session.close()
+
+
+def _set_job_status(job_id: int, status: str):
+    db_session = SessionLocal()
+    try:
+        job = db_session.get(EvaluationJob, job_id)
+        job.status = status
+        if status in ("completed", "cancelled", "failed"):
+            job.finished_at = datetime.now(timezone.utc)
+        db_session.commit()
+    finally:
+        db_session.close()
+
+
+class JobProgress:
+    """Live progress of a running job, with change notification for SSE"""
+
+    def __init__(
+        self,
+        job_id: int,
+        total: int,
+        models_per_prompt: int,
+        already_done: Dict[str, int],
+    ):
+        self.job_id = job_id
+        self.total = total
+        self.models_per_prompt = models_per_prompt
+        self.counts: Dict[str, int] = dict(already_done)
+        self.started_at = time.time()
+        self.finished_in_run = 0
+        self.status = "running"
+        self._subscribers: List[asyncio.Event] = []
+
+    def record(self, status: str):
+        self.counts[status] = self.counts.get(status, 0) + 1
+        self.finished_in_run += 1
+        self.notify()
+
+    def notify(self):
+        for event in self._subscribers:
+            event.set()
+
+    def subscribe(self) -> asyncio.Event:
+        event = asyncio.Event()
+        event.set()  # deliver the current state immediately
+        self._subscribers.append(event)
+        return event
+
+    def unsubscribe(self, event: asyncio.Event):
+        self._subscribers.remove(event)
+
+    def snapshot(self) -> Dict:
+        elapsed = time.time() - self.started_at
+        models_per_prompt = self.models_per_prompt
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "total": self.total,
+            "done": sum(self.counts.values()),
+            "counts": self.counts,
+            "elapsed": elapsed,
+            # Throughput of this run, in prompts (all models answered) per minute
+            "prompts_per_minute": (
+                self.finished_in_run / models_per_prompt / elapsed * 60
+                if elapsed > 0 and models_per_prompt
+                else 0.0
+            ),
+        }
+
+
+class JobRunner:
+    """Schedules job generations through the fan-out engine
+
+    Each model gets `per_model_concurrency` workers pulling from its own
+    queue, all sharing a job-wide semaphore of `max_concurrency`; the
+    engine's scheduler still applies on top of both, queueing each job as
+    its own user so it shares models fairly with interactive comparisons.
+    """
+
+    def __init__(self, engine: FanoutEngine):
+        self.engine = engine
+        self.progress: Dict[int, JobProgress] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._cancel_requested: Set[int] = set()
+
+    def start(self, job_id: int):
+        if job_id in self._tasks and not self._tasks[job_id].done():
+            return
+        self._tasks[job_id] = asyncio.create_task(self._run(job_id))
+
+    def cancel(self, job_id: int) -> bool:
+        task = self._tasks.get(job_id)
+        if task is None or task.done():
+            return False
+        self._cancel_requested.add(job_id)
+        task.cancel()
+        return True
+
+    async def resume_incomplete(self):
+        """Start the pending or running jobs no worker is running
+
+        Those interrupted by a restart, or left by a worker that died once its
+        lease has expired.
+        """
+        loop = asyncio.get_running_loop()
+
+        def load_ids():
+            db_session = SessionLocal()
+            try:
+                ids = [
+                    job_id
+                    for (job_id,) in db_session.query(EvaluationJob.id).filter(
+                        EvaluationJob.status.in_(("pending", "running"))
+                    )
+                ]
+            finally:
+                db_session.close()
+            # Not those another worker is running
+            held = set(held_leases("job:"))
+            return [job_id for job_id in ids if f"job:{job_id}" not in held]
+
+        for job_id in await loop.run_in_executor(self.engine.db_executor, load_ids):
+            task = self._tasks.get(job_id)
+            if task is None or task.done():
+                print(f"Resuming evaluation job {job_id}")
+                self.start(job_id)
+
+    async def _run(self, job_id: int):
+        # Runs on the one worker holding its lease; the others leave it be
+        async with leased(f"job:{job_id}", self.engine.db_executor) as held:
+            if held:
+                await self._run_leased(job_id)
+
+    async def _run_leased(self, job_id: int):
+        loop = asyncio.get_running_loop()
+        db_executor = self.engine.db_executor
+        job, work = await loop.run_in_executor(db_executor, _load_pending_work, job_id)
+        counts = await loop.run_in_executor(db_executor, get_job_counts, job_id)
+        models = json.loads(job.models)
+        progress = self.progress[job_id] = JobProgress(
+            job_id, sum(counts.values()) + len(work), len(models), counts
+        )
+
+        await loop.run_in_executor(db_executor, _set_job_status, job_id, "running")
+
+        queues: Dict[str, deque] = {model: deque() for model in models}
+        for item in work:
+            queues[item[2]].append(item)
+        job_slots = asyncio.Semaphore(job.max_concurrency)
+
+        async def worker(model: str):
+            pending = queues[model]
+            while pending:
+                prompt_id, text, _ = pending.popleft()
+                async with job_slots:
+                    status = await self._run_item(job_id, prompt_id, text, model)
+                progress.record(status)
+
+        workers = [
+            asyncio.ensure_future(worker(model))
+            for model in models
+            for _ in range(min(job.per_model_concurrency, len(queues[model])))
+        ]
+        try:
+            await asyncio.gather(*workers)
+        except asyncio.CancelledError:
+            # A shutdown also cancels us; only an explicit cancel is final,
+            # otherwise the job stays 'running' and resumes on next start
+            if job_id in self._cancel_requested:
+                self._cancel_requested.discard(job_id)
+                progress.status = "cancelled"
+                progress.notify()
+                await loop.run_in_executor(
+                    db_executor, _set_job_status, job_id, "cancelled"
+                )
+            raise
+        except Exception as e:
+            # Not resumed: the same error would likely stop it again
+            print(f"Error running job {job_id}: {e}")
+            for task in workers:
+                task.cancel()
+            progress.status = "failed"
+            progress.notify()
+            await loop.run_in_executor(db_executor, _set_job_status, job_id, "failed")
+            return
+
+        progress.status = "completed"
+        progress.notify()
+        await loop.run_in_executor(db_executor, _set_job_status, job_id, "completed")
+
+    async def _run_item(self, job_id: int, prompt_id: int, text: str, model: str) -> str:
+        """Run one (prompt, model) pair and return its final status"""
+        update_queue: asyncio.Queue = asyncio.Queue()
+        await self.engine.run_model(
+            model,
+            text,
+            prompt_id,
+            update_queue,
+            stream_tokens=False,
+            user=f"job:{job_id}",
+        )
+        update = update_queue.get_nowait()
+        if update.status == "error":
+            # Persisted so a failing pair is not retried on every resume
+            try:
+                await self.engine.save_response(
+                    prompt_id=prompt_id,
+                    model_name=model,
+                    response_text="",
+                    time_to_first_token=0.0,
+                    total_time=0.0,
+                    status="error",
+                    error=update.error,
+                    queue_wait_time=update.queue_wait,
+                )
+            except Exception as e:
+                print(f"Error saving failed job item ({prompt_id}, {model}): {e}")
+        return update.status
+
+    def get_progress(self, job_id: int) -> Optional[JobProgress]:
+        return self.progress.get(job_id)
@@ -1,10 +1,32 @@
 import os
 import time
-import httpx
-from typing import Dict, Optional, Callable, Union
-from langchain_oci import ChatOCIGenAI
-from langchain_openai import ChatOpenAI
-from oci_openai import OciUserPrincipalAuth
+import asyncio
+import threading
+from concurrent.futures import Executor
+from typing import TYPE_CHECKING, AsyncIterator, Dict, Optional, Callable
+from .deadlines import Watchdog, get_deadlines
+from .http_clients import get_http_clients, get_oci_client, open_connections
+from .metrics import MODEL_INIT_TIME, span
+from .model_registry import configured_models, fake_settings
+from .tokens import TokenUsage, UsageCollector, load_tokenizers
+
+if TYPE_CHECKING:
+    from langchain_core.language_models.chat_models import BaseChatModel
+
+# Provider SDKs (langchain_openai, oci_openai, langchain_oci, and langchain_core
+# under them) take seconds to import; each family's are imported when its
+# first model is initialized, so startup pays for none of them
+
+# Generation params a request may override per call (prompt sweeps); every
+# provider takes them under these names
+OVERRIDABLE_PARAMS = ("temperature", "top_p", "max_tokens")
+
+
+def build_messages(prompt: str, system_prompt: Optional[str] = None) -> list:
+    messages = [{"role": "user", "content": prompt}]
+    if system_prompt:
+        messages.insert(0, {"role": "system", "content": system_prompt})
+    return messages
 
 
 class LLMService:
@@ -22,78 +44,25 @@ class LLMService:
         )
 
         # Model registry - maps model key to model_id (without oci/ prefix)
-        # Only includes models that have environment variables set
-        self.model_registry = {}
+        # Only includes models that are configured (see model_registry.py)
+        self.model_registry = configured_models()
 
-        # xAI Grok Models
-        self._add_model_if_configured("xai.grok-4", "OCI_XAI_GROK_4_MODEL_ID")
-        self._add_model_if_configured(
-            "xai.grok-4-fast-reasoning", "OCI_XAI_GROK_4_FAST_REASONING_MODEL_ID"
-        )
-        self._add_model_if_configured(
-            "xai.grok-4-fast-non-reasoning",
-            "OCI_XAI_GROK_4_FAST_NON_REASONING_MODEL_ID",
-        )
-        self._add_model_if_configured("xai.grok-3", "OCI_XAI_GROK_3_MODEL_ID")
-        self._add_model_if_configured("xai.grok-3-fast", "OCI_XAI_GROK_3_FAST_MODEL_ID")
-        self._add_model_if_configured("xai.grok-3-mini", "OCI_XAI_GROK_3_MINI_MODEL_ID")
-        self._add_model_if_configured(
-            "xai.grok-3-mini-fast", "OCI_XAI_GROK_3_MINI_FAST_MODEL_ID"
-        )
+        # Local stand-in models (FAKE_LLM_MODELS / FAKE_LLM_CONFIG, see
+        # fake_llm.py) for benchmarking the service without calling OCI
+        self.fake_settings = fake_settings()
 
-        # Meta Llama Models
-        self._add_model_if_configured(
-            "meta.llama-4-maverick-17b-128e-instruct-fp8",
-            "OCI_META_LLAMA_4_MAVERICK_17B_128E_INSTRUCT_FP8_MODEL_ID",
-        )
-        self._add_model_if_configured(
-            "meta.llama-4-scout-17b-16e-instruct",
-            "OCI_META_LLAMA_4_SCOUT_17B_16E_INSTRUCT_MODEL_ID",
-        )
-        self._add_model_if_configured(
-            "meta.llama-3.3-70b-instruct", "OCI_META_LLAMA_3_3_70B_INSTRUCT_MODEL_ID"
-        )
-        self._add_model_if_configured(
-            "meta.llama-3.1-405b-instruct", "OCI_META_LLAMA_3_1_405B_INSTRUCT_MODEL_ID"
+        # OpenAI-compatible endpoint used for xAI models
+        self.openai_base_url = (
+            f"{self.service_endpoint.rstrip('/')}/20231130/actions/v1"
         )
 
-        # Cohere Models
-        self._add_model_if_configured(
-            "cohere.command-latest", "OCI_COHERE_COMMAND_LATEST_MODEL_ID"
-        )
-        self._add_model_if_configured(
-            "cohere.command-a-03-2025", "OCI_COHERE_COMMAND_A_03_2025_MODEL_ID"
-        )
-        self._add_model_if_configured(
-            "cohere.command-plus-latest", "OCI_COHERE_COMMAND_PLUS_LATEST_MODEL_ID"
-        )
+        # Initialize models lazily (on-demand); the locks make concurrent
+        # first requests for the same model build it only once
+        self.models: Dict[str, Optional["BaseChatModel"]] = {}
+        self._init_locks: Dict[str, threading.Lock] = {}
+        self._init_locks_guard = threading.Lock()
 
-        # Google Gemini Models
-        self._add_model_if_configured(
-            "google.gemini-2.5-pro", "OCI_GOOGLE_GEMINI_2_5_PRO_MODEL_ID"
-        )
-        self._add_model_if_configured(
-            "google.gemini-2.5-flash", "OCI_GOOGLE_GEMINI_2_5_FLASH_MODEL_ID"
-        )
-        self._add_model_if_configured(
-            "google.gemini-2.5-flash-lite", "OCI_GOOGLE_GEMINI_2_5_FLASH_LITE_MODEL_ID"
-        )
-
-        # Initialize models lazily (on-demand)
-        self.models: Dict[str, Optional[Union[ChatOCIGenAI, ChatOpenAI]]] = {}
-
-    def _add_model_if_configured(self, model_key: str, env_var_name: str):
-        """Add model to registry if environment variable is set"""
-        model_id = os.getenv(env_var_name)
-        if model_id:
-            # Remove 'oci/' prefix if present
-            if model_id.startswith("oci/"):
-                model_id = model_id[4:]
-            self.model_registry[model_key] = model_id
-
-    def _init_model(
-        self, model_key: str, model_id: str
-    ) -> Optional[Union[ChatOCIGenAI, ChatOpenAI]]:
+    def _init_model(self, model_key: str, model_id: str) -> Optional["BaseChatModel"]:
         """Initialize a single OCI model"""
         if not model_id:
             print(
@@ -102,78 +71,143 @@ class LLMService:
             return None
 
         try:
+            if model_key.startswith("fake."):
+                from .fake_llm import FakeChatModel
+
+                return FakeChatModel(**self.fake_settings[model_key])
             # Use ChatOpenAI with OciUserPrincipalAuth for xAI Grok models
             if model_key.startswith("xai."):
+                from langchain_openai import ChatOpenAI
+                from oci_openai import OciUserPrincipalAuth
+
+                http_client, http_async_client = get_http_clients(
+                    self.openai_base_url,
+                    self.compartment_id,
+                    lambda: OciUserPrincipalAuth(profile_name="DEFAULT"),
+                )
                 return ChatOpenAI(
                     model=model_id,  # Use model_id directly without oci/ prefix
                     api_key="OCI",
-                    base_url="https://inference.generativeai.us-chicago-1.oci.oraclecloud.com/20231130/actions/v1",
-                    http_client=httpx.Client(
-                        auth=OciUserPrincipalAuth(profile_name="DEFAULT"),
-                        headers={"CompartmentId": self.compartment_id},
-                    ),
+                    base_url=self.openai_base_url,
+                    http_client=http_client,
+                    http_async_client=http_async_client,
                     temperature=0.7,
                     streaming=True,
+                    # Token counts arrive on a final usage chunk
+                    stream_usage=True,
                 )
             else:
-                # Use ChatOCIGenAI for other models (Llama, Cohere)
+                # Use ChatOCIGenAI for other models (Llama, Cohere); all of them
+                # share one SDK client (and its connection pool) per endpoint
+                from langchain_oci import ChatOCIGenAI
+
+                client = get_oci_client(
+                    self.service_endpoint,
+                    lambda: ChatOCIGenAI(
+                        model_id=model_id,
+                        compartment_id=self.compartment_id,
+                        service_endpoint=self.service_endpoint,
+                    ).client,
+                )
                 return ChatOCIGenAI(
                     model_id=model_id,  # Use model_id directly without oci/ prefix
                     compartment_id=self.compartment_id,
+                    service_endpoint=self.service_endpoint,
+                    client=client,
                     is_stream=True,
                 )
         except Exception as e:
             print(f"Error initializing {model_key} model: {e}")
             return None
 
-    def _get_or_init_model(
-        self, model_key: str
-    ) -> Optional[Union[ChatOCIGenAI, ChatOpenAI]]:
-        """Get model instance, initializing if needed"""
-        if model_key not in self.models:
-            model_id = self.model_registry.get(model_key)
-            if model_id:
-                self.models[model_key] = self._init_model(model_key, model_id)
-            else:
-                self.models[model_key] = None
-        return self.models.get(model_key)
+    def get_generation_params(self, model_key: str, overrides: Optional[Dict] = None) -> Dict:
+        """Generation params a model is initialized with, plus per-call
+        `overrides` (part of cache keys)"""
+        params = {"temperature": 0.7} if model_key.startswith("xai.") else {}
+        if overrides:
+            params.update(overrides)
+        return params
+
+    def _get_or_init_model(self, model_key: str) -> Optional["BaseChatModel"]:
+        """Get model instance, initializing it exactly once if needed"""
+        if model_key in self.models:
+            return self.models[model_key]
+        with self._init_locks_guard:
+            lock = self._init_locks.setdefault(model_key, threading.Lock())
+        with lock:
+            if model_key not in self.models:
+                model_id = self.model_registry.get(model_key)
+                if model_id:
+                    with MODEL_INIT_TIME.labels(model_key).time(), span(
+                        "llm.init_model", model=model_key
+                    ):
+                        self.models[model_key] = self._init_model(model_key, model_id)
+                else:
+                    self.models[model_key] = None
+        return self.models[model_key]
+
+    async def warm_up(self, executor: Optional[Executor] = None):
+        """Initialize every configured model, load their tokenizers and pre-open provider connections"""
+        start_time = time.time()
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(
+            *(
+                loop.run_in_executor(executor, self._get_or_init_model, model_key)
+                for model_key in self.model_registry
+            ),
+            loop.run_in_executor(executor, load_tokenizers, list(self.model_registry)),
+        )
+        await open_connections()
+        print(
+            f"Warmed up {len(self.model_registry)} models in "
+            f"{time.time() - start_time:.2f}s"
+        )
 
     def generate_with_metrics(
         self,
         model_name: str,
         prompt: str,
         stream_callback: Optional[Callable[[str, Dict], None]] = None,
-    ) -> tuple[str, float, float]:
+        system_prompt: Optional[str] = None,
+        params: Optional[Dict] = None,
+    ) -> tuple[str, float, float, TokenUsage]:
         """
         Generate response with timing metrics
 
+        `params` (OVERRIDABLE_PARAMS) override the model's generation params
+        for this call only, on the same client.
+
         Returns:
-            tuple: (response_text, time_to_first_token, total_time)
+            tuple: (response_text, time_to_first_token, total_time, usage)
         """
         model = self._get_or_init_model(model_name)
         if not model:
             raise ValueError(f"Model {model_name} is not available")
 
-        start_time = time.time()
+        # Monotonic clock: wall-clock adjustments must not distort latencies
+        start_time = time.perf_counter()
         first_token_time = None
         first_token_received = False
 
         try:
             # Convert prompt to messages format for ChatOCIGenAI
-            messages = [{"role": "user", "content": prompt}]
+            messages = build_messages(prompt, system_prompt)
 
             # Stream the response
             response_parts = []
-            for chunk in model.stream(messages):
+            usage = UsageCollector()
+            for chunk in model.stream(messages, **(params or {})):
+                elapsed_time = time.perf_counter() - start_time
                 # Track time to first token
                 if not first_token_received:
-                    first_token_time = time.time() - start_time
+                    first_token_time = elapsed_time
                     first_token_received = True
 
                 if hasattr(chunk, "content"):
                     token = chunk.content
                 else:
                     token = str(chunk)
+                usage.add_chunk(chunk)
 
                 response_parts.append(token)
 
@@ -181,12 +215,12 @@ class LLMService:
                 if stream_callback:
                     metrics = {
                         "time_to_first_token": first_token_time,
-                        "elapsed_time": time.time() - start_time,
+                        "elapsed_time": elapsed_time,
                     }
                     stream_callback(token, metrics)
 
             response_text = "".join(response_parts)
-            end_time = time.time()
+            end_time = time.perf_counter()
             total_time = end_time - start_time
 
             # Ensure we have time_to_first_token
@@ -194,10 +228,167 @@ class LLMService:
                 # If no tokens were streamed, set to total_time
                 first_token_time = total_time
 
-            return response_text, first_token_time, total_time
+            return (
+                response_text,
+                first_token_time,
+                total_time,
+                usage.usage(model_name, prompt, response_text),
+            )
+
+        except Exception as e:
+            raise Exception(f"Error generating response from {model_name}: {str(e)}")
+
+    async def agenerate_with_metrics(
+        self,
+        model_name: str,
+        prompt: str,
+        stream_callback: Optional[Callable[[str, Dict], None]] = None,
+        executor: Optional[Executor] = None,
+        system_prompt: Optional[str] = None,
+        params: Optional[Dict] = None,
+    ) -> tuple[str, float, float, TokenUsage]:
+        """
+        Async variant of generate_with_metrics that never blocks the event loop.
+
+        Providers with a native async stream are consumed directly; the others
+        run their blocking stream on a thread of its own and hand chunks back
+        to the loop. `executor` runs model initialization and token counting.
+        Raises GenerationTimeout when the model misses its TTFT, idle-gap or
+        total deadline (see deadlines.get_deadlines). Token counts the provider
+        does not report are counted on `executor` after the stream ends.
+
+        Returns:
+            tuple: (response_text, time_to_first_token, total_time, usage)
+        """
+        loop = asyncio.get_running_loop()
+        if model_name in self.models:
+            model = self.models[model_name]
+        else:
+            model = await loop.run_in_executor(
+                executor, self._get_or_init_model, model_name
+            )
+        if not model:
+            raise ValueError(f"Model {model_name} is not available")
+
+        start_time = time.perf_counter()
+        first_token_time = None
+        watchdog = Watchdog(get_deadlines(model_name))
+
+        try:
+            messages = build_messages(prompt, system_prompt)
+
+            response_parts = []
+            usage = UsageCollector()
+            # Closed explicitly so a cancelled generation releases the provider
+            # stream immediately instead of whenever it is garbage collected
+            chunks = self._astream(model, messages, params or {})
+            try:
+                async for chunk in chunks:
+                    watchdog.chunk_received()
+                    elapsed_time = time.perf_counter() - start_time
+                    if first_token_time is None:
+                        first_token_time = elapsed_time
+
+                    token = chunk.content if hasattr(chunk, "content") else str(chunk)
+                    response_parts.append(token)
+                    usage.add_chunk(chunk)
+
+                    if stream_callback:
+                        metrics = {
+                            "time_to_first_token": first_token_time,
+                            "elapsed_time": elapsed_time,
+                        }
+                        stream_callback(token, metrics)
+            finally:
+                await chunks.aclose()
+
+            response_text = "".join(response_parts)
+            total_time = time.perf_counter() - start_time
+            if first_token_time is None:
+                first_token_time = total_time
+
+            if usage.reported:
+                token_usage = usage.usage(model_name, prompt, response_text)
+            else:
+                token_usage = await loop.run_in_executor(
+                    executor, usage.usage, model_name, prompt, response_text
+                )
+            return response_text, first_token_time, total_time, token_usage
 
+        except asyncio.CancelledError:
+            if watchdog.expired is None:
+                raise
+            raise watchdog.timeout_error(model_name)
         except Exception as e:
             raise Exception(f"Error generating response from {model_name}: {str(e)}")
+        finally:
+            watchdog.stop()
+
+    async def _astream(
+        self,
+        model: "BaseChatModel",
+        messages: list,
+        params: Dict,
+    ) -> AsyncIterator:
+        """Stream chunks from a model without blocking the event loop
+
+        A blocking stream is pumped from a daemon thread of its own rather
+        than a pooled one: a provider that hangs (what the deadlines are for)
+        cannot be interrupted mid-read, and would otherwise hold a pool
+        thread until its socket timed out, starving later generations.
+        """
+        # Already imported by the model's own module
+        from langchain_core.language_models.chat_models import BaseChatModel
+
+        if type(model)._astream is not BaseChatModel._astream:
+            stream = model.astream(messages, **params)
+            try:
+                async for chunk in stream:
+                    yield chunk
+            finally:
+                await stream.aclose()
+            return
+
+        # langchain's default astream hops through the loop's default executor
+        # once per chunk; instead pump the whole sync stream from one thread
+        # into an asyncio.Queue
+        loop = asyncio.get_running_loop()
+        chunks: asyncio.Queue = asyncio.Queue()
+        done = object()
+        cancelled = threading.Event()
+
+        def put(item):
+            try:
+                loop.call_soon_threadsafe(chunks.put_nowait, item)
+            except RuntimeError:
+                pass  # event loop already closed
+
+        def pump():
+            stream = model.stream(messages, **params)
+            try:
+                for chunk in stream:
+                    if cancelled.is_set():
+                        break
+                    put(chunk)
+            except Exception as e:
+                put(e)
+            finally:
+                stream.close()
+                put(done)
+
+        threading.Thread(target=pump, name="llm-stream-pump", daemon=True).start()
+        try:
+            while True:
+                item = await chunks.get()
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # The thread stops at the next chunk it receives, or when a hung
+            # provider's socket times out; no pool thread waits on it
+            cancelled.set()
 
     def get_available_models(self) -> list[str]:
         """Get list of available model keys from registry"""
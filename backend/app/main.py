@@ -1,13 +1,23 @@
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
+import asyncio
 import os
 
 # Load environment variables from .env file
 load_dotenv()
 
+from .analytics import backfill_rollups, update_rollups
+from .canary import CanaryProber
+from .coordination import LEASE_TTL
 from .database import init_db
-from .routers import prompts, stream
+from .metrics import render as render_metrics
+from .persistence import response_writer
+from .regressions import regression_detector
+from .routers import analytics, export, jobs, prompts, regressions, routing, search, stream, sweeps
+from .routing import latency_tracker
+from .search import backfill_search_index, ensure_search_index
 
 app = FastAPI(title="OCI LLM Comparison Demo", version="1.0.0")
 
@@ -25,10 +35,125 @@ app.add_middleware(
 
 # Initialize database
 init_db()
+ensure_search_index()
 
 # Include routers
 app.include_router(prompts.router)
 app.include_router(stream.router)
+app.include_router(jobs.router)
+app.include_router(sweeps.router)
+app.include_router(analytics.router)
+app.include_router(routing.router)
+app.include_router(regressions.router)
+app.include_router(search.router)
+app.include_router(export.router)
+
+# Derived data kept in step with every batch of inserted responses
+response_writer.add_listener(update_rollups)
+response_writer.add_listener(latency_tracker.observe_rows)
+response_writer.add_listener(regression_detector.observe_rows)
+
+canary_prober = CanaryProber(stream.engine, regression_detector)
+
+
+@app.on_event("startup")
+async def warm_up_models():
+    """Optionally pre-create model clients and open provider connections"""
+    # Keeps client construction and TLS handshakes out of the first user's TTFT
+    if os.getenv("LLM_WARMUP", "false").lower() in ("1", "true", "yes"):
+        await stream.llm_service.warm_up(stream.executor)
+
+
+async def resume_incomplete_work():
+    """Resume jobs and sweeps no worker is running, now and every LEASE_TTL seconds
+
+    Each runs on the worker holding its lease, so every worker can look for
+    them; checking again takes over those of a worker that died.
+    """
+    while True:
+        try:
+            await jobs.job_runner.resume_incomplete()
+            await sweeps.sweep_runner.resume_incomplete()
+        except Exception as e:
+            print(f"Warning: resuming jobs and sweeps failed: {e}")
+        await asyncio.sleep(LEASE_TTL)
+
+
+resume_task = None
+
+
+@app.on_event("startup")
+async def resume_jobs():
+    """Resume batch evaluation jobs and prompt sweeps interrupted by a restart"""
+    global resume_task
+    if os.getenv("JOBS_RESUME_ON_STARTUP", "true").lower() in ("1", "true", "yes"):
+        resume_task = asyncio.create_task(resume_incomplete_work())
+
+
+@app.on_event("startup")
+async def backfill_analytics():
+    """Build latency rollups for responses stored before they existed"""
+    def backfill():
+        try:
+            if backfill_rollups(response_writer):
+                print("Latency rollups rebuilt from existing responses")
+        except Exception as e:
+            print(f"Warning: latency rollup backfill failed: {e}")
+
+    # Runs in the background; the rollups fill in while the API serves
+    asyncio.get_running_loop().run_in_executor(None, backfill)
+
+
+@app.on_event("startup")
+async def backfill_search():
+    """Index prompts and responses stored before the search index existed"""
+    def backfill():
+        try:
+            if backfill_search_index(response_writer):
+                print("Search index backfilled")
+        except Exception as e:
+            print(f"Warning: search index backfill failed: {e}")
+
+    asyncio.get_running_loop().run_in_executor(None, backfill)
+
+
+@app.on_event("startup")
+async def seed_routing():
+    """Load recent latencies for routing decisions"""
+    def seed():
+        try:
+            response_writer.run_task(latency_tracker.seed).result()
+        except Exception as e:
+            print(f"Warning: seeding routing latencies failed: {e}")
+
+    asyncio.get_running_loop().run_in_executor(None, seed)
+
+
+@app.on_event("startup")
+async def watch_regressions():
+    """Load recent latencies into the regression windows and start canary probes"""
+    def seed():
+        try:
+            response_writer.run_task(regression_detector.seed).result()
+        except Exception as e:
+            print(f"Warning: seeding regression windows failed: {e}")
+
+    asyncio.get_running_loop().run_in_executor(None, seed)
+    canary_prober.start()
+
+
+@app.on_event("shutdown")
+def stop_canaries():
+    """Stop canary probes and looking for jobs to resume"""
+    canary_prober.stop()
+    if resume_task is not None:
+        resume_task.cancel()
+
+
+@app.on_event("shutdown")
+def flush_responses():
+    """Write out responses still queued for the database"""
+    response_writer.stop(timeout=10)
 
 
 @app.get("/")
@@ -39,3 +164,10 @@ def root():
 @app.get("/health")
 def health():
     return {"status": "healthy"}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics of this worker"""
+    # On the event loop: gauges read scheduler state that only it mutates
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,365 @@
+"""
+Prometheus metrics of this worker, served at GET /metrics.
+
+Instrumentation sits on hot paths (a counter increment per streamed token),
+so metrics are plain Python objects and never take a lock to record:
+
+- Counters and histograms are sharded per thread: each label set has a
+  cell per thread, written only by that thread, and a scrape sums them.
+- Gauges are set from the event loop, or computed by a callback when
+  scraped (queue depths, threads alive).
+
+Children for a label set are cached (`TOKENS.labels(model)`), so a hot loop
+looks them up once and then pays a thread-local lookup and a list update
+per increment (~0.2us).
+
+Each worker process serves its own metrics; with several workers, scrape
+each one (e.g. one port per worker) and aggregate in Prometheus.
+
+Tracing is optional: with TRACING_ENABLED=true and opentelemetry-api
+installed, `span()` opens OpenTelemetry spans, which the deployment's
+OpenTelemetry SDK exports. Otherwise it is a no-op.
+"""
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() in ("1", "true", "yes")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+
+LabelValues = Tuple[str, ...]
+
+_registry: List["_Metric"] = []
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[LabelValues, object] = {}
+        _registry.append(self)
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}, got {values}")
+            # setdefault: a racing thread gets the same child
+            child = self._children.setdefault(values, self._child(values))
+        return child
+
+    def _child(self, values: LabelValues):
+        raise NotImplementedError
+
+    def samples(self) -> Iterator[Tuple[str, LabelValues, float, str]]:
+        """(suffix, label values, value, extra label) per exposed sample"""
+        raise NotImplementedError
+
+
+class _Sharded(_Metric):
+    """Values kept in per-thread cells, summed when scraped"""
+
+    cell_size = 1
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cells: List[Tuple[LabelValues, list]] = []
+        self._cells_lock = threading.Lock()
+
+    def _new_cell(self, key: LabelValues) -> list:
+        """A cell for the calling thread (once per thread and label set)"""
+        cell = [0] * self.cell_size
+        with self._cells_lock:
+            self._cells.append((key, cell))
+        return cell
+
+    def _totals(self) -> Dict[LabelValues, list]:
+        with self._cells_lock:
+            cells = list(self._cells)
+        totals: Dict[LabelValues, list] = {}
+        for key, cell in cells:
+            total = totals.setdefault(key, [0] * self.cell_size)
+            for i, value in enumerate(list(cell)):
+                total[i] += value
+        return totals
+
+
+class _CounterChild:
+    __slots__ = ("_counter", "_key", "_local")
+
+    def __init__(self, counter: "Counter", key: LabelValues):
+        self._counter = counter
+        self._key = key
+        self._local = threading.local()
+
+    def inc(self, amount: float = 1):
+        try:
+            self._local.cell[0] += amount
+        except AttributeError:
+            self._local.cell = self._counter._new_cell(self._key)
+            self._local.cell[0] += amount
+
+
+class Counter(_Sharded):
+    type_name = "counter"
+
+    def _child(self, values: LabelValues) -> _CounterChild:
+        return _CounterChild(self, values)
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def samples(self):
+        totals = self._totals()
+        for key in list(self._children):
+            yield "_total", key, totals.get(key, [0])[0], ""
+
+
+class _HistogramChild:
+    __slots__ = ("_histogram", "_key", "_bounds", "_local")
+
+    def __init__(self, histogram: "Histogram", key: LabelValues):
+        self._histogram = histogram
+        self._key = key
+        self._bounds = histogram.buckets
+        self._local = threading.local()
+
+    def observe(self, value: float):
+        try:
+            cell = self._local.cell
+        except AttributeError:
+            cell = self._local.cell = self._histogram._new_cell(self._key)
+        cell[bisect.bisect_left(self._bounds, value)] += 1
+        cell[-2] += value
+        cell[-1] += 1
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Histogram(_Sharded):
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per-bucket counts (the last one is +Inf), then sum and count
+        self.cell_size = len(self.buckets) + 3
+
+    def _child(self, values: LabelValues) -> _HistogramChild:
+        return _HistogramChild(self, values)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def samples(self):
+        totals = self._totals()
+        for key in list(self._children):
+            total = totals.get(key, [0] * self.cell_size)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), total):
+                cumulative += count
+                yield "_bucket", key, cumulative, _format_value(bound)
+            yield "_sum", key, total[-2], ""
+            yield "_count", key, total[-1], ""
+
+
+class _GaugeChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+
+class Gauge(_Metric):
+    """Set from the event loop only, or computed by `callback` when scraped"""
+
+    type_name = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), callback: Optional[Callable] = None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def set_callback(self, callback: Callable[[], Dict[LabelValues, float]]):
+        """Compute the gauge when scraped: {label values: value}"""
+        self.callback = callback
+
+    def _child(self, values: LabelValues) -> _GaugeChild:
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1):
+        self.labels().dec(amount)
+
+    def samples(self):
+        if self.callback is not None:
+            values = self.callback()
+            if not isinstance(values, dict):
+                values = {(): values}
+            for key, value in values.items():
+                yield "", key, value, ""
+            return
+        for key, child in list(self._children.items()):
+            yield "", key, child.value, ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format (0.0.4)"""
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.type_name}")
+        try:
+            samples = list(metric.samples())
+        except Exception as e:
+            print(f"Warning: collecting metric {metric.name} failed: {e}")
+            continue
+        for suffix, key, value, le in samples:
+            labels = [f'{name}="{_escape(str(v))}"' for name, v in zip(metric.labelnames, key)]
+            if le:
+                labels.append(f'le="{le}"')
+            label_text = "{" + ",".join(labels) + "}" if labels else ""
+            lines.append(f"{metric.name}{suffix}{label_text} {_format_value(float(value))}")
+    return "\n".join(lines) + "\n"
+
+
+# --- Tracing ---------------------------------------------------------------
+
+_tracer = None
+_tracer_loaded = False
+
+
+def _get_tracer():
+    global _tracer, _tracer_loaded
+    if not _tracer_loaded:
+        _tracer_loaded = True
+        try:
+            from opentelemetry import trace
+
+            _tracer = trace.get_tracer("prompt-evaluator")
+        except ImportError:
+            print("Warning: TRACING_ENABLED is set but opentelemetry-api is not installed")
+    return _tracer
+
+
+def span(name: str, current: bool = True, **attributes):
+    """OpenTelemetry span when tracing is enabled, else a no-op context
+
+    With `current` off the span is not made the active one, for spans held
+    open across the yields of a generator (which may be closed elsewhere).
+    """
+    if not TRACING_ENABLED:
+        return nullcontext()
+    tracer = _get_tracer()
+    if tracer is None:
+        return nullcontext()
+    if not current:
+        return tracer.start_span(name, attributes=attributes)
+    return tracer.start_as_current_span(name, attributes=attributes)
+
+
+# --- Metrics ---------------------------------------------------------------
+
+GENERATIONS = Counter(
+    "prompt_eval_generations",
+    "Finished generations by outcome (completed, cached, error, timeout, cancelled)",
+    ["model", "status"],
+)
+PROVIDER_ERRORS = Counter(
+    "prompt_eval_provider_errors",
+    "Failed provider calls by kind (throttled, timeout, error)",
+    ["model", "kind"],
+)
+TOKENS = Counter("prompt_eval_stream_chunks", "Streamed token chunks", ["model"])
+COMPLETION_TOKENS = Counter(
+    "prompt_eval_completion_tokens", "Completion tokens of completed generations", ["model"]
+)
+TTFT = Histogram(
+    "prompt_eval_ttft_seconds", "Time to first token from admission", ["model"]
+)
+GENERATION_TIME = Histogram(
+    "prompt_eval_generation_seconds", "Total generation time from admission", ["model"]
+)
+QUEUE_WAIT = Histogram(
+    "prompt_eval_queue_wait_seconds", "Time queued in the scheduler before admission", ["model"]
+)
+MODEL_INIT_TIME = Histogram(
+    "prompt_eval_model_init_seconds", "Model client construction time", ["model"]
+)
+DB_WRITE_TIME = Histogram(
+    "prompt_eval_db_write_seconds",
+    "Response writer transactions (insert batches, tasks) including commit",
+    ["operation"],
+    buckets=DB_BUCKETS,
+)
+DB_ROWS_WRITTEN = Counter("prompt_eval_db_rows_written", "Responses inserted by the writer")
+SSE_BYTES = Counter("prompt_eval_sse_bytes", "Bytes sent on SSE streams", ["framing"])
+SSE_EVENTS = Counter("prompt_eval_sse_events", "Frames sent on SSE streams", ["framing"])
+ACTIVE_STREAMS = Gauge("prompt_eval_active_streams", "Open SSE connections")
+GENERATIONS_IN_FLIGHT = Gauge(
+    "prompt_eval_generations_in_flight", "Admitted generations running", ["model"]
+)
+GENERATIONS_QUEUED = Gauge(
+    "prompt_eval_generations_queued", "Generations waiting in the scheduler", ["model"]
+)
+CONCURRENCY_LIMIT = Gauge(
+    "prompt_eval_concurrency_limit", "Adaptive per-model concurrency limit", ["model"]
+)
+WRITER_QUEUE_DEPTH = Gauge(
+    "prompt_eval_writer_queue_depth", "Items waiting for the response writer"
+)
+LATENCY_REGRESSIONS = Counter(
+    "prompt_eval_latency_regressions", "Latency regressions detected", ["model", "metric"]
+)
+LATENCY_CHANGE = Gauge(
+    "prompt_eval_latency_change",
+    "Recent vs baseline median of a latency metric, minus 1, at the last regression test",
+    ["model", "metric"],
+)
+LATENCY_P_VALUE = Gauge(
+    "prompt_eval_latency_p_value",
+    "p-value of the last regression test (small: recent latency is worse)",
+    ["model", "metric"],
+)
+THREADS = Gauge(
+    "prompt_eval_threads", "Threads alive in this worker", callback=threading.active_count
+)
@@ -0,0 +1,92 @@
+"""
+The models this service knows about, and which of them are configured.
+
+MODEL_ENV_MAP lists every provider model with the environment variable that
+holds its OCI model id; a model is configured when that variable is set.
+Local fake models (FAKE_LLM_MODELS / FAKE_LLM_CONFIG, see fake_llm.py) are
+configured too. The registry is built once per process and shared by
+LLMService and the routers.
+
+Nothing here imports a provider SDK: LLMService imports a family's SDK when
+its first model is initialized.
+"""
+import os
+from functools import lru_cache
+from typing import Any, Dict, List
+
+# Maps model keys to the environment variable holding their OCI model id
+MODEL_ENV_MAP = {
+    # xAI Grok Models
+    "xai.grok-4": "OCI_XAI_GROK_4_MODEL_ID",
+    "xai.grok-4-fast-reasoning": "OCI_XAI_GROK_4_FAST_REASONING_MODEL_ID",
+    "xai.grok-4-fast-non-reasoning": "OCI_XAI_GROK_4_FAST_NON_REASONING_MODEL_ID",
+    "xai.grok-3": "OCI_XAI_GROK_3_MODEL_ID",
+    "xai.grok-3-fast": "OCI_XAI_GROK_3_FAST_MODEL_ID",
+    "xai.grok-3-mini": "OCI_XAI_GROK_3_MINI_MODEL_ID",
+    "xai.grok-3-mini-fast": "OCI_XAI_GROK_3_MINI_FAST_MODEL_ID",
+    # Meta Llama Models
+    "meta.llama-4-maverick-17b-128e-instruct-fp8": "OCI_META_LLAMA_4_MAVERICK_17B_128E_INSTRUCT_FP8_MODEL_ID",
+    "meta.llama-4-scout-17b-16e-instruct": "OCI_META_LLAMA_4_SCOUT_17B_16E_INSTRUCT_MODEL_ID",
+    "meta.llama-3.3-70b-instruct": "OCI_META_LLAMA_3_3_70B_INSTRUCT_MODEL_ID",
+    "meta.llama-3.1-405b-instruct": "OCI_META_LLAMA_3_1_405B_INSTRUCT_MODEL_ID",
+    # Cohere Models
+    "cohere.command-latest": "OCI_COHERE_COMMAND_LATEST_MODEL_ID",
+    "cohere.command-a-03-2025": "OCI_COHERE_COMMAND_A_03_2025_MODEL_ID",
+    "cohere.command-plus-latest": "OCI_COHERE_COMMAND_PLUS_LATEST_MODEL_ID",
+    # Google Gemini Models
+    "google.gemini-2.5-pro": "OCI_GOOGLE_GEMINI_2_5_PRO_MODEL_ID",
+    "google.gemini-2.5-flash": "OCI_GOOGLE_GEMINI_2_5_FLASH_MODEL_ID",
+    "google.gemini-2.5-flash-lite": "OCI_GOOGLE_GEMINI_2_5_FLASH_LITE_MODEL_ID",
+}
+
+# Display name of each provider, by model key prefix
+PROVIDER_NAMES = {
+    "xai": "xAI Grok",
+    "meta": "Meta Llama",
+    "cohere": "Cohere",
+    "google": "Google Gemini",
+}
+
+
+def family_of(model_key: str) -> str:
+    """Model key prefix naming its provider family ("xai", "fake", ...)"""
+    return model_key.split(".", 1)[0]
+
+
+@lru_cache(maxsize=None)
+def fake_settings() -> Dict[str, Dict[str, Any]]:
+    """FakeChatModel arguments per configured fake model key"""
+    if not (os.getenv("FAKE_LLM_MODELS") or os.getenv("FAKE_LLM_CONFIG")):
+        return {}
+    # fake_llm builds on langchain_core, only needed once models are used
+    from .fake_llm import fake_model_settings
+
+    return fake_model_settings()
+
+
+@lru_cache(maxsize=None)
+def _configured_models() -> Dict[str, str]:
+    registry = {}
+    for model_key, env_var in MODEL_ENV_MAP.items():
+        model_id = os.getenv(env_var)
+        if model_id:
+            # Remove 'oci/' prefix if present
+            if model_id.startswith("oci/"):
+                model_id = model_id[4:]
+            registry[model_key] = model_id
+    for model_key in fake_settings():
+        registry[model_key] = model_key
+    return registry
+
+
+def configured_models() -> Dict[str, str]:
+    """Configured model keys mapped to their model ids (a copy)"""
+    return dict(_configured_models())
+
+
+def models_by_provider() -> Dict[str, List[str]]:
+    """Every known provider model, configured or not, by provider name"""
+    organized: Dict[str, List[str]] = {name: [] for name in PROVIDER_NAMES.values()}
+    for model_key in MODEL_ENV_MAP:
+        organized[PROVIDER_NAMES[family_of(model_key)]].append(model_key)
+    return organized
@@ -1,7 +1,21 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text
+from sqlalchemy import Boolean, Column, Integer, String, Float, DateTime, ForeignKey, Index, LargeBinary, Text, text
+from sqlalchemy.dialects import sqlite
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
+from .compression import decode_response, encode_response
 from .database import Base
+from .tokens import throughput
+from .traces import trace_metrics
+
+# Creation time, kept on SQLite in CURRENT_TIMESTAMP's own text format (UTC,
+# whole seconds) so that bound datetimes compare correctly with rows stamped
+# by the server default
+Timestamp = DateTime(timezone=True).with_variant(
+    sqlite.DATETIME(
+        storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"
+    ),
+    "sqlite",
+)
 
 
 class Prompt(Base):
@@ -9,23 +23,248 @@ class Prompt(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     text = Column(Text, nullable=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    job_id = Column(Integer, ForeignKey("evaluation_jobs.id"), nullable=True, index=True)
+    sweep_id = Column(Integer, ForeignKey("prompt_sweeps.id"), nullable=True, index=True)
+    created_at = Column(Timestamp, server_default=func.now())
     
     # Relationships
     model_responses = relationship("ModelResponse", back_populates="prompt", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # Keyset pagination of the history, newest first
+        Index("ix_prompts_created_at_id", "created_at", "id"),
+    )
+
 
 class ModelResponse(Base):
     __tablename__ = "model_responses"
 
     id = Column(Integer, primary_key=True, index=True)
-    prompt_id = Column(Integer, ForeignKey("prompts.id"), nullable=False)
+    prompt_id = Column(Integer, ForeignKey("prompts.id"), nullable=False, index=True)
     model_name = Column(String, nullable=False)  # 'cohere', 'gemini', 'grok', 'llama'
-    response_text = Column(Text, nullable=False)
+    # The text as stored: empty when compressed into response_body. Read and
+    # write response_text instead, which (de)compresses (see compression.py)
+    stored_text = Column("response_text", Text, nullable=False)
+    response_codec = Column(String, nullable=True)  # NULL for plain text
+    response_body = Column(LargeBinary, nullable=True)
+    response_chars = Column(Integer, nullable=True)  # NULL on rows older than the column
     time_to_first_token = Column(Float, nullable=False)  # in seconds
     total_time = Column(Float, nullable=False)  # in seconds
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    status = Column(
+        String, nullable=False, default="completed", server_default="completed"
+    )  # 'completed', 'cancelled', 'timeout', 'error'
+    error = Column(Text, nullable=True)
+    # Replayed from the response cache; timings are the original generation's
+    # and must be excluded from latency statistics
+    cached = Column(Boolean, nullable=False, default=False, server_default="0")
+    # Seconds spent waiting for the scheduler; not part of time_to_first_token
+    queue_wait_time = Column(Float, nullable=True)
+    # Chunk arrival offsets and sizes, packed (see traces.py); NULL when not streamed
+    token_trace = Column(LargeBinary, nullable=True)
+    prompt_tokens = Column(Integer, nullable=True)
+    completion_tokens = Column(Integer, nullable=True)
+    token_count_source = Column(String, nullable=True)  # 'provider', 'tokenizer', 'estimate'
+    # Set by prompt sweeps: the system message and the generation params
+    # overridden for this call (JSON); NULL for plain prompts and defaults
+    system_prompt = Column(Text, nullable=True)
+    generation_params = Column(Text, nullable=True)
+    # Model that served the response: as reported by the provider when it
+    # says (aliases like *-latest change version underneath), else as configured
+    model_id = Column(String, nullable=True)
+    created_at = Column(Timestamp, server_default=func.now())
     
     # Relationships
     prompt = relationship("Prompt", back_populates="model_responses")
 
+    @property
+    def response_text(self) -> str:
+        return decode_response(self.response_codec, self.response_body, self.stored_text)
+
+    @response_text.setter
+    def response_text(self, value: str):
+        self.response_codec, self.response_body, self.stored_text = encode_response(value)
+        self.response_chars = len(value)
+
+    @property
+    def trace_metrics(self):
+        return trace_metrics(self.token_trace)
+
+    @property
+    def tokens_per_second(self):
+        return throughput(self.completion_tokens, self.time_to_first_token, self.total_time)[
+            "tokens_per_second"
+        ]
+
+    @property
+    def output_tokens_per_second(self):
+        """Decode rate: tokens after the first over the time after the first"""
+        return throughput(self.completion_tokens, self.time_to_first_token, self.total_time)[
+            "output_tokens_per_second"
+        ]
+
+    __table_args__ = (
+        # Per-model time series (analytics, regressions)
+        Index("ix_model_responses_model_name_created_at", "model_name", "created_at"),
+    )
+
+
+class CachedResponse(Base):
+    __tablename__ = "response_cache"
+
+    key = Column(String, primary_key=True)  # sha256 of prompt, model and params
+    model_name = Column(String, nullable=False)
+    model_id = Column(String, nullable=False)
+    response_text = Column(Text, nullable=False)
+    time_to_first_token = Column(Float, nullable=False)  # in seconds
+    total_time = Column(Float, nullable=False)  # in seconds
+    token_timings = Column(Text, nullable=False)  # JSON [[elapsed, token], ...]
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+
+
+class EvaluationJob(Base):
+    __tablename__ = "evaluation_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    status = Column(
+        String, nullable=False, default="pending"
+    )  # 'pending', 'running', 'completed', 'cancelled', 'failed'
+    models = Column(Text, nullable=False)  # JSON list of model keys
+    total_prompts = Column(Integer, nullable=False)
+    max_concurrency = Column(Integer, nullable=False)
+    per_model_concurrency = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class PromptSweep(Base):
+    """Prompt variants x generation params x models, run as one matrix (see sweeps.py)"""
+
+    __tablename__ = "prompt_sweeps"
+
+    id = Column(Integer, primary_key=True, index=True)
+    status = Column(
+        String, nullable=False, default="pending"
+    )  # 'pending', 'running', 'completed', 'cancelled'
+    spec = Column(Text, nullable=False)  # JSON: template, variables, system_prompts, params, models, cache
+    total_cells = Column(Integer, nullable=False)
+    unique_cells = Column(Integer, nullable=False)  # cells left after merging identical requests
+    max_concurrency = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class LatencyRollup(Base):
+    """Hourly histogram of one latency metric for one model
+
+    Maintained incrementally as responses are written (see analytics.py);
+    only completed, non-cached responses are counted.
+    """
+
+    __tablename__ = "latency_rollups"
+
+    model_name = Column(String, primary_key=True)
+    metric = Column(String, primary_key=True)  # one of analytics.METRICS
+    bucket_start = Column(DateTime, primary_key=True, index=True)  # UTC hour
+    count = Column(Integer, nullable=False)
+    total = Column(Float, nullable=False)  # sum of values, for the mean
+    min_value = Column(Float, nullable=False)
+    max_value = Column(Float, nullable=False)
+    histogram = Column(LargeBinary, nullable=False)  # uint32 counts per log-spaced bin
+
+
+class LatencyRegression(Base):
+    """A detected shift of one model's latency for the worse (see regressions.py)"""
+
+    __tablename__ = "latency_regressions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    model_name = Column(String, nullable=False, index=True)
+    metric = Column(String, nullable=False)  # one of regressions.METRICS
+    baseline_median = Column(Float, nullable=False)
+    recent_median = Column(Float, nullable=False)
+    change = Column(Float, nullable=False)  # recent / baseline median - 1
+    p_value = Column(Float, nullable=False)  # one-sided Mann-Whitney U test
+    baseline_samples = Column(Integer, nullable=False)
+    recent_samples = Column(Integer, nullable=False)
+    # Most frequent model ID in each window; differing IDs point at a version swap
+    baseline_model_id = Column(String, nullable=True)
+    recent_model_id = Column(String, nullable=True)
+    first_response_id = Column(Integer, nullable=True)  # span of the recent window
+    last_response_id = Column(Integer, nullable=True)
+    detected_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class GenerationRun(Base):
+    """A run shared between workers (coordination.SqlRunManager)
+
+    The owning worker generates and appends the run's updates to run_events;
+    any worker can stream them to its clients.
+    """
+
+    __tablename__ = "generation_runs"
+
+    id = Column(String, primary_key=True)
+    prompt_id = Column(Integer, ForeignKey("prompts.id"), nullable=False, index=True)
+    models = Column(Text, nullable=False)  # JSON list of model keys
+    run_key = Column(Text, nullable=True)  # runs.run_key(): the models and options generated
+    status = Column(String, nullable=False, default="running")  # 'running', 'finished', 'abandoned'
+    owner = Column(String, nullable=False)  # worker generating it, host:pid
+    heartbeat_at = Column(DateTime, nullable=False)  # UTC; owner is presumed dead when stale
+    watched_at = Column(DateTime, nullable=True)  # UTC; last seen by another worker's client
+    finished_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        # At most one running run per prompt and key; the insert is how a worker claims it
+        Index(
+            "ux_generation_runs_running_key",
+            "prompt_id",
+            "run_key",
+            unique=True,
+            sqlite_where=text("status = 'running'"),
+            postgresql_where=text("status = 'running'"),
+        ),
+    )
+
+
+class WorkerLease(Base):
+    """Background work claimed by one worker (coordination.acquire_lease)
+
+    Named for the work, e.g. 'job:12', 'sweep:3' or 'canary'. The holder
+    renews it while working; another worker takes it over once it expires.
+    """
+
+    __tablename__ = "worker_leases"
+
+    name = Column(String, primary_key=True)
+    owner = Column(String, nullable=False)  # host:pid
+    expires_at = Column(DateTime, nullable=False)  # UTC
+
+
+class RunEvent(Base):
+    __tablename__ = "run_events"
+
+    run_id = Column(String, ForeignKey("generation_runs.id"), primary_key=True)
+    seq = Column(Integer, primary_key=True)
+    payload = Column(Text, nullable=False)  # JSON, see coordination.encode_update
+
+
+class SearchBackfill(Base):
+    """Rows of a table still to be added to its new full-text index (see search.py)"""
+
+    __tablename__ = "search_backfills"
+
+    table_name = Column(String, primary_key=True)
+    next_id = Column(Integer, nullable=False)  # first id not indexed yet
+    max_id = Column(Integer, nullable=False)  # later rows are indexed on insert
+
+
+class CompressionDictionary(Base):
+    """Shared zstd dictionary for compressing responses (see compression.py)"""
+
+    __tablename__ = "compression_dictionaries"
+
+    id = Column(Integer, primary_key=True)
+    data = Column(LargeBinary, nullable=False)
+    samples = Column(Integer, nullable=False)  # responses it was trained on
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
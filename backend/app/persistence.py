@@ -0,0 +1,205 @@
+"""
+Write-behind persistence for model responses.
+
+Generations never touch the database themselves: they submit the row to a
+single writer thread and (optionally) await its commit. The writer drains
+whatever has queued up since its last commit and inserts it in one
+transaction, so under load many responses share a commit instead of
+contending for SQLite's write lock one row at a time.
+
+Listeners registered with `add_listener` run on the writer thread after each
+committed batch, in their own transaction, and receive the inserted rows.
+They keep derived data (rollups, indexes) in step without slowing writes
+down: awaiters are released as soon as the rows are committed, before the
+listeners run. A failing listener is logged and never loses responses.
+Maintenance work on that derived data (e.g. a backfill) goes through
+`run_task`, so it is serialized with the listeners.
+"""
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from datetime import datetime, timezone
+from typing import Any, Callable, List, Optional, Tuple, Union
+
+from sqlalchemy.orm import Session
+
+from .database import SessionLocal
+from .metrics import DB_ROWS_WRITTEN, DB_WRITE_TIME, WRITER_QUEUE_DEPTH, span
+from .models import ModelResponse
+
+# Upper bound on rows per transaction
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", "500"))
+
+Listener = Callable[[Session, List[ModelResponse]], None]
+Task = Callable[[Session], Any]
+
+_STOP = object()
+
+
+class ResponseWriter:
+    """Single writer thread batching ModelResponse inserts
+
+    `submit` is thread-safe and returns a Future resolved with the new row id
+    once committed (or with the insert's exception).
+    """
+
+    def __init__(self, batch_size: int = WRITE_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.listeners: List[Listener] = []
+        # (fields to insert | task to run | None for a flush barrier, future)
+        self._queue: "queue.SimpleQueue[Tuple[Union[dict, Task, None], Future]]" = (
+            queue.SimpleQueue()
+        )
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def add_listener(self, listener: Listener):
+        self.listeners.append(listener)
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="response-writer", daemon=True
+                )
+                self._thread.start()
+
+    def submit(self, **fields) -> Future:
+        """Queue a ModelResponse insert; fields are its column values"""
+        future: Future = Future()
+        self.start()
+        self._queue.put((fields, future))
+        return future
+
+    def run_task(self, task: Task) -> Future:
+        """Run `task(session)` on the writer thread and commit; resolves with its result"""
+        future: Future = Future()
+        self.start()
+        self._queue.put((task, future))
+        return future
+
+    def flush(self, timeout: Optional[float] = None):
+        """Block until everything submitted so far is committed"""
+        future: Future = Future()
+        self.start()
+        self._queue.put((None, future))
+        future.result(timeout)
+
+    def stop(self, timeout: Optional[float] = None):
+        """Write out the queue and stop the writer thread"""
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            # Consecutive inserts share a transaction; tasks and barriers keep their order
+            inserts = []
+            for payload, future in batch:
+                if isinstance(payload, dict):
+                    inserts.append((payload, future))
+                    continue
+                if inserts:
+                    self._write(inserts)
+                    inserts = []
+                if payload is None:
+                    if future.set_running_or_notify_cancel():
+                        future.set_result(None)
+                else:
+                    self._run_task(payload, future)
+            if inserts:
+                self._write(inserts)
+
+    def _run_task(self, task: Task, future: Future):
+        if not future.set_running_or_notify_cancel():
+            return
+        db_session = SessionLocal()
+        try:
+            with DB_WRITE_TIME.labels("task").time(), span("db.task", task=_task_name(task)):
+                result = task(db_session)
+                db_session.commit()
+        except Exception as e:
+            db_session.rollback()
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        finally:
+            db_session.close()
+
+    def _write(self, batch: List[Tuple[dict, Future]]):
+        # Awaiters may have gone away (cancelled); the row is written regardless
+        futures = [
+            future if future.set_running_or_notify_cancel() else None
+            for _, future in batch
+        ]
+        # Stamped here rather than by the server default, which listeners
+        # reading created_at would each reload with a SELECT
+        created_at = datetime.now(timezone.utc)
+        rows = [ModelResponse(**{"created_at": created_at, **fields}) for fields, _ in batch]
+        db_session = SessionLocal(expire_on_commit=False)
+        try:
+            with DB_WRITE_TIME.labels("insert").time(), span("db.insert", rows=len(rows)):
+                db_session.add_all(rows)
+                db_session.commit()
+        except Exception as e:
+            db_session.rollback()
+            db_session.close()
+            if len(batch) > 1:
+                # Isolate the failing row so the rest of the batch still lands
+                print(f"Warning: batched insert of {len(batch)} responses failed, retrying singly: {e}")
+                for fields, future in batch:
+                    retry: Future = Future()
+                    self._write([(fields, retry)])
+                    if future is not None and future.running():
+                        _copy_result(retry, future)
+            elif futures[0] is not None:
+                futures[0].set_exception(e)
+            return
+
+        DB_ROWS_WRITTEN.inc(len(rows))
+        for future, row in zip(futures, rows):
+            if future is not None:
+                future.set_result(row.id)
+
+        for listener in self.listeners:
+            try:
+                with DB_WRITE_TIME.labels("listener").time():
+                    listener(db_session, rows)
+                    db_session.commit()
+            except Exception as e:
+                db_session.rollback()
+                print(f"Warning: response listener {listener.__name__} failed: {e}")
+        db_session.close()
+
+
+def _task_name(task: Task) -> str:
+    return getattr(task, "__qualname__", type(task).__name__)
+
+
+def _copy_result(source: Future, target: Future):
+    if source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
+
+
+response_writer = ResponseWriter()
+WRITER_QUEUE_DEPTH.set_callback(response_writer._queue.qsize)
@@ -0,0 +1,264 @@
+"""
+Latency regression detection per model, over time and across model versions.
+
+RegressionDetector keeps, per model and metric, the values of the model's
+latest completed, non-cached responses in a sliding window of
+2 x REGRESSION_WINDOW: the older half is the baseline, the newer half the
+recent sample. Every REGRESSION_CHECK_EVERY responses a one-sided
+Mann-Whitney U test asks whether recent values are worse than the baseline
+(TTFT higher, output tokens/sec lower). A regression is recorded when
+p < REGRESSION_P_VALUE and the medians differ by at least
+REGRESSION_MIN_CHANGE; the recent half then becomes the baseline, so a shift
+is reported once and later responses are compared with the new level.
+
+The windows are updated from every batch the response writer inserts (a
+listener) and seeded at startup from the latest responses of each model, so
+the table is never rescanned. Each regression records the model ID that
+served most of each window: a new ID on the recent side points at a version
+swapped in behind an alias such as cohere.command-latest. Each worker
+watches the responses it writes itself (plus the seed).
+"""
+import math
+import os
+import threading
+import time
+from collections import Counter, deque
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from .metrics import LATENCY_CHANGE, LATENCY_P_VALUE, LATENCY_REGRESSIONS
+from .models import LatencyRegression, ModelResponse
+from .tokens import throughput
+
+# Responses in each of the baseline and recent windows
+REGRESSION_WINDOW = int(os.getenv("REGRESSION_WINDOW", "50"))
+# New responses of a model between two tests
+REGRESSION_CHECK_EVERY = int(os.getenv("REGRESSION_CHECK_EVERY", "10"))
+# Significance level of the test; strict, since every model is tested often
+REGRESSION_P_VALUE = float(os.getenv("REGRESSION_P_VALUE", "0.001"))
+# Smallest relative change of the median worth reporting (0.2: 20% worse)
+REGRESSION_MIN_CHANGE = float(os.getenv("REGRESSION_MIN_CHANGE", "0.2"))
+
+# Metric -> +1 if higher is worse, -1 if lower is worse
+METRICS = {"ttft": 1, "output_tokens_per_second": -1}
+
+# (value, model ID, response id)
+Sample = Tuple[float, Optional[str], Optional[int]]
+
+
+def mann_whitney_p(baseline: np.ndarray, recent: np.ndarray) -> float:
+    """One-sided p-value that `recent` tends to be greater than `baseline`
+
+    Normal approximation with tie and continuity corrections, accurate for
+    windows of a few dozen values and more.
+    """
+    n1, n2 = len(baseline), len(recent)
+    values = np.concatenate([baseline, recent])
+    order = np.argsort(values, kind="mergesort")
+    _, first, counts = np.unique(values[order], return_index=True, return_counts=True)
+    ranks = np.empty(len(values))
+    # Tied values share the average of their 1-based ranks
+    ranks[order] = np.repeat(first + (counts + 1) / 2, counts)
+    u = ranks[n1:].sum() - n2 * (n2 + 1) / 2
+    n = n1 + n2
+    ties = float((counts**3 - counts).sum())
+    variance = n1 * n2 / 12 * ((n + 1) - ties / (n * (n - 1)))
+    if variance <= 0:
+        return 1.0  # every value equal
+    z = (u - n1 * n2 / 2 - 0.5) / math.sqrt(variance)
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def _metric_values(row) -> Dict[str, float]:
+    values = {"ttft": row.time_to_first_token}
+    rate = throughput(row.completion_tokens, row.time_to_first_token, row.total_time)
+    if rate["output_tokens_per_second"] is not None:
+        values["output_tokens_per_second"] = rate["output_tokens_per_second"]
+    return values
+
+
+def _most_common(samples: Iterable[Sample]) -> Optional[str]:
+    model_ids = Counter(model_id for _, model_id, _ in samples if model_id)
+    return model_ids.most_common(1)[0][0] if model_ids else None
+
+
+class _Window:
+    """Sliding baseline + recent window of one model's metric"""
+
+    __slots__ = ("samples", "since_check", "last_test")
+
+    def __init__(self, size: int):
+        self.samples: Deque[Sample] = deque(maxlen=2 * size)
+        self.since_check = 0
+        self.last_test: Optional[Dict] = None
+
+
+class RegressionDetector:
+    """Rolling per-model latency windows, tested as responses are inserted"""
+
+    def __init__(
+        self,
+        window: int = REGRESSION_WINDOW,
+        check_every: int = REGRESSION_CHECK_EVERY,
+        p_value: float = REGRESSION_P_VALUE,
+        min_change: float = REGRESSION_MIN_CHANGE,
+    ):
+        self.window = window
+        self.check_every = check_every
+        self.p_value = p_value
+        self.min_change = min_change
+        self._windows: Dict[Tuple[str, str], _Window] = {}
+        self._lock = threading.Lock()
+        # Lowest response id the listener saw; the seed stops below it
+        self._first_observed_id: Optional[int] = None
+        # Monotonic time of each model's latest observed response
+        self._last_observed: Dict[str, float] = {}
+
+    def _observe(self, row) -> List[Dict]:
+        """Add a response's values; returns the regressions it reveals"""
+        regressions = []
+        model_name = row.model_name
+        model_id = getattr(row, "model_id", None)
+        with self._lock:
+            for metric, value in _metric_values(row).items():
+                window = self._windows.get((model_name, metric))
+                if window is None:
+                    window = self._windows[(model_name, metric)] = _Window(self.window)
+                window.samples.append((value, model_id, row.id))
+                window.since_check += 1
+                if window.since_check < self.check_every or len(window.samples) < window.samples.maxlen:
+                    continue
+                window.since_check = 0
+                regression = self._test(model_name, metric, window)
+                if regression is not None:
+                    regressions.append(regression)
+        return regressions
+
+    def _test(self, model_name: str, metric: str, window: _Window) -> Optional[Dict]:
+        samples = list(window.samples)
+        baseline = np.array([value for value, _, _ in samples[: self.window]])
+        recent = np.array([value for value, _, _ in samples[self.window :]])
+        direction = METRICS[metric]
+        p_value = mann_whitney_p(direction * baseline, direction * recent)
+        baseline_median = float(np.median(baseline))
+        recent_median = float(np.median(recent))
+        change = recent_median / baseline_median - 1 if baseline_median else 0.0
+        window.last_test = {
+            "baseline_median": baseline_median,
+            "recent_median": recent_median,
+            "change": change,
+            "p_value": p_value,
+        }
+        if p_value >= self.p_value or direction * change < self.min_change:
+            return None
+        # The new level becomes the baseline: one report per shift
+        for _ in range(self.window):
+            window.samples.popleft()
+        return {
+            "model_name": model_name,
+            "metric": metric,
+            "baseline_median": baseline_median,
+            "recent_median": recent_median,
+            "change": change,
+            "p_value": p_value,
+            "baseline_samples": len(baseline),
+            "recent_samples": len(recent),
+            "baseline_model_id": _most_common(samples[: self.window]),
+            "recent_model_id": _most_common(samples[self.window :]),
+            "first_response_id": samples[self.window][2],
+            "last_response_id": samples[-1][2],
+        }
+
+    def observe_rows(self, db_session: Session, rows: Iterable):
+        """Test a batch of inserted responses and store regressions (response-writer listener)"""
+        for row in rows:
+            if row.id is not None and (
+                self._first_observed_id is None or row.id < self._first_observed_id
+            ):
+                self._first_observed_id = row.id
+            if row.status != "completed" or row.cached:
+                continue
+            self._last_observed[row.model_name] = time.monotonic()
+            for regression in self._observe(row):
+                print(
+                    f"Warning: {regression['model_name']} {regression['metric']} regressed "
+                    f"{regression['change']:+.0%} (p={regression['p_value']:.1e})"
+                )
+                LATENCY_REGRESSIONS.labels(regression["model_name"], regression["metric"]).inc()
+                db_session.add(LatencyRegression(**regression))
+
+    def seed(self, db_session: Session) -> int:
+        """Fill each model's windows from its latest responses; returns the count
+
+        Run as a response-writer task, so it is serialized with observe_rows
+        and skips the rows the listener already saw. Seeded values are not
+        tested: a shift before the restart was reported then.
+        """
+        model_names = [
+            name for (name,) in db_session.query(ModelResponse.model_name).distinct()
+        ]
+        seeded = 0
+        for model_name in model_names:
+            query = db_session.query(
+                ModelResponse.id,
+                ModelResponse.model_id,
+                ModelResponse.time_to_first_token,
+                ModelResponse.total_time,
+                ModelResponse.completion_tokens,
+            ).filter(
+                ModelResponse.model_name == model_name,
+                ModelResponse.status == "completed",
+                ModelResponse.cached.is_(False),
+            )
+            if self._first_observed_id is not None:
+                query = query.filter(ModelResponse.id < self._first_observed_id)
+            rows = query.order_by(ModelResponse.id.desc()).limit(2 * self.window).all()
+            # Older than anything observed: goes in front of the windows
+            with self._lock:
+                for row in rows:
+                    for metric, value in _metric_values(row).items():
+                        window = self._windows.get((model_name, metric))
+                        if window is None:
+                            window = self._windows[(model_name, metric)] = _Window(self.window)
+                        if len(window.samples) < window.samples.maxlen:
+                            window.samples.appendleft((value, row.model_id, row.id))
+            seeded += len(rows)
+        return seeded
+
+    def idle_for(self, model_name: str) -> float:
+        """Seconds since the model's latest observed response (inf if none)"""
+        last = self._last_observed.get(model_name)
+        return math.inf if last is None else time.monotonic() - last
+
+    def status(self, model_name: Optional[str] = None) -> List[Dict]:
+        """Current windows: sizes, model IDs and the last test of each"""
+        with self._lock:
+            items = sorted(self._windows.items())
+            return [
+                {
+                    "model_name": name,
+                    "metric": metric,
+                    "samples": len(window.samples),
+                    "baseline_model_id": _most_common(list(window.samples)[: self.window]),
+                    "recent_model_id": _most_common(list(window.samples)[self.window :]),
+                    **(window.last_test or {}),
+                }
+                for (name, metric), window in items
+                if model_name is None or name == model_name
+            ]
+
+    def last_tests(self, field: str) -> Dict[Tuple[str, str], float]:
+        """A field of every window's last test, by (model, metric), for gauges"""
+        with self._lock:
+            return {
+                key: window.last_test[field]
+                for key, window in self._windows.items()
+                if window.last_test is not None
+            }
+
+
+regression_detector = RegressionDetector()
+LATENCY_CHANGE.set_callback(lambda: regression_detector.last_tests("change"))
+LATENCY_P_VALUE.set_callback(lambda: regression_detector.last_tests("p_value"))
@@ -0,0 +1,132 @@
+"""
+Opt-in exact-match cache of model responses.
+
+Entries are keyed on the normalized prompt text, model key, resolved model id
+and generation params. A bounded in-memory LRU sits in front of the
+`response_cache` table; both tiers honor the same TTL. Entries keep the
+original token timings so a hit can be replayed with its original pacing.
+"""
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from .database import SessionLocal
+from .models import CachedResponse
+
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "86400"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+
+
+@dataclass
+class CacheEntry:
+    model_name: str
+    response_text: str
+    time_to_first_token: float
+    total_time: float
+    token_timings: List[Tuple[float, str]]  # (elapsed seconds, token)
+    stored_at: float  # unix timestamp
+
+
+def normalize_prompt(text: str) -> str:
+    """Collapse whitespace so trivially different copies of a prompt match"""
+    return " ".join(text.split())
+
+
+def make_cache_key(prompt: str, model_name: str, model_id: str, params: Dict) -> str:
+    payload = json.dumps(
+        [normalize_prompt(prompt), model_name, model_id, params],
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Two-tier (memory LRU + database) response cache
+
+    The memory tier is only touched from the event loop; the database
+    methods block and are meant to run on an executor.
+    """
+
+    def __init__(
+        self,
+        ttl: float = RESPONSE_CACHE_TTL_SECONDS,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._memory: "OrderedDict[str, CacheEntry]" = OrderedDict()
+
+    def _expired(self, entry: CacheEntry) -> bool:
+        return time.time() - entry.stored_at > self.ttl
+
+    def get_memory(self, key: str) -> Optional[CacheEntry]:
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        if self._expired(entry):
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        return entry
+
+    def put_memory(self, key: str, entry: CacheEntry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def load(self, key: str) -> Optional[CacheEntry]:
+        """Read an entry from the database tier (blocking)"""
+        db_session = SessionLocal()
+        try:
+            row = db_session.get(CachedResponse, key)
+            if row is None:
+                return None
+            created_at = row.created_at
+            if created_at.tzinfo is None:
+                created_at = created_at.replace(tzinfo=timezone.utc)
+            entry = CacheEntry(
+                model_name=row.model_name,
+                response_text=row.response_text,
+                time_to_first_token=row.time_to_first_token,
+                total_time=row.total_time,
+                token_timings=[tuple(t) for t in json.loads(row.token_timings)],
+                stored_at=created_at.timestamp(),
+            )
+            if self._expired(entry):
+                db_session.delete(row)
+                db_session.commit()
+                return None
+            return entry
+        finally:
+            db_session.close()
+
+    def store(self, key: str, entry: CacheEntry, model_id: str):
+        """Write an entry to the database tier and purge expired rows (blocking)"""
+        db_session = SessionLocal()
+        try:
+            cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.ttl)
+            db_session.query(CachedResponse).filter(
+                CachedResponse.created_at < cutoff
+            ).delete(synchronize_session=False)
+            db_session.merge(
+                CachedResponse(
+                    key=key,
+                    model_name=entry.model_name,
+                    model_id=model_id,
+                    response_text=entry.response_text,
+                    time_to_first_token=entry.time_to_first_token,
+                    total_time=entry.total_time,
+                    token_timings=json.dumps(entry.token_timings),
+                    created_at=datetime.fromtimestamp(entry.stored_at, timezone.utc),
+                )
+            )
+            db_session.commit()
+        finally:
+            db_session.close()
@@ -0,0 +1,40 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from datetime import datetime, timedelta, timezone
+from ..database import get_db
+from ..analytics import latency_report
+from ..schemas import LatencyReport
+
+router = APIRouter(prefix="/api/analytics", tags=["analytics"])
+
+
+def to_utc(value: datetime) -> datetime:
+    """Naive UTC, as timestamps are stored; naive input is taken as UTC"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+@router.get("/latency", response_model=LatencyReport)
+def get_latency(
+    models: Optional[List[str]] = Query(None, description="Models to report (default: all)"),
+    start: Optional[datetime] = Query(None, description="Range start (default: 7 days before end)"),
+    end: Optional[datetime] = Query(None, description="Range end, exclusive (default: now)"),
+    exact: bool = Query(False, description="Exact percentiles from raw rows instead of rollups"),
+    db: Session = Depends(get_db),
+):
+    """Per-model count, mean and percentiles of TTFT, total time and throughput
+
+    Only completed, non-cached responses are counted.
+    """
+    end = to_utc(end) if end else datetime.now(timezone.utc).replace(tzinfo=None)
+    start = to_utc(start) if start else end - timedelta(days=7)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    return LatencyReport(
+        start=start,
+        end=end,
+        exact=exact,
+        models=latency_report(db, start, end, models=models, exact=exact),
+    )
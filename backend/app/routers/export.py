@@ -0,0 +1,40 @@
+from fastapi import APIRouter, Query
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
+from datetime import datetime
+from ..database import SessionLocal
+from ..export import EXPORT_BATCH_ROWS, export_batches, ndjson_chunks
+from .analytics import to_utc
+
+router = APIRouter(prefix="/api/export", tags=["export"])
+
+
+@router.get("")
+def export_history(
+    models: Optional[List[str]] = Query(None, description="Only responses of these models"),
+    start: Optional[datetime] = Query(None, description="Created at or after"),
+    end: Optional[datetime] = Query(None, description="Created before"),
+):
+    """Every response with its prompt, as NDJSON streamed from a server-side cursor"""
+
+    def records():
+        # Its own session: the response outlives the request's dependencies
+        db_session = SessionLocal()
+        try:
+            yield from ndjson_chunks(
+                export_batches(
+                    db_session,
+                    start=to_utc(start) if start else None,
+                    end=to_utc(end) if end else None,
+                    models=models,
+                    batch_size=EXPORT_BATCH_ROWS,
+                )
+            )
+        finally:
+            db_session.close()
+
+    return StreamingResponse(
+        records(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="history.ndjson"'},
+    )
@@ -0,0 +1,140 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from typing import List
+from ..database import get_db, SessionLocal
+from ..models import EvaluationJob, ModelResponse, Prompt
+from ..schemas import JobCreate, JobSchema, JobResultItem
+from ..jobs import JobRunner, create_job, get_job_counts, parse_dataset
+from .stream import engine, llm_service
+import json
+
+router = APIRouter(prefix="/api/jobs", tags=["jobs"])
+job_runner = JobRunner(engine)
+
+
+def build_job_schema(job: EvaluationJob) -> JobSchema:
+    """Combine the stored job with its result counts and live throughput"""
+    models = json.loads(job.models)
+    counts = get_job_counts(job.id)
+    progress = job_runner.get_progress(job.id)
+    return JobSchema(
+        id=job.id,
+        status=job.status,
+        models=models,
+        total_prompts=job.total_prompts,
+        total=job.total_prompts * len(models),
+        done=sum(counts.values()),
+        counts=counts,
+        prompts_per_minute=progress.snapshot()["prompts_per_minute"] if progress else None,
+        created_at=job.created_at,
+        finished_at=job.finished_at,
+    )
+
+
+def load_job_schema(job_id: int) -> JobSchema:
+    """The job's schema (blocking)"""
+    db = SessionLocal()
+    try:
+        job = db.get(EvaluationJob, job_id)
+        if not job:
+            raise HTTPException(status_code=404, detail="Job not found")
+        return build_job_schema(job)
+    finally:
+        db.close()
+
+
+@router.post("", response_model=JobSchema, status_code=201)
+async def create_evaluation_job(job: JobCreate):
+    """Create a batch job from inline prompts or a JSONL/CSV dataset and start it"""
+    available_models = llm_service.get_available_models()
+    models = list(dict.fromkeys(job.models))
+    unknown = [m for m in models if m not in available_models]
+    if not models or unknown:
+        raise HTTPException(
+            status_code=400, detail=f"Unknown or unavailable models: {unknown}"
+        )
+
+    try:
+        prompts = job.prompts or parse_dataset(job.dataset or "", job.dataset_format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not prompts:
+        raise HTTPException(status_code=400, detail="Job has no prompts")
+
+    job_id = await run_in_threadpool(
+        create_job, prompts, models, job.max_concurrency, job.per_model_concurrency
+    )
+    job_runner.start(job_id)
+    return await run_in_threadpool(load_job_schema, job_id)
+
+
+@router.get("/{job_id}", response_model=JobSchema)
+def get_job(job_id: int, db: Session = Depends(get_db)):
+    """Get a job's status and progress"""
+    job = db.get(EvaluationJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return build_job_schema(job)
+
+
+@router.get("/{job_id}/results", response_model=List[JobResultItem])
+def get_job_results(
+    job_id: int,
+    after_id: int = Query(0, description="Return results with an id greater than this"),
+    limit: int = Query(500, ge=1, le=5000),
+    db: Session = Depends(get_db),
+):
+    """Page through a job's responses in id order"""
+    if not db.get(EvaluationJob, job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return (
+        db.query(ModelResponse)
+        .join(Prompt, Prompt.id == ModelResponse.prompt_id)
+        .filter(Prompt.job_id == job_id, ModelResponse.id > after_id)
+        .order_by(ModelResponse.id)
+        .limit(limit)
+        .all()
+    )
+
+
+@router.post("/{job_id}/cancel", response_model=JobSchema)
+async def cancel_job(job_id: int):
+    """Stop a running job; it can be resumed by restarting the service"""
+    if not job_runner.cancel(job_id):
+        raise HTTPException(status_code=409, detail="Job is not running")
+    return await run_in_threadpool(load_job_schema, job_id)
+
+
+@router.get("/{job_id}/stream")
+async def stream_job(job_id: int):
+    """Stream job progress snapshots (SSE) until the job stops"""
+    final_snapshot = (await run_in_threadpool(load_job_schema, job_id)).dict()
+
+    async def progress_generator():
+        progress = job_runner.get_progress(job_id)
+        if progress is None or progress.status != "running":
+            yield f"data: {json.dumps(final_snapshot, default=str)}\n\n"
+            return
+        changed = progress.subscribe()
+        try:
+            while True:
+                await changed.wait()
+                changed.clear()
+                snapshot = progress.snapshot()
+                yield f"data: {json.dumps(snapshot)}\n\n"
+                if snapshot["status"] != "running":
+                    return
+        finally:
+            progress.unsubscribe(changed)
+
+    return StreamingResponse(
+        progress_generator(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+        },
+    )
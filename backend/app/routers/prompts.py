@@ -1,57 +1,40 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List, Dict
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import func, literal, select, tuple_
+from sqlalchemy.orm import Session, selectinload
+from datetime import datetime
+from typing import List, Dict, Optional, Tuple
 from ..database import get_db
-from ..models import Prompt
-from ..schemas import PromptCreate, PromptResponse, PromptListItem
-
-# Model registry mapping - maps model keys to their environment variable names
-# This is used to determine which models are available based on env vars
-MODEL_ENV_MAP = {
-    # xAI Grok Models
-    "xai.grok-4": "OCI_XAI_GROK_4_MODEL_ID",
-    "xai.grok-4-fast-reasoning": "OCI_XAI_GROK_4_FAST_REASONING_MODEL_ID",
-    "xai.grok-4-fast-non-reasoning": "OCI_XAI_GROK_4_FAST_NON_REASONING_MODEL_ID",
-    "xai.grok-3": "OCI_XAI_GROK_3_MODEL_ID",
-    "xai.grok-3-fast": "OCI_XAI_GROK_3_FAST_MODEL_ID",
-    "xai.grok-3-mini": "OCI_XAI_GROK_3_MINI_MODEL_ID",
-    "xai.grok-3-mini-fast": "OCI_XAI_GROK_3_MINI_FAST_MODEL_ID",
-    # Meta Llama Models
-    "meta.llama-4-maverick-17b-128e-instruct-fp8": "OCI_META_LLAMA_4_MAVERICK_17B_128E_INSTRUCT_FP8_MODEL_ID",
-    "meta.llama-4-scout-17b-16e-instruct": "OCI_META_LLAMA_4_SCOUT_17B_16E_INSTRUCT_MODEL_ID",
-    "meta.llama-3.3-70b-instruct": "OCI_META_LLAMA_3_3_70B_INSTRUCT_MODEL_ID",
-    "meta.llama-3.1-405b-instruct": "OCI_META_LLAMA_3_1_405B_INSTRUCT_MODEL_ID",
-    # Cohere Models
-    "cohere.command-latest": "OCI_COHERE_COMMAND_LATEST_MODEL_ID",
-    "cohere.command-a-03-2025": "OCI_COHERE_COMMAND_A_03_2025_MODEL_ID",
-    "cohere.command-plus-latest": "OCI_COHERE_COMMAND_PLUS_LATEST_MODEL_ID",
-    # Google Gemini Models
-    "google.gemini-2.5-pro": "OCI_GOOGLE_GEMINI_2_5_PRO_MODEL_ID",
-    "google.gemini-2.5-flash": "OCI_GOOGLE_GEMINI_2_5_FLASH_MODEL_ID",
-    "google.gemini-2.5-flash-lite": "OCI_GOOGLE_GEMINI_2_5_FLASH_LITE_MODEL_ID",
-}
-
-
-def get_available_model_registry():
-    """Get model registry based on environment variables"""
-    import os
-
-    registry = {}
-    for model_key, env_var in MODEL_ENV_MAP.items():
-        model_id = os.getenv(env_var)
-        if model_id:
-            # Remove 'oci/' prefix if present
-            if model_id.startswith("oci/"):
-                model_id = model_id[4:]
-            registry[model_key] = model_id
-    return registry
-
+from ..model_registry import models_by_provider
+from ..models import ModelResponse, Prompt
+from ..schemas import PromptCreate, PromptResponse, PromptListItem, PromptPage, TokenTraceSchema
+from ..traces import TokenTrace
+import base64
+import json
 
 router = APIRouter(prefix="/api/prompts", tags=["prompts"])
 
+# The history list ships a preview instead of the full prompt text
+PREVIEW_LENGTH = 200
+LIST_FIELDS = ("id", "preview", "truncated", "created_at", "job_id", "response_count")
+DEFAULT_LIST_FIELDS = "id,preview,truncated,created_at"
+
+
+def encode_cursor(created_at: datetime, prompt_id: int) -> str:
+    return base64.urlsafe_b64encode(
+        json.dumps([created_at.isoformat(), prompt_id]).encode()
+    ).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        created_at, prompt_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), int(prompt_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 
 @router.post("", response_model=PromptResponse, status_code=201)
-async def create_prompt(prompt: PromptCreate, db: Session = Depends(get_db)):
+def create_prompt(prompt: PromptCreate, db: Session = Depends(get_db)):
     """Create a new prompt record (responses are generated via streaming endpoint)"""
     # Create prompt record
     db_prompt = Prompt(text=prompt.text)
@@ -62,37 +45,101 @@ async def create_prompt(prompt: PromptCreate, db: Session = Depends(get_db)):
     return db_prompt
 
 
-@router.get("", response_model=List[PromptListItem])
-def get_prompts(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    """Get all prompts"""
-    prompts = db.query(Prompt).offset(skip).limit(limit).all()
-    return prompts
+@router.get("", response_model=PromptPage, response_model_exclude_unset=True)
+def get_prompts(
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    limit: int = Query(50, ge=1, le=500),
+    fields: str = Query(
+        DEFAULT_LIST_FIELDS, description=f"Comma-separated subset of {', '.join(LIST_FIELDS)}"
+    ),
+    db: Session = Depends(get_db),
+):
+    """Page through prompts, newest first, using keyset pagination on (created_at, id)
+
+    Prompts rendered by sweeps are left out; their grids show them.
+    """
+    wanted = {"id", *(f.strip() for f in fields.split(",") if f.strip())}
+    unknown = wanted.difference(LIST_FIELDS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {sorted(unknown)}")
+
+    # created_at is always read: the cursor is keyed on it
+    columns = [Prompt.id, Prompt.created_at]
+    if wanted & {"preview", "truncated"}:
+        columns.append(func.substr(Prompt.text, 1, PREVIEW_LENGTH + 1).label("preview"))
+    if "job_id" in wanted:
+        columns.append(Prompt.job_id)
+    if "response_count" in wanted:
+        columns.append(
+            select(func.count(ModelResponse.id))
+            .where(ModelResponse.prompt_id == Prompt.id)
+            .scalar_subquery()
+            .label("response_count")
+        )
+
+    query = db.query(*columns).filter(Prompt.sweep_id.is_(None))
+    if cursor:
+        after_created_at, after_id = decode_cursor(cursor)
+        query = query.filter(
+            tuple_(Prompt.created_at, Prompt.id)
+            < tuple_(literal(after_created_at, Prompt.created_at.type), literal(after_id))
+        )
+    rows = (
+        query.order_by(Prompt.created_at.desc(), Prompt.id.desc())
+        .limit(limit + 1)
+        .all()
+    )
+
+    items = []
+    for row in rows[:limit]:
+        values = row._asdict()
+        item = {field: values[field] for field in wanted if field in values}
+        if "preview" in values:
+            preview = values["preview"]
+            if "preview" in wanted:
+                item["preview"] = preview[:PREVIEW_LENGTH]
+            if "truncated" in wanted:
+                item["truncated"] = len(preview) > PREVIEW_LENGTH
+        items.append(PromptListItem(**item))
+
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = encode_cursor(last.created_at, last.id)
+    return PromptPage(items=items, next_cursor=next_cursor)
 
 
 @router.get("/{prompt_id}", response_model=PromptResponse)
 def get_prompt(prompt_id: int, db: Session = Depends(get_db)):
     """Get a specific prompt with all model responses"""
-    prompt = db.query(Prompt).filter(Prompt.id == prompt_id).first()
+    prompt = (
+        db.query(Prompt)
+        .options(selectinload(Prompt.model_responses))
+        .filter(Prompt.id == prompt_id)
+        .first()
+    )
     if not prompt:
         raise HTTPException(status_code=404, detail="Prompt not found")
     return prompt
 
 
+@router.get("/{prompt_id}/responses/{response_id}/trace", response_model=TokenTraceSchema)
+def get_response_trace(prompt_id: int, response_id: int, db: Session = Depends(get_db)):
+    """Get the per-chunk timing trace of a response"""
+    token_trace = (
+        db.query(ModelResponse.token_trace)
+        .filter(ModelResponse.id == response_id, ModelResponse.prompt_id == prompt_id)
+        .scalar()
+    )
+    if token_trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    trace = TokenTrace.decode(token_trace)
+    return TokenTraceSchema(response_id=response_id, metrics=trace.metrics(), **trace.to_dict())
+
+
 @router.get("/models/registry")
 def get_model_registry() -> Dict[str, List[str]]:
     """Get the model registry organized by provider"""
-    # Return all models from MODEL_ENV_MAP, regardless of whether env vars are set
+    # Return all known models, regardless of whether env vars are set
     # This allows users to see all available models in the UI
-    organized = {"xAI Grok": [], "Meta Llama": [], "Cohere": [], "Google Gemini": []}
-
-    for model_key in MODEL_ENV_MAP.keys():
-        if model_key.startswith("xai."):
-            organized["xAI Grok"].append(model_key)
-        elif model_key.startswith("meta."):
-            organized["Meta Llama"].append(model_key)
-        elif model_key.startswith("cohere."):
-            organized["Cohere"].append(model_key)
-        elif model_key.startswith("google."):
-            organized["Google Gemini"].append(model_key)
-
-    return organized
+    return models_by_provider()
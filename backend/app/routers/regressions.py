@@ -0,0 +1,32 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from ..database import get_db
+from ..models import LatencyRegression
+from ..regressions import regression_detector
+from ..schemas import LatencyRegressionSchema, RegressionWindow
+
+router = APIRouter(prefix="/api/regressions", tags=["regressions"])
+
+
+@router.get("", response_model=List[LatencyRegressionSchema])
+def list_regressions(
+    models: Optional[List[str]] = Query(None, description="Only these models"),
+    after_id: int = Query(0, description="Only regressions with an id greater than this"),
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+):
+    """Detected latency regressions, newest first"""
+    query = db.query(LatencyRegression).filter(LatencyRegression.id > after_id)
+    if models:
+        query = query.filter(LatencyRegression.model_name.in_(models))
+    return query.order_by(LatencyRegression.id.desc()).limit(limit).all()
+
+
+@router.get("/windows", response_model=List[RegressionWindow])
+def list_windows(model: Optional[str] = Query(None, description="Only this model")):
+    """The windows regressions are tested on and their last test, per model and metric
+
+    Held in memory by this worker; the database is not queried.
+    """
+    return regression_detector.status(model)
@@ -0,0 +1,26 @@
+from fastapi import APIRouter, HTTPException, Query
+from typing import List
+from ..routing import latency_tracker
+from ..schemas import RouteDecision
+from .stream import llm_service
+
+router = APIRouter(prefix="/api/routing", tags=["routing"])
+
+
+@router.get("", response_model=RouteDecision)
+def route_models(
+    models: List[str] = Query(..., description="Candidate models"),
+    hedge: bool = Query(False, description="Also pick a backup to hedge with"),
+    objective: str = Query("ttft", pattern="^(ttft|total_time)$", description="Latency to minimize"),
+):
+    """Pick the candidate with the best expected latency from recent history
+
+    Estimates come from in-memory per-model statistics of recent responses;
+    the database is not queried. Stream a prompt with `route=true` to have
+    this decision applied to it.
+    """
+    available = set(llm_service.get_available_models())
+    candidates = [model for model in dict.fromkeys(models) if model in available]
+    if not candidates:
+        raise HTTPException(status_code=400, detail="No valid models selected")
+    return latency_tracker.route(candidates, hedge=hedge, objective=objective)
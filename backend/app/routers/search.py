@@ -0,0 +1,46 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from datetime import datetime
+from ..database import get_db
+from ..schemas import SearchResults
+from ..search import SearchQueryError, search
+from .analytics import to_utc
+
+router = APIRouter(prefix="/api/search", tags=["search"])
+
+SCOPES = {"all": ("prompt", "response"), "prompts": ("prompt",), "responses": ("response",)}
+
+
+@router.get("", response_model=SearchResults)
+def search_history(
+    q: str = Query(..., min_length=1, description="Words to search for"),
+    scope: str = Query("all", pattern="^(all|prompts|responses)$"),
+    models: Optional[List[str]] = Query(None, description="Only responses of (and prompts answered by) these models"),
+    start: Optional[datetime] = Query(None, description="Created at or after"),
+    end: Optional[datetime] = Query(None, description="Created before"),
+    syntax: str = Query(
+        "plain",
+        pattern="^(plain|fts)$",
+        description="'plain' matches every word; 'fts' takes the full-text query syntax (phrases, OR, NOT, prefix*)",
+    ),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=1000),
+    db: Session = Depends(get_db),
+):
+    """Full-text search over prompts and model responses, best matches first"""
+    try:
+        hits = search(
+            db,
+            q,
+            kinds=SCOPES[scope],
+            models=models,
+            start=to_utc(start) if start else None,
+            end=to_utc(end) if end else None,
+            limit=limit,
+            offset=offset,
+            syntax=syntax,
+        )
+    except SearchQueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return SearchResults(query=q, hits=hits)
@@ -1,79 +1,80 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List, Optional
-from ..database import get_db, SessionLocal
-from ..models import Prompt, ModelResponse
-from ..schemas import StreamUpdate
+from typing import AsyncIterator, List, Optional
+from ..database import SessionLocal, get_db
+from ..models import Prompt
 from ..llm_service import LLMService
+from ..metrics import (
+    ACTIVE_STREAMS,
+    CONCURRENCY_LIMIT,
+    GENERATIONS_IN_FLIGHT,
+    GENERATIONS_QUEUED,
+    SSE_BYTES,
+    SSE_EVENTS,
+    span,
+)
+from ..fanout import FanoutEngine, MAX_CONCURRENT_GENERATIONS
+from ..response_cache import ResponseCache
+from ..coordination import create_run_manager
+from ..routing import latency_tracker
+from ..runs import run_key, stored_updates
+from ..sse import FRAMINGS, compact_frames, event_frames, format_sse, parse_event_id
 import json
-import asyncio
 from concurrent.futures import ThreadPoolExecutor
-from queue import Queue
-from threading import Thread
 
 router = APIRouter(prefix="/api/prompts", tags=["stream"])
 llm_service = LLMService()
-executor = ThreadPoolExecutor(max_workers=4)
+# Runs model initialization and local token counting; sized to the global
+# generation cap so every admitted generation gets a thread. Blocking provider
+# streams have threads of their own (LLMService._astream)
+executor = ThreadPoolExecutor(
+    max_workers=MAX_CONCURRENT_GENERATIONS, thread_name_prefix="llm-stream"
+)
+db_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="llm-db")
+engine = FanoutEngine(
+    llm_service, executor, db_executor, response_cache=ResponseCache()
+)
+runs = create_run_manager(engine)
 
 
-def generate_with_streaming(
-    model_name: str, 
-    prompt_text: str, 
-    prompt_id: int, 
-    update_queue: Queue
-):
-    """Generate response with streaming updates sent to queue"""
+def _scheduler_gauge(field: str):
+    return lambda: {
+        (model_key,): state[field] for model_key, state in engine.scheduler.snapshot().items()
+    }
+
+
+GENERATIONS_IN_FLIGHT.set_callback(_scheduler_gauge("in_flight"))
+GENERATIONS_QUEUED.set_callback(_scheduler_gauge("queued"))
+CONCURRENCY_LIMIT.set_callback(_scheduler_gauge("limit"))
+
+
+def _stored_updates(prompt_id: int, models: List[str]):
     db_session = SessionLocal()
-    
-    def stream_callback(token: str, metrics: dict):
-        """Callback for streaming tokens"""
-        update = StreamUpdate(
-            model_name=model_name,
-            token=token,
-            time_to_first_token=metrics.get("time_to_first_token"),
-            total_time=metrics.get("elapsed_time"),
-            is_complete=False
-        )
-        update_queue.put(update.dict())
-    
     try:
-        response_text, time_to_first_token, total_time = llm_service.generate_with_metrics(
-            model_name, prompt_text, stream_callback=stream_callback
-        )
-        
-        # Save to database
-        model_response = ModelResponse(
-            prompt_id=prompt_id,
-            model_name=model_name,
-            response_text=response_text,
-            time_to_first_token=time_to_first_token,
-            total_time=total_time
-        )
-        db_session.add(model_response)
-        db_session.commit()
-        
-        # Send completion update
-        completion_update = StreamUpdate(
-            model_name=model_name,
-            time_to_first_token=time_to_first_token,
-            total_time=total_time,
-            is_complete=True
-        )
-        update_queue.put(completion_update.dict())
-        
-    except Exception as e:
-        error_update = StreamUpdate(
-            model_name=model_name,
-            is_complete=True,
-            error=str(e)
-        )
-        update_queue.put(error_update.dict())
+        return stored_updates(db_session, prompt_id, models)
     finally:
         db_session.close()
 
 
-async def stream_generator(prompt_id: int, prompt_text: str, db: Session, selected_models: Optional[List[str]] = None):
+async def stream_generator(
+    prompt_id: int,
+    prompt_text: str,
+    selected_models: Optional[List[str]] = None,
+    framing: str = "events",
+    coalesce_ms: float = 20,
+    coalesce_bytes: int = 256,
+    use_cache: bool = False,
+    replay: str = "instant",
+    user: str = "anonymous",
+    last_event_id: Optional[str] = None,
+    rerun: bool = False,
+    first_k: Optional[int] = None,
+    min_tokens: Optional[int] = None,
+    route: bool = False,
+    hedge: bool = False,
+):
     """Generator function for SSE streaming"""
     # Get available models
     all_available_models = llm_service.get_available_models()
@@ -91,60 +92,180 @@ async def stream_generator(prompt_id: int, prompt_text: str, db: Session, select
     else:
         available_models = all_available_models
     
-    # Create a shared queue for all model updates
-    update_queue = Queue()
-    
-    # Start all model generations in separate threads
-    threads = []
-    for model_name in available_models:
-        thread = Thread(
-            target=generate_with_streaming,
-            args=(model_name, prompt_text, prompt_id, update_queue)
+    available_models = list(dict.fromkeys(available_models))
+
+    start_delays = None
+    if route or hedge:
+        decision = latency_tracker.route(available_models, hedge=hedge)
+        available_models = [decision["primary"]]
+        if decision["backup"]:
+            # Hedge: the backup starts if the primary has no first token by
+            # its p90 TTFT, and whichever streams first wins
+            available_models.append(decision["backup"])
+            start_delays = {decision["backup"]: decision["hedge_after"]}
+            first_k, min_tokens = 1, 1
+
+    # Join the prompt's run for the same models and options (any of its runs
+    # if no models were named); otherwise start one that replays stored
+    # answers and generates only the models without one
+    key = None
+    if selected_models or first_k or route or hedge:
+        key = run_key(available_models, use_cache, replay, first_k, min_tokens, start_delays)
+    run = await runs.find(prompt_id, key)
+    if run is None or ((rerun or first_k) and run.finished):
+        stored = []
+        # A race times every model now, so stored answers don't take part
+        if not rerun and not first_k:
+            stored = await run_in_threadpool(_stored_updates, prompt_id, available_models)
+        run = await runs.start(
+            prompt_id,
+            prompt_text,
+            available_models,
+            stored=stored,
+            use_cache=use_cache,
+            replay=replay,
+            user=user,
+            first_k=first_k,
+            min_tokens=min_tokens,
+            start_delays=start_delays,
         )
-        thread.start()
-        threads.append(thread)
-    
-    # Track completed models
-    completed_models = set()
-    
+
+    # Resume after the client's last event if it belongs to this run
+    last_run_id, last_seq = parse_event_id(last_event_id)
+    same_run = last_run_id == run.id
+
+    # Stream updates from all models as they arrive
+    if framing == "compact":
+        window = coalesce_ms / 1000
+        frames = compact_frames(
+            runs.attach(
+                run,
+                after=last_seq if same_run else 0,
+                reset=last_run_id is not None and not same_run,
+                heartbeat=window or None,
+            ),
+            run.id,
+            run.models,
+            window=window,
+            max_bytes=coalesce_bytes,
+        )
+    else:
+        frames = event_frames(
+            runs.attach(
+                run,
+                after=last_seq if same_run else 0,
+                reset=last_run_id is not None and not same_run,
+            ),
+            run.id,
+        )
+    async for frame in frames:
+        yield frame
+    # Tells EventSource clients not to reconnect
+    yield format_sse("{}", "end")
+
+
+async def metered(frames: AsyncIterator[str], framing: str) -> AsyncIterator[bytes]:
+    """Encode frames for the response, counting them and open streams"""
+    sse_bytes = SSE_BYTES.labels(framing)
+    sse_events = SSE_EVENTS.labels(framing)
+    ACTIVE_STREAMS.inc()
     try:
-        # Stream updates as they arrive
-        while len(completed_models) < len(available_models):
-            try:
-                # Get update from queue with timeout
-                update = update_queue.get(timeout=0.1)
-                
-                # Send update via SSE
-                yield f"data: {json.dumps(update)}\n\n"
-                
-                # Check if this model is complete
-                if update.get("is_complete"):
-                    completed_models.add(update.get("model_name"))
-                    
-            except Exception:
-                # Timeout or empty queue, continue checking
-                await asyncio.sleep(0.05)
-                continue
-    
+        with span("sse.stream", current=False, framing=framing):
+            async for frame in frames:
+                data = frame.encode()
+                sse_bytes.inc(len(data))
+                sse_events.inc()
+                yield data
     finally:
-        # Wait for all threads to complete
-        for thread in threads:
-            thread.join(timeout=5)
+        ACTIVE_STREAMS.dec()
 
 
 @router.get("/{prompt_id}/stream")
 async def stream_prompt(
     prompt_id: int, 
+    request: Request,
     db: Session = Depends(get_db),
-    models: Optional[List[str]] = Query(None, description="List of model names to run")
+    models: Optional[List[str]] = Query(None, description="List of model names to run"),
+    framing: str = Query(
+        "events",
+        pattern=f"^({'|'.join(FRAMINGS)})$",
+        description="'events' sends one frame per token; 'compact' coalesces tokens",
+    ),
+    coalesce_ms: float = Query(20, ge=0, le=1000, description="Compact framing time window"),
+    coalesce_bytes: int = Query(256, ge=1, description="Compact framing size window"),
+    cache: bool = Query(False, description="Replay cached answers for identical requests"),
+    replay: str = Query(
+        "instant",
+        pattern="^(instant|timed)$",
+        description="Replay cached answers instantly or with their original token timing",
+    ),
+    rerun: bool = Query(False, description="Generate again instead of replaying stored answers"),
+    first_k: Optional[int] = Query(
+        None, ge=1, description="Race mode: cancel the other models once this many finished"
+    ),
+    min_tokens: Optional[int] = Query(
+        None,
+        ge=1,
+        description="Race mode: a model finishes once it streamed this many tokens (first_k defaults to 1)",
+    ),
+    route: bool = Query(False, description="Generate only the model with the best expected TTFT"),
+    hedge: bool = Query(
+        False, description="Route, and start the runner-up if the pick is slower than its p90 TTFT"
+    ),
+    last_event_id: Optional[str] = Query(
+        None, description="Resume after this event id (for clients that cannot set Last-Event-ID)"
+    ),
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID"),
 ):
-    """Stream real-time updates as models generate responses"""
-    prompt = db.query(Prompt).filter(Prompt.id == prompt_id).first()
+    """Stream real-time updates as models generate responses
+
+    The generation runs independently of this connection: other clients
+    watching the same prompt share it, and a reconnect with Last-Event-ID
+    resumes where it left off. Models already answered are replayed from the
+    database.
+
+    With `first_k` (and optionally `min_tokens`) the models race: once the
+    first k finished, the others are cancelled, saved with their partial
+    output and reported with status "cancelled"; winners carry their `rank`.
+    A race always generates, like `rerun`.
+
+    With `route` only the selected model with the best expected TTFT (see
+    GET /api/routing) is generated; `hedge` also starts the runner-up if the
+    first has no token by its p90 TTFT, and cancels the slower of the two.
+    """
+    prompt = await run_in_threadpool(db.get, Prompt, prompt_id)
     if not prompt:
         raise HTTPException(status_code=404, detail="Prompt not found")
+    prompt_text = prompt.text
+    # Streams can outlive the request by minutes; don't hold a pooled connection
+    await run_in_threadpool(db.close)
+
+    # Generations are queued fairly per user when models are saturated
+    user = request.headers.get("X-User-Id") or (
+        request.client.host if request.client else "anonymous"
+    )
     
     return StreamingResponse(
-        stream_generator(prompt_id, prompt.text, db, selected_models=models),
+        metered(
+            stream_generator(
+                prompt_id,
+                prompt_text,
+                selected_models=models,
+                framing=framing,
+                coalesce_ms=coalesce_ms,
+                coalesce_bytes=coalesce_bytes,
+                use_cache=cache,
+                replay=replay,
+                user=user,
+                last_event_id=last_event_id_header or last_event_id,
+                rerun=rerun,
+                first_k=first_k or (1 if min_tokens else None),
+                min_tokens=min_tokens,
+                route=route,
+                hedge=hedge,
+            ),
+            framing,
+        ),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
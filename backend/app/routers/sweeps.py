@@ -0,0 +1,158 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from ..llm_service import OVERRIDABLE_PARAMS
+from ..schemas import SweepCreate, SweepGrid
+from ..sweeps import (
+    SWEEP_MAX_CELLS,
+    SweepProgress,
+    SweepRunner,
+    cell_count,
+    create_sweep,
+    load_sweep,
+    param_combinations,
+)
+from .stream import engine, llm_service
+import json
+
+router = APIRouter(prefix="/api/sweeps", tags=["sweeps"])
+sweep_runner = SweepRunner(engine)
+
+
+def build_sweep_grid(sweep_id: int) -> SweepGrid:
+    """The sweep's axes and every cell with its result so far (blocking)"""
+    loaded = load_sweep(sweep_id)
+    if loaded is None:
+        raise HTTPException(status_code=404, detail="Sweep not found")
+    sweep, spec, cells, prompt_ids, results = loaded
+    first_cell = {}
+    grid_cells = []
+    for cell in cells:
+        first = first_cell.setdefault(cell.key, cell.index)
+        grid_cells.append(
+            {
+                "index": cell.index,
+                "variables": cell.variables,
+                "system_prompt": cell.system_prompt,
+                "params": cell.params,
+                "model_name": cell.model_name,
+                "prompt_id": prompt_ids[cell.key[0]],
+                "duplicate_of": first if first != cell.index else None,
+                "result": results.get(cell.key),
+            }
+        )
+    return SweepGrid(
+        id=sweep.id,
+        status=sweep.status,
+        total_cells=sweep.total_cells,
+        unique_cells=sweep.unique_cells,
+        done=len(results),
+        created_at=sweep.created_at,
+        finished_at=sweep.finished_at,
+        template=spec["template"],
+        variables=spec["variables"],
+        system_prompts=spec["system_prompts"],
+        params=param_combinations(spec["params"]),
+        models=spec["models"],
+        cells=grid_cells,
+    )
+
+
+@router.post("", response_model=SweepGrid, status_code=201)
+async def create_prompt_sweep(sweep: SweepCreate):
+    """Expand a template, variable sets, system prompts and a params grid across models and run it"""
+    available_models = llm_service.get_available_models()
+    models = list(dict.fromkeys(sweep.models))
+    unknown = [m for m in models if m not in available_models]
+    if not models or unknown:
+        raise HTTPException(
+            status_code=400, detail=f"Unknown or unavailable models: {unknown}"
+        )
+    unsupported = [name for name in sweep.params if name not in OVERRIDABLE_PARAMS]
+    if unsupported:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported params {unsupported}; sweeps can vary {list(OVERRIDABLE_PARAMS)}",
+        )
+    if any(not values for values in sweep.params.values()):
+        raise HTTPException(status_code=400, detail="Every swept param needs at least one value")
+    if any(not isinstance(value, int) for value in sweep.params.get("max_tokens", [])):
+        raise HTTPException(status_code=400, detail="max_tokens values must be integers")
+
+    spec = {
+        "template": sweep.template,
+        "variables": sweep.variables,
+        "system_prompts": sweep.system_prompts,
+        "params": sweep.params,
+        "models": models,
+        "cache": sweep.cache,
+    }
+    cells = cell_count(spec)
+    if not cells:
+        raise HTTPException(status_code=400, detail="Sweep has no cells")
+    if cells > SWEEP_MAX_CELLS:
+        raise HTTPException(
+            status_code=400, detail=f"Sweep has {cells} cells; the limit is {SWEEP_MAX_CELLS}"
+        )
+
+    sweep_id = await run_in_threadpool(create_sweep, spec, sweep.max_concurrency)
+    sweep_runner.start(sweep_id)
+    return await run_in_threadpool(build_sweep_grid, sweep_id)
+
+
+@router.get("/{sweep_id}", response_model=SweepGrid)
+def get_sweep(sweep_id: int):
+    """Get a sweep's grid: its axes and every cell with its result so far"""
+    return build_sweep_grid(sweep_id)
+
+
+@router.post("/{sweep_id}/cancel", response_model=SweepGrid)
+async def cancel_sweep(sweep_id: int):
+    """Stop a running sweep; it can be resumed by restarting the service"""
+    if not sweep_runner.cancel(sweep_id):
+        raise HTTPException(status_code=409, detail="Sweep is not running")
+    return await run_in_threadpool(build_sweep_grid, sweep_id)
+
+
+@router.get("/{sweep_id}/stream")
+async def stream_sweep(sweep_id: int):
+    """Stream cell results (SSE) as they arrive, then the sweep's final status
+
+    Each `cell` event lists the grid cells it fills: duplicates of one
+    request arrive together.
+    """
+    progress = await sweep_runner.get_progress(sweep_id)
+    live = progress is not None and progress.status == "running"
+    if not live:
+        # Not running here: replay the stored results
+        loaded = await run_in_threadpool(load_sweep, sweep_id)
+        if loaded is None:
+            raise HTTPException(status_code=404, detail="Sweep not found")
+        sweep, _, cells, _, results = loaded
+        progress = SweepProgress(sweep_id, cells, results, status=sweep.status)
+
+    async def event_generator():
+        changed = progress.subscribe()
+        sent = 0
+        try:
+            while True:
+                await changed.wait()
+                changed.clear()
+                while sent < len(progress.events):
+                    yield f"data: {json.dumps(progress.events[sent])}\n\n"
+                    sent += 1
+                if not live or progress.status != "running":
+                    yield f"data: {json.dumps(progress.status_event())}\n\n"
+                    return
+        finally:
+            progress.unsubscribe(changed)
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+        },
+    )
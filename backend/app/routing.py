@@ -0,0 +1,215 @@
+"""
+Latency-aware model routing.
+
+LatencyTracker keeps, per model and in memory, an EWMA and a decaying
+quantile sketch of TTFT and total time. It is updated from every batch of
+responses the writer inserts (a response-writer listener) and seeded once
+at startup from the latest ROUTING_SEED_ROWS responses of each model, so
+routing decisions never query the database.
+
+The sketch is a histogram over the log-spaced bins of analytics.py (values
+within ~5%) in which each observation weighs 2 ** (1 / half-life) times the
+previous one: the last ROUTING_HALF_LIFE responses of a model carry half of
+its weight. Only completed, non-cached responses are observed.
+
+`route()` ranks candidates by expected latency (EWMA) and, for hedging,
+names a backup to start if the primary has no first token by its p90 TTFT.
+Each worker tracks the responses it writes itself (plus the seed).
+"""
+import math
+import os
+import threading
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from .analytics import HISTOGRAM_BINS, HISTOGRAM_GROWTH, HISTOGRAM_MIN
+from .models import ModelResponse
+
+# Weight of the newest response in the EWMA
+ROUTING_EWMA_ALPHA = float(os.getenv("ROUTING_EWMA_ALPHA", "0.2"))
+# Responses after which an observation's weight in the quantile sketch halves
+ROUTING_HALF_LIFE = float(os.getenv("ROUTING_HALF_LIFE", "100"))
+# Latest responses per model loaded at startup
+ROUTING_SEED_ROWS = int(os.getenv("ROUTING_SEED_ROWS", "500"))
+# Hedge delay for a primary without enough history, in seconds
+ROUTING_DEFAULT_HEDGE_AFTER = float(os.getenv("ROUTING_DEFAULT_HEDGE_AFTER", "2"))
+# Responses a model needs before its percentiles are trusted
+ROUTING_MIN_SAMPLES = int(os.getenv("ROUTING_MIN_SAMPLES", "5"))
+
+METRICS = ("ttft", "total_time")
+HEDGE_PERCENTILE = 90
+_LOG_GROWTH = math.log(HISTOGRAM_GROWTH)
+# Renormalize the sketch before observation weights overflow
+_MAX_WEIGHT = 1e100
+
+
+class _Sketch:
+    """EWMA and exponentially decaying histogram of one metric"""
+
+    __slots__ = ("ewma", "histogram", "weight", "growth", "min_value", "max_value")
+
+    def __init__(self, half_life: float):
+        self.ewma: Optional[float] = None
+        self.histogram = np.zeros(HISTOGRAM_BINS, dtype=np.float64)
+        self.weight = 1.0
+        self.growth = 2 ** (1 / half_life)
+        self.min_value = math.inf
+        self.max_value = -math.inf
+
+    def observe(self, value: float, alpha: float):
+        self.ewma = value if self.ewma is None else self.ewma + alpha * (value - self.ewma)
+        self.min_value = min(self.min_value, value)
+        self.max_value = max(self.max_value, value)
+        if value > 0:
+            index = min(HISTOGRAM_BINS - 1, max(0, int(math.log(value / HISTOGRAM_MIN) / _LOG_GROWTH)))
+        else:
+            index = 0
+        # Growing the new weight instead of decaying every bin keeps this O(1)
+        self.histogram[index] += self.weight
+        self.weight *= self.growth
+        if self.weight > _MAX_WEIGHT:
+            self.histogram /= self.weight
+            self.weight = 1.0
+
+    def quantile(self, q: float) -> Optional[float]:
+        cumulative = np.cumsum(self.histogram)
+        if not cumulative[-1]:
+            return None
+        index = int(np.searchsorted(cumulative, q * cumulative[-1]))
+        # Geometric midpoint of the bin, within the observed range
+        value = HISTOGRAM_MIN * HISTOGRAM_GROWTH ** (min(index, HISTOGRAM_BINS - 1) + 0.5)
+        return min(max(value, self.min_value), self.max_value)
+
+
+class _ModelLatency:
+    def __init__(self, half_life: float):
+        self.samples = 0
+        self.sketches = {metric: _Sketch(half_life) for metric in METRICS}
+
+    def observe(self, ttft: float, total_time: float, alpha: float):
+        self.samples += 1
+        self.sketches["ttft"].observe(ttft, alpha)
+        self.sketches["total_time"].observe(total_time, alpha)
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        stats: Dict[str, Optional[float]] = {"samples": self.samples}
+        for metric, sketch in self.sketches.items():
+            stats[f"{metric}_ewma"] = sketch.ewma
+            for pct in (50, HEDGE_PERCENTILE, 99):
+                stats[f"{metric}_p{pct}"] = sketch.quantile(pct / 100)
+        return stats
+
+
+class LatencyTracker:
+    """Recent per-model latency, updated incrementally from inserted responses"""
+
+    def __init__(
+        self,
+        alpha: float = ROUTING_EWMA_ALPHA,
+        half_life: float = ROUTING_HALF_LIFE,
+        min_samples: int = ROUTING_MIN_SAMPLES,
+    ):
+        self.alpha = alpha
+        self.half_life = half_life
+        self.min_samples = min_samples
+        self._models: Dict[str, _ModelLatency] = {}
+        self._lock = threading.Lock()
+        # Lowest response id the listener saw; the seed stops below it
+        self._first_observed_id: Optional[int] = None
+
+    def observe(self, model_name: str, ttft: float, total_time: float):
+        with self._lock:
+            model = self._models.get(model_name)
+            if model is None:
+                model = self._models[model_name] = _ModelLatency(self.half_life)
+            model.observe(ttft, total_time, self.alpha)
+
+    def observe_rows(self, db_session: Session, rows: Iterable):
+        """Observe a batch of inserted responses (response-writer listener)"""
+        for row in rows:
+            if row.id is not None and (
+                self._first_observed_id is None or row.id < self._first_observed_id
+            ):
+                self._first_observed_id = row.id
+            if row.status != "completed" or row.cached:
+                continue
+            self.observe(row.model_name, row.time_to_first_token, row.total_time)
+
+    def seed(self, db_session: Session, rows_per_model: int = ROUTING_SEED_ROWS) -> int:
+        """Observe each model's latest responses, oldest first; returns the count
+
+        Run as a response-writer task, so it is serialized with observe_rows
+        and skips the rows the listener already saw.
+        """
+        model_names = [
+            name for (name,) in db_session.query(ModelResponse.model_name).distinct()
+        ]
+        seeded = 0
+        for model_name in model_names:
+            query = db_session.query(
+                ModelResponse.time_to_first_token, ModelResponse.total_time
+            ).filter(
+                ModelResponse.model_name == model_name,
+                ModelResponse.status == "completed",
+                ModelResponse.cached.is_(False),
+            )
+            if self._first_observed_id is not None:
+                query = query.filter(ModelResponse.id < self._first_observed_id)
+            rows = (
+                query.order_by(ModelResponse.created_at.desc(), ModelResponse.id.desc())
+                .limit(rows_per_model)
+                .all()
+            )
+            for ttft, total_time in reversed(rows):
+                self.observe(model_name, ttft, total_time)
+            seeded += len(rows)
+        return seeded
+
+    def stats(self, model_name: str) -> Dict[str, Optional[float]]:
+        with self._lock:
+            model = self._models.get(model_name)
+            if model is None:
+                return {"samples": 0}
+            return model.stats()
+
+    def route(
+        self, models: List[str], hedge: bool = False, objective: str = "ttft"
+    ) -> dict:
+        """Rank `models` by expected latency; with `hedge`, pick a backup
+
+        Models with fewer than min_samples responses rank after the others,
+        in the order given. The backup (the runner-up) is meant to start
+        `hedge_after` seconds in: the primary's p90 TTFT, or
+        ROUTING_DEFAULT_HEDGE_AFTER without enough history.
+        """
+        candidates = []
+        for model_name in models:
+            stats = self.stats(model_name)
+            expected = stats.get(f"{objective}_ewma")
+            known = stats["samples"] >= self.min_samples and expected is not None
+            candidates.append(
+                {"model_name": model_name, "expected": expected if known else None, **stats}
+            )
+        ranked = sorted(
+            candidates,
+            key=lambda c: (c["expected"] is None, c["expected"] or 0.0),
+        )
+        primary = ranked[0]
+        backup = ranked[1] if hedge and len(ranked) > 1 else None
+        hedge_after = None
+        if backup is not None:
+            hedge_after = ROUTING_DEFAULT_HEDGE_AFTER
+            if primary["expected"] is not None and primary.get(f"ttft_p{HEDGE_PERCENTILE}"):
+                hedge_after = primary[f"ttft_p{HEDGE_PERCENTILE}"]
+        return {
+            "objective": objective,
+            "primary": primary["model_name"],
+            "backup": backup["model_name"] if backup else None,
+            "hedge_after": hedge_after,
+            "candidates": ranked,
+        }
+
+
+latency_tracker = LatencyTracker()
@@ -0,0 +1,424 @@
+"""
+Generation runs, decoupled from the connections watching them.
+
+A run generates one prompt against a set of models and publishes every
+update into a ring buffer under increasing sequence numbers. Any number of
+subscribers read from it, each from its own position, so a second tab
+attaches to the run in progress and a reconnect carrying the last sequence
+it saw (SSE `Last-Event-ID`) resumes without lost or duplicated tokens.
+
+Updates pushed out of the ring are folded into per-model text, so a
+subscriber starting behind the ring gets a snapshot (one token event per
+model with the text so far) before the buffered updates. Such a subscriber
+first receives a RESET if it already had state, telling it to discard it.
+
+Runs are keyed by prompt and run_key(): a request joins a run only if it
+asks for the same models with the same options (or names no models at all),
+so asking for another model starts a run of its own.
+
+A run watched by a single client is cancelled as soon as that client
+disconnects, freeing its generation slots; one that several clients shared
+is cancelled when the last leaves only after a grace period, in case one
+reattaches. Finished runs are kept for a while for reconnects and then
+dropped, since their responses are in the database by then.
+"""
+import asyncio
+import json
+import os
+import uuid
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple, Union
+
+from sqlalchemy.orm import Session
+
+from .fanout import FanoutEngine, TokenEvent
+from .models import ModelResponse
+from .schemas import StreamUpdate
+from .tokens import throughput
+
+# Updates kept per run for replay; older ones are folded into snapshots
+RUN_BUFFER_EVENTS = int(os.getenv("RUN_BUFFER_EVENTS", "10000"))
+# Seconds a run keeps generating with nobody watching: before its first
+# client attaches, or after the last leaves a run several clients shared
+RUN_ORPHAN_TIMEOUT = float(os.getenv("RUN_ORPHAN_TIMEOUT", "30"))
+# Seconds a finished run stays attachable before replays come from the database
+RUN_RETENTION = float(os.getenv("RUN_RETENTION", "60"))
+
+Event = Union[TokenEvent, StreamUpdate]
+# Marker telling a subscriber to drop what it has; a snapshot follows
+RESET = object()
+
+
+def run_key(
+    models: List[str],
+    use_cache: bool = False,
+    replay: str = "instant",
+    first_k: Optional[int] = None,
+    min_tokens: Optional[int] = None,
+    start_delays: Optional[Dict[str, float]] = None,
+) -> str:
+    """What a run generates, as a string: requests with equal keys share a run
+
+    Hedge delays are estimated per request, so only the hedged models count.
+    """
+    return json.dumps(
+        [
+            sorted(models),
+            use_cache,
+            replay if use_cache else None,
+            first_k,
+            min_tokens,
+            sorted(start_delays or ()),
+        ],
+        separators=(",", ":"),
+    )
+
+
+class Run:
+    """Ring buffer of one run's sequence-numbered updates"""
+
+    def __init__(self, models: List[str], key: str = "", capacity: int = RUN_BUFFER_EVENTS):
+        self.id = uuid.uuid4().hex[:12]
+        self.models = models
+        self.key = key
+        self.capacity = capacity
+        self.next_seq = 1
+        self.finished = False
+        self.subscribers = 0
+        # Whether more than one client watched it at once
+        self.shared = False
+        self._buffer: List[Optional[Event]] = [None] * capacity
+        self._waiters: List[asyncio.Future] = []
+        # Per model: evicted token text, last evicted token and evicted final update
+        self._evicted_text: Dict[str, List[str]] = {}
+        self._evicted_token: Dict[str, TokenEvent] = {}
+        self._evicted_final: Dict[str, StreamUpdate] = {}
+
+    @property
+    def first_seq(self) -> int:
+        """Oldest sequence number still buffered"""
+        return max(1, self.next_seq - self.capacity)
+
+    def publish(self, event: Event) -> int:
+        seq = self.next_seq
+        slot = seq % self.capacity
+        old = self._buffer[slot]
+        if old is not None:
+            self._evict(old)
+        self._buffer[slot] = event
+        self.next_seq += 1
+        self._wake()
+        return seq
+
+    def finish(self):
+        self.finished = True
+        self._wake()
+
+    def _wake(self):
+        if self._waiters:
+            for waiter in self._waiters:
+                if not waiter.done():
+                    waiter.set_result(None)
+            self._waiters.clear()
+
+    def _evict(self, event: Event):
+        if isinstance(event, TokenEvent):
+            self._evicted_text.setdefault(event.model_name, []).append(event.token)
+            self._evicted_token[event.model_name] = event
+        else:
+            self._evicted_final[event.model_name] = event
+
+    def _snapshot(self) -> Iterable[Event]:
+        """Everything evicted so far, condensed to one token event per model"""
+        for model_name in self.models:
+            if model_name in self._evicted_token:
+                last = self._evicted_token[model_name]
+                yield last._replace(token="".join(self._evicted_text[model_name]))
+            if model_name in self._evicted_final:
+                yield self._evicted_final[model_name]
+
+    async def subscribe(
+        self, after: int = 0, reset: bool = False, heartbeat: Optional[float] = None
+    ) -> AsyncIterator[Optional[Tuple[Optional[int], object]]]:
+        """Yield (seq, update) for every update after `after` until the run ends
+
+        `reset` forces a RESET and full replay (the subscriber's state belongs
+        to another run). Items without a position a subscriber could resume
+        from (RESET, all but the last snapshot event) have seq None. With
+        `heartbeat` set, None is yielded whenever nothing was published for
+        that many seconds.
+        """
+        self.subscribers += 1
+        if self.subscribers > 1:
+            self.shared = True
+        try:
+            if reset or after >= self.next_seq:
+                if reset or after:
+                    yield None, RESET
+                after = 0
+            while True:
+                seq = after + 1
+                if seq < self.first_seq:
+                    # Behind the ring: condense what was evicted
+                    if after:
+                        yield None, RESET
+                    after = self.first_seq - 1
+                    snapshot = list(self._snapshot())
+                    for i, event in enumerate(snapshot, 1):
+                        yield (after if i == len(snapshot) else None), event
+                    continue
+                if seq < self.next_seq:
+                    after = seq
+                    yield seq, self._buffer[seq % self.capacity]
+                    continue
+                if self.finished:
+                    return
+                waiter = asyncio.get_running_loop().create_future()
+                self._waiters.append(waiter)
+                if heartbeat is None:
+                    await waiter
+                    continue
+                try:
+                    await asyncio.wait_for(waiter, heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            self.subscribers -= 1
+
+
+def stored_updates(db_session: Session, prompt_id: int, models: List[str]) -> List[Event]:
+    """Updates replaying the latest completed response of each model, if any"""
+    rows = (
+        db_session.query(ModelResponse)
+        .filter(
+            ModelResponse.prompt_id == prompt_id,
+            ModelResponse.model_name.in_(models),
+            ModelResponse.status == "completed",
+        )
+        .order_by(ModelResponse.id)
+        .all()
+    )
+    latest = {row.model_name: row for row in rows}
+    updates: List[Event] = []
+    for model_name in models:
+        row = latest.get(model_name)
+        if row is None:
+            continue
+        if row.response_text:
+            updates.append(
+                TokenEvent(
+                    model_name,
+                    row.response_text,
+                    row.time_to_first_token,
+                    row.total_time,
+                    row.cached,
+                )
+            )
+        updates.append(
+            StreamUpdate(
+                model_name=model_name,
+                time_to_first_token=row.time_to_first_token,
+                total_time=row.total_time,
+                is_complete=True,
+                status=row.status,
+                cached=row.cached,
+                queue_wait=row.queue_wait_time,
+                prompt_tokens=row.prompt_tokens,
+                completion_tokens=row.completion_tokens,
+                **throughput(row.completion_tokens, row.time_to_first_token, row.total_time),
+            )
+        )
+    return updates
+
+
+class RunManager:
+    """Starts runs and tracks the ones in progress, one per prompt and run key
+
+    Runs live in this process only; coordination.SqlRunManager extends it to
+    share them between workers.
+    """
+
+    def __init__(
+        self,
+        engine: FanoutEngine,
+        orphan_timeout: float = RUN_ORPHAN_TIMEOUT,
+        retention: float = RUN_RETENTION,
+    ):
+        self.engine = engine
+        self.orphan_timeout = orphan_timeout
+        self.retention = retention
+        self.runs: Dict[Tuple[int, str], Run] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._orphan_timers: Dict[str, asyncio.TimerHandle] = {}
+
+    async def find(self, prompt_id: int, key: Optional[str] = None) -> Optional[Run]:
+        """The prompt's run in progress or recently finished, if any
+
+        With `key` only a run of that key; without, any of the prompt's runs,
+        preferring one in progress.
+        """
+        if key is not None:
+            return self.runs.get((prompt_id, key))
+        found = None
+        for (run_prompt_id, _), run in self.runs.items():
+            if run_prompt_id == prompt_id and (found is None or found.finished):
+                found = run
+        return found
+
+    async def start(
+        self,
+        prompt_id: int,
+        prompt_text: str,
+        models: List[str],
+        stored: Iterable[Event] = (),
+        use_cache: bool = False,
+        replay: str = "instant",
+        user: str = "anonymous",
+        first_k: Optional[int] = None,
+        min_tokens: Optional[int] = None,
+        start_delays: Optional[Dict[str, float]] = None,
+    ) -> Run:
+        """Start the run of a prompt, or join the one in progress with the same key
+
+        `stored` are updates of models already answered, published first;
+        only the other models in `models` are generated. A run with nothing
+        to generate is returned finished and not tracked. `first_k` and
+        `min_tokens` make the models race, and `start_delays` start some of
+        them late (see FanoutEngine.stream).
+        """
+        key = run_key(models, use_cache, replay, first_k, min_tokens, start_delays)
+        run = self.runs.get((prompt_id, key))
+        if run is not None and not run.finished:
+            return run
+        run = self._new_run(models, key)
+        done = set()
+        for event in stored:
+            run.publish(event)
+            done.add(event.model_name)
+        to_generate = [model for model in models if model not in done]
+        if not to_generate:
+            run.finish()
+            return run
+
+        winner = await self._register(prompt_id, run)
+        if winner is not run:
+            return winner
+        self._tasks[run.id] = asyncio.create_task(
+            self._pump(
+                prompt_id,
+                run,
+                prompt_text,
+                to_generate,
+                use_cache,
+                replay,
+                user,
+                first_k,
+                min_tokens,
+                start_delays,
+            )
+        )
+        # Cancelled if nobody subscribes in time
+        self.detached(run)
+        return run
+
+    def _new_run(self, models: List[str], key: str) -> Run:
+        return Run(models, key)
+
+    async def _register(self, prompt_id: int, run: Run) -> Run:
+        """Make `run` the prompt's run for its key; returns the one that won a race"""
+        existing = self.runs.get((prompt_id, run.key))
+        if existing is not None and not existing.finished:
+            return existing
+        self.runs[(prompt_id, run.key)] = run
+        return run
+
+    async def _watched_elsewhere(self, run: Run) -> bool:
+        """Whether the run has subscribers outside this process"""
+        return False
+
+    async def _pump(
+        self,
+        prompt_id: int,
+        run: Run,
+        prompt_text: str,
+        models: List[str],
+        use_cache: bool,
+        replay: str,
+        user: str,
+        first_k: Optional[int] = None,
+        min_tokens: Optional[int] = None,
+        start_delays: Optional[Dict[str, float]] = None,
+    ):
+        updates = self.engine.stream(
+            prompt_id,
+            prompt_text,
+            models,
+            use_cache=use_cache,
+            replay=replay,
+            user=user,
+            first_k=first_k,
+            min_tokens=min_tokens,
+            start_delays=start_delays,
+        )
+        try:
+            async for update in updates:
+                run.publish(update)
+        finally:
+            # Closing the stream cancels generations still running
+            await updates.aclose()
+            run.finish()
+            self._tasks.pop(run.id, None)
+            self._cancel_orphan_timer(run)
+            asyncio.get_running_loop().call_later(self.retention, self._forget, prompt_id, run)
+
+    def _forget(self, prompt_id: int, run: Run):
+        if self.runs.get((prompt_id, run.key)) is run:
+            del self.runs[(prompt_id, run.key)]
+
+    async def attach(
+        self, run: Run, after: int = 0, reset: bool = False, heartbeat: Optional[float] = None
+    ) -> AsyncIterator[Optional[Tuple[Optional[int], object]]]:
+        """Subscribe to a run, keeping it alive while subscribed
+
+        When the last subscriber leaves, a run nobody else watched is
+        cancelled right away; a shared one gets the grace period.
+        """
+        self._cancel_orphan_timer(run)
+        subscription = run.subscribe(after, reset, heartbeat)
+        try:
+            async for item in subscription:
+                yield item
+        finally:
+            # Closed now, not when collected, so the subscriber count is current
+            await subscription.aclose()
+            if not run.subscribers:
+                if run.shared:
+                    self.detached(run)
+                elif run.id in self._tasks:
+                    asyncio.create_task(self._cancel_if_unwatched(run))
+
+    def detached(self, run: Run):
+        """Cancel the run unless someone subscribes within the grace period"""
+        task = self._tasks.get(run.id)
+        if task is None or run.id in self._orphan_timers:
+            return
+        self._orphan_timers[run.id] = asyncio.get_running_loop().call_later(
+            self.orphan_timeout, self._cancel_orphan, run
+        )
+
+    def _cancel_orphan(self, run: Run):
+        self._orphan_timers.pop(run.id, None)
+        if self._tasks.get(run.id) is not None and not run.subscribers:
+            asyncio.create_task(self._cancel_if_unwatched(run))
+
+    async def _cancel_if_unwatched(self, run: Run):
+        if await self._watched_elsewhere(run):
+            self.detached(run)
+            return
+        task = self._tasks.get(run.id)
+        if task is not None and not run.subscribers:
+            task.cancel()
+
+    def _cancel_orphan_timer(self, run: Run):
+        timer = self._orphan_timers.pop(run.id, None)
+        if timer is not None:
+            timer.cancel()
@@ -0,0 +1,330 @@
+"""
+Admission control for model generations.
+
+Every generation passes through the Scheduler before it reaches a provider.
+A request is admitted once all of the following hold:
+
+- the worker-wide cap (MAX_CONCURRENT_GENERATIONS) has room;
+- the model is below its adaptive concurrency limit;
+- every token bucket that applies to the model has a token. Buckets are
+  configured in RATE_LIMITS for an exact model key, a provider prefix ending
+  in "." (shared by all of that provider's models) or "*" for the tenancy.
+
+Per-model limits follow AIMD: they grow while generations succeed (doubling
+per round trip until the first congestion signal, then by one per round
+trip) and are cut multiplicatively on a 429 or when TTFT drifts well above
+the model's baseline. Waiting requests are served round-robin across users,
+so one large batch cannot starve everyone else's comparisons.
+"""
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import AsyncIterator, Deque, Dict, List, Optional
+
+from .deadlines import GenerationTimeout
+
+ADAPTIVE_CONCURRENCY_INITIAL = int(os.getenv("ADAPTIVE_CONCURRENCY_INITIAL", "8"))
+ADAPTIVE_CONCURRENCY_MAX = int(os.getenv("ADAPTIVE_CONCURRENCY_MAX", "64"))
+# TTFT above baseline x tolerance counts as a congestion signal
+ADAPTIVE_LATENCY_TOLERANCE = float(os.getenv("ADAPTIVE_LATENCY_TOLERANCE", "2.0"))
+
+
+@lru_cache(maxsize=1)
+def _load_rate_limits() -> dict:
+    # e.g. RATE_LIMITS='{"*": {"rate": 20}, "xai.": {"rate": 2, "burst": 4}}'
+    # rate is in requests per second; burst defaults to max(1, rate)
+    raw = os.getenv("RATE_LIMITS")
+    return json.loads(raw) if raw else {}
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    """Whether an error (or one it wraps) is a provider 429"""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        # httpx/openai expose status_code, oci.exceptions.ServiceError status
+        for attribute in ("status_code", "status"):
+            if getattr(error, attribute, None) == 429:
+                return True
+        message = str(error)
+        if "429" in message or "Too Many Requests" in message:
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+class TokenBucket:
+    """Classic token bucket, refilled lazily from the monotonic clock"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self.tokens = self.burst
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        # `now` may predate a bucket created during the same dispatch
+        if now > self.updated_at:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+
+    def delay(self, now: float) -> float:
+        """Seconds until a token is available (0 if one is available now)"""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+class AIMDLimiter:
+    """Adaptive concurrency limit of one model"""
+
+    def __init__(
+        self,
+        initial: float = ADAPTIVE_CONCURRENCY_INITIAL,
+        max_limit: float = ADAPTIVE_CONCURRENCY_MAX,
+        min_limit: float = 1,
+    ):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.in_flight = 0
+        self.slow_start = True
+        self.ttft_ewma: Optional[float] = None
+        self.ttft_baseline: Optional[float] = None
+
+    def on_success(self, time_to_first_token: Optional[float]):
+        if time_to_first_token is not None:
+            self.ttft_ewma = (
+                time_to_first_token
+                if self.ttft_ewma is None
+                else 0.8 * self.ttft_ewma + 0.2 * time_to_first_token
+            )
+            # Lowest smoothed TTFT seen, drifting up slowly so a model that
+            # became permanently slower does not stay throttled forever
+            self.ttft_baseline = (
+                self.ttft_ewma
+                if self.ttft_baseline is None
+                else min(self.ttft_baseline * 1.001, self.ttft_ewma)
+            )
+            if self.ttft_ewma > self.ttft_baseline * ADAPTIVE_LATENCY_TOLERANCE:
+                self.decrease(0.9)
+                return
+        step = 1 if self.slow_start else 1 / self.limit
+        self.limit = min(self.max_limit, self.limit + step)
+
+    def decrease(self, factor: float):
+        self.slow_start = False
+        self.limit = max(self.min_limit, self.limit * factor)
+
+
+class Ticket:
+    """An admitted (or waiting) generation; report its outcome before release"""
+
+    __slots__ = ("model_key", "user", "enqueued_at", "admitted_at", "future", "outcome")
+
+    def __init__(self, model_key: str, user: str, future: asyncio.Future):
+        self.model_key = model_key
+        self.user = user
+        self.enqueued_at = time.monotonic()
+        self.admitted_at: Optional[float] = None
+        self.future = future
+        self.outcome = None  # ("success", ttft) | ("throttled",) | ("timeout",)
+
+    @property
+    def queue_wait(self) -> float:
+        end = self.admitted_at if self.admitted_at is not None else time.monotonic()
+        return end - self.enqueued_at
+
+    def succeeded(self, time_to_first_token: Optional[float]):
+        self.outcome = ("success", time_to_first_token)
+
+    def failed(self, error: BaseException):
+        if is_rate_limited(error):
+            self.outcome = ("throttled",)
+        elif isinstance(error, GenerationTimeout):
+            self.outcome = ("timeout",)
+
+
+class _FairQueue:
+    """Waiting tickets of one model, served round-robin across users"""
+
+    def __init__(self):
+        self.users: "OrderedDict[str, Deque[Ticket]]" = OrderedDict()
+        self.size = 0
+
+    def push(self, ticket: Ticket):
+        self.users.setdefault(ticket.user, deque()).append(ticket)
+        self.size += 1
+
+    def pop(self) -> Ticket:
+        user, pending = next(iter(self.users.items()))
+        ticket = pending.popleft()
+        if pending:
+            self.users.move_to_end(user)
+        else:
+            del self.users[user]
+        self.size -= 1
+        return ticket
+
+    def remove(self, ticket: Ticket):
+        pending = self.users.get(ticket.user)
+        if pending is None or ticket not in pending:
+            return
+        pending.remove(ticket)
+        if not pending:
+            del self.users[ticket.user]
+        self.size -= 1
+
+    def oldest(self) -> float:
+        return min(pending[0].enqueued_at for pending in self.users.values())
+
+
+class Scheduler:
+    """Queues generations and admits them within rate and concurrency limits
+
+    Only used from the event loop; admission is event driven (on enqueue,
+    release and when a token bucket refills), never polled.
+    """
+
+    def __init__(self, max_concurrency: int, rate_limits: Optional[dict] = None):
+        self.max_concurrency = max_concurrency
+        self.rate_limits = _load_rate_limits() if rate_limits is None else rate_limits
+        self.in_flight = 0
+        self.limiters: Dict[str, AIMDLimiter] = {}
+        self.queues: Dict[str, _FairQueue] = {}
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._model_buckets: Dict[str, List[TokenBucket]] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def _limiter(self, model_key: str) -> AIMDLimiter:
+        limiter = self.limiters.get(model_key)
+        if limiter is None:
+            limiter = self.limiters[model_key] = AIMDLimiter(
+                min(ADAPTIVE_CONCURRENCY_INITIAL, self.max_concurrency),
+                min(ADAPTIVE_CONCURRENCY_MAX, self.max_concurrency),
+            )
+        return limiter
+
+    def _buckets_for(self, model_key: str) -> List[TokenBucket]:
+        buckets = self._model_buckets.get(model_key)
+        if buckets is None:
+            buckets = []
+            for pattern, config in self.rate_limits.items():
+                if (
+                    pattern == "*"
+                    or pattern == model_key
+                    or (pattern.endswith(".") and model_key.startswith(pattern))
+                ):
+                    if pattern not in self._buckets:
+                        self._buckets[pattern] = TokenBucket(
+                            float(config["rate"]), config.get("burst")
+                        )
+                    buckets.append(self._buckets[pattern])
+            self._model_buckets[model_key] = buckets
+        return buckets
+
+    @asynccontextmanager
+    async def slot(self, model_key: str, user: str) -> AsyncIterator[Ticket]:
+        """Wait for admission and hold the slot for the body of the block"""
+        ticket = await self.acquire(model_key, user)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    async def acquire(self, model_key: str, user: str) -> Ticket:
+        ticket = Ticket(model_key, user, asyncio.get_running_loop().create_future())
+        queue = self.queues.get(model_key)
+        if queue is None:
+            queue = self.queues[model_key] = _FairQueue()
+        queue.push(ticket)
+        self._dispatch()
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            if ticket.admitted_at is not None:
+                self.release(ticket)
+            else:
+                queue.remove(ticket)
+            raise
+        return ticket
+
+    def release(self, ticket: Ticket):
+        self.in_flight -= 1
+        limiter = self._limiter(ticket.model_key)
+        limiter.in_flight -= 1
+        if ticket.outcome is not None:
+            if ticket.outcome[0] == "success":
+                limiter.on_success(ticket.outcome[1])
+            elif ticket.outcome[0] == "throttled":
+                limiter.decrease(0.5)
+            elif ticket.outcome[0] == "timeout":
+                limiter.decrease(0.9)
+        self._dispatch()
+
+    def _dispatch(self):
+        """Admit as many waiting tickets as the limits allow"""
+        now = time.monotonic()
+        retry_in: Optional[float] = None
+        # Models whose longest-waiting request is oldest go first
+        waiting = sorted(
+            (queue.oldest(), model_key)
+            for model_key, queue in self.queues.items()
+            if queue.size
+        )
+        for _, model_key in waiting:
+            queue = self.queues[model_key]
+            limiter = self._limiter(model_key)
+            buckets = self._buckets_for(model_key)
+            while (
+                queue.size
+                and self.in_flight < self.max_concurrency
+                and limiter.in_flight < int(limiter.limit)
+            ):
+                delay = max((bucket.delay(now) for bucket in buckets), default=0.0)
+                if delay > 0:
+                    retry_in = delay if retry_in is None else min(retry_in, delay)
+                    break
+                ticket = queue.pop()
+                if ticket.future.done():
+                    continue  # cancelled while waiting, not yet unqueued
+                for bucket in buckets:
+                    bucket.take()
+                ticket.admitted_at = now
+                self.in_flight += 1
+                limiter.in_flight += 1
+                ticket.future.set_result(None)
+            if self.in_flight >= self.max_concurrency:
+                break
+
+        if retry_in is not None:
+            loop = asyncio.get_running_loop()
+            # A pending timer for a later refill would leave this one waiting
+            if self._timer is not None and self._timer.when() > loop.time() + retry_in:
+                self._timer.cancel()
+                self._timer = None
+            if self._timer is None:
+                self._timer = loop.call_later(retry_in, self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        self._dispatch()
+
+    def snapshot(self) -> Dict[str, dict]:
+        """Per-model limit, in-flight and queued counts"""
+        return {
+            model_key: {
+                "limit": round(limiter.limit, 2),
+                "in_flight": limiter.in_flight,
+                "queued": self.queues[model_key].size if model_key in self.queues else 0,
+            }
+            for model_key, limiter in self.limiters.items()
+        }
@@ -1,6 +1,21 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import List, Optional
+from typing import Dict, List, Optional, Union
+
+
+class TraceMetrics(BaseModel):
+    chunks: int
+    itl_p50: Optional[float] = None  # inter-chunk latency, seconds
+    itl_p99: Optional[float] = None
+    max_stall: Optional[float] = None  # longest gap between chunks, seconds
+    steady_tokens_per_second: Optional[float] = None  # after the first chunk
+
+
+class TokenTraceSchema(BaseModel):
+    response_id: int
+    offsets_us: List[int]  # chunk arrival, microseconds since the generation started
+    sizes: List[int]  # characters per chunk
+    metrics: TraceMetrics
 
 
 class ModelResponseSchema(BaseModel):
@@ -9,6 +24,16 @@ class ModelResponseSchema(BaseModel):
     response_text: str
     time_to_first_token: float
     total_time: float
+    status: str = "completed"
+    cached: bool = False
+    error: Optional[str] = None
+    queue_wait_time: Optional[float] = None
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    token_count_source: Optional[str] = None  # 'provider', 'tokenizer' or 'estimate'
+    tokens_per_second: Optional[float] = None
+    output_tokens_per_second: Optional[float] = None  # after the first token
+    trace_metrics: Optional[TraceMetrics] = None
     created_at: datetime
 
     class Config:
@@ -30,12 +55,18 @@ class PromptResponse(BaseModel):
 
 
 class PromptListItem(BaseModel):
+    # Only `id` is always present; the rest depend on the requested fields
     id: int
-    text: str
-    created_at: datetime
+    preview: Optional[str] = None  # start of the prompt text
+    truncated: Optional[bool] = None  # whether `preview` is shorter than the text
+    created_at: Optional[datetime] = None
+    job_id: Optional[int] = None
+    response_count: Optional[int] = None
 
-    class Config:
-        from_attributes = True
+
+class PromptPage(BaseModel):
+    items: List[PromptListItem]
+    next_cursor: Optional[str] = None  # pass back as `cursor` for the next page
 
 
 class StreamUpdate(BaseModel):
@@ -44,5 +75,193 @@ class StreamUpdate(BaseModel):
     time_to_first_token: Optional[float] = None
     total_time: Optional[float] = None
     is_complete: bool = False
+    status: Optional[str] = None
+    cached: bool = False
     error: Optional[str] = None
+    queue_wait: Optional[float] = None
+    # Set on completion
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    tokens_per_second: Optional[float] = None
+    output_tokens_per_second: Optional[float] = None
+    # Race mode: finishing position of the models that won
+    rank: Optional[int] = None
+
+
+
+class JobCreate(BaseModel):
+    models: List[str]
+    # Either inline prompts or a dataset file's content in `dataset_format`
+    prompts: Optional[List[str]] = None
+    dataset: Optional[str] = None
+    dataset_format: str = Field("jsonl", pattern="^(jsonl|csv)$")
+    max_concurrency: int = Field(16, ge=1, le=1024)
+    per_model_concurrency: int = Field(4, ge=1, le=256)
+
+
+class JobSchema(BaseModel):
+    id: int
+    status: str
+    models: List[str]
+    total_prompts: int
+    total: int  # prompts x models
+    done: int
+    counts: Dict[str, int]
+    prompts_per_minute: Optional[float] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
 
+
+class JobResultItem(BaseModel):
+    id: int
+    prompt_id: int
+    model_name: str
+    status: str
+    time_to_first_token: float
+    total_time: float
+    error: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+
+class LatencyStats(BaseModel):
+    count: int
+    mean: float
+    min: float
+    max: float
+    p50: float
+    p95: float
+    p99: float
+
+
+class LatencyReport(BaseModel):
+    start: datetime
+    end: datetime
+    exact: bool  # percentiles from raw rows rather than rollup histograms
+    # model -> metric ('ttft', 'total_time', 'chars_per_second',
+    # 'output_tokens_per_second') -> stats
+    models: Dict[str, Dict[str, LatencyStats]]
+
+
+class RouteCandidate(BaseModel):
+    model_name: str
+    expected: Optional[float] = None  # EWMA of the objective; None without enough history
+    samples: int
+    ttft_ewma: Optional[float] = None
+    ttft_p50: Optional[float] = None
+    ttft_p90: Optional[float] = None
+    ttft_p99: Optional[float] = None
+    total_time_ewma: Optional[float] = None
+    total_time_p50: Optional[float] = None
+    total_time_p90: Optional[float] = None
+    total_time_p99: Optional[float] = None
+
+
+class RouteDecision(BaseModel):
+    objective: str  # 'ttft' or 'total_time'
+    primary: str
+    backup: Optional[str] = None
+    hedge_after: Optional[float] = None  # seconds without a first token before the backup starts
+    candidates: List[RouteCandidate]
+
+
+class SearchHit(BaseModel):
+    kind: str  # 'prompt' or 'response'
+    prompt_id: int
+    response_id: Optional[int] = None
+    model_name: Optional[str] = None
+    created_at: Optional[datetime] = None
+    score: float  # higher is better, 1.0 for the best prompt and the best response
+    snippet: str  # matched terms wrapped in « »
+
+
+class SearchResults(BaseModel):
+    query: str
+    hits: List[SearchHit]
+
+
+class SweepCreate(BaseModel):
+    template: str  # `{name}` placeholders are filled from each variable set
+    variables: List[Dict[str, str]] = [{}]
+    system_prompts: List[Optional[str]] = [None]
+    # Values to try per param (temperature, top_p, max_tokens); every combination runs
+    params: Dict[str, List[Union[int, float]]] = {}
+    models: List[str]
+    max_concurrency: int = Field(8, ge=1, le=1024)
+    cache: bool = False  # reuse cached answers to identical requests
+
+
+class SweepCellResult(BaseModel):
+    status: str
+    response_id: Optional[int] = None
+    time_to_first_token: Optional[float] = None
+    total_time: Optional[float] = None
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    tokens_per_second: Optional[float] = None
+    cached: bool = False
+    error: Optional[str] = None
+
+
+class SweepCell(BaseModel):
+    index: int
+    variables: int  # indexes into the sweep's axes
+    system_prompt: int
+    params: int
+    model_name: str
+    prompt_id: int
+    duplicate_of: Optional[int] = None  # first cell sending the same request
+    result: Optional[SweepCellResult] = None
+
+
+class SweepSchema(BaseModel):
+    id: int
+    status: str
+    total_cells: int
+    unique_cells: int  # requests actually sent
+    done: int  # unique cells with a final result
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
+
+class SweepGrid(SweepSchema):
+    template: str
+    variables: List[Dict[str, str]]
+    system_prompts: List[Optional[str]]
+    params: List[Dict[str, Union[int, float]]]  # every combination of the params grid
+    models: List[str]
+    cells: List[SweepCell]
+
+
+class LatencyRegressionSchema(BaseModel):
+    id: int
+    model_name: str
+    metric: str  # 'ttft' or 'output_tokens_per_second'
+    baseline_median: float
+    recent_median: float
+    change: float  # recent / baseline median - 1
+    p_value: float
+    baseline_samples: int
+    recent_samples: int
+    baseline_model_id: Optional[str] = None
+    recent_model_id: Optional[str] = None
+    first_response_id: Optional[int] = None
+    last_response_id: Optional[int] = None
+    detected_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class RegressionWindow(BaseModel):
+    model_name: str
+    metric: str
+    samples: int  # in the baseline and recent windows together
+    baseline_model_id: Optional[str] = None
+    recent_model_id: Optional[str] = None
+    # Last test, once both windows were full
+    baseline_median: Optional[float] = None
+    recent_median: Optional[float] = None
+    change: Optional[float] = None
+    p_value: Optional[float] = None
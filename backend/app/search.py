@@ -0,0 +1,408 @@
+"""
+Full-text search over prompt texts and model responses.
+
+SQLite: FTS5 tables (porter stemming) index prompts.text and
+model_responses.response_text. They read the texts from those tables
+(external content; responses through a view decoding compressed ones, see
+compression.py), so nothing is stored twice, and triggers keep them in
+sync on insert, update and delete, whoever writes. An index added to an
+existing database is filled in the background, in chunks on the response
+writer; search_backfills records the progress so a restart resumes it.
+Until it finishes, older rows are missing from results.
+
+PostgreSQL: GIN indexes over to_tsvector('english', ...), built
+concurrently and kept in sync by the database. Other backends fall back to
+an unindexed LIKE scan.
+
+Hits are ranked by bm25 (ts_rank on PostgreSQL), best first, and carry a
+snippet with the matched terms wrapped in HIGHLIGHT. Scoring every match of
+a term found in most rows takes seconds on SQLite, so only the newest
+SEARCH_RANK_WINDOW matches of a query are ranked (filters apply after).
+Prompt and response scores are on different scales (each index has its own
+document count and lengths), so each kind's are divided by its best before
+the two lists merge.
+"""
+import os
+import re
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from .database import engine
+from .models import SearchBackfill
+
+# Indexed text column of each table
+INDEXED = {"prompts": "text", "model_responses": "response_text"}
+KINDS = {"prompt": "prompts", "response": "model_responses"}
+# What the SQLite index reads each table's text from, the columns that text
+# depends on, and the SQL computing it from a trigger row
+CONTENT = {"prompts": "prompts", "model_responses": "model_responses_text"}
+SOURCE_COLUMNS = {
+    "prompts": "text",
+    "model_responses": "response_text, response_codec, response_body",
+}
+ROW_TEXT = {
+    "prompts": "{row}.text",
+    "model_responses": (
+        "decode_response({row}.response_codec, {row}.response_body, {row}.response_text)"
+    ),
+}
+
+SEARCH_BACKFILL_CHUNK = int(os.getenv("SEARCH_BACKFILL_CHUNK", "5000"))
+# Newest matches of a query ranked on SQLite (0 ranks every match)
+SEARCH_RANK_WINDOW = int(os.getenv("SEARCH_RANK_WINDOW", "10000"))
+HIGHLIGHT = ("«", "»")
+SNIPPET_TOKENS = 16
+SQLITE_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"  # created_at holds CURRENT_TIMESTAMP text
+
+
+class SearchQueryError(ValueError):
+    """The query is empty or not valid full-text syntax"""
+
+
+def ensure_search_index():
+    """Create the full-text indexes if missing (at startup)"""
+    if engine.dialect.name == "sqlite":
+        _ensure_sqlite()
+    elif engine.dialect.name == "postgresql":
+        _ensure_postgresql()
+    else:
+        print(f"Warning: no full-text index on {engine.dialect.name}; search scans the tables")
+
+
+def _ensure_sqlite():
+    with engine.begin() as conn:
+        # A write first takes the database's write lock for the whole setup:
+        # no other worker creates the index concurrently and no row is
+        # inserted between creating the triggers and reading max(id)
+        conn.execute(text("DELETE FROM search_backfills WHERE 0"))
+        conn.execute(
+            text(
+                "CREATE VIEW IF NOT EXISTS model_responses_text AS SELECT id, "
+                f"{ROW_TEXT['model_responses'].format(row='model_responses')} AS response_text "
+                "FROM model_responses"
+            )
+        )
+        for table, column in INDEXED.items():
+            fts = f"{table}_fts"
+            content = CONTENT[table]
+            existing = conn.execute(
+                text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                {"name": fts},
+            ).scalar()
+            if existing and f"content='{content}'" in existing:
+                continue
+            if existing:
+                # Built before it read through `content`: rebuilt by the backfill
+                for trigger in ("insert", "delete", "update"):
+                    conn.execute(text(f"DROP TRIGGER IF EXISTS {fts}_{trigger}"))
+                conn.execute(text(f"DROP TABLE {fts}"))
+                conn.execute(
+                    SearchBackfill.__table__.delete().where(SearchBackfill.table_name == table)
+                )
+            conn.execute(
+                text(
+                    f"CREATE VIRTUAL TABLE {fts} USING fts5({column}, content='{content}', "
+                    f"content_rowid='id', tokenize='porter unicode61')"
+                )
+            )
+            new_text = ROW_TEXT[table].format(row="new")
+            old_text = ROW_TEXT[table].format(row="old")
+            # Rows the backfill has yet to reach are left to it: indexing them
+            # twice, or deleting them from the index before, corrupts it
+            conn.execute(
+                text(
+                    f"CREATE TRIGGER {fts}_insert AFTER INSERT ON {table} "
+                    f"WHEN {_not_backfilling(table, 'new')} BEGIN "
+                    f"INSERT INTO {fts}(rowid, {column}) VALUES (new.id, {new_text}); END"
+                )
+            )
+            conn.execute(
+                text(
+                    f"CREATE TRIGGER {fts}_delete AFTER DELETE ON {table} "
+                    f"WHEN {_not_backfilling(table, 'old')} BEGIN "
+                    f"INSERT INTO {fts}({fts}, rowid, {column}) "
+                    f"VALUES ('delete', old.id, {old_text}); END"
+                )
+            )
+            # Compressing a stored response changes its columns, not its text
+            conn.execute(
+                text(
+                    f"CREATE TRIGGER {fts}_update AFTER UPDATE OF {SOURCE_COLUMNS[table]} "
+                    f"ON {table} WHEN {_not_backfilling(table, 'old')} "
+                    f"AND {old_text} IS NOT {new_text} BEGIN "
+                    f"INSERT INTO {fts}({fts}, rowid, {column}) "
+                    f"VALUES ('delete', old.id, {old_text}); "
+                    f"INSERT INTO {fts}(rowid, {column}) VALUES (new.id, {new_text}); END"
+                )
+            )
+            bounds = conn.execute(text(f"SELECT MIN(id), MAX(id) FROM {table}")).first()
+            if bounds[1] is not None:
+                conn.execute(
+                    SearchBackfill.__table__.insert().values(
+                        table_name=table, next_id=bounds[0], max_id=bounds[1]
+                    )
+                )
+
+
+def _not_backfilling(table: str, row: str) -> str:
+    return (
+        f"NOT EXISTS (SELECT 1 FROM search_backfills WHERE table_name = '{table}' "
+        f"AND {row}.id BETWEEN next_id AND max_id)"
+    )
+
+
+def _ensure_postgresql():
+    # CONCURRENTLY keeps the table writable while a large index builds; it
+    # cannot run inside a transaction
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for table, column in INDEXED.items():
+            conn.execute(
+                text(
+                    f"CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_{table}_fts ON {table} "
+                    f"USING gin (to_tsvector('english', {column}))"
+                )
+            )
+
+
+def _backfill_chunk(table: str):
+    column = INDEXED[table]
+
+    def task(db_session: Session) -> bool:
+        # Write first so workers resuming the same backfill take turns
+        db_session.execute(
+            SearchBackfill.__table__.update()
+            .where(SearchBackfill.table_name == table)
+            .values(next_id=SearchBackfill.next_id)
+        )
+        state = db_session.get(SearchBackfill, table)
+        if state is None:
+            return False
+        last_id = min(state.next_id + SEARCH_BACKFILL_CHUNK - 1, state.max_id)
+        db_session.execute(
+            text(
+                f"INSERT INTO {table}_fts(rowid, {column}) "
+                f"SELECT id, {column} FROM {CONTENT[table]} WHERE id >= :first AND id <= :last"
+            ),
+            {"first": state.next_id, "last": last_id},
+        )
+        if last_id >= state.max_id:
+            db_session.delete(state)
+            return False
+        state.next_id = last_id + 1
+        return True
+
+    return task
+
+
+def backfill_search_index(writer) -> bool:
+    """Index rows written before the index existed (blocking); returns whether any were"""
+    if engine.dialect.name != "sqlite":
+        return False
+    ran = False
+    for table in INDEXED:
+        while writer.run_task(_backfill_chunk(table)).result():
+            ran = True
+    return ran
+
+
+def _fts_query(query: str, syntax: str) -> str:
+    if syntax == "fts":
+        return query
+    # Plain text: every word must occur (quoted, so nothing is an operator)
+    words = re.findall(r"\w+", query)
+    if not words:
+        raise SearchQueryError("Query has no words to search for")
+    return " ".join(f'"{word}"' for word in words)
+
+
+def search(
+    db_session: Session,
+    query: str,
+    kinds: Sequence[str] = ("prompt", "response"),
+    models: Optional[List[str]] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = 20,
+    offset: int = 0,
+    syntax: str = "plain",
+) -> List[Dict]:
+    """Best matching prompts and responses, best first
+
+    `syntax` 'plain' matches texts containing every word of the query;
+    'fts' passes it on as the backend's query syntax (FTS5 on SQLite,
+    websearch_to_tsquery on PostgreSQL). `models` restricts responses to
+    those models and prompts to ones they answered; `start` / `end` (naive
+    UTC) bound created_at.
+    """
+    dialect = engine.dialect.name
+    if dialect == "sqlite":
+        run = _search_sqlite
+    elif dialect == "postgresql":
+        run = _search_postgresql
+    else:
+        run = _search_scan
+    hits = []
+    for kind in kinds:
+        kind_hits = run(db_session, kind, query, syntax, models, start, end, limit + offset)
+        # Best first: the first is the kind's best match on every page
+        best = kind_hits[0]["score"] if kind_hits else 0
+        for hit in kind_hits:
+            hit["score"] = hit["score"] / best if best > 0 else 0.0
+        hits.extend(kind_hits)
+    hits.sort(key=lambda hit: hit["score"], reverse=True)
+    return hits[offset : offset + limit]
+
+
+def _filters(kind: str, models, start, end, sqlite: bool = False):
+    """SQL conditions on `t` (the searched table) and their parameters"""
+    conditions, params = [], {}
+    if models:
+        if kind == "response":
+            conditions.append("t.model_name IN :models")
+        else:
+            # Unary + keeps SQLite from answering this through the
+            # (model_name, created_at) index, scanning a model's every response
+            model_name = "+r.model_name" if sqlite else "r.model_name"
+            conditions.append(
+                "EXISTS (SELECT 1 FROM model_responses r "
+                f"WHERE r.prompt_id = t.id AND {model_name} IN :models)"
+            )
+        params["models"] = list(models)
+    for name, value, operator in (("start", start, ">="), ("end", end, "<")):
+        if value is not None:
+            conditions.append(f"t.created_at {operator} :{name}")
+            params[name] = value.strftime(SQLITE_DATE_FORMAT) if sqlite else value
+    return "".join(f" AND {condition}" for condition in conditions), params
+
+
+def _hits(db_session: Session, kind: str, sql: str, params: dict) -> List[Dict]:
+    statement = text(sql)
+    if "models" in params:
+        statement = statement.bindparams(bindparam("models", expanding=True))
+    return [
+        {
+            "kind": kind,
+            "prompt_id": row.prompt_id,
+            "response_id": row.response_id,
+            "model_name": row.model_name,
+            "created_at": row.created_at,
+            "score": row.score,
+            "snippet": row.snippet,
+        }
+        for row in db_session.execute(statement, params)
+    ]
+
+
+def _columns(kind: str) -> str:
+    if kind == "response":
+        return "t.prompt_id AS prompt_id, t.id AS response_id, t.model_name AS model_name"
+    return "t.id AS prompt_id, NULL AS response_id, NULL AS model_name"
+
+
+def _search_sqlite(db_session, kind, query, syntax, models, start, end, limit):
+    table = KINDS[kind]
+    fts = f"{table}_fts"
+    conditions, params = _filters(kind, models, start, end, sqlite=True)
+    match = _fts_query(query, syntax)
+    try:
+        if SEARCH_RANK_WINDOW:
+            # Walking the match list back from the newest row is cheap;
+            # computing bm25 for each of its rows is not
+            floor = db_session.execute(
+                text(
+                    f"SELECT rowid FROM {fts} WHERE {fts} MATCH :query "
+                    f"ORDER BY rowid DESC LIMIT 1 OFFSET :skip"
+                ),
+                {"query": match, "skip": SEARCH_RANK_WINDOW - 1},
+            ).scalar()
+            if floor is not None:
+                conditions += f" AND {fts}.rowid >= :floor"
+                params["floor"] = floor
+        # bm25() is lower for better matches
+        sql = (
+            f"SELECT {_columns(kind)}, t.created_at AS created_at, -bm25({fts}) AS score, "
+            f"snippet({fts}, 0, :mark_start, :mark_end, '…', :tokens) AS snippet "
+            f"FROM {fts} JOIN {table} t ON t.id = {fts}.rowid "
+            f"WHERE {fts} MATCH :query{conditions} ORDER BY bm25({fts}) LIMIT :limit"
+        )
+        params.update(
+            query=match,
+            mark_start=HIGHLIGHT[0],
+            mark_end=HIGHLIGHT[1],
+            tokens=SNIPPET_TOKENS,
+            limit=limit,
+        )
+        return _hits(db_session, kind, sql, params)
+    except OperationalError as e:
+        if syntax != "fts":
+            raise
+        # FTS5 reports malformed queries as errors of the statement
+        raise SearchQueryError(f"Invalid search query: {e.orig}")
+
+
+def _search_postgresql(db_session, kind, query, syntax, models, start, end, limit):
+    table = KINDS[kind]
+    column = INDEXED[table]
+    conditions, params = _filters(kind, models, start, end)
+    to_query = "websearch_to_tsquery" if syntax == "fts" else "plainto_tsquery"
+    # Headlines are costly; only build them for the rows returned
+    sql = (
+        f"WITH q AS (SELECT {to_query}('english', :query) AS query), "
+        f"best AS (SELECT t.id, ts_rank(to_tsvector('english', t.{column}), q.query) AS score "
+        f"FROM {table} t, q WHERE to_tsvector('english', t.{column}) @@ q.query{conditions} "
+        f"ORDER BY score DESC LIMIT :limit) "
+        f"SELECT {_columns(kind)}, t.created_at AS created_at, best.score AS score, "
+        f"ts_headline('english', t.{column}, q.query, :options) AS snippet "
+        f"FROM best JOIN {table} t ON t.id = best.id, q ORDER BY best.score DESC"
+    )
+    params.update(
+        query=query,
+        limit=limit,
+        options=(
+            f"StartSel={HIGHLIGHT[0]}, StopSel={HIGHLIGHT[1]}, "
+            f"MaxWords={SNIPPET_TOKENS}, MinWords={SNIPPET_TOKENS // 2}"
+        ),
+    )
+    return _hits(db_session, kind, sql, params)
+
+
+def _search_scan(db_session, kind, query, syntax, models, start, end, limit):
+    table = KINDS[kind]
+    column = INDEXED[table]
+    words = re.findall(r"\w+", query)
+    if not words:
+        raise SearchQueryError("Query has no words to search for")
+    conditions, params = _filters(kind, models, start, end)
+    for i, word in enumerate(words):
+        conditions += f" AND LOWER(t.{column}) LIKE :word{i}"
+        params[f"word{i}"] = f"%{word.lower()}%"
+    sql = (
+        f"SELECT {_columns(kind)}, t.created_at AS created_at, 0.0 AS score, "
+        f"t.{column} AS snippet FROM {table} t WHERE 1 = 1{conditions} "
+        f"ORDER BY t.id DESC LIMIT :limit"
+    )
+    params["limit"] = limit
+    hits = _hits(db_session, kind, sql, params)
+    for hit in hits:
+        hit["snippet"] = _excerpt(hit["snippet"], words[0])
+    return hits
+
+
+def _excerpt(value: str, word: str, width: int = 80) -> str:
+    index = value.lower().find(word.lower())
+    start = max(0, index - width // 2)
+    excerpt = value[start : start + width]
+    match = excerpt.lower().find(word.lower())
+    if match >= 0:
+        excerpt = (
+            excerpt[:match]
+            + HIGHLIGHT[0]
+            + excerpt[match : match + len(word)]
+            + HIGHLIGHT[1]
+            + excerpt[match + len(word) :]
+        )
+    return ("…" if start else "") + excerpt + ("…" if start + width < len(value) else "")
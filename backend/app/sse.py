@@ -0,0 +1,174 @@
+"""
+Server-Sent Events framing for the stream endpoint.
+
+Two framings are supported:
+
+- "events" (default): one `data:` frame per token carrying a full
+  StreamUpdate, as the frontend has always consumed it.
+- "compact" (opt-in): a `header` event announces the model list once, after
+  which models are referenced by their index. Tokens are coalesced per model
+  over a short time/size window and sent as JSON arrays:
+
+      event: header
+      data: {"v":1,"models":["cohere.command-latest","xai.grok-4"]}
+
+      data: [[0,"Hello wor",0.41,0.38],[1,"Hi",0.52]]
+
+  Each entry is [model_index, text, elapsed_time] with the model's
+  time_to_first_token appended to its first entry only. Terminal updates are
+  sent as `done` events: {"model":0,"status":"completed",...}.
+
+Both framings consume a run subscription (see runs.py) and tag frames with
+`id: <run id>:<seq>` so a reconnecting EventSource resumes where it left off
+via Last-Event-ID. A `reset` event tells the client to discard what it has
+received; the run's updates are replayed after it.
+"""
+import json
+import time
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Union
+
+from .fanout import TokenEvent
+from .runs import RESET
+from .schemas import StreamUpdate
+
+FRAMINGS = ("events", "compact")
+
+# Reused instead of json.dumps(..., separators=...), which builds a new encoder per call
+_compact_json = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False).encode
+
+# (seq or None, update or RESET) from a run subscription; None is a heartbeat
+Item = Optional[Tuple[Optional[int], Union[TokenEvent, StreamUpdate, object]]]
+
+
+def format_sse(data: str, event: Optional[str] = None, event_id: Optional[str] = None) -> str:
+    """Format a single SSE frame"""
+    frame = f"id: {event_id}\n" if event_id else ""
+    if event:
+        frame += f"event: {event}\n"
+    return f"{frame}data: {data}\n\n"
+
+
+def _event_id(run_id: str, seq: Optional[int]) -> Optional[str]:
+    return f"{run_id}:{seq}" if seq is not None else None
+
+
+def parse_event_id(event_id: Optional[str]) -> Tuple[Optional[str], int]:
+    """(run id, seq) of a Last-Event-ID; (None, 0) if absent or malformed"""
+    run_id, _, seq = (event_id or "").partition(":")
+    if not run_id or not seq.isdigit():
+        return None, 0
+    return run_id, int(seq)
+
+
+async def event_frames(items: AsyncIterator[Item], run_id: str) -> AsyncIterator[str]:
+    """One frame per update, in the original StreamUpdate format"""
+    async for item in items:
+        if item is None:
+            continue
+        seq, update = item
+        if update is RESET:
+            yield format_sse("{}", "reset")
+            continue
+        if isinstance(update, TokenEvent):
+            # Same payload as StreamUpdate(...).dict() without building the model
+            payload = {
+                "model_name": update.model_name,
+                "token": update.token,
+                "time_to_first_token": update.time_to_first_token,
+                "total_time": update.total_time,
+                "is_complete": False,
+                "status": None,
+                "cached": update.cached,
+                "error": None,
+                "queue_wait": None,
+                "prompt_tokens": None,
+                "completion_tokens": None,
+                "tokens_per_second": None,
+                "output_tokens_per_second": None,
+                "rank": None,
+            }
+        else:
+            payload = update.dict()
+        yield format_sse(json.dumps(payload), event_id=_event_id(run_id, seq))
+
+
+async def compact_frames(
+    items: AsyncIterator[Item],
+    run_id: str,
+    model_names: List[str],
+    window: float = 0.02,
+    max_bytes: int = 256,
+) -> AsyncIterator[str]:
+    """Coalesced frames referencing models by index (see module docstring)
+
+    Pending tokens are flushed once the oldest is `window` seconds old or a
+    model has buffered `max_bytes` of text. `items` should yield None as a
+    heartbeat while idle so the time window is honored. A coalesced frame
+    carries the id of the last update in it.
+    """
+    model_ids: Dict[str, int] = {name: i for i, name in enumerate(model_names)}
+    yield format_sse(_compact_json({"v": 1, "models": model_names}), "header")
+
+    pending: Dict[int, list] = {}  # model index -> [parts, size, elapsed, ttft]
+    announced_ttft = set()
+    oldest: Optional[float] = None
+    pending_seq: Optional[int] = None
+
+    def flush() -> Optional[str]:
+        nonlocal oldest, pending_seq
+        if not pending:
+            return None
+        batch = []
+        for model_id, (parts, _, elapsed, ttft) in pending.items():
+            entry = [model_id, "".join(parts), elapsed]
+            if model_id not in announced_ttft and ttft is not None:
+                entry.append(ttft)
+                announced_ttft.add(model_id)
+            batch.append(entry)
+        pending.clear()
+        oldest = None
+        event_id = _event_id(run_id, pending_seq)
+        pending_seq = None
+        return format_sse(_compact_json(batch), event_id=event_id)
+
+    async for item in items:
+        update = None
+        if item is not None:
+            seq, update = item
+        if update is RESET:
+            pending.clear()
+            announced_ttft.clear()
+            oldest = pending_seq = None
+            yield format_sse("{}", "reset")
+            continue
+        if isinstance(update, TokenEvent):
+            if seq is not None:
+                pending_seq = seq
+            model_id = model_ids[update.model_name]
+            entry = pending.get(model_id)
+            if entry is None:
+                entry = pending[model_id] = [[], 0, None, None]
+            entry[0].append(update.token)
+            entry[1] += len(update.token)
+            entry[2] = update.total_time
+            entry[3] = update.time_to_first_token
+            if oldest is None:
+                oldest = time.monotonic()
+            if entry[1] >= max_bytes:
+                yield flush()
+                continue
+        elif isinstance(update, StreamUpdate):
+            frame = flush()
+            if frame:
+                yield frame
+            payload = update.dict(exclude={"model_name", "token"}, exclude_none=True)
+            payload["model"] = model_ids.get(update.model_name)
+            yield format_sse(_compact_json(payload), "done", _event_id(run_id, seq))
+            continue
+
+        if oldest is not None and time.monotonic() - oldest >= window:
+            yield flush()
+
+    frame = flush()
+    if frame:
+        yield frame
@@ -0,0 +1,389 @@
+"""
+Prompt sweeps: a template, variable sets, system prompts, a grid of
+generation params and a set of models, expanded into a matrix of cells.
+
+A cell is one generation: the template rendered with one variable set
+(`{name}` placeholders), under one system prompt, with one combination of
+the params grid, by one model. Cells that would send the same request
+(same rendered text, system prompt, params and model) run once and share
+the result.
+
+As with jobs, rendered prompts are stored as Prompt rows tagged with the
+sweep and results as ordinary ModelResponse rows carrying their system
+prompt and params, so the work still to do is derived from the database
+and a sweep resumes after a restart. Its generations share the sweep's
+max_concurrency slots and go through the engine's scheduler as user
+`sweep:<id>`. Params are applied per call, so every variant of a model
+reuses its one client.
+"""
+import asyncio
+import itertools
+import json
+import os
+import re
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import insert
+
+from .coordination import held_leases, leased
+from .database import SessionLocal
+from .fanout import FanoutEngine
+from .jobs import FINAL_STATUSES
+from .models import ModelResponse, Prompt, PromptSweep
+from .tokens import throughput
+
+# Largest matrix a sweep may expand to, duplicates included
+SWEEP_MAX_CELLS = int(os.getenv("SWEEP_MAX_CELLS", "1000"))
+
+_PLACEHOLDER = re.compile(r"\{(\w+)\}")
+
+# (rendered text, system prompt, params JSON, model): identical requests share it
+CellKey = Tuple[str, Optional[str], Optional[str], str]
+
+
+class Cell(NamedTuple):
+    index: int
+    variables: int  # index into the spec's variable sets
+    system_prompt: int  # index into the spec's system prompts
+    params: int  # index into param_combinations()
+    model_name: str
+    key: CellKey
+
+
+def render(template: str, variables: Dict[str, str]) -> str:
+    """Fill `{name}` placeholders; other braces are left as they are"""
+    return _PLACEHOLDER.sub(
+        lambda match: str(variables.get(match.group(1), match.group(0))), template
+    )
+
+
+def param_combinations(grid: Dict[str, List]) -> List[Dict]:
+    """Every combination of the grid's values, by sorted param name"""
+    names = sorted(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[n] for n in names))]
+
+
+def params_json(params: Dict) -> Optional[str]:
+    """Params as stored on responses (see FanoutEngine.run_model)"""
+    return json.dumps(params, sort_keys=True) if params else None
+
+
+def expand(spec: Dict) -> List[Cell]:
+    """The sweep's cells in row-major order (variables, system prompt, params, model)"""
+    combinations = param_combinations(spec["params"])
+    cells = []
+    for v, variables in enumerate(spec["variables"]):
+        text = render(spec["template"], variables)
+        for s, system_prompt in enumerate(spec["system_prompts"]):
+            for p, params in enumerate(combinations):
+                for model_name in spec["models"]:
+                    key = (text, system_prompt or None, params_json(params), model_name)
+                    cells.append(Cell(len(cells), v, s, p, model_name, key))
+    return cells
+
+
+def cell_count(spec: Dict) -> int:
+    combinations = 1
+    for values in spec["params"].values():
+        combinations *= len(values)
+    return len(spec["variables"]) * len(spec["system_prompts"]) * combinations * len(spec["models"])
+
+
+def create_sweep(spec: Dict, max_concurrency: int) -> int:
+    """Create a sweep and insert its distinct rendered prompts (blocking)"""
+    cells = expand(spec)
+    texts = list(dict.fromkeys(cell.key[0] for cell in cells))
+    db_session = SessionLocal()
+    try:
+        sweep = PromptSweep(
+            spec=json.dumps(spec),
+            total_cells=len(cells),
+            unique_cells=len({cell.key for cell in cells}),
+            max_concurrency=max_concurrency,
+        )
+        db_session.add(sweep)
+        db_session.flush()
+        db_session.execute(insert(Prompt), [{"text": text, "sweep_id": sweep.id} for text in texts])
+        db_session.commit()
+        return sweep.id
+    finally:
+        db_session.close()
+
+
+def _result(row) -> Dict:
+    """A stored response as a cell result"""
+    return {
+        "status": row.status,
+        "response_id": row.id,
+        "time_to_first_token": row.time_to_first_token,
+        "total_time": row.total_time,
+        "prompt_tokens": row.prompt_tokens,
+        "completion_tokens": row.completion_tokens,
+        "tokens_per_second": throughput(
+            row.completion_tokens, row.time_to_first_token, row.total_time
+        )["tokens_per_second"],
+        "cached": row.cached,
+        "error": row.error,
+    }
+
+
+def load_sweep(sweep_id: int) -> Optional[Tuple[PromptSweep, Dict, List[Cell], Dict[str, int], Dict[CellKey, Dict]]]:
+    """The sweep, its spec and cells, prompt ids by text and results by cell key (blocking)"""
+    db_session = SessionLocal()
+    try:
+        sweep = db_session.get(PromptSweep, sweep_id)
+        if sweep is None:
+            return None
+        db_session.expunge(sweep)
+        spec = json.loads(sweep.spec)
+        prompt_ids = {
+            text: prompt_id
+            for prompt_id, text in db_session.query(Prompt.id, Prompt.text).filter(
+                Prompt.sweep_id == sweep_id
+            )
+        }
+        rows = (
+            db_session.query(
+                ModelResponse.id,
+                ModelResponse.prompt_id,
+                ModelResponse.model_name,
+                ModelResponse.system_prompt,
+                ModelResponse.generation_params,
+                ModelResponse.status,
+                ModelResponse.error,
+                ModelResponse.cached,
+                ModelResponse.time_to_first_token,
+                ModelResponse.total_time,
+                ModelResponse.prompt_tokens,
+                ModelResponse.completion_tokens,
+            )
+            .join(Prompt, Prompt.id == ModelResponse.prompt_id)
+            .filter(Prompt.sweep_id == sweep_id, ModelResponse.status.in_(FINAL_STATUSES))
+            .order_by(ModelResponse.id)
+            .all()
+        )
+        texts = {prompt_id: text for text, prompt_id in prompt_ids.items()}
+        results = {
+            (texts[row.prompt_id], row.system_prompt, row.generation_params, row.model_name): _result(row)
+            for row in rows
+        }
+        return sweep, spec, expand(spec), prompt_ids, results
+    finally:
+        db_session.close()
+
+
+def _set_sweep_status(sweep_id: int, status: str):
+    db_session = SessionLocal()
+    try:
+        sweep = db_session.get(PromptSweep, sweep_id)
+        sweep.status = status
+        if status in ("completed", "cancelled"):
+            sweep.finished_at = datetime.now(timezone.utc)
+        db_session.commit()
+    finally:
+        db_session.close()
+
+
+class SweepProgress:
+    """Results of a running sweep as they arrive, with change notification for SSE"""
+
+    def __init__(
+        self,
+        sweep_id: int,
+        cells: List[Cell],
+        results: Dict[CellKey, Dict],
+        status: str = "running",
+    ):
+        self.sweep_id = sweep_id
+        self.cells_by_key: Dict[CellKey, List[int]] = {}
+        for cell in cells:
+            self.cells_by_key.setdefault(cell.key, []).append(cell.index)
+        self.status = status
+        # Append-only: each subscriber keeps its own position
+        self.events: List[Dict] = [self._cell_event(key, result) for key, result in results.items()]
+        self._subscribers: List[asyncio.Event] = []
+
+    def _cell_event(self, key: CellKey, result: Dict) -> Dict:
+        return {"type": "cell", "cells": self.cells_by_key.get(key, []), "model_name": key[3], **result}
+
+    def record(self, key: CellKey, result: Dict):
+        self.events.append(self._cell_event(key, result))
+        self.notify()
+
+    def finish(self, status: str):
+        self.status = status
+        self.notify()
+
+    def notify(self):
+        for event in self._subscribers:
+            event.set()
+
+    def subscribe(self) -> asyncio.Event:
+        event = asyncio.Event()
+        event.set()  # deliver the results so far immediately
+        self._subscribers.append(event)
+        return event
+
+    def unsubscribe(self, event: asyncio.Event):
+        self._subscribers.remove(event)
+
+    def status_event(self) -> Dict:
+        return {
+            "type": "status",
+            "sweep_id": self.sweep_id,
+            "status": self.status,
+            "done": len(self.events),
+            "unique_cells": len(self.cells_by_key),
+        }
+
+
+class SweepRunner:
+    """Runs sweeps through the fan-out engine
+
+    `max_concurrency` workers pull the sweep's pending requests in cell
+    order, which interleaves the models; the engine's scheduler applies on
+    top, queueing each sweep as its own user.
+    """
+
+    def __init__(self, engine: FanoutEngine):
+        self.engine = engine
+        self.progress: Dict[int, SweepProgress] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+        # Set once a started sweep's progress is loaded
+        self._loaded: Dict[int, asyncio.Event] = {}
+        self._cancel_requested = set()
+
+    def start(self, sweep_id: int):
+        if sweep_id in self._tasks and not self._tasks[sweep_id].done():
+            return
+        self._loaded[sweep_id] = asyncio.Event()
+        self._tasks[sweep_id] = asyncio.create_task(self._run(sweep_id))
+
+    def cancel(self, sweep_id: int) -> bool:
+        task = self._tasks.get(sweep_id)
+        if task is None or task.done():
+            return False
+        self._cancel_requested.add(sweep_id)
+        task.cancel()
+        return True
+
+    async def resume_incomplete(self):
+        """Start the pending or running sweeps no worker is running
+
+        Those interrupted by a restart, or left by a worker that died once its
+        lease has expired.
+        """
+        loop = asyncio.get_running_loop()
+
+        def load_ids():
+            db_session = SessionLocal()
+            try:
+                ids = [
+                    sweep_id
+                    for (sweep_id,) in db_session.query(PromptSweep.id).filter(
+                        PromptSweep.status.in_(("pending", "running"))
+                    )
+                ]
+            finally:
+                db_session.close()
+            # Not those another worker is running
+            held = set(held_leases("sweep:"))
+            return [sweep_id for sweep_id in ids if f"sweep:{sweep_id}" not in held]
+
+        for sweep_id in await loop.run_in_executor(self.engine.db_executor, load_ids):
+            task = self._tasks.get(sweep_id)
+            if task is None or task.done():
+                print(f"Resuming prompt sweep {sweep_id}")
+                self.start(sweep_id)
+
+    async def _run(self, sweep_id: int):
+        # Runs on the one worker holding its lease; the others leave it be
+        async with leased(f"sweep:{sweep_id}", self.engine.db_executor) as held:
+            if held:
+                await self._run_leased(sweep_id)
+
+    async def _run_leased(self, sweep_id: int):
+        loop = asyncio.get_running_loop()
+        db_executor = self.engine.db_executor
+        sweep, spec, cells, prompt_ids, results = await loop.run_in_executor(
+            db_executor, load_sweep, sweep_id
+        )
+        progress = self.progress[sweep_id] = SweepProgress(sweep_id, cells, results)
+        self._loaded[sweep_id].set()
+        await loop.run_in_executor(db_executor, _set_sweep_status, sweep_id, "running")
+
+        pending = deque(dict.fromkeys(cell.key for cell in cells if cell.key not in results))
+
+        async def worker():
+            while pending:
+                key = pending.popleft()
+                progress.record(key, await self._run_cell(sweep_id, key, prompt_ids[key[0]], spec))
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(min(sweep.max_concurrency, len(pending)))))
+        except asyncio.CancelledError:
+            # Only an explicit cancel is final; after a shutdown the sweep resumes
+            if sweep_id in self._cancel_requested:
+                self._cancel_requested.discard(sweep_id)
+                progress.finish("cancelled")
+                await loop.run_in_executor(db_executor, _set_sweep_status, sweep_id, "cancelled")
+            raise
+
+        progress.finish("completed")
+        await loop.run_in_executor(db_executor, _set_sweep_status, sweep_id, "completed")
+
+    async def _run_cell(self, sweep_id: int, key: CellKey, prompt_id: int, spec: Dict) -> Dict:
+        """Run one distinct request and return its cell result"""
+        text, system_prompt, params, model_name = key
+        update_queue: asyncio.Queue = asyncio.Queue()
+        await self.engine.run_model(
+            model_name,
+            text,
+            prompt_id,
+            update_queue,
+            use_cache=spec.get("cache", False),
+            stream_tokens=False,
+            user=f"sweep:{sweep_id}",
+            system_prompt=system_prompt,
+            params=json.loads(params) if params else None,
+        )
+        update = update_queue.get_nowait()
+        if update.status == "error":
+            # Persisted so a failing request is not retried on every resume
+            try:
+                await self.engine.save_response(
+                    prompt_id=prompt_id,
+                    model_name=model_name,
+                    response_text="",
+                    time_to_first_token=0.0,
+                    total_time=0.0,
+                    status="error",
+                    error=update.error,
+                    queue_wait_time=update.queue_wait,
+                    system_prompt=system_prompt,
+                    generation_params=params,
+                )
+            except Exception as e:
+                print(f"Error saving failed sweep cell ({prompt_id}, {model_name}): {e}")
+        return {
+            "status": update.status,
+            "response_id": None,
+            "time_to_first_token": update.time_to_first_token,
+            "total_time": update.total_time,
+            "prompt_tokens": update.prompt_tokens,
+            "completion_tokens": update.completion_tokens,
+            "tokens_per_second": update.tokens_per_second,
+            "cached": update.cached,
+            "error": update.error,
+        }
+
+    async def get_progress(self, sweep_id: int) -> Optional[SweepProgress]:
+        """The sweep's progress, waiting for a just-started sweep to load it"""
+        task = self._tasks.get(sweep_id)
+        if task is not None and not task.done():
+            loaded = asyncio.ensure_future(self._loaded[sweep_id].wait())
+            await asyncio.wait((loaded, task), return_when=asyncio.FIRST_COMPLETED)
+            loaded.cancel()
+        return self.progress.get(sweep_id)
@@ -0,0 +1,176 @@
+"""
+Prompt and completion token counts of generations.
+
+Counts come from the provider when it reports them: langchain's
+`usage_metadata` on streamed chunks (OpenAI-compatible endpoints with
+`stream_usage`), or a `usage` / `token_usage` dict in the chunk metadata.
+Otherwise the text is counted with a local tokenizer for the model family,
+and if that cannot be loaded (tiktoken downloads its vocabularies on first
+use) with a characters-per-token estimate. Each count records its source.
+load_tokenizers() fetches the vocabularies ahead of time: the startup
+warm-up calls it, and a deployment without internet access can run it at
+build time with TIKTOKEN_CACHE_DIR set to a directory it ships.
+
+The collector also picks up which model the provider says served the
+generation (OpenAI-compatible `model_name`, OCI `model_id` / `model_version`),
+which can differ from the configured ID behind aliases like *-latest.
+"""
+import math
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+# Local tokenizer per model family (prefix of the model key). None of the
+# providers publish their tokenizers for tiktoken, so these are the nearest
+# vocabularies: within a few percent for Llama 3/4 and Grok, rougher for the rest.
+FAMILY_ENCODINGS = {
+    "xai": "o200k_base",
+    "meta": "cl100k_base",
+    "cohere": "cl100k_base",
+    "google": "o200k_base",
+}
+DEFAULT_ENCODING = "cl100k_base"
+CHARS_PER_TOKEN = 4
+# Seconds before loading a tokenizer that failed is tried again
+TOKENIZER_RETRY_INTERVAL = float(os.getenv("TOKENIZER_RETRY_INTERVAL", "300"))
+
+# Loaded counters per family, and when loading one last failed
+_counters: Dict[str, Callable[[str], int]] = {}
+_failed_at: Dict[str, float] = {}
+_load_lock = threading.Lock()
+
+
+class TokenUsage(NamedTuple):
+    prompt_tokens: Optional[int]
+    completion_tokens: Optional[int]
+    source: str  # 'provider', 'tokenizer' or 'estimate'
+    model_id: Optional[str] = None  # model the provider reported serving, if any
+
+
+class UsageCollector:
+    """Accumulates provider-reported usage across the chunks of one stream"""
+
+    def __init__(self):
+        self.prompt_tokens: Optional[int] = None
+        self.completion_tokens: Optional[int] = None
+        self.model_id: Optional[str] = None
+
+    def add_chunk(self, chunk: Any):
+        metadata = getattr(chunk, "response_metadata", None)
+        if metadata:
+            model_id = metadata.get("model_name") or metadata.get("model_id")
+            if model_id:
+                version = metadata.get("model_version")
+                self.model_id = f"{model_id}@{version}" if version else model_id
+        usage = getattr(chunk, "usage_metadata", None)
+        if usage:
+            # langchain reports usage per chunk; merged chunks add up
+            self.prompt_tokens = (self.prompt_tokens or 0) + usage.get("input_tokens", 0)
+            self.completion_tokens = (self.completion_tokens or 0) + usage.get(
+                "output_tokens", 0
+            )
+            return
+        for metadata in (
+            getattr(chunk, "response_metadata", None),
+            getattr(chunk, "additional_kwargs", None),
+        ):
+            usage = metadata and (metadata.get("usage") or metadata.get("token_usage"))
+            if isinstance(usage, dict):
+                # Provider totals so far; the last one wins
+                prompt = usage.get("prompt_tokens", usage.get("input_tokens"))
+                completion = usage.get("completion_tokens", usage.get("output_tokens"))
+                if prompt is not None:
+                    self.prompt_tokens = prompt
+                if completion is not None:
+                    self.completion_tokens = completion
+                return
+
+    @property
+    def reported(self) -> bool:
+        """Whether the provider reported both counts"""
+        return self.prompt_tokens is not None and self.completion_tokens is not None
+
+    def usage(self, model_name: str, prompt: str, response_text: str) -> TokenUsage:
+        """Provider counts, with local counts for whatever it did not report"""
+        if self.reported:
+            return TokenUsage(self.prompt_tokens, self.completion_tokens, "provider", self.model_id)
+        counted = count_usage(model_name, prompt, response_text)
+        if self.completion_tokens is not None:
+            return TokenUsage(counted.prompt_tokens, self.completion_tokens, "provider", self.model_id)
+        return counted._replace(model_id=self.model_id)
+
+
+def _family(model_name: str) -> str:
+    return model_name.split(".", 1)[0]
+
+
+def _family_counter(family: str) -> Optional[Callable[[str], int]]:
+    """Token counter of a model family; None if unavailable
+
+    A loaded counter is kept; a failed load (e.g. no network for the
+    download) is retried after TOKENIZER_RETRY_INTERVAL. Call with
+    _load_lock held, so concurrent first calls load it once.
+    """
+    counter = _counters.get(family)
+    if counter is not None:
+        return counter
+    failed_at = _failed_at.get(family)
+    if failed_at is not None and time.monotonic() - failed_at < TOKENIZER_RETRY_INTERVAL:
+        return None
+    encoding_name = FAMILY_ENCODINGS.get(family, DEFAULT_ENCODING)
+    try:
+        import tiktoken
+
+        encoding = tiktoken.get_encoding(encoding_name)
+    except Exception as e:
+        _failed_at[family] = time.monotonic()
+        print(
+            f"Warning: tokenizer {encoding_name} unavailable for {family} models, "
+            f"estimating token counts: {e}"
+        )
+        return None
+    _failed_at.pop(family, None)
+    counter = _counters[family] = lambda text: len(encoding.encode(text, disallowed_special=()))
+    return counter
+
+
+def load_tokenizers(model_names: Optional[List[str]] = None) -> int:
+    """Load the tokenizers of these models' families (all known families by
+    default); returns how many families have one (blocking: may download)
+    """
+    if model_names is None:
+        families = list(FAMILY_ENCODINGS)
+    else:
+        families = list(dict.fromkeys(_family(model_name) for model_name in model_names))
+    with _load_lock:
+        return sum(_family_counter(family) is not None for family in families)
+
+
+def count_usage(model_name: str, prompt: str, response_text: str) -> TokenUsage:
+    """Count tokens locally (may load a tokenizer; call off the event loop)"""
+    with _load_lock:
+        counter = _family_counter(_family(model_name))
+    if counter is not None:
+        return TokenUsage(counter(prompt), counter(response_text), "tokenizer")
+    return TokenUsage(
+        math.ceil(len(prompt) / CHARS_PER_TOKEN),
+        math.ceil(len(response_text) / CHARS_PER_TOKEN),
+        "estimate",
+    )
+
+
+def throughput(
+    completion_tokens: Optional[int], time_to_first_token: float, total_time: float
+) -> Dict[str, Optional[float]]:
+    """Tokens/sec over the whole generation and after the first token"""
+    rates = {"tokens_per_second": None, "output_tokens_per_second": None}
+    if completion_tokens is None:
+        return rates
+    if total_time and total_time > 0:
+        rates["tokens_per_second"] = completion_tokens / total_time
+    # The first chunk arrives at TTFT; the rest stream in over the remaining time
+    decode_time = (total_time or 0) - (time_to_first_token or 0)
+    if completion_tokens > 1 and decode_time > 0:
+        rates["output_tokens_per_second"] = (completion_tokens - 1) / decode_time
+    return rates
@@ -0,0 +1,102 @@
+"""
+Per-chunk timing traces of generations.
+
+A trace records when each streamed chunk arrived (microseconds since the
+generation was admitted, on the monotonic clock) and how many characters it
+carried. It is stored on the response as a small blob:
+
+    header   version (uint8), chunk count (uint32)
+    offsets  uint32 per chunk, delta-encoded (gap to the previous chunk)
+    sizes    uint16 per chunk
+
+all little-endian, so a 500-chunk answer takes ~3KB instead of the tens of
+KB a JSON list of floats would.
+"""
+import struct
+from array import array
+from typing import Dict, List, Optional
+
+import numpy as np
+
+TRACE_VERSION = 1
+_HEADER = struct.Struct("<BI")
+_MAX_OFFSET_DELTA = 2**32 - 1  # ~71 minutes between chunks
+_MAX_SIZE = 2**16 - 1
+
+
+class TokenTrace:
+    """Chunk arrival offsets and sizes of one generation"""
+
+    __slots__ = ("offsets", "sizes")
+
+    def __init__(self):
+        self.offsets = array("Q")  # microseconds since start, absolute
+        self.sizes = array("I")
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def add(self, elapsed: float, size: int):
+        """Record a chunk of `size` characters arriving `elapsed` seconds in"""
+        offset = max(int(elapsed * 1_000_000), self.offsets[-1] if self.offsets else 0)
+        self.offsets.append(offset)
+        self.sizes.append(size)
+
+    def encode(self) -> bytes:
+        offsets = np.frombuffer(self.offsets, dtype=np.uint64)
+        deltas = np.diff(offsets, prepend=np.uint64(0))
+        return b"".join(
+            (
+                _HEADER.pack(TRACE_VERSION, len(self)),
+                np.minimum(deltas, _MAX_OFFSET_DELTA).astype("<u4").tobytes(),
+                np.minimum(np.frombuffer(self.sizes, dtype=np.uint32), _MAX_SIZE)
+                .astype("<u2")
+                .tobytes(),
+            )
+        )
+
+    @classmethod
+    def decode(cls, blob: bytes) -> "TokenTrace":
+        version, count = _HEADER.unpack_from(blob)
+        if version != TRACE_VERSION:
+            raise ValueError(f"Unsupported token trace version {version}")
+        deltas = np.frombuffer(blob, dtype="<u4", count=count, offset=_HEADER.size)
+        sizes = np.frombuffer(blob, dtype="<u2", count=count, offset=_HEADER.size + 4 * count)
+        trace = cls()
+        trace.offsets = array("Q", np.cumsum(deltas, dtype=np.uint64).tobytes())
+        trace.sizes = array("I", sizes.astype(np.uint32).tobytes())
+        return trace
+
+    def to_dict(self) -> Dict[str, List[int]]:
+        return {"offsets_us": self.offsets.tolist(), "sizes": self.sizes.tolist()}
+
+    def metrics(self) -> Dict[str, Optional[float]]:
+        """Inter-chunk latency percentiles, longest stall and steady-state rate
+
+        Each streamed chunk counts as one token, which is what the providers
+        send; the steady-state rate excludes the wait for the first chunk.
+        """
+        offsets = np.frombuffer(self.offsets, dtype=np.uint64).astype(np.float64) / 1e6
+        metrics = {
+            "chunks": len(offsets),
+            "itl_p50": None,
+            "itl_p99": None,
+            "max_stall": None,
+            "steady_tokens_per_second": None,
+        }
+        if len(offsets) < 2:
+            return metrics
+        gaps = np.diff(offsets)
+        p50, p99 = np.percentile(gaps, (50, 99))
+        metrics.update(itl_p50=float(p50), itl_p99=float(p99), max_stall=float(gaps.max()))
+        span = offsets[-1] - offsets[0]
+        if span > 0:
+            metrics["steady_tokens_per_second"] = float((len(offsets) - 1) / span)
+        return metrics
+
+
+def trace_metrics(blob: Optional[bytes]) -> Optional[Dict[str, Optional[float]]]:
+    """Metrics of a stored trace, or None for responses without one"""
+    if not blob:
+        return None
+    return TokenTrace.decode(blob).metrics()
@@ -0,0 +1,134 @@
+"""
+Fan-out engine benchmark against the local fake LLM.
+
+Runs many concurrent comparisons in one process (i.e. one uvicorn worker)
+and reports event-loop lag and the TTFT overhead added on top of the fake
+model's configured TTFT.
+
+Usage (from the backend directory):
+    uv run python -m benchmarks.fanout --comparisons 200 --models 4
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+async def run(args):
+    from app.database import SessionLocal, init_db
+    from app.fanout import FanoutEngine
+    from app.llm_service import LLMService
+    from app.models import Prompt
+    from app.schemas import StreamUpdate
+    from concurrent.futures import ThreadPoolExecutor
+
+    init_db()
+    db = SessionLocal()
+    prompt = Prompt(text="benchmark prompt")
+    db.add(prompt)
+    db.commit()
+    prompt_id = prompt.id
+    db.close()
+
+    service = LLMService()
+    model_names = service.get_available_models()
+    engine = FanoutEngine(
+        service,
+        ThreadPoolExecutor(max_workers=args.max_concurrency),
+        ThreadPoolExecutor(max_workers=4),
+        max_concurrency=args.max_concurrency,
+    )
+
+    lags = []
+    stop = asyncio.Event()
+
+    async def ticker():
+        # Measures how late the loop wakes us up, i.e. how long it was blocked
+        while not stop.is_set():
+            before = time.perf_counter()
+            await asyncio.sleep(0.01)
+            lags.append(time.perf_counter() - before - 0.01)
+
+    ttfts = []
+    queue_waits = []
+    events = 0
+
+    async def comparison():
+        nonlocal events
+        async for update in engine.stream(prompt_id, "benchmark prompt", model_names):
+            events += 1
+            if isinstance(update, StreamUpdate) and update.status == "completed":
+                ttfts.append(update.time_to_first_token)
+                queue_waits.append(update.queue_wait)
+
+    ticker_task = asyncio.create_task(ticker())
+    start = time.perf_counter()
+    await asyncio.gather(*(comparison() for _ in range(args.comparisons)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await ticker_task
+
+    overhead_ms = [(t - args.ttft) * 1000 for t in ttfts]
+    print(f"comparisons:        {args.comparisons} x {len(model_names)} models")
+    print(f"wall time:          {elapsed:.2f}s")
+    print(f"events/sec:         {events / elapsed:.0f}")
+    print(f"completed:          {len(ttfts)}")
+    print(
+        f"TTFT overhead ms:   p50={percentile(overhead_ms, 50):.2f} "
+        f"p99={percentile(overhead_ms, 99):.2f} max={max(overhead_ms, default=0):.2f}"
+    )
+    print(
+        f"queue wait ms:      p50={percentile(queue_waits, 50) * 1000:.2f} "
+        f"p99={percentile(queue_waits, 99) * 1000:.2f}"
+    )
+    print(
+        f"loop lag ms:        mean={statistics.mean(lags) * 1000:.2f} "
+        f"p99={percentile(lags, 99) * 1000:.2f} max={max(lags) * 1000:.2f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--comparisons", type=int, default=200)
+    parser.add_argument("--models", type=int, default=4)
+    parser.add_argument("--ttft", type=float, default=0.2)
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    parser.add_argument("--tokens", type=int, default=50)
+    parser.add_argument("--max-concurrency", type=int, default=1024)
+    parser.add_argument(
+        "--model-concurrency",
+        type=int,
+        default=None,
+        help="Fixed per-model concurrency (default: --max-concurrency)",
+    )
+    args = parser.parse_args()
+
+    os.environ.setdefault("COMPARTMENT_OCID", "benchmark")
+    os.environ["FAKE_LLM_MODELS"] = ",".join(
+        f"fake.model-{i}" for i in range(args.models)
+    )
+    os.environ["FAKE_LLM_TTFT"] = str(args.ttft)
+    os.environ["FAKE_LLM_TOKEN_DELAY"] = str(args.token_delay)
+    os.environ["FAKE_LLM_OUTPUT_TOKENS"] = str(args.tokens)
+    # Start at the cap: fake models never throttle, so skip the AIMD ramp-up
+    model_concurrency = str(args.model_concurrency or args.max_concurrency)
+    os.environ["ADAPTIVE_CONCURRENCY_INITIAL"] = model_concurrency
+    os.environ["ADAPTIVE_CONCURRENCY_MAX"] = model_concurrency
+    db_dir = tempfile.mkdtemp(prefix="fanout-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_dir}/bench.db"
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+History API benchmark on a seeded database.
+
+Seeds a SQLite database with many prompts (and responses per prompt), then
+times the keyset-paginated `GET /api/prompts` at increasing depths next to
+the old offset query, plus `GET /api/prompts/{id}`. Keyset pages should cost
+the same at any depth; offset pages grow with it.
+
+Usage (from the backend directory):
+    uv run python -m benchmarks.history --prompts 1000000
+    uv run python -m benchmarks.history --db /tmp/history.db  # reuse a seeded file
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+
+def seed(args):
+    from app.database import engine, init_db
+    from app.models import Prompt
+
+    init_db()
+    with engine.connect() as conn:
+        if conn.execute(Prompt.__table__.select().limit(1)).first() is not None:
+            print("database already seeded")
+            return
+
+    start = time.perf_counter()
+    base = datetime(2024, 1, 1)
+    chunk = 50_000
+    with engine.begin() as conn:
+        for first in range(1, args.prompts + 1, chunk):
+            ids = range(first, min(first + chunk, args.prompts + 1))
+            # Raw inserts so created_at has the CURRENT_TIMESTAMP text format;
+            # ~4 prompts per second so it has plenty of ties
+            conn.exec_driver_sql(
+                "INSERT INTO prompts (id, text, created_at) VALUES (?, ?, ?)",
+                [
+                    (
+                        i,
+                        f"seeded prompt {i} " + "lorem ipsum dolor " * 30,
+                        (base + timedelta(seconds=i // 4)).strftime("%Y-%m-%d %H:%M:%S"),
+                    )
+                    for i in ids
+                ],
+            )
+            conn.exec_driver_sql(
+                "INSERT INTO model_responses (prompt_id, model_name, response_text, "
+                "time_to_first_token, total_time) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (i, f"fake.model-{m}", "lorem ipsum " * 40, 0.2, 1.2)
+                    for i in ids
+                    for m in range(args.responses_per_prompt)
+                ],
+            )
+    print(f"seeded {args.prompts:,} prompts in {time.perf_counter() - start:.1f}s")
+
+
+async def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        before = time.perf_counter()
+        await fn()
+        samples.append((time.perf_counter() - before) * 1000)
+    return statistics.median(samples)
+
+
+async def run(args):
+    import httpx
+    from fastapi.concurrency import run_in_threadpool
+    from app.database import SessionLocal
+    from app.main import app
+    from app.models import Prompt
+    from app.routers.prompts import encode_cursor
+
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+    db = SessionLocal()
+    total = db.query(Prompt).count()
+    print(f"{total:,} prompts; median of {args.repeat} runs, page size {args.limit}")
+    print(f"{'depth':>10} {'keyset ms':>10} {'offset ms':>10}")
+
+    for fraction in (0, 0.01, 0.5, 0.99):
+        depth = int(total * fraction)
+        # Cursor of the row just before `depth` in newest-first order
+        cursor = None
+        if depth:
+            row = (
+                db.query(Prompt.id, Prompt.created_at)
+                .order_by(Prompt.created_at.desc(), Prompt.id.desc())
+                .offset(depth - 1)
+                .first()
+            )
+            cursor = encode_cursor(row.created_at, row.id)
+        params = {"limit": args.limit, **({"cursor": cursor} if cursor else {})}
+
+        async def keyset():
+            response = await client.get("/api/prompts", params=params)
+            assert response.status_code == 200, response.text
+
+        def offset_page():
+            db.query(Prompt).order_by(Prompt.created_at.desc(), Prompt.id.desc()).offset(
+                depth
+            ).limit(args.limit).all()
+            db.expunge_all()
+
+        async def offset():
+            await run_in_threadpool(offset_page)
+
+        keyset_ms = await timed(keyset, args.repeat)
+        offset_ms = await timed(offset, args.repeat)
+        print(f"{depth:>10,} {keyset_ms:>10.2f} {offset_ms:>10.2f}")
+
+    detail_id = total // 2 or 1
+
+    async def detail():
+        response = await client.get(f"/api/prompts/{detail_id}")
+        assert response.status_code == 200, response.text
+
+    print(f"detail GET /api/prompts/{detail_id}: {await timed(detail, args.repeat):.2f} ms")
+    await client.aclose()
+    db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--prompts", type=int, default=1_000_000)
+    parser.add_argument("--responses-per-prompt", type=int, default=4)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--db", help="SQLite file to seed or reuse (default: a temp file)")
+    args = parser.parse_args()
+
+    os.environ.setdefault("COMPARTMENT_OCID", "benchmark")
+    os.environ["JOBS_RESUME_ON_STARTUP"] = "false"
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix="history-bench-"), "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+
+    seed(args)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
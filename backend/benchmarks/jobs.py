@@ -0,0 +1,88 @@
+"""
+Batch job throughput benchmark against the local fake LLM.
+
+Creates one evaluation job in a temporary database and runs it to completion
+in-process, reporting prompts/min (a prompt counts once all of its models
+have answered).
+
+Usage (from the backend directory):
+    uv run python -m benchmarks.jobs --prompts 1000 --models 4
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+
+async def run(args):
+    from concurrent.futures import ThreadPoolExecutor
+    from app.database import init_db
+    from app.fanout import FanoutEngine
+    from app.jobs import JobRunner, create_job, get_job_counts
+    from app.llm_service import LLMService
+
+    init_db()
+    service = LLMService()
+    models = service.get_available_models()
+    engine = FanoutEngine(
+        service,
+        ThreadPoolExecutor(max_workers=args.max_concurrency),
+        ThreadPoolExecutor(max_workers=4),
+        max_concurrency=args.max_concurrency,
+    )
+    runner = JobRunner(engine)
+
+    prompts = [f"benchmark prompt {i}" for i in range(args.prompts)]
+    start = time.perf_counter()
+    job_id = create_job(prompts, models, args.max_concurrency, args.per_model_concurrency)
+    created = time.perf_counter()
+    runner.start(job_id)
+    await runner._tasks[job_id]
+    elapsed = time.perf_counter() - created
+
+    counts = get_job_counts(job_id)
+    print(f"job:             {args.prompts} prompts x {len(models)} models")
+    print(f"bulk insert:     {created - start:.3f}s")
+    print(f"run time:        {elapsed:.2f}s")
+    print(f"results:         {counts}")
+    print(f"prompts/min:     {args.prompts / elapsed * 60:,.0f}")
+    print(f"generations/sec: {sum(counts.values()) / elapsed:,.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--prompts", type=int, default=1000)
+    parser.add_argument("--models", type=int, default=4)
+    parser.add_argument("--max-concurrency", type=int, default=256)
+    parser.add_argument("--per-model-concurrency", type=int, default=64)
+    parser.add_argument("--ttft", type=float, default=0.2)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--tokens", type=int, default=50)
+    parser.add_argument(
+        "--model-concurrency",
+        type=int,
+        default=None,
+        help="Fixed per-model concurrency (default: --max-concurrency)",
+    )
+    args = parser.parse_args()
+
+    os.environ.setdefault("COMPARTMENT_OCID", "benchmark")
+    os.environ["FAKE_LLM_MODELS"] = ",".join(
+        f"fake.model-{i}" for i in range(args.models)
+    )
+    os.environ["FAKE_LLM_TTFT"] = str(args.ttft)
+    os.environ["FAKE_LLM_TOKEN_DELAY"] = str(args.token_delay)
+    os.environ["FAKE_LLM_OUTPUT_TOKENS"] = str(args.tokens)
+    # Start at the cap: fake models never throttle, so skip the AIMD ramp-up
+    model_concurrency = str(args.model_concurrency or args.max_concurrency)
+    os.environ["ADAPTIVE_CONCURRENCY_INITIAL"] = model_concurrency
+    os.environ["ADAPTIVE_CONCURRENCY_MAX"] = model_concurrency
+    db_dir = tempfile.mkdtemp(prefix="jobs-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_dir}/bench.db"
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
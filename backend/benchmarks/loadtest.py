@@ -0,0 +1,359 @@
+"""
+HTTP load test: submit prompts and stream them like the frontend does.
+
+Keeps --concurrency comparisons in flight, each a POST /api/prompts followed
+by the SSE stream, until --prompts have run. Against the fake models
+(--spawn starts a server with them) every millisecond beyond the model's own
+timing is the service's, so it reports:
+
+- server-added latency: time to a model's first token seen by the client
+  minus the TTFT the server measured for the model (queueing, scheduling,
+  SSE framing and transport)
+- SSE events/sec and tokens/sec
+- server CPU time and memory growth per concurrent stream (from /proc, Linux)
+
+--output writes the results as JSON; --baseline compares with a previous
+results file and exits with status 1 if a metric regressed by more than
+--tolerance.
+
+Usage (from the backend directory):
+    uv run python -m benchmarks.loadtest --spawn --concurrency 50 --prompts 500 --output results.json
+    uv run prompt-evaluator-loadtest --url http://localhost:8000 --server-pid 1234 --baseline results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+# (section, key, direction): compared against --baseline
+REGRESSION_METRICS = [
+    ("server_added_latency", "p50", "lower"),
+    ("server_added_latency", "p99", "lower"),
+    ("throughput", "events_per_second", "higher"),
+    ("server", "cpu_ms_per_stream", "lower"),
+    ("server", "rss_kb_per_stream", "lower"),
+    ("errors", "rate", "lower"),
+]
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    """p50/p95/p99 and mean, in milliseconds"""
+    return {
+        "p50": percentile(values, 50) * 1000,
+        "p95": percentile(values, 95) * 1000,
+        "p99": percentile(values, 99) * 1000,
+        "mean": sum(values) / len(values) * 1000 if values else 0.0,
+    }
+
+
+class ProcessSampler:
+    """Samples a process's CPU time and resident memory from /proc"""
+
+    def __init__(self, pid: int, interval: float = 0.2):
+        self.pid = pid
+        self.interval = interval
+        self.ticks = os.sysconf("SC_CLK_TCK")
+        self.page_kb = os.sysconf("SC_PAGE_SIZE") // 1024
+        self.rss_start_kb = self.rss_peak_kb = self.rss_kb()
+        self.cpu_start = self.cpu_seconds()
+        self._task: Optional[asyncio.Task] = None
+
+    def cpu_seconds(self) -> float:
+        with open(f"/proc/{self.pid}/stat") as f:
+            # Fields after the parenthesized command name; utime, stime are 14, 15
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / self.ticks
+
+    def rss_kb(self) -> int:
+        with open(f"/proc/{self.pid}/statm") as f:
+            return int(f.read().split()[1]) * self.page_kb
+
+    async def _sample(self):
+        while True:
+            self.rss_peak_kb = max(self.rss_peak_kb, self.rss_kb())
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self._task = asyncio.create_task(self._sample())
+
+    async def stop(self) -> Dict[str, float]:
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self.rss_peak_kb = max(self.rss_peak_kb, self.rss_kb())
+        return {
+            "cpu_seconds": self.cpu_seconds() - self.cpu_start,
+            "rss_start_kb": self.rss_start_kb,
+            "rss_peak_kb": self.rss_peak_kb,
+        }
+
+
+class Stats:
+    def __init__(self):
+        self.submit: List[float] = []
+        self.client_ttft: List[float] = []
+        self.added: List[float] = []
+        self.queue_wait: List[float] = []
+        self.events = 0
+        self.tokens = 0
+        self.streams = 0
+        self.failed_streams = 0
+        self.failed_requests = 0
+        self.models = set()
+
+
+async def compare(client, args, index, stats: Stats):
+    params = [("models", model) for model in args.models] if args.models else None
+    try:
+        start = time.perf_counter()
+        response = await client.post(
+            f"{args.url}/api/prompts", json={"text": f"{args.prompt} #{index}"}
+        )
+        response.raise_for_status()
+        prompt_id = response.json()["id"]
+        stats.submit.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        first_token: Dict[str, float] = {}
+        event = None
+        async with client.stream(
+            "GET", f"{args.url}/api/prompts/{prompt_id}/stream", params=params
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line.startswith("event: "):
+                    event = line[7:]
+                elif line.startswith("data: "):
+                    if event == "end":
+                        break
+                    stats.events += 1
+                    if event is not None:
+                        continue
+                    update = json.loads(line[6:])
+                    model_name = update["model_name"]
+                    stats.models.add(model_name)
+                    if update["token"]:
+                        stats.tokens += 1
+                        first_token.setdefault(model_name, time.perf_counter() - start)
+                    if update["is_complete"]:
+                        stats.streams += 1
+                        if update["status"] != "completed":
+                            stats.failed_streams += 1
+                        elif update["time_to_first_token"] is not None and model_name in first_token:
+                            stats.client_ttft.append(first_token[model_name])
+                            stats.added.append(
+                                first_token[model_name] - update["time_to_first_token"]
+                            )
+                        if update.get("queue_wait") is not None:
+                            stats.queue_wait.append(update["queue_wait"])
+                elif not line:
+                    event = None
+    except (httpx.HTTPError, KeyError, ValueError) as e:
+        stats.failed_requests += 1
+        if stats.failed_requests <= 3:
+            print(f"Warning: prompt {index} failed: {e!r}")
+
+
+async def run(args) -> dict:
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        await wait_ready(client, args.url)
+
+        sampler = None
+        if args.server_pid:
+            try:
+                sampler = ProcessSampler(args.server_pid)
+                sampler.start()
+            except OSError as e:
+                print(f"Warning: cannot sample server process {args.server_pid}: {e}")
+                sampler = None
+
+        stats = Stats()
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def one(index):
+            async with semaphore:
+                await compare(client, args, index, stats)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(args.prompts)))
+        elapsed = time.perf_counter() - start
+        server = await sampler.stop() if sampler else None
+
+    models = args.models or sorted(stats.models)
+    concurrent_streams = min(args.concurrency, args.prompts) * max(1, len(models))
+    results = {
+        "config": {
+            "url": args.url,
+            "models": models,
+            "prompts": args.prompts,
+            "concurrency": args.concurrency,
+        },
+        "duration_seconds": elapsed,
+        "throughput": {
+            "prompts_per_second": args.prompts / elapsed,
+            "streams_per_second": stats.streams / elapsed,
+            "events_per_second": stats.events / elapsed,
+            "tokens_per_second": stats.tokens / elapsed,
+        },
+        "submit_latency": summarize(stats.submit),
+        "client_ttft": summarize(stats.client_ttft),
+        "server_added_latency": summarize(stats.added),
+        "queue_wait": summarize(stats.queue_wait),
+        "errors": {
+            "failed_requests": stats.failed_requests,
+            "failed_streams": stats.failed_streams,
+            "rate": (stats.failed_requests * len(models) + stats.failed_streams)
+            / max(1, args.prompts * len(models)),
+        },
+    }
+    if server is not None:
+        server["concurrent_streams"] = concurrent_streams
+        server["cpu_ms_per_stream"] = server["cpu_seconds"] * 1000 / max(1, stats.streams)
+        server["rss_kb_per_stream"] = (
+            server["rss_peak_kb"] - server["rss_start_kb"]
+        ) / concurrent_streams
+        results["server"] = server
+    return results
+
+
+async def wait_ready(client, url, timeout=120):
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            if (await client.get(f"{url}/api/prompts", params={"limit": 1})).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        if time.perf_counter() > deadline:
+            raise RuntimeError(f"Server at {url} did not become ready")
+        await asyncio.sleep(0.2)
+
+
+def spawn_server(args) -> subprocess.Popen:
+    """A uvicorn server with fake models and a scratch database"""
+    db_dir = tempfile.mkdtemp(prefix="loadtest-")
+    env = dict(os.environ)
+    env.setdefault("COMPARTMENT_OCID", "loadtest")
+    env.setdefault("JOBS_RESUME_ON_STARTUP", "false")
+    env["DATABASE_URL"] = f"sqlite:///{db_dir}/loadtest.db"
+    if args.fake_config:
+        env["FAKE_LLM_CONFIG"] = args.fake_config
+    if not env.get("FAKE_LLM_MODELS") and not env.get("FAKE_LLM_CONFIG"):
+        env["FAKE_LLM_MODELS"] = ",".join(f"fake.model-{i}" for i in range(args.fake_models))
+    port = args.url.rsplit(":", 1)[1].split("/")[0]
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", port, "--log-level", "warning"],
+        env=env,
+    )
+
+
+def compare_baseline(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Descriptions of metrics worse than the baseline by more than `tolerance`"""
+    regressions = []
+    for section, key, direction in REGRESSION_METRICS:
+        old = baseline.get(section, {}).get(key)
+        new = results.get(section, {}).get(key)
+        if old is None or new is None:
+            continue
+        if direction == "lower":
+            worse = new > old * (1 + tolerance) and new - old > 1e-9
+        else:
+            worse = new < old * (1 - tolerance)
+        if worse:
+            regressions.append(f"{section}.{key}: {old:,.3f} -> {new:,.3f}")
+    return regressions
+
+
+def report(results: dict):
+    throughput = results["throughput"]
+    print(f"models:               {', '.join(results['config']['models'])}")
+    print(f"prompts:              {results['config']['prompts']} at concurrency {results['config']['concurrency']}")
+    print(f"duration:             {results['duration_seconds']:.2f}s")
+    print(f"prompts/sec:          {throughput['prompts_per_second']:,.1f}")
+    print(f"events/sec:           {throughput['events_per_second']:,.0f}")
+    print(f"tokens/sec:           {throughput['tokens_per_second']:,.0f}")
+    for name in ("submit_latency", "client_ttft", "server_added_latency", "queue_wait"):
+        values = results[name]
+        print(
+            f"{name + ':':<22}p50 {values['p50']:.1f}ms, p95 {values['p95']:.1f}ms, "
+            f"p99 {values['p99']:.1f}ms"
+        )
+    errors = results["errors"]
+    print(
+        f"errors:               {errors['failed_requests']} requests, "
+        f"{errors['failed_streams']} streams ({errors['rate']:.1%})"
+    )
+    server = results.get("server")
+    if server:
+        print(f"server cpu:           {server['cpu_seconds']:.2f}s, {server['cpu_ms_per_stream']:.2f}ms per stream")
+        print(
+            f"server rss:           {server['rss_start_kb'] / 1024:.0f}MB -> "
+            f"{server['rss_peak_kb'] / 1024:.0f}MB peak, "
+            f"{server['rss_kb_per_stream']:.1f}KB per concurrent stream"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--spawn", action="store_true", help="Start a server with fake models at --url")
+    parser.add_argument("--server-pid", type=int, help="Server process to sample CPU and memory of")
+    parser.add_argument("--models", nargs="*", help="Models to compare (default: all the server has)")
+    parser.add_argument("--prompts", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20, help="Comparisons in flight")
+    parser.add_argument("--prompt", default="Load test prompt")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--fake-models", type=int, default=4, help="Fake models of a spawned server")
+    parser.add_argument(
+        "--fake-config", help="FAKE_LLM_CONFIG of a spawned server (JSON or a file path)"
+    )
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--baseline", help="Results JSON to check for regressions against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed regression (0.2 = 20%%)")
+    args = parser.parse_args()
+    args.url = args.url.rstrip("/")
+
+    server = None
+    if args.spawn:
+        server = spawn_server(args)
+        args.server_pid = args.server_pid or server.pid
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    report(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_baseline(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Multi-worker streaming benchmark against the local fake LLM.
+
+Starts uvicorn workers on consecutive ports sharing one SQLite database with
+RUN_BACKEND=sql, submits prompts round-robin and streams every prompt from
+several workers at once, so most viewers follow a run generated by another
+worker. Checks that all viewers of a prompt received the same text and that
+each model was generated once, and reports throughput and time to first
+token with 1 worker and with --workers workers.
+
+Usage (from the backend directory):
+    uv run python -m benchmarks.multiworker --workers 4 --prompts 200 --viewers 3
+"""
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def start_workers(count, args, db_path):
+    env = dict(
+        os.environ,
+        COMPARTMENT_OCID=os.environ.get("COMPARTMENT_OCID", "benchmark"),
+        DATABASE_URL=f"sqlite:///{db_path}",
+        RUN_BACKEND="sql",
+        JOBS_RESUME_ON_STARTUP="false",
+        FAKE_LLM_MODELS=",".join(f"fake.model-{i}" for i in range(args.models)),
+        FAKE_LLM_TTFT=str(args.ttft),
+        FAKE_LLM_TOKEN_DELAY=str(args.token_delay),
+        FAKE_LLM_OUTPUT_TOKENS=str(args.tokens),
+    )
+    return [
+        subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.port + i),
+             "--log-level", "warning"],
+            env=env,
+        )
+        for i in range(count)
+    ]
+
+
+async def wait_ready(client, urls, timeout=120):
+    deadline = time.perf_counter() + timeout
+    for url in urls:
+        while True:
+            try:
+                if (await client.get(f"{url}/api/prompts", params={"limit": 1})).status_code == 200:
+                    break
+            except httpx.TransportError:
+                pass
+            if time.perf_counter() > deadline:
+                raise RuntimeError(f"Worker at {url} did not start")
+            await asyncio.sleep(0.2)
+
+
+async def view(client, url, prompt_id, started):
+    """Stream a prompt; returns (text per model, seconds to first token)"""
+    texts = {}
+    first_token = None
+    async with client.stream("GET", f"{url}/api/prompts/{prompt_id}/stream") as response:
+        event = None
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event = line[7:]
+            elif line.startswith("data: "):
+                if event == "end":
+                    break
+                if event == "reset":
+                    texts.clear()
+                elif event is None:
+                    update = json.loads(line[6:])
+                    if update["token"]:
+                        if first_token is None:
+                            first_token = time.perf_counter() - started
+                        texts[update["model_name"]] = (
+                            texts.get(update["model_name"], "") + update["token"]
+                        )
+            elif not line:
+                event = None
+    return texts, first_token
+
+
+async def compare(client, urls, index, viewers):
+    owner = urls[index % len(urls)]
+    prompt_id = (await client.post(f"{owner}/api/prompts", json={"text": f"prompt {index}"})).json()["id"]
+    started = time.perf_counter()
+    results = await asyncio.gather(
+        *(view(client, urls[(index + i) % len(urls)], prompt_id, started) for i in range(viewers))
+    )
+    consistent = all(texts == results[0][0] for texts, _ in results)
+    return prompt_id, consistent, [ttft for _, ttft in results if ttft is not None]
+
+
+async def measure(count, args):
+    db_dir = tempfile.mkdtemp(prefix="multiworker-bench-")
+    db_path = f"{db_dir}/bench.db"
+    urls = [f"http://127.0.0.1:{args.port + i}" for i in range(count)]
+    workers = start_workers(count, args, db_path)
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    try:
+        async with httpx.AsyncClient(timeout=None, limits=limits) as client:
+            await wait_ready(client, urls)
+            semaphore = asyncio.Semaphore(args.concurrency)
+
+            async def one(index):
+                async with semaphore:
+                    return await compare(client, urls, index, args.viewers)
+
+            start = time.perf_counter()
+            results = await asyncio.gather(*(one(i) for i in range(args.prompts)))
+            elapsed = time.perf_counter() - start
+    finally:
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.wait()
+
+    with sqlite3.connect(db_path) as db:
+        generations = db.execute(
+            "SELECT COUNT(*) FROM model_responses WHERE status = 'completed'"
+        ).fetchone()[0]
+    ttfts = [ttft for _, _, values in results for ttft in values]
+    inconsistent = sum(1 for _, consistent, _ in results if not consistent)
+    print(f"workers:          {count}")
+    print(f"run time:         {elapsed:.2f}s")
+    print(f"prompts/sec:      {args.prompts / elapsed:,.1f}")
+    print(f"viewer ttft:      p50 {percentile(ttfts, 50) * 1000:.0f}ms, p99 {percentile(ttfts, 99) * 1000:.0f}ms")
+    print(f"generations:      {generations} (expected {args.prompts * args.models})")
+    print(f"inconsistent:     {inconsistent} prompts")
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--prompts", type=int, default=200)
+    parser.add_argument("--viewers", type=int, default=3, help="Concurrent streams per prompt")
+    parser.add_argument("--concurrency", type=int, default=50, help="Prompts in flight")
+    parser.add_argument("--models", type=int, default=4)
+    parser.add_argument("--ttft", type=float, default=0.2)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--tokens", type=int, default=50)
+    parser.add_argument("--port", type=int, default=8900, help="Port of the first worker")
+    args = parser.parse_args()
+
+    for count in sorted({1, args.workers}):
+        asyncio.run(measure(count, args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Persistence benchmark: per-row commits versus the write-behind writer.
+
+Simulates concurrent comparisons at the storage layer: each one creates a
+prompt and then saves one response per model. Two modes are compared, each
+on a fresh SQLite file:
+
+- "legacy": the previous behavior. The prompt is committed on the event
+  loop, and every response is committed on its own thread with its own
+  session, against a default-configured (rollback journal) database.
+- "writer": the prompt is committed off the loop, and responses go through
+  the batching ResponseWriter on a WAL database.
+
+Reports comparisons/sec, response rows/sec, failures (e.g. "database is
+locked") and event-loop lag.
+
+Usage (from the backend directory):
+    uv run python -m benchmarks.persistence --comparisons 2000 --models 4
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from .fanout import percentile
+
+
+async def measure(args, create_prompt, save_response):
+    lags = []
+    stop = asyncio.Event()
+
+    async def ticker():
+        while not stop.is_set():
+            before = time.perf_counter()
+            await asyncio.sleep(0.005)
+            lags.append(time.perf_counter() - before - 0.005)
+
+    failures = 0
+    slots = asyncio.Semaphore(args.concurrency)
+
+    async def comparison(i: int):
+        nonlocal failures
+        async with slots:
+            try:
+                prompt_id = await create_prompt(f"benchmark prompt {i}")
+                await asyncio.gather(
+                    *(
+                        save_response(
+                            prompt_id=prompt_id,
+                            model_name=f"fake.model-{m}",
+                            response_text="lorem ipsum " * 40,
+                            time_to_first_token=0.2,
+                            total_time=1.2,
+                        )
+                        for m in range(args.models)
+                    )
+                )
+            except Exception:
+                failures += 1
+
+    ticker_task = asyncio.create_task(ticker())
+    start = time.perf_counter()
+    await asyncio.gather(*(comparison(i) for i in range(args.comparisons)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await ticker_task
+    return elapsed, failures, lags
+
+
+async def run_legacy(args, db_path):
+    from concurrent.futures import ThreadPoolExecutor
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from app.database import Base
+    from app.models import ModelResponse, Prompt
+
+    engine = create_engine(
+        f"sqlite:///{db_path}", connect_args={"check_same_thread": False}
+    )
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    threads = ThreadPoolExecutor(max_workers=args.concurrency * args.models)
+    loop = asyncio.get_running_loop()
+
+    async def create_prompt(text):
+        db = Session()
+        try:
+            prompt = Prompt(text=text)
+            db.add(prompt)
+            db.commit()
+            return prompt.id
+        finally:
+            db.close()
+
+    def save(fields):
+        db = Session()
+        try:
+            db.add(ModelResponse(**fields))
+            db.commit()
+        finally:
+            db.close()
+
+    async def save_response(**fields):
+        await loop.run_in_executor(threads, save, fields)
+
+    return await measure(args, create_prompt, save_response)
+
+
+async def run_writer(args):
+    from fastapi.concurrency import run_in_threadpool
+    from app.database import SessionLocal, init_db
+    from app.models import Prompt
+    from app.persistence import response_writer
+
+    init_db()
+
+    def create(text):
+        db = SessionLocal()
+        try:
+            prompt = Prompt(text=text)
+            db.add(prompt)
+            db.commit()
+            return prompt.id
+        finally:
+            db.close()
+
+    async def create_prompt(text):
+        return await run_in_threadpool(create, text)
+
+    async def save_response(**fields):
+        await asyncio.wrap_future(response_writer.submit(**fields))
+
+    result = await measure(args, create_prompt, save_response)
+    response_writer.stop()
+    return result
+
+
+def report(mode, args, elapsed, failures, lags):
+    print(f"[{mode}]")
+    print(f"  comparisons/sec:  {args.comparisons / elapsed:,.0f}")
+    print(f"  rows/sec:         {args.comparisons * args.models / elapsed:,.0f}")
+    print(f"  failures:         {failures}")
+    print(
+        f"  loop lag ms:      mean={statistics.mean(lags or [0]) * 1000:.2f} "
+        f"p99={percentile(lags, 99) * 1000:.2f} max={max(lags, default=0) * 1000:.2f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--comparisons", type=int, default=2000)
+    parser.add_argument("--models", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--mode", choices=("both", "legacy", "writer"), default="both")
+    args = parser.parse_args()
+
+    db_dir = tempfile.mkdtemp(prefix="persistence-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_dir}/writer.db"
+
+    print(f"{args.comparisons} comparisons x {args.models} models, concurrency {args.concurrency}")
+    if args.mode in ("both", "legacy"):
+        report("legacy", args, *asyncio.run(run_legacy(args, f"{db_dir}/legacy.db")))
+    if args.mode in ("both", "writer"):
+        report("writer", args, *asyncio.run(run_writer(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+SSE framing benchmark: per-token "events" framing vs coalesced "compact" framing.
+
+Feeds a synthetic interleaved token stream from many models through both
+serializers and reports frames/sec, tokens/sec and bytes/sec (CPU-bound, no
+network), plus bytes on the wire per token.
+
+Usage (from the backend directory):
+    uv run python -m benchmarks.sse_framing --models 12 --tokens 2000
+"""
+import argparse
+import asyncio
+import time
+
+
+async def synthetic_events(model_names, tokens_per_model, token_interval):
+    from app.fanout import TokenEvent
+    from app.schemas import StreamUpdate
+
+    started = time.monotonic()
+    seq = 0
+    for i in range(tokens_per_model):
+        elapsed = i * token_interval
+        for name in model_names:
+            seq += 1
+            yield seq, TokenEvent(name, "tok%d " % i, 0.25, elapsed)
+        if token_interval:
+            # Emulates provider pacing so the time window actually applies
+            await asyncio.sleep(token_interval)
+    for name in model_names:
+        seq += 1
+        yield seq, StreamUpdate(
+            model_name=name,
+            time_to_first_token=0.25,
+            total_time=time.monotonic() - started,
+            is_complete=True,
+            status="completed",
+        )
+
+
+async def measure(framing, args):
+    from app.sse import compact_frames, event_frames
+
+    model_names = [f"provider.model-{i}" for i in range(args.models)]
+    events = synthetic_events(model_names, args.tokens, args.token_interval)
+    if framing == "compact":
+        frames = compact_frames(
+            events,
+            "bench",
+            model_names,
+            window=args.window_ms / 1000,
+            max_bytes=args.max_bytes,
+        )
+    else:
+        frames = event_frames(events, "bench")
+
+    frame_count = 0
+    byte_count = 0
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    async for frame in frames:
+        frame_count += 1
+        byte_count += len(frame.encode("utf-8"))
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    tokens = args.models * args.tokens
+    print(f"[{framing}]")
+    print(f"  frames:         {frame_count}")
+    print(f"  bytes:          {byte_count}  ({byte_count / tokens:.1f} per token)")
+    print(f"  cpu time:       {cpu:.3f}s  (wall {wall:.3f}s)")
+    print(f"  frames/sec:     {frame_count / cpu:,.0f} (per cpu second)")
+    print(f"  tokens/sec:     {tokens / cpu:,.0f} (per cpu second)")
+    print(f"  bytes/sec:      {byte_count / wall:,.0f} (wall clock)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--models", type=int, default=12)
+    parser.add_argument("--tokens", type=int, default=2000, help="tokens per model")
+    parser.add_argument(
+        "--token-interval",
+        type=float,
+        default=0.0,
+        help="seconds between token rounds (0 = as fast as possible)",
+    )
+    parser.add_argument("--window-ms", type=float, default=20)
+    parser.add_argument("--max-bytes", type=int, default=256)
+    args = parser.parse_args()
+
+    for framing in ("events", "compact"):
+        asyncio.run(measure(framing, args))
+
+
+if __name__ == "__main__":
+    main()
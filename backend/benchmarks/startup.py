@@ -0,0 +1,149 @@
+"""
+Cold start benchmark: import time of the app and time to first /health.
+
+Each run uses a fresh interpreter, so nothing is cached in-process:
+
+- import: `import app.main` timed inside a new process, which also reports
+  whether any provider SDK got imported (they must load only when a model
+  of their family is first used)
+- health: from spawning uvicorn to the first 200 from GET /health
+
+Exits with status 1 if a provider SDK was imported at startup, if a median
+is above --max-import / --max-health, or if it regressed by more than
+--tolerance against a --baseline results file (written by --output).
+
+Usage (from the backend directory):
+    uv run python -m benchmarks.startup --runs 5 --output startup.json
+    uv run python -m benchmarks.startup --baseline startup.json --max-health 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List
+
+import httpx
+
+# Modules that must not be imported until a model is used
+PROVIDER_MODULES = ("langchain_core", "langchain_openai", "langchain_oci", "openai", "oci", "oci_openai")
+
+IMPORT_SCRIPT = f"""
+import json, sys, time
+start = time.perf_counter()
+import app.main
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "providers": [
+    name for name in {PROVIDER_MODULES!r} if name in sys.modules
+]}}))
+"""
+
+
+def server_env(db_dir: str) -> dict:
+    env = dict(os.environ)
+    env.setdefault("COMPARTMENT_OCID", "startup-benchmark")
+    env.setdefault("JOBS_RESUME_ON_STARTUP", "false")
+    env["DATABASE_URL"] = f"sqlite:///{db_dir}/startup.db"
+    # Fake models are built on langchain_core; measure a deployment without them
+    env.pop("FAKE_LLM_MODELS", None)
+    env.pop("FAKE_LLM_CONFIG", None)
+    return env
+
+
+def measure_import(env: dict) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT], env=env, check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def measure_health(env: dict, port: int, timeout: float = 120) -> float:
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        env=env,
+    )
+    try:
+        with httpx.Client(timeout=1) as client:
+            while True:
+                try:
+                    if client.get(f"http://127.0.0.1:{port}/health").status_code == 200:
+                        return time.perf_counter() - start
+                except httpx.TransportError:
+                    pass
+                if server.poll() is not None:
+                    raise RuntimeError(f"Server exited with status {server.returncode}")
+                if time.perf_counter() - start > timeout:
+                    raise RuntimeError("Server did not become healthy")
+                time.sleep(0.01)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def check(results: dict, args) -> List[str]:
+    """Descriptions of every failed guard"""
+    failures = []
+    if results["providers_imported"]:
+        failures.append(f"provider modules imported at startup: {', '.join(results['providers_imported'])}")
+    limits = {"import": args.max_import, "health": args.max_health}
+    for name, limit in limits.items():
+        median = results[name]["median"]
+        if limit is not None and median > limit:
+            failures.append(f"{name} median {median:.3f}s is above {limit:.3f}s")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        for name in limits:
+            old = baseline.get(name, {}).get("median")
+            new = results[name]["median"]
+            if old is not None and new > old * (1 + args.tolerance):
+                failures.append(f"{name} median: {old:.3f}s -> {new:.3f}s")
+    return failures
+
+
+def summarize(values: List[float]) -> dict:
+    return {"median": statistics.median(values), "min": min(values), "max": max(values)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8795)
+    parser.add_argument("--max-import", type=float, help="Fail above this median import time (seconds)")
+    parser.add_argument("--max-health", type=float, help="Fail above this median time to /health (seconds)")
+    parser.add_argument("--output", help="Write the results as JSON")
+    parser.add_argument("--baseline", help="Results JSON to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed regression (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    env = server_env(tempfile.mkdtemp(prefix="startup-bench-"))
+    imports = [measure_import(env) for _ in range(args.runs)]
+    health = [measure_health(env, args.port) for _ in range(args.runs)]
+    results = {
+        "runs": args.runs,
+        "import": summarize([run["seconds"] for run in imports]),
+        "health": summarize(health),
+        "providers_imported": sorted({name for run in imports for name in run["providers"]}),
+    }
+
+    for name, label in (("import", "import app.main"), ("health", "first /health")):
+        stats = results[name]
+        print(f"{label + ':':18}median {stats['median']:.3f}s (min {stats['min']:.3f}s, max {stats['max']:.3f}s)")
+    print(f"{'providers:':18}{', '.join(results['providers_imported']) or 'none imported'}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    failures = check(results, args)
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
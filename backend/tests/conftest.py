@@ -0,0 +1,66 @@
+"""Test settings: a throwaway SQLite database and local fake models
+
+The environment is set before the app is imported, since modules read it
+at import time.
+"""
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+_tmp = tempfile.mkdtemp(prefix="prompt-evaluator-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'test.db')}"
+os.environ.setdefault("COMPARTMENT_OCID", "ocid1.compartment.test")
+os.environ["FAKE_LLM_CONFIG"] = json.dumps(
+    {
+        "fake.fast": {"time_to_first_token": 0.01, "token_delay": 0.001, "output_tokens": 5},
+        "fake.slow": {"time_to_first_token": 0.01, "token_delay": 0.05, "output_tokens": 100},
+        "fake.broken": {"time_to_first_token": 0.01, "output_tokens": 5, "error_rate": 1.0},
+    }
+)
+os.environ["JOBS_RESUME_ON_STARTUP"] = "false"
+# No vocabulary downloads: counts the fake models do not report are estimated
+os.environ["TOKENIZER_RETRY_INTERVAL"] = "1e9"
+
+from app.database import SessionLocal, init_db  # noqa: E402
+from app.fanout import FanoutEngine  # noqa: E402
+from app.llm_service import LLMService  # noqa: E402
+from app.models import Prompt  # noqa: E402
+from app.persistence import ResponseWriter  # noqa: E402
+
+init_db()
+
+
+@pytest.fixture
+def db_session():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def writer():
+    writer = ResponseWriter()
+    yield writer
+    writer.stop(5)
+
+
+@pytest.fixture
+def engine(writer):
+    executor = ThreadPoolExecutor(max_workers=8)
+    db_executor = ThreadPoolExecutor(max_workers=2)
+    yield FanoutEngine(LLMService(), executor, db_executor, writer=writer)
+    executor.shutdown(wait=False)
+    db_executor.shutdown(wait=False)
+
+
+@pytest.fixture
+def prompt_id(db_session) -> int:
+    prompt = Prompt(text="Say hello")
+    db_session.add(prompt)
+    db_session.commit()
+    return prompt.id
@@ -0,0 +1,113 @@
+"""Latency analytics: histogram percentiles against exact ones, raw-row ranges"""
+import math
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from app.analytics import (
+    HISTOGRAM_BINS,
+    HISTOGRAM_GROWTH,
+    HISTOGRAM_MIN,
+    PERCENTILES,
+    _Accumulator,
+    bin_counts,
+    latency_report,
+    update_rollups,
+)
+from app.models import LatencyRollup, ModelResponse
+
+# A value and the midpoint of its bin differ by at most half a bin's growth
+TOLERANCE = math.sqrt(HISTOGRAM_GROWTH) - 1
+HOUR = datetime(2001, 2, 3, 10)
+
+
+def _exact(values, pct):
+    """Nearest-rank percentile, the order statistic the histogram reads"""
+    return float(np.percentile(values, pct, method="inverted_cdf"))
+
+
+def test_bin_counts_places_values_in_log_spaced_bins():
+    values = np.array([HISTOGRAM_MIN, HISTOGRAM_MIN * 1.05, HISTOGRAM_MIN * HISTOGRAM_GROWTH])
+    counts = bin_counts(values)
+    assert counts.shape == (HISTOGRAM_BINS,)
+    assert counts[0] == 2 and counts[1] == 1
+    assert counts.sum() == 3
+
+
+def test_bin_counts_clamps_out_of_range_values():
+    counts = bin_counts(np.array([0.0, -1.0, np.nan, HISTOGRAM_MIN / 10, 1e12]))
+    assert counts[0] == 4
+    assert counts[-1] == 1
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_histogram_percentiles_are_within_a_bin_of_exact(seed):
+    values = np.random.default_rng(seed).lognormal(mean=0, sigma=1.5, size=2000)
+    accumulator = _Accumulator()
+    accumulator.add_values(values[:700])
+    accumulator.add_values(values[700:])
+    stats = accumulator.stats()
+
+    assert stats["count"] == 2000
+    assert stats["mean"] == pytest.approx(values.mean())
+    assert (stats["min"], stats["max"]) == (values.min(), values.max())
+    for pct in PERCENTILES:
+        assert stats[f"p{pct}"] == pytest.approx(_exact(values, pct), rel=TOLERANCE)
+
+
+def test_percentiles_are_clamped_to_the_observed_range():
+    accumulator = _Accumulator()
+    accumulator.add_values(np.array([0.0517, 0.0517, 0.0517]))
+    stats = accumulator.stats()
+    assert stats["p50"] == stats["p99"] == 0.0517
+
+
+@pytest.fixture
+def analytics_rows(writer, prompt_id, db_session):
+    """A few hours of responses of one model, added to the rollups as written"""
+    writer.add_listener(update_rollups)
+    rng = np.random.default_rng(7)
+    ttfts = []
+    # On the hour, on whole seconds and in between, through three hours
+    for second in [0, 1, 2, *range(3, 3 * 3600, 37)]:
+        ttft = float(rng.lognormal(-1, 0.5))
+        ttfts.append((HOUR + timedelta(seconds=second), ttft))
+        writer.submit(
+            prompt_id=prompt_id,
+            model_name="fake.analytics",
+            response_text="x" * 100,
+            time_to_first_token=ttft,
+            total_time=ttft + 1,
+            completion_tokens=20,
+            created_at=HOUR + timedelta(seconds=second),
+        )
+    writer.flush(10)
+    yield ttfts
+    for model in (ModelResponse, LatencyRollup):
+        db_session.query(model).filter(model.model_name == "fake.analytics").delete()
+    db_session.commit()
+
+
+def test_rollup_report_matches_raw_rows(db_session, analytics_rows):
+    # Partial hours at both ends, read from raw rows; the middle from rollups
+    start, end = HOUR + timedelta(minutes=20), HOUR + timedelta(hours=2, minutes=40)
+    values = np.array([ttft for created_at, ttft in analytics_rows if start <= created_at < end])
+
+    approximate = latency_report(db_session, start, end, ["fake.analytics"])
+    exact = latency_report(db_session, start, end, ["fake.analytics"], exact=True)
+    stats = approximate["fake.analytics"]["ttft"]
+    assert stats["count"] == exact["fake.analytics"]["ttft"]["count"] == len(values)
+    for pct in PERCENTILES:
+        assert stats[f"p{pct}"] == pytest.approx(_exact(values, pct), rel=TOLERANCE)
+
+
+def test_raw_ranges_include_the_start_second_and_exclude_the_end(db_session, analytics_rows):
+    def count(start, end):
+        report = latency_report(db_session, start, end, ["fake.analytics"], exact=True)
+        return report["fake.analytics"]["ttft"]["count"]
+
+    assert count(HOUR, HOUR + timedelta(seconds=2)) == 2
+    assert count(HOUR + timedelta(seconds=1), HOUR + timedelta(seconds=3)) == 2
+    # A fractional end includes its own second
+    assert count(HOUR, HOUR + timedelta(seconds=1, microseconds=500)) == 2
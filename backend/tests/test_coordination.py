@@ -0,0 +1,227 @@
+"""Sharing runs between workers through the database, and leases"""
+import asyncio
+import json
+import time
+from datetime import timedelta
+
+import pytest
+
+from app.coordination import (
+    RemoteRun,
+    SqlRunManager,
+    _utcnow,
+    acquire_lease,
+    held_leases,
+    leased,
+    release_lease,
+)
+from app.jobs import JobRunner, create_job
+from app.models import EvaluationJob, GenerationRun, RunEvent
+from app.runs import run_key
+from app.schemas import StreamUpdate
+
+
+class FakeEngine:
+    """Streams a few tokens per model, recording the models of every generation"""
+
+    def __init__(self):
+        self.generated = []
+
+    async def stream(self, prompt_id, prompt_text, model_names, **options):
+        self.generated.append(list(model_names))
+        for model_name in model_names:
+            for token in ("Hel", "lo"):
+                await asyncio.sleep(0.01)
+                yield StreamUpdate(model_name=model_name, token=token)
+            yield StreamUpdate(model_name=model_name, is_complete=True, status="completed")
+
+
+def _manager(writer, worker, **options) -> SqlRunManager:
+    options = {"poll_interval": 0.01, "flush_interval": 0.01, **options}
+    manager = SqlRunManager(FakeEngine(), writer=writer, **options)
+    manager.worker_id = worker
+    return manager
+
+
+async def _consume(manager, run):
+    task = manager._tasks.get(run.id)
+    updates = [
+        (update.model_name, update.token, update.status)
+        async for _, update in manager.attach(run)
+    ]
+    if task is not None:
+        # Until the run's row is marked finished
+        await task
+    return updates
+
+
+def _runs(db_session, prompt_id):
+    db_session.expire_all()
+    return {
+        run.id: run.status
+        for run in db_session.query(GenerationRun).filter(GenerationRun.prompt_id == prompt_id)
+    }
+
+
+def test_second_worker_follows_the_first_workers_run(writer, prompt_id, db_session):
+    async def scenario():
+        first, second = _manager(writer, "host:1"), _manager(writer, "host:2")
+        owned = await first.start(prompt_id, "hello", ["fake.a", "fake.b"])
+        followed = await second.start(prompt_id, "hello", ["fake.b", "fake.a"])
+        assert isinstance(followed, RemoteRun)
+        assert followed.id == owned.id
+        # Another run key is claimed separately
+        other = await second.start(prompt_id, "hello", ["fake.c"])
+        assert not isinstance(other, RemoteRun)
+
+        owner_updates, follower_updates, _ = await asyncio.gather(
+            _consume(first, owned), _consume(second, followed), _consume(second, other)
+        )
+        return first.engine.generated, second.engine.generated, owner_updates, follower_updates
+
+    first_generated, second_generated, owner_updates, follower_updates = asyncio.run(scenario())
+    assert first_generated == [["fake.a", "fake.b"]]
+    assert second_generated == [["fake.c"]]
+    assert follower_updates == owner_updates
+    assert ("fake.b", None, "completed") in follower_updates
+    assert set(_runs(db_session, prompt_id).values()) == {"finished"}
+
+
+def test_run_of_a_dead_owner_is_taken_over(writer, prompt_id, db_session):
+    key = run_key(["fake.a"])
+    db_session.add(
+        GenerationRun(
+            id="dead-run",
+            prompt_id=prompt_id,
+            models=json.dumps(["fake.a"]),
+            run_key=key,
+            status="running",
+            owner="host:dead",
+            heartbeat_at=_utcnow() - timedelta(minutes=5),
+        )
+    )
+    db_session.commit()
+
+    async def scenario():
+        manager = _manager(writer, "host:1")
+        run = await manager.start(prompt_id, "hello", ["fake.a"])
+        assert not isinstance(run, RemoteRun)
+        await _consume(manager, run)
+        return run.id
+
+    run_id = asyncio.run(scenario())
+    assert _runs(db_session, prompt_id) == {"dead-run": "abandoned", run_id: "finished"}
+
+
+def test_runs_past_their_retention_are_deleted(writer, prompt_id, db_session):
+    long_ago = _utcnow() - timedelta(hours=1)
+    for run_id, status, finished_at in (
+        ("old-finished", "finished", long_ago),
+        ("old-dead", "running", None),
+    ):
+        db_session.add(
+            GenerationRun(
+                id=run_id,
+                prompt_id=prompt_id,
+                models=json.dumps(["fake.a"]),
+                run_key=run_id,
+                status=status,
+                owner="host:dead",
+                heartbeat_at=long_ago,
+                finished_at=finished_at,
+            )
+        )
+        db_session.add(RunEvent(run_id=run_id, seq=1, payload="[]"))
+    db_session.commit()
+
+    async def scenario():
+        manager = _manager(writer, "host:1", retention=60)
+        run = await manager.start(prompt_id, "hello", ["fake.a"])
+        await _consume(manager, run)
+        return run.id
+
+    run_id = asyncio.run(scenario())
+    # Purged when the new run finished; it is kept for its own retention
+    assert _runs(db_session, prompt_id) == {run_id: "finished"}
+    old_events = db_session.query(RunEvent).filter(RunEvent.run_id.in_(["old-finished", "old-dead"]))
+    assert old_events.count() == 0
+    assert db_session.query(RunEvent).filter(RunEvent.run_id == run_id).count() > 0
+
+
+def test_lease_is_held_by_one_worker_until_it_expires():
+    assert acquire_lease("test:a", "host:1", ttl=60)
+    assert not acquire_lease("test:a", "host:2", ttl=60)
+    # Renewed by its holder
+    assert acquire_lease("test:a", "host:1", ttl=0)
+    # Expired: taken over
+    assert acquire_lease("test:a", "host:2", ttl=60)
+    assert not acquire_lease("test:a", "host:1", ttl=60)
+    assert "test:a" in held_leases("test:")
+
+    release_lease("test:a", "host:1")  # not the holder: no effect
+    assert "test:a" in held_leases("test:")
+    release_lease("test:a", "host:2")
+    assert "test:a" not in held_leases("test:")
+
+
+def test_leased_block_runs_on_one_worker():
+    async def scenario():
+        async with leased("test:b") as held:
+            assert held
+            assert not acquire_lease("test:b", "host:other")
+        # Released at the end of the block
+        assert acquire_lease("test:b", "host:other")
+        async with leased("test:b") as held:
+            assert not held
+        release_lease("test:b", "host:other")
+
+    asyncio.run(scenario())
+
+
+def test_leased_block_stops_when_its_lease_is_taken_over():
+    async def scenario():
+        async with leased("test:c", ttl=0.15) as held:
+            assert held
+            # This worker stalls, and another takes the lease over
+            time.sleep(0.2)
+            assert acquire_lease("test:c", "host:other", ttl=60)
+            with pytest.raises(asyncio.CancelledError):
+                await asyncio.sleep(1)
+        release_lease("test:c", "host:other")
+
+    asyncio.run(scenario())
+
+
+def test_job_runs_under_its_lease(engine, db_session):
+    job_id = create_job(["Say hello"], ["fake.fast"], 1, 1)
+
+    async def scenario():
+        runner = JobRunner(engine)
+        runner.start(job_id)
+        await asyncio.sleep(0.005)
+        assert f"job:{job_id}" in held_leases("job:")
+        await runner._tasks[job_id]
+
+    asyncio.run(scenario())
+    assert db_session.get(EvaluationJob, job_id).status == "completed"
+    assert f"job:{job_id}" not in held_leases("job:")
+
+
+def test_job_leased_by_another_worker_is_left_alone(engine, db_session):
+    job_id = create_job(["Say hello"], ["fake.fast"], 1, 1)
+    assert acquire_lease(f"job:{job_id}", "host:other", ttl=60)
+
+    async def scenario():
+        runner = JobRunner(engine)
+        await runner.resume_incomplete()
+        assert job_id not in runner._tasks
+        # Started anyway (e.g. by the API), it does not run
+        runner.start(job_id)
+        await runner._tasks[job_id]
+        return runner.get_progress(job_id)
+
+    try:
+        assert asyncio.run(scenario()) is None
+        assert db_session.get(EvaluationJob, job_id).status == "pending"
+    finally:
+        release_lease(f"job:{job_id}", "host:other")
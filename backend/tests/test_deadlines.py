@@ -0,0 +1,114 @@
+"""Generation deadlines: the Watchdog, and a hung provider timing out"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Iterator, List, Optional
+
+import pytest
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+
+import app.llm_service as llm_service_module
+from app.deadlines import Deadlines, GenerationTimeout, Watchdog
+from app.llm_service import LLMService
+
+
+def _expired_phase(deadlines: Deadlines, chunks_every: Optional[float], chunks: int) -> str:
+    """Phase the watchdog expires in, for a stream sending `chunks` chunks"""
+
+    async def generation(watchdog_box):
+        watchdog = watchdog_box["watchdog"] = Watchdog(deadlines)
+        try:
+            for _ in range(chunks):
+                await asyncio.sleep(chunks_every)
+                watchdog.chunk_received()
+            await asyncio.sleep(10)
+        finally:
+            watchdog.stop()
+
+    async def scenario():
+        box = {}
+        started = time.perf_counter()
+        with pytest.raises(asyncio.CancelledError):
+            await asyncio.create_task(generation(box))
+        return box["watchdog"].expired, time.perf_counter() - started
+
+    phase, elapsed = asyncio.run(scenario())
+    assert elapsed < 2
+    return phase
+
+
+def test_watchdog_ttft_deadline():
+    assert _expired_phase(Deadlines(ttft=0.05, idle=1, total=5), None, 0) == "ttft"
+
+
+def test_watchdog_idle_gap_deadline():
+    # Chunks arrive, then stop for longer than the idle limit
+    assert _expired_phase(Deadlines(ttft=1, idle=0.1, total=5), 0.02, 3) == "idle"
+
+
+def test_watchdog_total_deadline():
+    # Chunks keep arriving within the idle limit, past the total limit
+    assert _expired_phase(Deadlines(ttft=1, idle=0.1, total=0.3), 0.02, 1000) == "total"
+
+
+def test_watchdog_timeout_error_names_the_phase():
+    async def scenario():
+        watchdog = Watchdog(Deadlines(ttft=0.01, idle=1, total=5))
+        watchdog.expired = "ttft"
+        watchdog.stop()
+        return watchdog.timeout_error("fake.model")
+
+    error = asyncio.run(scenario())
+    assert isinstance(error, GenerationTimeout)
+    assert (error.phase, error.limit) == ("ttft", 0.01)
+    assert "first token within 0.01s" in str(error)
+
+
+class HangingChatModel(BaseChatModel):
+    """Sync-only model whose stream blocks until released, like a stuck socket"""
+
+    release: Any = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "hanging-chat-model"
+
+    def _generate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        raise NotImplementedError
+
+    def _stream(
+        self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs
+    ) -> Iterator[ChatGenerationChunk]:
+        self.release.wait()
+        yield ChatGenerationChunk(message=AIMessageChunk(content="late"))
+
+
+def test_hung_provider_times_out_without_holding_an_executor_thread(monkeypatch):
+    release = threading.Event()
+    service = LLMService()
+    service.models["fake.hanging"] = HangingChatModel(release=release)
+    monkeypatch.setattr(
+        llm_service_module,
+        "get_deadlines",
+        lambda model_name: Deadlines(ttft=0.1, idle=1, total=5),
+    )
+    # One thread: a hung stream holding it would block the generation after it
+    executor = ThreadPoolExecutor(max_workers=1)
+
+    async def scenario():
+        with pytest.raises(GenerationTimeout) as timeout:
+            await service.agenerate_with_metrics("fake.hanging", "hi", executor=executor)
+        assert timeout.value.phase == "ttft"
+        text, _, _, _ = await asyncio.wait_for(
+            service.agenerate_with_metrics("fake.fast", "hi", executor=executor), 2
+        )
+        return text
+
+    try:
+        assert asyncio.run(scenario())
+    finally:
+        release.set()
+        executor.shutdown(wait=False)
@@ -0,0 +1,115 @@
+"""FanoutEngine.run_model against the fake models: success, error and cancel"""
+import asyncio
+
+from app.fanout import TokenEvent
+from app.models import ModelResponse
+from app.schemas import StreamUpdate
+
+
+def _drain(update_queue: asyncio.Queue):
+    updates = []
+    while not update_queue.empty():
+        updates.append(update_queue.get_nowait())
+    return updates
+
+
+def _stored(db_session, prompt_id, model_name):
+    return (
+        db_session.query(ModelResponse)
+        .filter(ModelResponse.prompt_id == prompt_id, ModelResponse.model_name == model_name)
+        .all()
+    )
+
+
+def test_completed_generation_streams_tokens_and_is_stored(engine, prompt_id, db_session):
+    async def scenario():
+        update_queue: asyncio.Queue = asyncio.Queue()
+        await engine.run_model("fake.fast", "Say hello", prompt_id, update_queue)
+        return _drain(update_queue)
+
+    updates = asyncio.run(scenario())
+    tokens = [update for update in updates if isinstance(update, TokenEvent)]
+    final = updates[-1]
+    assert len(tokens) == 5
+    assert isinstance(final, StreamUpdate) and final.is_complete
+    assert final.status == "completed"
+    assert final.completion_tokens == 5
+    assert final.time_to_first_token <= final.total_time
+
+    [row] = _stored(db_session, prompt_id, "fake.fast")
+    assert row.status == "completed"
+    assert row.response_text == "".join(token.token for token in tokens)
+    assert row.token_count_source == "provider"
+    assert row.token_trace is not None
+
+
+def test_stream_tokens_off_queues_only_the_final_update(engine, prompt_id):
+    async def scenario():
+        update_queue: asyncio.Queue = asyncio.Queue()
+        await engine.run_model(
+            "fake.fast", "Say hello", prompt_id, update_queue, stream_tokens=False
+        )
+        return _drain(update_queue)
+
+    [final] = asyncio.run(scenario())
+    assert final.status == "completed"
+
+
+def test_provider_error_ends_with_an_error_update(engine, prompt_id, db_session):
+    async def scenario():
+        update_queue: asyncio.Queue = asyncio.Queue()
+        await engine.run_model("fake.broken", "Say hello", prompt_id, update_queue)
+        return _drain(update_queue)
+
+    final = asyncio.run(scenario())[-1]
+    assert final.is_complete
+    assert final.status == "error"
+    assert "500" in final.error
+    # Errors are reported, not stored (batch jobs store theirs themselves)
+    assert _stored(db_session, prompt_id, "fake.broken") == []
+
+
+def test_unknown_model_is_an_error(engine, prompt_id):
+    async def scenario():
+        update_queue: asyncio.Queue = asyncio.Queue()
+        await engine.run_model("fake.missing", "Say hello", prompt_id, update_queue)
+        return _drain(update_queue)
+
+    [final] = asyncio.run(scenario())
+    assert final.status == "error"
+    assert "not available" in final.error
+
+
+def test_cancelled_generation_saves_its_partial_output(engine, prompt_id, db_session):
+    async def scenario():
+        update_queue: asyncio.Queue = asyncio.Queue()
+        task = asyncio.create_task(
+            engine.run_model("fake.slow", "Say hello", prompt_id, update_queue)
+        )
+        # Let a few tokens arrive, then cancel mid-stream
+        while update_queue.qsize() < 3:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        else:
+            raise AssertionError("run_model swallowed the cancellation")
+        return _drain(update_queue)
+
+    updates = asyncio.run(scenario())
+    streamed = [update for update in updates if isinstance(update, TokenEvent)]
+    final = updates[-1]
+    assert final.status == "cancelled"
+    assert final.is_complete
+    assert final.total_time is not None
+
+    [row] = _stored(db_session, prompt_id, "fake.slow")
+    assert row.status == "cancelled"
+    assert row.response_text == "".join(token.token for token in streamed)
+    assert 3 <= final.completion_tokens < 100
+    # Counted locally: the provider reports usage on its last chunk only
+    assert row.token_count_source in ("tokenizer", "estimate")
+    # The scheduler slot was released
+    assert engine.scheduler.snapshot()["fake.slow"]["in_flight"] == 0
@@ -0,0 +1,135 @@
+"""ResponseWriter: batched inserts, isolating a failing row, listeners"""
+import threading
+
+import pytest
+from sqlalchemy import event
+
+from app.database import engine as db_engine
+from app.models import ModelResponse
+from app.persistence import ResponseWriter
+
+
+def _fields(prompt_id, model_name="fake.a", **overrides):
+    fields = dict(
+        prompt_id=prompt_id,
+        model_name=model_name,
+        response_text="hello",
+        time_to_first_token=0.1,
+        total_time=0.5,
+    )
+    fields.update(overrides)
+    return fields
+
+
+def _hold(writer):
+    """Block the writer thread until the returned event is set"""
+    started, release = threading.Event(), threading.Event()
+
+    def task(db_session):
+        started.set()
+        release.wait(5)
+
+    writer.run_task(task)
+    assert started.wait(5)
+    return release
+
+
+def test_queued_responses_share_one_transaction(writer, prompt_id):
+    batches = []
+    writer.add_listener(lambda db_session, rows: batches.append([row.id for row in rows]))
+    release = _hold(writer)
+    futures = [writer.submit(**_fields(prompt_id, f"fake.{n}")) for n in range(5)]
+    release.set()
+    writer.flush(5)
+
+    ids = [future.result(0) for future in futures]
+    assert batches == [ids]
+    assert ids == sorted(ids)
+
+
+def test_batch_size_bounds_a_transaction(prompt_id):
+    writer = ResponseWriter(batch_size=2)
+    batches = []
+    writer.add_listener(lambda db_session, rows: batches.append(len(rows)))
+    try:
+        release = _hold(writer)
+        for n in range(5):
+            writer.submit(**_fields(prompt_id, f"fake.{n}"))
+        release.set()
+        writer.flush(5)
+    finally:
+        writer.stop(5)
+    assert batches == [2, 2, 1]
+
+
+def test_a_failing_row_is_isolated_from_its_batch(writer, prompt_id, db_session):
+    written = []
+    writer.add_listener(lambda db_session, rows: written.extend(row.model_name for row in rows))
+    release = _hold(writer)
+    good = writer.submit(**_fields(prompt_id, "fake.good"))
+    bad = writer.submit(**_fields(None, "fake.bad"))  # prompt_id is NOT NULL
+    after = writer.submit(**_fields(prompt_id, "fake.after"))
+    release.set()
+    writer.flush(5)
+
+    with pytest.raises(Exception, match="NOT NULL"):
+        bad.result(0)
+    stored = {
+        row.id: row.model_name
+        for row in db_session.query(ModelResponse).filter(ModelResponse.prompt_id == prompt_id)
+    }
+    assert stored == {good.result(0): "fake.good", after.result(0): "fake.after"}
+    assert written == ["fake.good", "fake.after"]
+
+
+def test_listeners_run_in_order_after_the_commit(writer, prompt_id):
+    calls = []
+    submitted = []
+
+    def first(db_session, rows):
+        # Awaiters are released before the listeners run
+        calls.append(("first", submitted[0].done()))
+        raise RuntimeError("listener failure")
+
+    def second(db_session, rows):
+        calls.append(("second", [row.model_name for row in rows]))
+
+    writer.add_listener(first)
+    writer.add_listener(second)
+    submitted.append(writer.submit(**_fields(prompt_id)))
+    # Tasks queued after a write see its listeners' work done
+    seen = writer.run_task(lambda db_session: list(calls)).result(5)
+
+    assert seen == [("first", True), ("second", ["fake.a"])]
+    assert submitted[0].result(0)
+
+
+def test_listeners_read_created_at_without_reloading_rows(writer, prompt_id, monkeypatch):
+    # As on a backend without INSERT ... RETURNING, where server defaults
+    # are not fetched with the insert
+    monkeypatch.setattr(ModelResponse.__mapper__, "eager_defaults", False)
+    statements = []
+    stamped = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    def listener(db_session, rows):
+        statements.clear()
+        stamped.extend(row.created_at for row in rows)
+        stamped.append(len(statements))
+
+    writer.add_listener(listener)
+    event.listen(db_engine, "before_cursor_execute", record)
+    try:
+        release = _hold(writer)
+        for n in range(3):
+            writer.submit(**_fields(prompt_id, f"fake.{n}"))
+        release.set()
+        writer.flush(5)
+    finally:
+        event.remove(db_engine, "before_cursor_execute", record)
+
+    *created_at, selects = stamped
+    assert selects == 0
+    assert len(created_at) == 3 and all(value is not None for value in created_at)
@@ -0,0 +1,80 @@
+"""Prompt history: keyset pagination"""
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import text
+
+from app.models import Prompt, PromptSweep
+from app.routers.prompts import decode_cursor, encode_cursor, get_prompts
+
+# Later than anything the other tests create, so these are the newest prompts
+TIE = datetime(2100, 1, 1, 12, 0, 0)
+NEWER = datetime(2100, 1, 1, 12, 0, 1)
+
+
+def _page(db_session, cursor=None, limit=2):
+    return get_prompts(cursor=cursor, limit=limit, fields="id,created_at", db=db_session)
+
+
+@pytest.fixture
+def tied_prompts(db_session):
+    """Five prompts created in the same second and one a second later"""
+    ids = []
+    for n in range(3):
+        prompt = Prompt(text=f"tied {n}", created_at=TIE)
+        db_session.add(prompt)
+        db_session.commit()
+        ids.append(prompt.id)
+    # As stamped by the server default: CURRENT_TIMESTAMP text
+    for n in range(2):
+        db_session.execute(
+            text("INSERT INTO prompts (text, created_at) VALUES (:text, :created_at)"),
+            {"text": f"tied raw {n}", "created_at": TIE.strftime("%Y-%m-%d %H:%M:%S")},
+        )
+        db_session.commit()
+        ids.append(db_session.execute(text("SELECT max(id) FROM prompts")).scalar())
+    newer = Prompt(text="newer", created_at=NEWER)
+    db_session.add(newer)
+    db_session.commit()
+    yield [newer.id, *sorted(ids, reverse=True)]
+    db_session.query(Prompt).filter(Prompt.created_at >= TIE).delete()
+    db_session.commit()
+
+
+def test_pages_walk_tied_timestamps_without_gaps_or_repeats(db_session, tied_prompts):
+    seen = []
+    cursor = None
+    while len(seen) < len(tied_prompts):
+        page = _page(db_session, cursor)
+        assert len(page.items) == 2
+        seen += [item.id for item in page.items]
+        cursor = page.next_cursor
+    assert seen == tied_prompts
+    assert [item.id for item in _page(db_session, limit=6).items] == tied_prompts
+
+
+def test_cursor_in_the_middle_of_a_tie(db_session, tied_prompts):
+    cursor = encode_cursor(TIE, tied_prompts[2])
+    page = _page(db_session, cursor, limit=3)
+    assert [item.id for item in page.items] == tied_prompts[3:6]
+
+
+def test_cursor_round_trips_a_datetime():
+    assert decode_cursor(encode_cursor(TIE, 7)) == (TIE, 7)
+    with pytest.raises(HTTPException):
+        decode_cursor(encode_cursor(TIE, 7)[:-4])
+
+
+def test_sweep_prompts_are_left_out_of_the_history(db_session, tied_prompts):
+    sweep = PromptSweep(spec="{}", total_cells=1, unique_cells=1, max_concurrency=1)
+    db_session.add(sweep)
+    db_session.flush()
+    db_session.add(Prompt(text="rendered", sweep_id=sweep.id, created_at=NEWER))
+    db_session.commit()
+    try:
+        assert [item.id for item in _page(db_session, limit=6).items] == tied_prompts
+    finally:
+        db_session.query(Prompt).filter(Prompt.sweep_id == sweep.id).delete()
+        db_session.delete(sweep)
+        db_session.commit()
@@ -0,0 +1,114 @@
+"""Latency regressions: the Mann-Whitney test and the detector's directions"""
+import math
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from app.regressions import RegressionDetector, mann_whitney_p
+
+
+def _normal_tail(z: float) -> float:
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def test_mann_whitney_known_value_without_ties():
+    # Recent ranks 4 + 5 + 6: U = 15 - 6 = 9 of n1 * n2 = 9, mean 4.5,
+    # variance 3 * 3 / 12 * 7 = 5.25; continuity-corrected z = 4 / sqrt(5.25)
+    p = mann_whitney_p(np.array([1.0, 2.0, 3.0]), np.array([4.0, 5.0, 6.0]))
+    assert p == pytest.approx(_normal_tail(4 / math.sqrt(5.25)))
+    assert p == pytest.approx(0.04043, abs=1e-5)
+
+
+def test_mann_whitney_known_value_with_ties():
+    # Sorted 1, 2, 2, 2, 3, 3: the 2s share rank 3, the 3s rank 5.5, so the
+    # recent ranks sum to 14 and U = 8. Tie groups of 3 and 2 remove
+    # (27 - 3 + 8 - 2) / (6 * 5) = 1 from n + 1: variance 0.75 * 6 = 4.5
+    p = mann_whitney_p(np.array([1.0, 2.0, 2.0]), np.array([2.0, 3.0, 3.0]))
+    assert p == pytest.approx(_normal_tail(3 / math.sqrt(4.5)))
+    assert p == pytest.approx(0.07865, abs=1e-5)
+
+
+def test_mann_whitney_is_one_sided():
+    # U = 0: recent is lower, not greater
+    p = mann_whitney_p(np.array([4.0, 5.0, 6.0]), np.array([1.0, 2.0, 3.0]))
+    assert p == pytest.approx(_normal_tail(-5 / math.sqrt(5.25)))
+    assert p > 0.98
+
+
+def test_mann_whitney_of_identical_values():
+    assert mann_whitney_p(np.full(5, 0.3), np.full(5, 0.3)) == 1.0
+
+
+def test_mann_whitney_detects_a_shift_of_larger_windows():
+    rng = np.random.default_rng(3)
+    baseline = rng.lognormal(0, 0.2, 50)
+    assert mann_whitney_p(baseline, rng.lognormal(0.5, 0.2, 50)) < 1e-6
+    assert mann_whitney_p(baseline, rng.lognormal(0, 0.2, 50)) > 0.001
+
+
+class FakeSession:
+    def __init__(self):
+        self.added = []
+
+    def add(self, row):
+        self.added.append(row)
+
+
+def _feed(detector, ttfts, output_rates, start_id=1):
+    """Observe completed responses of 11 tokens with these TTFTs and output tokens/sec"""
+    session = FakeSession()
+    rows = [
+        SimpleNamespace(
+            id=start_id + n,
+            model_name="fake.a",
+            model_id="fake.a-v1",
+            status="completed",
+            cached=False,
+            time_to_first_token=ttft,
+            total_time=ttft + 10 / rate,
+            completion_tokens=11,
+        )
+        for n, (ttft, rate) in enumerate(zip(ttfts, output_rates))
+    ]
+    detector.observe_rows(session, rows)
+    return {row.metric: row for row in session.added}
+
+
+def _detector():
+    return RegressionDetector(window=20, check_every=20, p_value=0.001, min_change=0.2)
+
+
+def _jitter(level, n=20, seed=0):
+    return list(level * np.random.default_rng(seed).uniform(0.95, 1.05, n))
+
+
+def test_higher_ttft_and_lower_tokens_per_second_are_regressions():
+    detector = _detector()
+    assert _feed(detector, _jitter(0.2), _jitter(50)) == {}
+    regressions = _feed(detector, _jitter(0.4, seed=1), _jitter(25, seed=1), start_id=21)
+    assert set(regressions) == {"ttft", "output_tokens_per_second"}
+    assert regressions["ttft"].change == pytest.approx(1.0, abs=0.15)
+    assert regressions["output_tokens_per_second"].change == pytest.approx(-0.5, abs=0.1)
+    assert regressions["ttft"].first_response_id == 21
+    assert regressions["ttft"].last_response_id == 40
+
+
+def test_lower_ttft_and_higher_tokens_per_second_are_not():
+    detector = _detector()
+    _feed(detector, _jitter(0.4), _jitter(25))
+    assert _feed(detector, _jitter(0.2, seed=1), _jitter(50, seed=1), start_id=21) == {}
+    tests = {status["metric"]: status for status in detector.status("fake.a")}
+    # Clearly significant the other way, and still not reported
+    assert tests["ttft"]["change"] < -0.4
+    assert tests["output_tokens_per_second"]["change"] > 0.8
+    assert tests["ttft"]["p_value"] > 0.99
+
+
+def test_small_shifts_are_not_reported():
+    detector = _detector()
+    _feed(detector, _jitter(0.2), _jitter(50))
+    # Significant, but under min_change
+    assert _feed(detector, _jitter(0.22, seed=1), _jitter(46, seed=1), start_id=21) == {}
+    tests = {status["metric"]: status for status in detector.status("fake.a")}
+    assert tests["ttft"]["p_value"] < 0.001
@@ -0,0 +1,111 @@
+"""Latency-aware routing: sketch quantiles, ranking and hedge delays"""
+import math
+
+import pytest
+
+from app.analytics import HISTOGRAM_GROWTH
+from app.routing import ROUTING_DEFAULT_HEDGE_AFTER, LatencyTracker, _Sketch
+
+TOLERANCE = math.sqrt(HISTOGRAM_GROWTH) - 1
+
+
+def _tracker(**latencies) -> LatencyTracker:
+    """A tracker that observed each model's (ttft, total_time) pairs in order"""
+    tracker = LatencyTracker(alpha=0.5, half_life=100, min_samples=3)
+    for model_name, observations in latencies.items():
+        for ttft, total_time in observations:
+            tracker.observe(model_name.replace("_", "."), ttft, total_time)
+    return tracker
+
+
+def test_empty_sketch_has_no_quantiles():
+    assert _Sketch(100).quantile(0.5) is None
+
+
+def test_quantiles_are_clamped_to_the_observed_range():
+    sketch = _Sketch(100)
+    for _ in range(3):
+        sketch.observe(0.0517, 0.2)
+    assert sketch.quantile(0.5) == sketch.quantile(0.9) == 0.0517
+
+
+def test_quantiles_are_within_a_bin_of_the_observations():
+    sketch = _Sketch(1e9)  # no decay to speak of
+    for n in range(1, 101):
+        sketch.observe(n / 100, 0.2)
+    assert sketch.quantile(0.5) == pytest.approx(0.5, rel=TOLERANCE)
+    assert sketch.quantile(0.9) == pytest.approx(0.9, rel=TOLERANCE)
+    assert sketch.quantile(1.0) <= 1.0
+
+
+def test_recent_observations_outweigh_old_ones():
+    sketch = _Sketch(10)
+    for _ in range(100):
+        sketch.observe(0.1, 0.2)
+    for _ in range(50):
+        sketch.observe(2.0, 0.2)
+    # 50 responses are five half-lives: the old latency is ~3% of the weight
+    assert sketch.quantile(0.1) == pytest.approx(2.0, rel=TOLERANCE)
+
+
+def test_models_rank_by_expected_latency():
+    tracker = _tracker(
+        fake_slow=[(1.0, 3.0)] * 5,
+        fake_fast=[(0.2, 1.0)] * 5,
+        fake_new=[(0.01, 0.1)] * 2,  # too few samples to be trusted
+    )
+    decision = tracker.route(["fake.slow", "fake.new", "fake.fast"])
+    assert [c["model_name"] for c in decision["candidates"]] == ["fake.fast", "fake.slow", "fake.new"]
+    assert decision["primary"] == "fake.fast"
+    assert decision["backup"] is None and decision["hedge_after"] is None
+
+
+def test_objective_selects_the_metric():
+    tracker = _tracker(
+        fake_a=[(0.2, 5.0)] * 5,
+        fake_b=[(0.5, 1.0)] * 5,
+    )
+    assert tracker.route(["fake.a", "fake.b"], objective="ttft")["primary"] == "fake.a"
+    assert tracker.route(["fake.a", "fake.b"], objective="total_time")["primary"] == "fake.b"
+
+
+def test_unknown_models_keep_the_given_order():
+    decision = _tracker().route(["fake.b", "fake.a"], hedge=True)
+    assert decision["primary"] == "fake.b"
+    assert decision["backup"] == "fake.a"
+    assert decision["hedge_after"] == ROUTING_DEFAULT_HEDGE_AFTER
+
+
+def test_hedge_starts_the_backup_at_the_primarys_p90_ttft():
+    ttfts = [0.04, 0.045, 0.05, 0.0505, 0.051, 0.0512, 0.0514, 0.0515, 0.0516, 0.0517]
+    tracker = _tracker(
+        fake_fast=[(ttft, 1.0) for ttft in ttfts],
+        fake_slow=[(1.0, 3.0)] * 5,
+    )
+    decision = tracker.route(["fake.slow", "fake.fast"], hedge=True)
+    assert (decision["primary"], decision["backup"]) == ("fake.fast", "fake.slow")
+    assert decision["hedge_after"] == decision["candidates"][0]["ttft_p90"]
+    # Never later than the slowest first token seen
+    assert 0.05 <= decision["hedge_after"] <= 0.0517
+
+
+def test_model_without_history_is_only_a_backup():
+    tracker = _tracker(fake_slow=[(1.0, 3.0)] * 5, fake_new=[(0.1, 0.5)] * 2)
+    decision = tracker.route(["fake.new", "fake.slow"], hedge=True)
+    assert (decision["primary"], decision["backup"]) == ("fake.slow", "fake.new")
+    assert decision["hedge_after"] == pytest.approx(decision["candidates"][0]["ttft_p90"])
+
+    decision = tracker.route(["fake.new"], hedge=True)
+    assert decision["backup"] is None and decision["hedge_after"] is None
+
+
+def test_listener_observes_completed_uncached_rows(db_session):
+    class Row:
+        def __init__(self, id, status="completed", cached=False):
+            self.id, self.status, self.cached = id, status, cached
+            self.model_name, self.time_to_first_token, self.total_time = "fake.a", 0.3, 1.0
+
+    tracker = LatencyTracker()
+    tracker.observe_rows(db_session, [Row(7), Row(5, status="error"), Row(6, cached=True), Row(8)])
+    assert tracker.stats("fake.a")["samples"] == 2
+    assert tracker._first_observed_id == 5
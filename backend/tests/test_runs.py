@@ -0,0 +1,120 @@
+"""Which requests share a generation run (runs.RunManager)"""
+import asyncio
+
+from app.runs import RunManager, run_key
+from app.schemas import StreamUpdate
+
+
+class FakeEngine:
+    """Stands in for FanoutEngine, recording the models of every generation"""
+
+    def __init__(self):
+        self.generated = []
+
+    async def stream(self, prompt_id, prompt_text, model_names, **options):
+        self.generated.append(list(model_names))
+        for model_name in model_names:
+            await asyncio.sleep(0.01)
+            yield StreamUpdate(model_name=model_name, is_complete=True, status="completed")
+
+
+async def _consume(manager, run):
+    return [update.model_name async for _, update in manager.attach(run)]
+
+
+def test_other_models_start_their_own_run():
+    async def scenario():
+        engine = FakeEngine()
+        manager = RunManager(engine)
+        first = await manager.start(1, "hello", ["fake.a", "fake.b"])
+
+        # A run in progress for other models is not joined
+        assert await manager.find(1, run_key(["fake.c"])) is None
+        second = await manager.start(1, "hello", ["fake.c"])
+        assert second is not first
+
+        assert await _consume(manager, first) == ["fake.a", "fake.b"]
+        assert await _consume(manager, second) == ["fake.c"]
+        assert engine.generated == [["fake.a", "fake.b"], ["fake.c"]]
+
+    asyncio.run(scenario())
+
+
+def test_same_models_and_options_join():
+    async def scenario():
+        engine = FakeEngine()
+        manager = RunManager(engine)
+        run = await manager.start(1, "hello", ["fake.a", "fake.b"])
+
+        assert await manager.find(1, run_key(["fake.b", "fake.a"])) is run
+        assert await manager.start(1, "hello", ["fake.b", "fake.a"]) is run
+        # Other options are another run
+        assert await manager.find(1, run_key(["fake.a", "fake.b"], first_k=1)) is None
+        assert await manager.find(1, run_key(["fake.a", "fake.b"], use_cache=True)) is None
+        # A request naming no models joins whatever the prompt is running
+        assert await manager.find(1) is run
+
+        await _consume(manager, run)
+        assert engine.generated == [["fake.a", "fake.b"]]
+
+    asyncio.run(scenario())
+
+
+class SlowEngine:
+    """Streams a token per model every 10ms, for a long time; records cancellation"""
+
+    def __init__(self):
+        self.cancelled = asyncio.Event()
+
+    async def stream(self, prompt_id, prompt_text, model_names, **options):
+        try:
+            for i in range(1000):
+                await asyncio.sleep(0.01)
+                for model_name in model_names:
+                    yield StreamUpdate(model_name=model_name, token=str(i))
+        except (asyncio.CancelledError, GeneratorExit):
+            self.cancelled.set()
+            raise
+
+
+async def _read_some(subscription, count):
+    for _ in range(count):
+        await subscription.__anext__()
+
+
+def test_disconnect_of_the_only_client_cancels_the_run():
+    async def scenario():
+        engine = SlowEngine()
+        manager = RunManager(engine, orphan_timeout=30)
+        run = await manager.start(1, "hello", ["fake.a"])
+        subscription = manager.attach(run)
+        await _read_some(subscription, 3)
+        await subscription.aclose()
+        # Well before the grace period
+        await asyncio.wait_for(engine.cancelled.wait(), 1)
+        await asyncio.sleep(0)
+        assert run.finished
+
+    asyncio.run(scenario())
+
+
+def test_shared_run_outlives_a_client_and_gets_a_grace_period():
+    async def scenario():
+        engine = SlowEngine()
+        manager = RunManager(engine, orphan_timeout=0.3)
+        run = await manager.start(1, "hello", ["fake.a"])
+        first, second = manager.attach(run), manager.attach(run)
+        await _read_some(first, 2)
+        await _read_some(second, 2)
+        assert run.shared
+
+        await first.aclose()
+        await _read_some(second, 5)
+        assert not engine.cancelled.is_set()
+
+        await second.aclose()
+        await asyncio.sleep(0.1)
+        assert not engine.cancelled.is_set()
+        await asyncio.wait_for(engine.cancelled.wait(), 1)
+
+    asyncio.run(scenario())
@@ -0,0 +1,152 @@
+"""Admission control: token buckets, AIMD limits and fairness across users"""
+import asyncio
+import time
+
+import pytest
+
+from app.scheduler import AIMDLimiter, Scheduler, TokenBucket
+
+
+def test_token_bucket_allows_a_burst_then_paces():
+    bucket = TokenBucket(rate=10, burst=2)
+    now = bucket.updated_at
+    for _ in range(2):
+        assert bucket.delay(now) == 0
+        bucket.take()
+    assert bucket.delay(now) == pytest.approx(0.1)
+    assert bucket.delay(now + 0.05) == pytest.approx(0.05)
+    assert bucket.delay(now + 0.1) == 0
+    # Refills up to the burst, never beyond
+    bucket.take()
+    bucket.delay(now + 100)
+    assert bucket.tokens == 2
+    # A clock reading from before the last refill adds nothing
+    bucket.take()
+    bucket.take()
+    assert bucket.delay(now + 99) == pytest.approx(0.1)
+
+
+def test_rate_limit_delays_admission():
+    async def scenario():
+        scheduler = Scheduler(8, {"fake.": {"rate": 20, "burst": 1}})
+        started = time.monotonic()
+        first = await scheduler.acquire("fake.a", "alice")
+        # The provider bucket is shared by its models
+        second = await scheduler.acquire("fake.b", "alice")
+        waited = time.monotonic() - started
+        scheduler.release(first)
+        scheduler.release(second)
+        return first.queue_wait, second.queue_wait, waited
+
+    first_wait, second_wait, waited = asyncio.run(scenario())
+    assert first_wait < 0.01
+    assert 0.04 <= second_wait < 0.5
+    assert waited >= 0.04
+
+
+def test_sooner_refill_reschedules_the_pending_timer():
+    async def scenario():
+        scheduler = Scheduler(
+            8, {"fake.a": {"rate": 0.5, "burst": 1}, "fake.b": {"rate": 20, "burst": 1}}
+        )
+        await scheduler.acquire("fake.a", "alice")
+        # Next fake.a token in 2s: the timer is set for then
+        slow = asyncio.create_task(scheduler.acquire("fake.a", "alice"))
+        await asyncio.sleep(0)
+        # A fresh bucket admits at once; its next token is due in 50ms,
+        # well before the pending timer
+        await asyncio.wait_for(scheduler.acquire("fake.b", "alice"), 0.01)
+        await asyncio.wait_for(scheduler.acquire("fake.b", "alice"), 0.5)
+        slow.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_aimd_slow_start_then_additive_increase():
+    limiter = AIMDLimiter(initial=4, max_limit=64)
+    for _ in range(4):
+        limiter.on_success(None)
+    assert limiter.limit == 8
+    limiter.decrease(0.5)
+    assert limiter.limit == 4
+    assert not limiter.slow_start
+    # One per round trip: a full window of successes adds one
+    for _ in range(4):
+        limiter.on_success(None)
+    assert 4.9 < limiter.limit < 5
+
+
+def test_aimd_limits_are_bounded():
+    limiter = AIMDLimiter(initial=3, max_limit=4)
+    for _ in range(10):
+        limiter.on_success(None)
+    assert limiter.limit == 4
+    for _ in range(10):
+        limiter.decrease(0.5)
+    assert limiter.limit == limiter.min_limit == 1
+
+
+def test_aimd_decreases_when_ttft_drifts_above_baseline():
+    limiter = AIMDLimiter(initial=10, max_limit=64)
+    for _ in range(5):
+        limiter.on_success(0.1)
+    assert limiter.limit == 15
+    # One slow generation lifts the smoothed TTFT past twice the baseline
+    limiter.on_success(1.0)
+    assert limiter.ttft_ewma > 2 * limiter.ttft_baseline
+    assert limiter.limit == pytest.approx(13.5)
+    assert not limiter.slow_start
+
+
+def test_scheduler_outcomes_drive_the_model_limit():
+    async def scenario():
+        scheduler = Scheduler(16, {})
+        ticket = await scheduler.acquire("fake.a", "alice")
+        ticket.failed(Exception("429 Too Many Requests"))
+        scheduler.release(ticket)
+        return scheduler.snapshot()["fake.a"]
+
+    snapshot = asyncio.run(scenario())
+    assert snapshot == {"limit": 4.0, "in_flight": 0, "queued": 0}
+
+
+def test_waiting_requests_are_served_round_robin_across_users():
+    async def scenario():
+        scheduler = Scheduler(1, {})
+        admitted = []
+
+        async def generation(user, n):
+            async with scheduler.slot("fake.a", user):
+                admitted.append(f"{user}{n}")
+                await asyncio.sleep(0)
+
+        holder = await scheduler.acquire("fake.a", "setup")
+        # A large batch is queued before the other user's requests
+        tasks = [asyncio.create_task(generation("batch", n)) for n in range(4)]
+        await asyncio.sleep(0)
+        tasks += [asyncio.create_task(generation("alice", n)) for n in range(2)]
+        await asyncio.sleep(0)
+        assert scheduler.snapshot()["fake.a"]["queued"] == 6
+        scheduler.release(holder)
+        await asyncio.gather(*tasks)
+        return admitted
+
+    assert asyncio.run(scenario()) == [
+        "batch0", "alice0", "batch1", "alice1", "batch2", "batch3",
+    ]
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        scheduler = Scheduler(1, {})
+        holder = await scheduler.acquire("fake.a", "alice")
+        waiter = asyncio.create_task(scheduler.acquire("fake.a", "bob"))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        queued = scheduler.snapshot()["fake.a"]["queued"]
+        scheduler.release(holder)
+        return queued, scheduler.in_flight
+
+    assert asyncio.run(scenario()) == (0, 0)
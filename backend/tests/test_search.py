@@ -0,0 +1,162 @@
+"""Full-text search: index triggers, backfill and queries (SQLite FTS5)"""
+from datetime import datetime
+
+import pytest
+from sqlalchemy import text
+
+from app import search as search_module
+from app.database import engine
+from app.models import ModelResponse, Prompt, SearchBackfill
+from app.search import (
+    INDEXED,
+    SearchQueryError,
+    backfill_search_index,
+    ensure_search_index,
+    search,
+)
+
+ensure_search_index()
+
+
+@pytest.fixture
+def rows(db_session):
+    """Adds prompts and responses; deletes them, and their index entries, after"""
+    added = {Prompt: [], ModelResponse: []}
+
+    def add(*new_rows):
+        db_session.add_all(new_rows)
+        db_session.commit()
+        for row in new_rows:
+            added[type(row)].append(row.id)
+        return new_rows
+
+    yield add
+    db_session.rollback()
+    for model in (ModelResponse, Prompt):
+        db_session.query(model).filter(model.id.in_(added[model])).delete()
+    db_session.commit()
+
+
+def _response(prompt, text, model_name="fake.a"):
+    return ModelResponse(
+        prompt_id=prompt.id,
+        model_name=model_name,
+        response_text=text,
+        time_to_first_token=0.1,
+        total_time=1.0,
+    )
+
+
+def _found(db_session, query, **options):
+    return [
+        (hit["kind"], hit["response_id"] or hit["prompt_id"])
+        for hit in search(db_session, query, **options)
+    ]
+
+
+def test_plain_queries_match_every_word_stemmed(db_session, rows):
+    both, one = rows(Prompt(text="Explain quokkas jumping"), Prompt(text="Quokkas sleep"))
+    assert _found(db_session, "quokka jumps") == [("prompt", both.id)]
+    assert set(_found(db_session, "quokkas")) == {("prompt", both.id), ("prompt", one.id)}
+    # Punctuation is not query syntax
+    assert _found(db_session, 'quokka, (jump!') == [("prompt", both.id)]
+    assert "«jumping»" in search(db_session, "jumping")[0]["snippet"]
+
+
+def test_fts_queries_take_the_full_text_syntax(db_session, rows):
+    left, right = rows(Prompt(text="wombat left"), Prompt(text="wombat right"))
+    assert _found(db_session, "wombat NOT left", syntax="fts") == [("prompt", right.id)]
+    assert _found(db_session, '"wombat right"', syntax="fts") == [("prompt", right.id)]
+    assert len(_found(db_session, "womb*", syntax="fts")) == 2
+    with pytest.raises(SearchQueryError):
+        search(db_session, 'wombat AND ("', syntax="fts")
+    with pytest.raises(SearchQueryError):
+        search(db_session, "?!")
+
+
+def test_triggers_follow_updates_and_deletes(db_session, rows):
+    (prompt,) = rows(Prompt(text="Describe a numbat"))
+    (response,) = rows(_response(prompt, "A numbat eats termites"))
+    assert set(_found(db_session, "numbat")) == {("prompt", prompt.id), ("response", response.id)}
+
+    response.response_text = "A marsupial that eats ants"
+    db_session.commit()
+    assert _found(db_session, "numbat") == [("prompt", prompt.id)]
+    assert _found(db_session, "marsupial") == [("response", response.id)]
+
+    db_session.query(ModelResponse).filter(ModelResponse.id == response.id).delete()
+    db_session.commit()
+    assert _found(db_session, "marsupial") == []
+
+
+def test_filters_by_kind_model_and_date(db_session, rows):
+    old, new = rows(
+        Prompt(text="Name a bilby", created_at=datetime(2001, 1, 1)),
+        Prompt(text="Draw a bilby", created_at=datetime(2001, 1, 3)),
+    )
+    a, b = rows(_response(old, "bilby facts", "fake.a"), _response(new, "bilby art", "fake.b"))
+
+    assert _found(db_session, "bilby", kinds=("response",), models=["fake.b"]) == [("response", b.id)]
+    # Prompts answered by the model
+    assert _found(db_session, "bilby", kinds=("prompt",), models=["fake.a"]) == [("prompt", old.id)]
+    assert _found(
+        db_session, "bilby", kinds=("prompt",), start=datetime(2001, 1, 2), end=datetime(2001, 1, 4)
+    ) == [("prompt", new.id)]
+    # The end is exclusive
+    assert _found(db_session, "bilby", kinds=("prompt",), end=datetime(2001, 1, 3)) == [("prompt", old.id)]
+
+
+def test_prompt_and_response_scores_are_ranked_on_one_scale(db_session, rows):
+    # A term rare among prompts and common among responses scores far
+    # higher in the prompt index; each kind's best still comes first
+    prompts = rows(*(Prompt(text="potoroo question" + " more" * n) for n in range(3)))
+    rows(*(_response(prompts[0], "potoroo answer" + " more" * n) for n in range(20)))
+    hits = search(db_session, "potoroo", limit=2)
+    assert {(hit["kind"], hit["score"]) for hit in hits} == {("prompt", 1.0), ("response", 1.0)}
+    # Every score is relative to its kind's best
+    hits = search(db_session, "potoroo", limit=30)
+    assert len(hits) == 23
+    assert all(0 < hit["score"] <= 1 for hit in hits)
+    assert [hit["score"] for hit in hits] == sorted((hit["score"] for hit in hits), reverse=True)
+    # Pages agree with the full list
+    page = search(db_session, "potoroo", limit=5, offset=5)
+    assert [hit["score"] for hit in page] == [hit["score"] for hit in hits[5:10]]
+
+
+def _drop_index():
+    with engine.begin() as conn:
+        for table in INDEXED:
+            for trigger in ("insert", "delete", "update"):
+                conn.execute(text(f"DROP TRIGGER IF EXISTS {table}_fts_{trigger}"))
+            conn.execute(text(f"DROP TABLE IF EXISTS {table}_fts"))
+
+
+def test_index_added_to_a_populated_database_is_backfilled(db_session, rows, writer, monkeypatch):
+    monkeypatch.setattr(search_module, "SEARCH_BACKFILL_CHUNK", 2)
+    existing = rows(*(Prompt(text=f"dunnart {n}") for n in range(5)))
+    (answer,) = rows(_response(existing[0], "dunnart reply"))
+    try:
+        _drop_index()
+        ensure_search_index()
+        assert db_session.query(SearchBackfill).count() == 2
+        # Written while the backfill is pending: indexed by the triggers
+        (fresh,) = rows(Prompt(text="dunnart fresh"))
+        # Deleted before the backfill reached it: never indexed
+        db_session.query(Prompt).filter(Prompt.id == existing[4].id).delete()
+        db_session.commit()
+        assert _found(db_session, "dunnart") == [("prompt", fresh.id)]
+
+        assert backfill_search_index(writer)
+        assert db_session.query(SearchBackfill).count() == 0
+        assert set(_found(db_session, "dunnart", limit=50)) == {
+            *(("prompt", prompt.id) for prompt in (*existing[:4], fresh)),
+            ("response", answer.id),
+        }
+        assert not backfill_search_index(writer)
+        # The index is consistent with its content tables
+        with engine.begin() as conn:
+            for table in INDEXED:
+                conn.execute(text(f"INSERT INTO {table}_fts({table}_fts) VALUES ('integrity-check')"))
+    finally:
+        # Leave a complete index behind for the other tests
+        backfill_search_index(writer)
@@ -0,0 +1,168 @@
+"""SSE framing: compact coalescing windows and event ids"""
+import asyncio
+import json
+
+import app.sse as sse
+from app.fanout import TokenEvent
+from app.runs import RESET
+from app.schemas import StreamUpdate
+
+MODELS = ["fake.a", "fake.b"]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def _parse(frame: str) -> dict:
+    """Fields of one SSE frame, with `data` decoded"""
+    fields = {}
+    for line in frame.strip().split("\n"):
+        name, _, value = line.partition(": ")
+        fields[name] = value
+    fields["data"] = json.loads(fields["data"])
+    return fields
+
+
+def _token(model_name, token, ttft=0.1, elapsed=0.2):
+    return TokenEvent(model_name, token, ttft, elapsed)
+
+
+def _compact(items, clock=None, monkeypatch=None, **options):
+    """Run compact_frames over `items`; a float item advances the clock instead"""
+    if clock is not None:
+        monkeypatch.setattr(sse.time, "monotonic", clock)
+
+    async def source():
+        for item in items:
+            if isinstance(item, float):
+                clock.now += item
+                continue
+            yield item
+
+    async def collect():
+        return [frame async for frame in sse.compact_frames(source(), "run1", MODELS, **options)]
+
+    frames = [_parse(frame) for frame in asyncio.run(collect())]
+    assert frames[0]["event"] == "header"
+    assert frames[0]["data"] == {"v": 1, "models": MODELS}
+    return frames[1:]
+
+
+def test_byte_window_flushes_a_model_that_buffered_enough(monkeypatch):
+    clock = FakeClock()
+    frames = _compact(
+        [
+            (1, _token("fake.a", "x" * 100)),
+            (2, _token("fake.a", "y" * 100)),
+            (3, _token("fake.a", "z" * 100)),
+        ],
+        clock,
+        monkeypatch,
+        window=10,
+        max_bytes=256,
+    )
+    [frame] = frames
+    assert frame["id"] == "run1:3"
+    assert frame["data"] == [[0, "x" * 100 + "y" * 100 + "z" * 100, 0.2, 0.1]]
+
+
+def test_time_window_flushes_on_a_heartbeat(monkeypatch):
+    clock = FakeClock()
+    frames = _compact(
+        [
+            (1, _token("fake.a", "Hel")),
+            0.01,
+            (2, _token("fake.b", "Hi")),
+            0.005,
+            None,  # still inside the window: nothing sent
+            0.01,
+            None,  # the oldest token is now 25ms old
+            (3, _token("fake.a", "lo", elapsed=0.3)),
+        ],
+        clock,
+        monkeypatch,
+        window=0.02,
+        max_bytes=256,
+    )
+    first, last = frames
+    assert first["id"] == "run1:2"
+    assert first["data"] == [[0, "Hel", 0.2, 0.1], [1, "Hi", 0.2, 0.1]]
+    # Flushed at the end; the time to first token is only sent once per model
+    assert last["id"] == "run1:3"
+    assert last["data"] == [[0, "lo", 0.3]]
+
+
+def test_terminal_update_flushes_pending_tokens_first(monkeypatch):
+    clock = FakeClock()
+    done = StreamUpdate(model_name="fake.b", is_complete=True, status="completed", total_time=0.5)
+    frames = _compact(
+        [(1, _token("fake.b", "Hi")), (2, done)], clock, monkeypatch, window=10
+    )
+    tokens, finished = frames
+    assert tokens["id"] == "run1:1"
+    assert tokens["data"] == [[1, "Hi", 0.2, 0.1]]
+    assert finished["event"] == "done"
+    assert finished["id"] == "run1:2"
+    assert finished["data"]["model"] == 1
+    assert finished["data"]["status"] == "completed"
+    assert "token" not in finished["data"]
+
+
+def test_reset_drops_pending_tokens_and_announces_ttft_again(monkeypatch):
+    clock = FakeClock()
+    frames = _compact(
+        [
+            (1, _token("fake.a", "stale")),
+            (None, RESET),
+            (1, _token("fake.a", "fresh")),
+        ],
+        clock,
+        monkeypatch,
+        window=10,
+    )
+    reset, frame = frames
+    assert reset["event"] == "reset"
+    assert frame["data"] == [[0, "fresh", 0.2, 0.1]]
+
+
+def test_snapshot_items_without_seq_keep_the_last_id(monkeypatch):
+    clock = FakeClock()
+    frames = _compact(
+        [(None, _token("fake.a", "snap")), (7, _token("fake.b", "shot"))],
+        clock,
+        monkeypatch,
+        window=10,
+    )
+    [frame] = frames
+    assert frame["id"] == "run1:7"
+
+
+def test_event_frames_carry_run_ids_and_full_updates():
+    async def source():
+        yield 1, _token("fake.a", "Hi")
+        yield None
+        yield None, RESET
+        yield 2, StreamUpdate(model_name="fake.a", is_complete=True, status="completed")
+
+    async def collect():
+        return [_parse(frame) for frame in [f async for f in sse.event_frames(source(), "run9")]]
+
+    token, reset, done = asyncio.run(collect())
+    assert token["id"] == "run9:1"
+    assert token["data"] == StreamUpdate(
+        model_name="fake.a", token="Hi", time_to_first_token=0.1, total_time=0.2
+    ).dict()
+    assert reset["event"] == "reset" and "id" not in reset
+    assert done["id"] == "run9:2" and done["data"]["status"] == "completed"
+
+
+def test_parse_event_id():
+    assert sse.parse_event_id("abc123:42") == ("abc123", 42)
+    assert sse.parse_event_id(None) == (None, 0)
+    assert sse.parse_event_id("abc123") == (None, 0)
+    assert sse.parse_event_id("abc123:x") == (None, 0)
@@ -0,0 +1,157 @@
+"""Prompt sweeps: expansion, deduplicated requests and resuming from stored results"""
+import asyncio
+
+from app.models import ModelResponse, Prompt, PromptSweep
+from app.sweeps import (
+    SweepRunner,
+    cell_count,
+    create_sweep,
+    expand,
+    load_sweep,
+    param_combinations,
+    render,
+)
+
+SPEC = {
+    "template": "Say {greeting} to {name}",
+    "variables": [
+        {"greeting": "hello", "name": "Ada"},
+        {"greeting": "hello", "name": "Ada", "unused": "x"},  # renders the same text
+        {"greeting": "bye", "name": "Bob"},
+    ],
+    "system_prompts": ["", "Be terse."],
+    "params": {"temperature": [0.0, 1.0]},
+    "models": ["fake.fast", "fake.broken"],
+}
+
+
+def test_render_fills_known_placeholders_only():
+    assert render("{a} and {b} {{c}}", {"a": 1}) == "1 and {b} {{c}}"
+
+
+def test_param_combinations_cover_the_grid_by_sorted_name():
+    assert param_combinations({"top_p": [0.5, 1], "temperature": [0]}) == [
+        {"temperature": 0, "top_p": 0.5},
+        {"temperature": 0, "top_p": 1},
+    ]
+    assert param_combinations({}) == [{}]
+
+
+def test_expand_is_row_major_and_keys_identical_requests_alike():
+    cells = expand(SPEC)
+    assert len(cells) == cell_count(SPEC) == 3 * 2 * 2 * 2
+    assert [cell.index for cell in cells] == list(range(len(cells)))
+    first, second = cells[0], cells[1]
+    assert (first.variables, first.system_prompt, first.params, first.model_name) == (0, 0, 0, "fake.fast")
+    assert (second.variables, second.model_name) == (0, "fake.broken")
+    # No system prompt is None; params are stored as sorted JSON
+    assert first.key == ("Say hello to Ada", None, '{"temperature": 0.0}', "fake.fast")
+    assert cells[2].key[2] == '{"temperature": 1.0}'
+    assert cells[4].key[1] == "Be terse."
+    # The second variable set duplicates the first
+    assert [cell.key for cell in cells[:8]] == [cell.key for cell in cells[8:16]]
+    assert len({cell.key for cell in cells}) == 16
+
+
+def test_expand_without_params_keys_no_params():
+    spec = {**SPEC, "params": {}}
+    assert expand(spec)[0].key[2] is None
+    assert cell_count(spec) == 3 * 2 * 2
+
+
+def _delete_sweep(db_session, sweep_id):
+    prompt_ids = [p for (p,) in db_session.query(Prompt.id).filter(Prompt.sweep_id == sweep_id)]
+    db_session.query(ModelResponse).filter(ModelResponse.prompt_id.in_(prompt_ids)).delete()
+    db_session.query(Prompt).filter(Prompt.sweep_id == sweep_id).delete()
+    db_session.query(PromptSweep).filter(PromptSweep.id == sweep_id).delete()
+    db_session.commit()
+
+
+def _responses(db_session, sweep_id):
+    return (
+        db_session.query(ModelResponse)
+        .join(Prompt, Prompt.id == ModelResponse.prompt_id)
+        .filter(Prompt.sweep_id == sweep_id)
+        .all()
+    )
+
+
+def _run(engine, sweep_id):
+    async def scenario():
+        runner = SweepRunner(engine)
+        runner.start(sweep_id)
+        await runner._tasks[sweep_id]
+        return runner.progress[sweep_id]
+
+    return asyncio.run(scenario())
+
+
+def test_create_sweep_stores_each_rendered_text_once(db_session):
+    sweep_id = create_sweep(SPEC, max_concurrency=2)
+    try:
+        sweep = db_session.get(PromptSweep, sweep_id)
+        assert (sweep.total_cells, sweep.unique_cells, sweep.status) == (24, 16, "pending")
+        texts = [text for (text,) in db_session.query(Prompt.text).filter(Prompt.sweep_id == sweep_id)]
+        assert sorted(texts) == ["Say bye to Bob", "Say hello to Ada"]
+    finally:
+        _delete_sweep(db_session, sweep_id)
+
+
+def test_sweep_runs_each_distinct_request_once(engine, writer, db_session):
+    sweep_id = create_sweep(SPEC, max_concurrency=3)
+    try:
+        progress = _run(engine, sweep_id)
+        writer.flush(10)
+        assert progress.status == "completed"
+        # One event per distinct request, filling every cell that shares it
+        assert len(progress.events) == 16
+        assert sorted(i for event in progress.events for i in event["cells"]) == list(range(24))
+        assert {event["status"] for event in progress.events if event["model_name"] == "fake.broken"} == {"error"}
+
+        responses = _responses(db_session, sweep_id)
+        keys = [(r.system_prompt, r.generation_params, r.model_name, r.prompt_id) for r in responses]
+        assert len(keys) == len(set(keys)) == 16
+        db_session.expire_all()
+        assert db_session.get(PromptSweep, sweep_id).status == "completed"
+    finally:
+        _delete_sweep(db_session, sweep_id)
+
+
+def test_sweep_resumes_from_stored_results(engine, writer, db_session):
+    spec = {**SPEC, "models": ["fake.fast"]}
+    sweep_id = create_sweep(spec, max_concurrency=2)
+    try:
+        # Results stored before a restart, among them a failure: neither reruns
+        _, _, cells, prompt_ids, _ = load_sweep(sweep_id)
+        done = [cells[0].key, cells[1].key]
+        for (text, system_prompt, params, model_name), status in zip(done, ("completed", "error")):
+            db_session.add(
+                ModelResponse(
+                    prompt_id=prompt_ids[text],
+                    model_name=model_name,
+                    response_text="stored",
+                    time_to_first_token=0.1,
+                    total_time=0.2,
+                    status=status,
+                    system_prompt=system_prompt,
+                    generation_params=params,
+                )
+            )
+        db_session.commit()
+        assert set(load_sweep(sweep_id)[4]) == set(done)
+
+        progress = _run(engine, sweep_id)
+        writer.flush(10)
+        # Stored results are replayed first, then the 6 missing requests run
+        assert len(progress.events) == 8
+        assert [event["status"] for event in progress.events[:2]] == ["completed", "error"]
+        responses = _responses(db_session, sweep_id)
+        assert len(responses) == 8
+        assert sum(r.response_text == "stored" for r in responses) == 2
+
+        # Nothing is left to run
+        assert len(_run(engine, sweep_id).events) == 8
+        writer.flush(10)
+        assert len(_responses(db_session, sweep_id)) == 8
+    finally:
+        _delete_sweep(db_session, sweep_id)
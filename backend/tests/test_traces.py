@@ -0,0 +1,89 @@
+"""TokenTrace: encode/decode round trips and metrics"""
+import pytest
+
+from app.traces import TokenTrace, trace_metrics
+
+_MAX_GAP = 2**32 - 1
+
+
+def _trace(*chunks):
+    trace = TokenTrace()
+    for elapsed, size in chunks:
+        trace.add(elapsed, size)
+    return trace
+
+
+def _round_trip(trace: TokenTrace) -> TokenTrace:
+    return TokenTrace.decode(trace.encode())
+
+
+def test_empty_trace_round_trips():
+    trace = TokenTrace()
+    blob = trace.encode()
+    assert len(blob) == 5  # the header alone
+    decoded = TokenTrace.decode(blob)
+    assert len(decoded) == 0
+    assert decoded.to_dict() == {"offsets_us": [], "sizes": []}
+    assert decoded.metrics()["chunks"] == 0
+    assert decoded.metrics()["itl_p50"] is None
+
+
+def test_single_chunk_round_trips():
+    decoded = _round_trip(_trace((0.25, 12)))
+    assert decoded.to_dict() == {"offsets_us": [250_000], "sizes": [12]}
+    metrics = decoded.metrics()
+    assert metrics["chunks"] == 1
+    assert metrics["max_stall"] is None
+    assert metrics["steady_tokens_per_second"] is None
+
+
+def test_many_chunks_round_trip_exactly():
+    trace = _trace(*((0.1 + n * 0.02, n % 7 + 1) for n in range(500)))
+    blob = trace.encode()
+    assert len(blob) == 5 + 500 * 6
+    decoded = TokenTrace.decode(blob)
+    assert decoded.to_dict() == trace.to_dict()
+    metrics = decoded.metrics()
+    assert metrics["itl_p50"] == pytest.approx(0.02, abs=1e-5)
+    assert metrics["steady_tokens_per_second"] == pytest.approx(50, rel=1e-3)
+
+
+def test_offsets_never_go_backwards():
+    trace = _trace((0.5, 1), (0.4, 1), (0.6, 1))
+    assert trace.to_dict()["offsets_us"] == [500_000, 500_000, 600_000]
+    assert _round_trip(trace).to_dict() == trace.to_dict()
+
+
+def test_large_gaps_round_trip_up_to_the_delta_limit():
+    # An hour's stall fits in a delta
+    trace = _trace((0.1, 1), (3600.1, 1), (3600.2, 1))
+    decoded = _round_trip(trace)
+    assert decoded.to_dict() == trace.to_dict()
+    assert decoded.metrics()["max_stall"] == pytest.approx(3600)
+
+
+def test_gaps_beyond_the_delta_limit_are_capped():
+    trace = _trace((0.1, 1), (0.1 + 3 * 3600, 1), (0.2 + 3 * 3600, 1))
+    offsets = _round_trip(trace).to_dict()["offsets_us"]
+    assert offsets[0] == 100_000
+    assert offsets[1] - offsets[0] == _MAX_GAP
+    # Later gaps are kept
+    assert offsets[2] - offsets[1] == 100_000
+
+
+def test_oversized_chunks_are_capped():
+    decoded = _round_trip(_trace((0.1, 70_000), (0.2, 3)))
+    assert decoded.to_dict()["sizes"] == [2**16 - 1, 3]
+
+
+def test_decode_rejects_unknown_versions():
+    blob = bytearray(_trace((0.1, 1)).encode())
+    blob[0] = 99
+    with pytest.raises(ValueError, match="version 99"):
+        TokenTrace.decode(bytes(blob))
+
+
+def test_trace_metrics_of_missing_trace():
+    assert trace_metrics(None) is None
+    assert trace_metrics(b"") is None
+    assert trace_metrics(_trace((0.1, 1), (0.3, 1)).encode())["max_stall"] == pytest.approx(0.2)
@@ -36,6 +36,9 @@ function PromptDetail() {
           response: response.response_text,
           timeToFirstToken: response.time_to_first_token,
           totalTime: response.total_time,
+          completionTokens: response.completion_tokens,
+          tokensPerSecond: response.tokens_per_second,
+          outputTokensPerSecond: response.output_tokens_per_second,
           isComplete: true,
           error: null,
         };
@@ -211,6 +211,11 @@ function PromptForm() {
 
           if (update.is_complete) {
             newState[modelName].isComplete = true;
+            if (update.completion_tokens !== null && update.completion_tokens !== undefined) {
+              newState[modelName].completionTokens = update.completion_tokens;
+              newState[modelName].tokensPerSecond = update.tokens_per_second;
+              newState[modelName].outputTokensPerSecond = update.output_tokens_per_second;
+            }
             if (update.time_to_first_token !== null) {
               newState[modelName].timeToFirstToken = update.time_to_first_token;
             }
@@ -231,7 +236,7 @@ function PromptForm() {
 
           return newState;
         });
-      }, selectedModelList);
+      }, selectedModelList, () => setModelStates(initializeModelStates()));
     } catch (error) {
       console.error('Error submitting prompt:', error);
       alert('Failed to submit prompt. Please try again.');
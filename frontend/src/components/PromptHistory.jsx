@@ -5,6 +5,8 @@ import './PromptHistory.css';
 
 function PromptHistory() {
   const [prompts, setPrompts] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
   const navigate = useNavigate();
@@ -16,8 +18,9 @@ function PromptHistory() {
   const loadPrompts = async () => {
     try {
       setLoading(true);
-      const data = await getPrompts();
-      setPrompts(data);
+      const page = await getPrompts();
+      setPrompts(page.items);
+      setNextCursor(page.next_cursor);
       setError(null);
     } catch (err) {
       setError('Failed to load prompts');
@@ -27,6 +30,20 @@ function PromptHistory() {
     }
   };
 
+  const loadMore = async () => {
+    try {
+      setLoadingMore(true);
+      const page = await getPrompts(nextCursor);
+      setPrompts((previous) => [...previous, ...page.items]);
+      setNextCursor(page.next_cursor);
+    } catch (err) {
+      setError('Failed to load prompts');
+      console.error(err);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const formatDate = (dateString) => {
     const date = new Date(dateString);
     return date.toLocaleString();
@@ -81,7 +98,7 @@ function PromptHistory() {
               {prompts.map((prompt) => (
                 <tr key={prompt.id}>
                   <td>{prompt.id}</td>
-                  <td className="prompt-text">{truncateText(prompt.text)}</td>
+                  <td className="prompt-text">{truncateText(prompt.preview)}</td>
                   <td>{formatDate(prompt.created_at)}</td>
                   <td>
                     <button
@@ -95,6 +112,11 @@ function PromptHistory() {
               ))}
             </tbody>
           </table>
+          {nextCursor && (
+            <button onClick={loadMore} disabled={loadingMore} className="refresh-button">
+              {loadingMore ? 'Loading...' : 'Load more'}
+            </button>
+          )}
         </div>
       )}
     </div>
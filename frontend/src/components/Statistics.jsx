@@ -22,7 +22,7 @@ function Statistics({ modelStates }) {
     Object.entries(modelStates).forEach(([modelKey, state]) => {
       if (!state.error && state.response && state.totalTime !== null) {
         stats[modelKey] = {
-          ...calculateAllStatistics(state.response, state.totalTime),
+          ...calculateAllStatistics(state.response, state.totalTime, state),
           timeToFirstToken: state.timeToFirstToken,
           totalTime: state.totalTime,
         };
@@ -215,6 +215,7 @@ function Statistics({ modelStates }) {
                 <th>Reading Time (min)</th>
                 <th>Chars/sec</th>
                 <th>Tokens/sec</th>
+                <th>Output Tokens/sec</th>
               </tr>
             </thead>
             <tbody>
@@ -235,7 +236,11 @@ function Statistics({ modelStates }) {
                           ? (state.totalTime * 1000).toFixed(0)
                           : '-'}
                       </td>
-                      <td>{stats.tokenCount || '-'}</td>
+                      <td>
+                        {stats.tokenCount
+                          ? `${stats.tokenCountEstimated ? '~' : ''}${stats.tokenCount}`
+                          : '-'}
+                      </td>
                       <td>{stats.wordCount || '-'}</td>
                       <td>{stats.emojiCount || '-'}</td>
                       <td>{stats.sentenceCount || '-'}</td>
@@ -243,6 +248,7 @@ function Statistics({ modelStates }) {
                       <td>{stats.readingTime || '-'}</td>
                       <td>{stats.throughput || '-'}</td>
                       <td>{stats.tokensPerSecond || '-'}</td>
+                      <td>{stats.outputTokensPerSecond || '-'}</td>
                     </tr>
                   );
                 })}
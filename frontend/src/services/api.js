@@ -16,8 +16,13 @@ export const submitPrompt = async (promptText) => {
   return response.json();
 };
 
-export const getPrompts = async () => {
-  const response = await fetch(`${API_BASE_URL}/prompts`);
+export const getPrompts = async (cursor = null, limit = 50) => {
+  // Returns a page: { items, next_cursor }; pass next_cursor back for the next page
+  const params = new URLSearchParams({ limit });
+  if (cursor) {
+    params.set('cursor', cursor);
+  }
+  const response = await fetch(`${API_BASE_URL}/prompts?${params}`);
   
   if (!response.ok) {
     throw new Error('Failed to fetch prompts');
@@ -46,7 +51,9 @@ export const getModelRegistry = async () => {
   return response.json();
 };
 
-export const streamPrompt = (promptId, onUpdate, selectedModels = null) => {
+export const streamPrompt = (promptId, onUpdate, selectedModels = null, onReset = null) => {
+  // The run continues server-side if the connection drops: EventSource
+  // reconnects with Last-Event-ID and the stream resumes where it left off
   // Build URL with model query parameters if models are selected
   let url = `${API_BASE_URL}/prompts/${promptId}/stream`;
   if (selectedModels && selectedModels.length > 0) {
@@ -65,9 +72,24 @@ export const streamPrompt = (promptId, onUpdate, selectedModels = null) => {
     }
   };
   
-  eventSource.onerror = (error) => {
-    console.error('SSE error:', error);
+  // Sent when the server replays the run from scratch; drop partial output
+  eventSource.addEventListener('reset', () => {
+    if (onReset) {
+      onReset();
+    }
+  });
+
+  // The run is over; without closing, EventSource would reconnect
+  eventSource.addEventListener('end', () => {
     eventSource.close();
+  });
+
+  eventSource.onerror = (error) => {
+    if (eventSource.readyState === EventSource.CLOSED) {
+      console.error('SSE error:', error);
+    } else {
+      console.warn('SSE connection lost, reconnecting...');
+    }
   };
   
   return () => {
@@ -4,7 +4,8 @@
 
 /**
  * Approximate token count using a simple heuristic
- * Roughly 1 token ≈ 4 characters for English text
+ * Roughly 1 token ≈ 4 characters for English text; only used when the
+ * backend did not send a token count
  */
 export function estimateTokenCount(text) {
   if (!text) return 0;
@@ -80,17 +81,26 @@ export function calculateTokensPerSecond(text, totalTimeSeconds) {
 
 /**
  * Calculate all statistics for a given response
+ * `usage` holds the backend's completionTokens, tokensPerSecond and
+ * outputTokensPerSecond when known; they take precedence over estimates
  */
-export function calculateAllStatistics(response, totalTimeSeconds) {
+export function calculateAllStatistics(response, totalTimeSeconds, usage = {}) {
+  const hasTokenCount = usage.completionTokens !== null && usage.completionTokens !== undefined;
   return {
-    tokenCount: estimateTokenCount(response),
+    tokenCount: hasTokenCount ? usage.completionTokens : estimateTokenCount(response),
+    tokenCountEstimated: !hasTokenCount,
     emojiCount: countEmojis(response),
     wordCount: countWords(response),
     sentenceCount: countSentences(response),
     averageWordLength: parseFloat(averageWordLength(response)),
     readingTime: parseFloat(estimateReadingTime(response)),
     throughput: parseFloat(calculateThroughput(response, totalTimeSeconds)),
-    tokensPerSecond: parseFloat(calculateTokensPerSecond(response, totalTimeSeconds)),
+    tokensPerSecond: usage.tokensPerSecond
+      ? parseFloat(usage.tokensPerSecond.toFixed(1))
+      : parseFloat(calculateTokensPerSecond(response, totalTimeSeconds)),
+    outputTokensPerSecond: usage.outputTokensPerSecond
+      ? parseFloat(usage.outputTokensPerSecond.toFixed(1))
+      : null,
   };
 }
 